@@ -0,0 +1,4 @@
+"""Benchmarks for the Python servers. Run the modules with python -m scry_pkg.scry_bench.<name>"""
+from scry_pkg.utils import setup_logging
+# LOGGING CONFIGURATION
+logger = setup_logging('BENCH')
@@ -0,0 +1,158 @@
+"""
+Decoding and cleanup of search pages on the multilingual fixture corpus of
+page_corpus: thirteen languages in the encodings their sites use, the
+charset declared in the header, in a <meta>, nowhere or wrongly, and text
+already mojibake at the source.
+
+  decode     bytes to text. legacy: the charset of the Content-Type header,
+             else UTF-8, undecodable bytes replaced. now: decode_body (byte
+             order mark, valid UTF-8, the declared charset when the bytes
+             decode in it, else charset_normalizer); "declared" is the
+             pages whose charset is declared right, which skip detection
+  pipeline   decode then extract: legacy decoding with the regex list of
+             cleanText, against decode_body with extract_page. A page is
+             right when every sentence it was generated from is in its text
+  residue    mojibake and replacement characters left in the texts
+  clean      cleanText alone (legacy: the regex list, one re.sub after the
+             other; now: the single pass) on the trafilatura text of the
+             multilingual pages and of --pages pages of the English corpus,
+             in MB/s; the outputs are compared text by text
+
+    python -m scry_pkg.scry_bench.decoding --pages 200 --repeat 20
+"""
+import os
+import re
+import time
+import argparse
+import trafilatura
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_bench.page_corpus import corpus, multilingual
+from scry_pkg.scry_net.client import decode_body
+from scry_pkg.scry_tools.search import cleanText
+from scry_pkg.scry_tools.search.extract import MOJIBAKE
+
+CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+# WHAT IS LEFT OF BROKEN TEXT: UTF-8 READ AS CP1252, AND THE REPLACEMENT CHARACTER OF UNDECODABLE BYTES
+RESIDUE = re.compile("Ã.|Â.|â€|Å.|Ä.|�")
+
+
+def legacy_decode(data: bytes, content_type: Optional[str]) -> str:
+    match = CHARSET.search(content_type or "")
+    try:
+        return data.decode(match.group(1) if match else "utf-8", "replace")
+    except LookupError:
+        return data.decode("utf-8", "replace")
+
+
+def legacy_clean_text(content: str) -> str:
+    encoding_fixes = [
+        (r'Ã¡', 'á'), (r'Ã©', 'é'), (r'Ã­', 'í'), (r'Ã³', 'ó'), (r'Ãº', 'ú'),
+        (r'Ã£', 'ã'), (r'Ãµ', 'õ'), (r'Ã§', 'ç'), (r'Ã¢', 'â'), (r'Ãª', 'ê'),
+        (r'Ã´', 'ô'), (r'Ã ', 'à'), (r'Â°', '°'), (r'â', '-'), (r'â', '"'),
+        (r'â', '"'), (r'â¦', '...')
+    ]
+    for wrong, correct in encoding_fixes:
+        content = re.sub(wrong, correct, content)
+    content = re.sub(r'\[\s*\.\.\.\s*\]', '', content)
+    content = re.sub(r'\[\d+\s*Comments?\]', '', content, flags=re.IGNORECASE)
+    content = re.sub(r'\|\s*', ' ', content)
+    content = re.sub(r'\s*\|', ' ', content)
+    content = re.sub(r'\n\s*\n\s*\n+', '\n\n', content)
+    content = re.sub(r'\s+', ' ', content)
+    content = re.sub(r'\[(\d+)\]', r'\1', content)
+    content = re.sub(r'\[\]', '', content)
+    content = re.sub(r'\s+', ' ', content)
+    content = re.sub(r'\s+(\d+)\s+', r' \1 ', content)
+    return content.strip()
+
+
+def extract(html_content: str, clean: Callable[[str], str]) -> str:
+    """extract_page with the cleanup given."""
+    content = trafilatura.extract(html_content)
+    if content and (any(char in content for char in MOJIBAKE) or len(content.strip()) < 200):
+        content = clean(content)
+    return content.strip() if content and len(content.strip()) > 150 else ""
+
+
+def throughput(function: Callable, items: List, repeat: int) -> float:
+    """Seconds per pass of `function` over `items`, best of `repeat`."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            function(*item)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def found(text: str, sentences: List[str]) -> float:
+    return sum(sentence in text for sentence in sentences) / len(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="pages of the English corpus in the clean comparison")
+    parser.add_argument("--per-case", type=int, default=1, help="multilingual pages per language, encoding and declaration")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = multilingual(args.per_case, args.seed)
+    wire = [(p["body"], p["content_type"]) for p in pages]
+    megabytes = sum(len(p["body"]) for p in pages) / 1e6
+
+    # DECODE, ALL PAGES AND THOSE WITH THEIR CHARSET DECLARED RIGHT (NO DETECTION)
+    declared = [(p["body"], p["content_type"]) for p in pages if p["declaration"] in ("header", "meta", "double")]
+    declared_megabytes = sum(len(body) for body, _ in declared) / 1e6
+    decode_seconds = {"legacy": throughput(legacy_decode, wire, args.repeat), "now": throughput(decode_body, wire, args.repeat)}
+    declared_seconds = {"legacy": throughput(legacy_decode, declared, args.repeat), "now": throughput(decode_body, declared, args.repeat)}
+    logger.info(f"decoded {len(pages)} pages ({megabytes:.1f} MB)")
+
+    # PIPELINE
+    right: Dict[str, Dict[str, List[float]]] = {"legacy": defaultdict(list), "now": defaultdict(list)}
+    residue = {"legacy": 0, "now": 0}
+    wrong = []
+    extracted = []
+    for p in pages:
+        for name, decode, clean in (("legacy", legacy_decode, legacy_clean_text), ("now", decode_body, cleanText)):
+            text = extract(decode(p["body"], p["content_type"]), clean)
+            right[name][p["declaration"]].append(found(text, p["sentences"]))
+            if name == "now" and right[name][p["declaration"]][-1] < 1:
+                wrong.append(p["name"])
+            residue[name] += len(RESIDUE.findall(text))
+        extracted.append(trafilatura.extract(decode_body(p["body"], p["content_type"])) or "")
+    logger.info(f"extracted {len(pages)} pages twice")
+
+    # CLEAN
+    english = [trafilatura.extract(p["html"]) or "" for p in corpus(args.pages, args.seed)]
+    texts = [(text,) for text in extracted + english]
+    clean_megabytes = sum(len(text.encode("utf-8")) for (text,) in texts) / 1e6
+    clean_seconds = {"legacy": throughput(legacy_clean_text, texts, args.repeat), "now": throughput(cleanText, texts, args.repeat)}
+    legacy_texts = [legacy_clean_text(text) for (text,) in texts]
+    now_texts = [cleanText(text) for (text,) in texts]
+    differ = [i for i, (a, b) in enumerate(zip(legacy_texts, now_texts)) if a != b]
+
+    print(f"{len(pages)} multilingual pages ({megabytes:.1f} MB): {len(set(p['language'] for p in pages))} languages, "
+          f"{len(set(p['encoding'] for p in pages))} encodings")
+    print(f"{'':>10}{'decode MB/s':>13}{'declared':>10}{'clean MB/s':>12}{'residue':>9}")
+    for name in ("legacy", "now"):
+        print(f"{name:>10}{megabytes / decode_seconds[name]:>13.1f}{declared_megabytes / declared_seconds[name]:>10.1f}"
+              f"{clean_megabytes / clean_seconds[name]:>12.1f}{residue[name]:>9}")
+    print("pages with every sentence in their text (legacy -> now), by where the charset was declared:")
+    for declaration in right["now"]:
+        legacy, now = right["legacy"][declaration], right["now"][declaration]
+        print(f"{declaration:>15}  {sum(r == 1 for r in legacy):>3} -> {sum(r == 1 for r in now):>3} of {len(now)}   "
+              f"sentences found {sum(legacy) / len(legacy):>6.1%} -> {sum(now) / len(now):>6.1%}")
+    print(f"clean: {len(texts)} texts ({clean_megabytes:.1f} MB); single pass differs from the regex list on {len(differ)}")
+    for i in differ[:3]:
+        a, b = legacy_texts[i], now_texts[i]
+        start = len(os.path.commonprefix([a, b]))
+        print(f"  legacy {a[max(start - 20, 0):start + 40]!r}\n     now {b[max(start - 20, 0):start + 40]!r}")
+    if wrong:
+        logger.info(f"pages still missing sentences: {wrong}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Page extraction throughput on the fixture corpus of page_corpus.
+
+  legacy        the extraction before the single pass: trafilatura.extract,
+                then cleanPage (a second trafilatura.extract of the same HTML)
+                for mojibake or short texts; one thread
+  single-pass   extract_page: one trafilatura pass, cleanText on its output;
+                one thread
+  threads       extract_page on --workers threads (what the default executor
+                gave search)
+  processes     extract_page in an ExtractionPool of --workers processes
+
+Reported per mode: pages/s, trafilatura passes per page (in-process modes),
+and the worst stall of the event loop while the pages were extracted, which
+is what the other connections of the server would see. The texts of legacy
+and single-pass are compared page by page.
+
+    python -m scry_pkg.scry_bench.extraction --pages 400 --workers 4
+"""
+import os
+import time
+import asyncio
+import argparse
+import trafilatura
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_bench.page_corpus import corpus
+from scry_pkg.scry_tools.search import cleanPage
+from scry_pkg.scry_tools.search.extract import ExtractionPool, extract_page, MOJIBAKE
+
+MODES = ("legacy", "single-pass", "threads", "processes")
+
+
+def legacy_extract(html_content: str) -> str:
+    content = trafilatura.extract(html_content)
+    if content and any(char in content for char in MOJIBAKE):
+        content = cleanPage(html_content)
+    elif not content or len(content.strip()) < 200:
+        content = cleanPage(html_content)
+    return content.strip() if content and len(content.strip()) > 150 else ""
+
+
+class CountingExtract:
+    """Stands in for trafilatura.extract (in this process only) and counts the calls."""
+
+    def __init__(self, extract: Callable):
+        self.extract = extract
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.extract(*args, **kwargs)
+
+
+async def watch_loop(stalls: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - started - 0.001)
+
+
+async def run(mode: str, htmls: List[str], workers: int) -> Dict:
+    loop = asyncio.get_running_loop()
+    counter = CountingExtract(trafilatura.extract)
+    # cleanPage AND extract_page BOTH LOOK trafilatura.extract UP AT CALL TIME
+    trafilatura.extract = counter
+    stalls, stop = [], asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stalls, stop))
+    started = time.perf_counter()
+    try:
+        if mode in ("legacy", "single-pass"):
+            function = legacy_extract if mode == "legacy" else extract_page
+            with ThreadPoolExecutor(1) as executor:
+                texts = await loop.run_in_executor(executor, lambda: [function(html) for html in htmls])
+        elif mode == "threads":
+            with ThreadPoolExecutor(workers) as executor:
+                texts = await asyncio.gather(*(loop.run_in_executor(executor, extract_page, html) for html in htmls))
+        else:
+            pool = ExtractionPool(workers)
+            # SPAWNING THE WORKERS AND THEIR IMPORTS IS PAID ONCE PER SERVER, NOT PER PAGE
+            await asyncio.gather(*(pool.extract(html) for html in htmls[:workers]))
+            started = time.perf_counter()
+            texts = await asyncio.gather(*(pool.extract(html) for html in htmls))
+            pool.close()
+        seconds = time.perf_counter() - started
+    finally:
+        stop.set()
+        await watcher
+        trafilatura.extract = counter.extract
+    return {"texts": texts, "seconds": seconds, "passes": counter.calls / len(htmls) if mode != "processes" else None,
+            "stall": max(stalls, default=0.0)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 4))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = corpus(args.pages, args.seed)
+    htmls = [p["html"] for p in pages]
+    megabytes = sum(len(html.encode("utf-8")) for html in htmls) / 1024**2
+    # trafilatura BUILDS ITS LOOKUP TABLES ON FIRST USE: NOT PART OF THE FIRST MODE'S TIME
+    for html in htmls[:5]:
+        extract_page(html)
+    results = {}
+    for mode in MODES:
+        results[mode] = await run(mode, htmls, args.workers)
+        logger.info(f"{mode}: {args.pages} pages in {results[mode]['seconds']:.2f} s")
+
+    print(f"{args.pages} pages ({megabytes:.1f} MiB of HTML), {args.workers} workers for threads/processes")
+    print(f"{'mode':>12}{'pages/s':>10}{'passes/page':>13}{'loop stall ms':>15}")
+    for mode, r in results.items():
+        passes = f"{r['passes']:.2f}" if r["passes"] is not None else "-"
+        print(f"{mode:>12}{args.pages / r['seconds']:>10.1f}{passes:>13}{r['stall'] * 1000:>15.1f}")
+    differ = [p["name"] for p, a, b in zip(pages, results["legacy"]["texts"], results["single-pass"]["texts"]) if a != b]
+    kept = sum(bool(text) for text in results["single-pass"]["texts"])
+    print(f"{kept}/{args.pages} pages kept; single-pass differs from legacy on {len(differ)}" + (f": {differ[:5]}" if differ else ""))
+    base = args.pages / results["legacy"]["seconds"]
+    for mode in MODES[1:]:
+        print(f"{mode}: {args.pages / results[mode]['seconds'] / base:.1f}x the pages/s of legacy")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
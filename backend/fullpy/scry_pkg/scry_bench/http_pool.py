@@ -0,0 +1,196 @@
+"""
+Handshakes saved by the shared keep-alive HTTP clients of scry_net.
+
+A stand-in server on 127.0.0.1 answers every request with a --body-kb page
+over HTTPS (a throwaway self-signed certificate made with openssl; plain
+HTTP with --plain or without openssl). Before the TLS handshake of each new
+connection it waits --connect-delay-ms, the round trips a handshake costs
+against a remote search result or model host. --requests GETs are sent
+four ways:
+
+  async-fresh   a new aiohttp session per request, as download_to_ram did
+  async-pooled  one HttpClient for all of them
+  sync-fresh    a new urllib3 pool per request, as a bare requests.get does
+  sync-pooled   one SyncHttpClient, sequential
+
+The async modes keep --concurrency requests in flight, the sync ones run one
+at a time. The table shows the connections opened, the reuse rate, the time
+spent setting connections up (async modes, from the aiohttp traces) and the
+latency per request.
+
+    python -m scry_pkg.scry_bench.http_pool --requests 200 --concurrency 4
+    python -m scry_pkg.scry_bench.http_pool --requests 200 --connect-delay-ms 0 --plain
+"""
+import os
+import ssl
+import socket
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List, Optional, Tuple
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_net.client import HttpClient, SyncHttpClient
+
+MODES = ("async-fresh", "async-pooled", "sync-fresh", "sync-pooled")
+
+
+def self_signed(directory: str) -> Optional[Tuple[str, str]]:
+    """(certificate, key) for 127.0.0.1, or None without openssl."""
+    if shutil.which("openssl") is None:
+        return None
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert, "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+async def stand_in(listener: socket.socket, body: bytes, connect_delay: float, server_tls: Optional[ssl.SSLContext]) -> None:
+    """
+    HTTP/1.1 server keeping connections alive. Connections are accepted by
+    hand: the client's first bytes (its TLS hello) wait in the kernel for
+    connect_delay, like on a distant host, before the handshake starts.
+    """
+    loop = asyncio.get_running_loop()
+    head = (f"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: keep-alive\r\n\r\n").encode()
+
+    async def serve(conn: socket.socket) -> None:
+        writer = None
+        try:
+            await asyncio.sleep(connect_delay)
+            reader = asyncio.StreamReader()
+            protocol = asyncio.StreamReaderProtocol(reader)
+            transport, _ = await loop.connect_accepted_socket(lambda: protocol, conn, ssl=server_tls)
+            writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                writer.write(head + body)
+                await writer.drain()
+                if b"connection: close" in request.lower():
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            if writer is not None:
+                writer.close()
+            else:
+                conn.close()
+
+    connections = set()
+    try:
+        while True:
+            conn, _ = await loop.sock_accept(listener)
+            task = asyncio.create_task(serve(conn))
+            connections.add(task)
+            task.add_done_callback(connections.discard)
+    finally:
+        for task in list(connections):
+            task.cancel()
+        listener.close()
+
+
+async def run_async(mode: str, url: str, client_tls, args) -> Tuple[List[float], Dict]:
+    pooled = HttpClient(name="bench") if mode == "async-pooled" else None
+    totals = {"connections": 0, "reused": 0, "connect_seconds": 0.0}
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            client = pooled or HttpClient(name="bench")
+            started = time.perf_counter()
+            await client.text(url, ssl=client_tls)
+            latencies.append(time.perf_counter() - started)
+            if pooled is None:
+                await client.close()
+                for key in totals:
+                    totals[key] += client.stats()[key]
+
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    if pooled is not None:
+        totals = {key: pooled.stats()[key] for key in totals}
+        await pooled.close()
+    return latencies, totals
+
+
+def run_sync(mode: str, url: str, cert: Optional[str], args) -> Tuple[List[float], Dict]:
+    tls = {"ca_certs": cert} if cert else {}
+    pooled = SyncHttpClient(name="bench", **tls) if mode == "sync-pooled" else None
+    totals = {"connections": 0, "reused": 0, "connect_seconds": None}
+    latencies = []
+    for _ in range(args.requests):
+        client = pooled or SyncHttpClient(name="bench", **tls)
+        started = time.perf_counter()
+        client.text(url)
+        latencies.append(time.perf_counter() - started)
+        if pooled is None:
+            totals["connections"] += client.stats()["connections"]
+            client.close()
+    if pooled is not None:
+        totals.update({key: pooled.stats()[key] for key in ("connections", "reused")})
+        pooled.close()
+    return latencies, totals
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4, help="async modes: requests in flight")
+    parser.add_argument("--connect-delay-ms", type=float, default=30.0, help="stand-in: wait before each new connection's handshake")
+    parser.add_argument("--body-kb", type=int, default=32)
+    parser.add_argument("--plain", action="store_true", help="HTTP instead of HTTPS")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="scry-http-") as directory:
+        pem = None if args.plain else self_signed(directory)
+        server_tls = client_tls = None
+        if pem is not None:
+            server_tls = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_tls.load_cert_chain(*pem)
+            client_tls = ssl.create_default_context(cafile=pem[0])
+        elif not args.plain:
+            logger.warning("openssl not found: plain HTTP, the handshakes are TCP only")
+        body = b"<html><body><article>" + b"<p>stand-in page</p>" * (args.body_kb * 1024 // 20) + b"</article></body></html>"
+        listener = socket.create_server(("127.0.0.1", 0), backlog=256)
+        listener.setblocking(False)
+        url = f"{'https' if pem else 'http'}://127.0.0.1:{listener.getsockname()[1]}/page"
+        server = asyncio.create_task(stand_in(listener, body, args.connect_delay_ms / 1000, server_tls))
+
+        results = {}
+        try:
+            for mode in MODES:
+                started = time.perf_counter()
+                if mode.startswith("async"):
+                    latencies, totals = await run_async(mode, url, client_tls, args)
+                else:
+                    # urllib3 BLOCKS: OFF THE LOOP, WHICH KEEPS SERVING THE STAND-IN
+                    latencies, totals = await asyncio.get_running_loop().run_in_executor(
+                        None, run_sync, mode, url, pem[0] if pem else None, args)
+                results[mode] = {**totals, "latencies": latencies, "seconds": time.perf_counter() - started}
+                logger.info(f"{mode}: {len(latencies)} requests in {results[mode]['seconds']:.2f} s")
+        finally:
+            server.cancel()
+
+    print(f"{args.requests} GETs of {args.body_kb} KiB over {'HTTPS' if pem else 'HTTP'}, "
+          f"stand-in connect delay {args.connect_delay_ms:.0f} ms")
+    print(f"{'mode':>14}{'connections':>13}{'reuse':>8}{'setup ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'total s':>9}")
+    for mode, r in results.items():
+        ordered = sorted(r["latencies"])
+        setup = f"{r['connect_seconds'] * 1000:.0f}" if r["connect_seconds"] is not None else "-"
+        reuse = r["reused"] / (r["reused"] + r["connections"]) if r["reused"] + r["connections"] else 0.0
+        print(f"{mode:>14}{r['connections']:>13}{reuse:>8.0%}{setup:>10}{statistics.median(ordered) * 1000:>9.1f}"
+              f"{ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)] * 1000:>9.1f}{r['seconds']:>9.2f}")
+    saved = results["async-fresh"]["connect_seconds"] - results["async-pooled"]["connect_seconds"]
+    print(f"connection setup saved by pooling (async): {saved * 1000:.0f} ms over {args.requests} requests")
+    for kind in ("async", "sync"):
+        fresh, pooled = (statistics.mean(results[f"{kind}-{m}"]["latencies"]) for m in ("fresh", "pooled"))
+        print(f"{kind}: {(fresh - pooled) * 1000:.1f} ms less per request pooled ({fresh / pooled:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
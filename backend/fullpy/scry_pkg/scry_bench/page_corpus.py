@@ -0,0 +1,238 @@
+"""
+Fixture corpus of the search benchmarks: web pages generated from a seed,
+so every run and every machine extracts the same documents. Each page wraps
+its text in what real pages carry around it (head scripts and styles,
+navigation, sidebar, related links, comments, footer) in one of four
+layouts; some pages are short and some carry UTF-8 read as Latin-1
+(mojibake), which sends them through the cleanText fallback.
+
+multilingual() gives pages the way they come off the wire: bytes in the
+encodings sites in each language use, their charset declared in the
+Content-Type header, in a <meta>, nowhere, or wrongly (UTF-8 served as
+latin-1), some with text that was already mojibake at the source; each
+with the sentences its extracted text has to contain.
+"""
+import random
+from typing import Dict, List, Optional
+
+LAYOUTS = ("article", "news", "docs", "forum")
+
+WORDS = ("the of and to in is that for it as was with be by on not he this are or his from at which but have an they "
+         "you were her all she there would their we him been has when who will more no if out so said what up its about "
+         "into than them can only other new some could time these two may then do first any my now such like our over "
+         "man me even most made after also did many before must through back years where much your way well down should "
+         "because each just those people how too little state good very make world still own see men work long get here "
+         "between both life being under never day same another know while last might us great old year off come since "
+         "against go came right used take three cache network latency memory kernel thread process database index query "
+         "compiler runtime library server client protocol request response buffer socket stream parser token model").split()
+
+MOJIBAKE = ("cafÃ©", "naÃ¯ve", "rÃ©sumÃ©", "SÃ£o Paulo", "â€œquotedâ€", "coÃ¶perate")
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + rng.choice((".", ".", ".", "?", "!"))
+
+
+def paragraph(rng: random.Random, sentences: int, mojibake: bool = False) -> str:
+    parts = [sentence(rng, rng.randint(8, 24)) for _ in range(sentences)]
+    if mojibake:
+        parts.insert(rng.randrange(len(parts) + 1), f"See {rng.choice(MOJIBAKE)} [12] and {rng.choice(MOJIBAKE)}.")
+    return " ".join(parts)
+
+
+def boilerplate_head(rng: random.Random, title: str, charset: Optional[str] = "utf-8") -> str:
+    scripts = "".join(f"<script>window.dataLayer=window.dataLayer||[];function t{i}(){{dataLayer.push(arguments)}}"
+                      f"t{i}('config','{rng.getrandbits(48):x}');</script>" for i in range(rng.randint(2, 6)))
+    styles = "".join(f".c{i}{{margin:{i}px;padding:{i % 7}px;color:#{rng.getrandbits(24):06x}}}" for i in range(rng.randint(300, 1500)))
+    state = ",".join(f"\"{rng.choice(WORDS)}{i}\":{{\"id\":{rng.getrandbits(32)},\"v\":\"{rng.getrandbits(64):x}\"}}"
+                     for i in range(rng.randint(100, 600)))
+    meta = f"<meta charset=\"{charset}\">" if charset else ""
+    return (f"<head>{meta}<title>{title}</title><meta name=\"description\" content=\"{title}\">"
+            f"<style>{styles}</style>{scripts}<script type=\"application/json\">{{{state}}}</script></head>")
+
+
+def links(rng: random.Random, n: int, css: str) -> str:
+    return "".join(f"<li class=\"{css}\"><a href=\"/{rng.choice(WORDS)}/{rng.getrandbits(24):x}\">"
+                   f"{sentence(rng, rng.randint(2, 5))}</a></li>" for _ in range(n))
+
+
+def body_text(rng: random.Random, paragraphs: int, mojibake: bool, layout: str) -> str:
+    # A ONE PARAGRAPH PAGE IS A SHORT ONE: ITS TEXT STAYS NEAR THE 200 CHARACTERS THAT TRIGGER THE CLEANUP
+    sentences = (1, 1) if paragraphs == 1 else (2, 6)
+    blocks = []
+    for i in range(paragraphs):
+        if layout == "docs" and i % 4 == 3:
+            rows = "".join(f"<tr><td>{rng.choice(WORDS)}</td><td>{rng.randint(1, 9999)}</td><td>{sentence(rng, 5)}</td></tr>"
+                           for _ in range(rng.randint(3, 8)))
+            blocks.append(f"<table><tr><th>name</th><th>value</th><th>notes</th></tr>{rows}</table>")
+        elif layout == "docs" and i % 5 == 4:
+            blocks.append(f"<pre><code>def {rng.choice(WORDS)}(x):\n    return x * {rng.randint(2, 9)}</code></pre>")
+        elif i % 6 == 5:
+            blocks.append(f"<h2>{sentence(rng, 4)}</h2>")
+        blocks.append(f"<p>{paragraph(rng, rng.randint(*sentences), mojibake and i == min(paragraphs - 1, 1))}</p>")
+    return "".join(blocks)
+
+
+def page(rng: random.Random, layout: str, paragraphs: int, mojibake: bool = False) -> str:
+    title = sentence(rng, 6)
+    nav = f"<nav><ul>{links(rng, rng.randint(10, 40), 'menu')}</ul></nav>"
+    sidebar = f"<aside><h3>Related</h3><ul>{links(rng, rng.randint(5, 20), 'related')}</ul></aside>"
+    footer = f"<footer><p>Copyright {rng.randint(2001, 2025)}</p><ul>{links(rng, rng.randint(5, 15), 'foot')}</ul></footer>"
+    text = body_text(rng, paragraphs, mojibake, layout)
+    if layout == "forum":
+        posts = "".join(f"<div class=\"post\"><span class=\"author\">{rng.choice(WORDS)}{rng.randint(1, 99)}</span>"
+                        f"<div class=\"message\"><p>{paragraph(rng, rng.randint(1, 4 if paragraphs > 1 else 1), mojibake and i == 0)}</p></div></div>"
+                        for i in range(paragraphs))
+        main = f"<main><h1>{title}</h1>{posts}</main>"
+    else:
+        byline = f"<p class=\"byline\">By {rng.choice(WORDS).title()} {rng.choice(WORDS).title()}</p>" if layout == "news" else ""
+        comments = ("<section class=\"comments\"><h3>[3 Comments]</h3>" +
+                    "".join(f"<div class=\"comment\"><p>{sentence(rng, 10)}</p></div>" for _ in range(3)) + "</section>"
+                    if layout in ("news", "article") and paragraphs > 1 else "")
+        main = f"<main><article><h1>{title}</h1>{byline}{text}</article>{comments}</main>"
+    return f"<!DOCTYPE html><html lang=\"en\">{boilerplate_head(rng, title)}<body>{nav}{sidebar}{main}{footer}</body></html>"
+
+
+def corpus(n: int, seed: int = 0) -> List[Dict[str, str]]:
+    """`n` pages: mostly full articles, one in ten short, one in seven with mojibake."""
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n):
+        layout = LAYOUTS[i % len(LAYOUTS)]
+        paragraphs = 1 if i % 10 == 9 else rng.randint(6, 40)
+        pages.append({"name": f"{layout}-{i:04d}", "layout": layout, "html": page(rng, layout, paragraphs, i % 7 == 3)})
+    return pages
+
+
+# SENTENCES OF EACH LANGUAGE, AND THE ENCODINGS ITS SITES ARE SERVED IN
+LANGUAGES = {
+    "en": (("utf-8",), (
+        "The \u201cquick\u201d fix \u2013 a cache in front of the index \u2013 cut the latency by half\u2026",
+        "Nobody\u2019s request waited more than a second after the change.",
+        "The server answered 95% of the queries from memory.",
+        "Results are shown with their sources, as \u201clinks\u201d under the answer.")),
+    "fr": (("utf-8", "cp1252", "iso-8859-1"), (
+        "Le cache réduit la latence des requêtes répétées.",
+        "Les développeurs ont mesuré le débit du serveur à midi.",
+        "Cette bibliothèque gère les caractères accentués sans problème.",
+        "Le réseau était très lent pendant la mise à jour de l'été.",
+        "Nous préférons une solution simple et éprouvée.")),
+    "de": (("utf-8", "iso-8859-1"), (
+        "Die Größe des Speichers hängt von der Anwendung ab.",
+        "Übermäßige Zugriffe verlangsamen den Server spürbar.",
+        "Für die nächste Version planen wir schnellere Abfragen.",
+        "Der Schlüssel wird beim Öffnen der Datei geprüft.",
+        "Straßenbahnen fahren in München häufig pünktlich.")),
+    "es": (("utf-8", "cp1252"), (
+        "La compañía añadió una función de búsqueda más rápida.",
+        "¿Cuándo se publicará la próxima versión del índice?",
+        "El niño leyó la información en español sin dificultad.",
+        "Los árboles del jardín crecieron mucho este año.",
+        "¡Qué rendimiento tan sorprendente tiene el analizador!")),
+    "pt": (("utf-8", "iso-8859-1"), (
+        "A função de pesquisa ficou mais rápida depois da atualização.",
+        "São Paulo é a maior cidade do Brasil.",
+        "Não há informação suficiente para concluir a análise.",
+        "As ações do usuário são registradas em português.",
+        "O coração do sistema é o índice de páginas.")),
+    "pl": (("utf-8", "iso-8859-2"), (
+        "Zażółć gęślą jaźń to znane polskie zdanie testowe.",
+        "Serwer odpowiada szybciej po włączeniu pamięci podręcznej.",
+        "Dziękujemy za cierpliwość podczas aktualizacji.",
+        "Źródło danych znajduje się w głównym katalogu.",
+        "Wiele stron używa kodowania środkowoeuropejskiego.")),
+    "tr": (("utf-8", "cp1254"), (
+        "Arama sonuçları önbellekten çok hızlı geliyor.",
+        "Türkçe karakterler doğru görüntülenmelidir.",
+        "Sunucu güncellemesi başarıyla tamamlandı.",
+        "Ağ bağlantısı şu anda oldukça yavaş.",
+        "Kullanıcılar işlemin süresini ölçtü.")),
+    "ru": (("utf-8", "cp1251", "koi8-r"), (
+        "Кэш значительно уменьшает задержку повторных запросов.",
+        "Разработчики измерили пропускную способность сервера.",
+        "Эта библиотека правильно обрабатывает кириллицу.",
+        "Сеть была очень медленной во время обновления.",
+        "Мы предпочитаем простое и проверенное решение.")),
+    "el": (("utf-8", "iso-8859-7"), (
+        "Η προσωρινή μνήμη μειώνει σημαντικά την καθυστέρηση.",
+        "Οι προγραμματιστές μέτρησαν την ταχύτητα του διακομιστή.",
+        "Η βιβλιοθήκη χειρίζεται σωστά τους ελληνικούς χαρακτήρες.",
+        "Το δίκτυο ήταν πολύ αργό κατά την ενημέρωση.",
+        "Προτιμούμε μια απλή και δοκιμασμένη λύση.")),
+    "ar": (("utf-8", "cp1256"), (
+        "تقلل الذاكرة المؤقتة زمن الاستجابة بشكل كبير.",
+        "قاس المطورون سرعة الخادم بعد التحديث.",
+        "تعالج هذه المكتبة الحروف العربية بشكل صحيح.",
+        "كانت الشبكة بطيئة جدا أثناء التحديث.",
+        "نفضل حلا بسيطا ومجربا.")),
+    "ja": (("utf-8", "shift_jis", "euc-jp"), (
+        "キャッシュは繰り返しの検索の遅延を大きく減らします。",
+        "開発者はサーバーの処理速度を測定しました。",
+        "このライブラリは日本語の文字を正しく扱います。",
+        "更新中はネットワークがとても遅かったです。",
+        "私たちは単純で実績のある方法を選びます。")),
+    "zh": (("utf-8", "gb18030"), (
+        "缓存大大减少了重复查询的延迟。",
+        "开发人员测量了服务器的吞吐量。",
+        "这个库可以正确处理中文字符。",
+        "更新期间网络非常慢。",
+        "我们更喜欢简单可靠的解决方案。")),
+    "ko": (("utf-8", "euc-kr"), (
+        "캐시는 반복 검색의 지연 시간을 크게 줄입니다.",
+        "개발자들은 서버의 처리 속도를 측정했습니다.",
+        "이 라이브러리는 한국어 문자를 올바르게 처리합니다.",
+        "업데이트 중에는 네트워크가 매우 느렸습니다.",
+        "우리는 단순하고 검증된 방법을 선호합니다.")),
+}
+
+# WHERE A PAGE'S CHARSET IS SAID: header, meta, none, latin1-header (A UTF-8 BODY SERVED AS iso-8859-1) AND
+# double (A UTF-8 PAGE WHOSE TEXT WAS UTF-8 READ AS WINDOWS-1252 BEFORE IT WAS PUBLISHED)
+DECLARATIONS = ("header", "meta", "none", "latin1-header", "double")
+
+
+def double_encoded(text: str) -> str:
+    """`text` as a site that read its own UTF-8 as windows-1252 publishes it (bytes cp1252 lacks read as latin-1)."""
+    return "".join(bytes([b]).decode("cp1252", "ignore") or chr(b) for b in text.encode("utf-8"))
+
+
+def multilingual_page(rng: random.Random, language: str, encoding: str, declaration: str) -> Dict:
+    sentences = LANGUAGES[language][1]
+    used = []
+    paragraphs = []
+    for _ in range(rng.randint(6, 20)):
+        chosen = [rng.choice(sentences) for _ in range(rng.randint(2, 5))]
+        used += chosen
+        text = " ".join(chosen)
+        paragraphs.append(f"<p>{double_encoded(text) if declaration == 'double' else text}</p>")
+    title = sentences[0]
+    nav = f"<nav><ul>{links(rng, rng.randint(10, 40), 'menu')}</ul></nav>"
+    footer = f"<footer><p>Copyright {rng.randint(2001, 2025)}</p><ul>{links(rng, rng.randint(5, 15), 'foot')}</ul></footer>"
+    head = boilerplate_head(rng, title, encoding if declaration == "meta" else None)
+    html = (f"<!DOCTYPE html><html lang=\"{language}\">{head}<body>{nav}<main><article><h1>{title}</h1>"
+            f"{''.join(paragraphs)}</article></main>{footer}</body></html>")
+    content_type = {"header": f"text/html; charset={encoding}", "latin1-header": "text/html; charset=iso-8859-1",
+                    "double": "text/html; charset=utf-8"}.get(declaration, "text/html")
+    return {"name": f"{language}-{encoding}-{declaration}", "language": language, "encoding": encoding,
+            "declaration": declaration, "content_type": content_type, "body": html.encode(encoding),
+            "sentences": sorted(set(used))}
+
+
+def multilingual(pages_per_case: int = 1, seed: int = 0) -> List[Dict]:
+    """
+    Every language in every encoding of it, declared in the header, in a
+    <meta> and nowhere; UTF-8 pages also served as latin-1, and double
+    encoded for the languages written in the Latin alphabet.
+    """
+    rng = random.Random(seed)
+    pages = []
+    for language, (encodings, _) in LANGUAGES.items():
+        for encoding in encodings:
+            declarations = ["header", "meta", "none"]
+            if encoding == "utf-8":
+                declarations.append("latin1-header")
+                if language in ("en", "fr", "de", "es", "pt", "pl", "tr"):
+                    declarations.append("double")
+            for declaration in declarations:
+                pages += [multilingual_page(rng, language, encoding, declaration) for _ in range(pages_per_case)]
+    return pages
@@ -0,0 +1,146 @@
+"""
+Resume of a dropped session against resending its history for a full re-prefill.
+
+Each run builds a session of --turns prompts, drops the connection and asks
+the next question three ways, reporting the time from the reconnect to the
+first token of the answer and the prompt tokens the server had to prefill:
+
+  resume           reconnect with ?session=<id>, the server still running
+                   (the session's prefix is still in the prefix cache)
+  resume-restart   the server restarted before the reconnect: the history
+                   comes from the session store, the KV state from its
+                   snapshot with --kv, else the history is prefilled again
+  re-prefill       a new session whose prompt carries the whole transcript,
+                   what a client without resume has to do
+
+The servers started here get a throwaway session store.
+
+    python -m scry_pkg.scry_bench.resume --server fake --runs 5 --turns 6 --kv
+    python -m scry_pkg.scry_bench.resume --server model --runs 3 --turns 4 --kv
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+import websockets
+from typing import Dict, List, Tuple
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_bench.ws_load import VOCABULARY, receive, wait_ready, start_server
+
+MODES = ("resume", "resume-restart", "re-prefill")
+
+
+async def ask(websocket, prompt: str, prompt_id: str, timeout: float) -> Tuple[str, float, Dict]:
+    """Sends a prompt; returns the reply, the perf_counter of its first token and the stats message."""
+    await websocket.send(json.dumps({"action": "prompt", "prompt": prompt, "promptId": prompt_id, "stats": True}))
+    reply, first = [], None
+    while True:
+        message = await receive(websocket, timeout)
+        kind = message.get("type")
+        if kind == "token":
+            first = first or time.perf_counter()
+            reply.append(message.get("token", ""))
+        elif kind == "error":
+            raise RuntimeError(f"{prompt_id}: {message.get('error')}")
+        elif kind == "complete":
+            stats = await receive(websocket, timeout)
+            return "".join(reply), first or time.perf_counter(), stats
+
+
+def question(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+async def build_session(url: str, rng: random.Random, args) -> Tuple[str, List[Tuple[str, str]]]:
+    turns = []
+    async with websockets.connect(url, max_size=None) as websocket:
+        session_id = (await wait_ready(websocket, args.timeout))["sessionId"]
+        for n in range(args.turns):
+            prompt = question(rng, args.prompt_words)
+            reply, _, _ = await ask(websocket, prompt, f"build-{n}", args.timeout)
+            turns.append((prompt, reply))
+    return session_id, turns
+
+
+async def restart(server: Dict, args) -> None:
+    # SIGTERM: THE SERVER FLUSHES ITS SESSION STORE BEFORE EXITING
+    server["process"].terminate()
+    await server["process"].wait()
+    server["process"], server["url"] = await start_server(args)
+
+
+async def run_once(run: int, server: Dict, args) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(args.seed * 7919 + run)
+    results = {}
+    for mode in MODES:
+        session_id, turns = await build_session(server["url"], rng, args)
+        next_question = question(rng, args.prompt_words)
+        if mode == "resume-restart":
+            await restart(server, args)
+        if mode == "re-prefill":
+            transcript = "\n".join(f"User: {prompt}\nAssistant: {reply}" for prompt, reply in turns)
+            url, prompt = server["url"], f"{transcript}\nUser: {next_question}"
+        else:
+            url, prompt = f"{server['url']}/?session={session_id}", next_question
+
+        started = time.perf_counter()
+        async with websockets.connect(url, max_size=None) as websocket:
+            ready = await wait_ready(websocket, args.timeout)
+            _, first, stats = await ask(websocket, prompt, f"{mode}-{run}", args.timeout)
+        if mode != "re-prefill" and not ready.get("resumed"):
+            raise RuntimeError(f"{mode}: session {session_id} was not resumed")
+        results[mode] = {"first_token": first - started,
+                         "prefill": stats.get("promptTokens", 0) - stats.get("cachedTokens", 0),
+                         "prompt": stats.get("promptTokens", 0)}
+        logger.info(f"Run {run + 1}, {mode}: first token {results[mode]['first_token'] * 1000:.0f} ms after the reconnect, "
+                    f"{results[mode]['prefill']}/{results[mode]['prompt']} prompt tokens prefilled")
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["fake", "model"], default="fake", help="fake engine or the GGUF of current_model.json")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=6, help="turns of the session before the drop")
+    parser.add_argument("--prompt-words", type=int, default=120)
+    parser.add_argument("--kv", action="store_true", help="KV snapshots on (SCRY_SESSION_KV=1)")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-rate", type=float, default=50.0, help="fake engine: tokens/s per sequence")
+    parser.add_argument("--fake-prefill-rate", type=float, default=400.0, help="fake engine: prompt tokens/s (CPU-like)")
+    parser.add_argument("--fake-reply-tokens", type=int, default=64, help="fake engine: tokens per reply")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="scry-resume-") as store:
+        # INHERITED BY EVERY SERVER start_server SPAWNS
+        os.environ.update(SCRY_SESSION_STORE=os.path.join(store, "sessions.sqlite"),
+                          SCRY_SESSION_KV="1" if args.kv else "0", SCRY_SESSION_KV_DIR=os.path.join(store, "kv"))
+        process, url = await start_server(args)
+        server = {"process": process, "url": url}
+        results: Dict[str, List[Dict[str, float]]] = {mode: [] for mode in MODES}
+        try:
+            for run in range(args.runs):
+                for mode, result in (await run_once(run, server, args)).items():
+                    results[mode].append(result)
+        finally:
+            server["process"].terminate()
+            await server["process"].wait()
+
+    print(f"{args.server} server, {args.runs} runs, {args.turns} turns of {args.prompt_words} words, "
+          f"KV snapshots {'on' if args.kv else 'off'}")
+    print(f"{'mode':>16}{'first token ms':>16}{'prefilled':>11}{'of prompt':>11}")
+    for mode, runs in results.items():
+        print(f"{mode:>16}{statistics.median(r['first_token'] for r in runs) * 1000:>16.0f}"
+              f"{statistics.median(r['prefill'] for r in runs):>11.0f}{statistics.median(r['prompt'] for r in runs):>11.0f}")
+    base = statistics.median(r["first_token"] for r in results["re-prefill"])
+    for mode in ("resume", "resume-restart"):
+        resumed = statistics.median(r["first_token"] for r in results[mode])
+        print(f"{mode}: {base / resumed:.1f}x faster to the first token than re-prefill")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+Prompt tokens a search adds, with the pages joined whole (what RunSearch._search
+and bridges sent) against the BM25-ranked passages of select_passages.
+
+Every search has a question and --pages-per-search pages of the page_corpus
+fixture corpus, extracted by extract_page. One page carries the answer, a
+paragraph planted at a random position; the other paragraphs share words
+with the questions (cache, latency, socket, ...) without answering them.
+Reported per --budget, for the passages ranked across all the pages at
+once ("all") and for PassageStream, each page ranked on arrival against its
+share of the budget as stream_search does ("stream"): the prompt tokens of
+the search context, how often the answer made it into the context, the
+time ranking took, and the prefill time saved per search at --prefill-rate
+prompt tokens/s (or the tokens of --model's tokenizer, the rate still being
+--prefill-rate).
+
+    python -m scry_pkg.scry_bench.search_context --searches 50 --budget 512 1024 2048
+"""
+import time
+import random
+import argparse
+import statistics
+from typing import Callable, Dict, List
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_bench.page_corpus import corpus
+from scry_pkg.scry_tools.search.extract import extract_page
+from scry_pkg.scry_tools.search.passages import PassageStream, select_passages, format_passages
+from scry_pkg.utils import estimate_tokens
+
+QUESTIONS = (
+    ("how does the kv cache reduce prefill latency",
+     "The KV cache keeps the attention keys and values computed for the prompt, so a follow-up request skips the prefill "
+     "of the shared prefix and its first-token latency drops accordingly."),
+    ("what is the default socket receive buffer size on linux",
+     "On Linux the default socket receive buffer size comes from net.core.rmem_default, which is 212992 bytes on most "
+     "distributions; setsockopt with SO_RCVBUF changes it per socket."),
+    ("why do database indexes slow down writes",
+     "Every index on a table has to be updated by each insert, update and delete, so a database table with many indexes "
+     "writes more slowly even though its queries read faster."),
+    ("does compiler inlining improve runtime performance",
+     "Inlining lets the compiler remove the call overhead and optimize the inlined body together with its caller, which "
+     "usually improves runtime performance at the cost of a larger binary."),
+    ("how does http keep alive reuse connections",
+     "With HTTP keep-alive the client sends the next request over the connection that is already open instead of paying "
+     "for a new TCP and TLS handshake every time."),
+)
+
+
+def searches(n: int, pages_per_search: int, seed: int) -> List[Dict]:
+    """`n` searches of `pages_per_search` extracted pages, the answer planted in one of them."""
+    rng = random.Random(seed)
+    texts = [text for text in (extract_page(page["html"]) for page in corpus(n * pages_per_search + n, seed)) if text]
+    result = []
+    for i in range(n):
+        question, answer = QUESTIONS[i % len(QUESTIONS)]
+        pages = [{"url": f"https://example.org/{i}/{j}", "content": texts[(i * pages_per_search + j) % len(texts)]}
+                 for j in range(pages_per_search)]
+        target = pages[rng.randrange(pages_per_search)]
+        paragraphs = target["content"].split("\n")
+        paragraphs.insert(rng.randrange(len(paragraphs) + 1), answer)
+        target["content"] = "\n".join(paragraphs)
+        result.append({"question": question, "answer": answer, "pages": pages})
+    return result
+
+
+def run(budget: int, items: List[Dict], count_tokens: Callable[[str], int], streamed: bool) -> Dict:
+    full, context, found, ranking = [], [], 0, []
+    for item in items:
+        full.append(count_tokens("\n\n".join(page["content"] for page in item["pages"])))
+        started = time.perf_counter()
+        if streamed:
+            selection = PassageStream(item["question"], len(item["pages"]), budget, count_tokens)
+            passages = [passage for page in item["pages"] for passage in selection.add(page)]
+        else:
+            passages = select_passages(item["question"], item["pages"], budget, count_tokens)
+        ranking.append(time.perf_counter() - started)
+        text = format_passages(passages)
+        context.append(count_tokens(text))
+        found += item["answer"] in text
+    return {"full": statistics.mean(full), "context": statistics.mean(context), "found": found / len(items),
+            "ranking_ms": statistics.median(ranking) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--searches", type=int, default=50)
+    parser.add_argument("--pages-per-search", type=int, default=3, help="RunSearch joined up to three pages")
+    parser.add_argument("--budget", type=int, nargs="+", default=[512, 1024, 2048], help="SEARCH_CONTEXT_TOKENS values")
+    parser.add_argument("--prefill-rate", type=float, default=400.0, help="prompt tokens/s of the model (CPU-like by default)")
+    parser.add_argument("--model", help="GGUF whose tokenizer counts the tokens (else four characters a token)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    count_tokens = estimate_tokens
+    if args.model:
+        from scry_pkg.scry_ws.engine import open_tokenizer
+        count_tokens = open_tokenizer(args.model, 4096).count_tokens
+    items = searches(args.searches, args.pages_per_search, args.seed)
+    logger.info(f"{len(items)} searches of {args.pages_per_search} pages ready")
+    results = {(budget, mode): run(budget, items, count_tokens, mode == "stream") for budget in args.budget for mode in ("all", "stream")}
+
+    print(f"{args.searches} searches, {args.pages_per_search} pages each, tokens by {'the model' if args.model else 'estimate'}, "
+          f"prefill at {args.prefill_rate:.0f} tokens/s")
+    print(f"{'budget':>8}{'ranked':>8}{'full pages':>12}{'context':>9}{'smaller':>9}{'answer in':>11}{'rank ms':>9}{'prefill saved s':>17}")
+    for (budget, mode), r in results.items():
+        saved = (r["full"] - r["context"]) / args.prefill_rate
+        print(f"{budget:>8}{mode:>8}{r['full']:>12.0f}{r['context']:>9.0f}{r['full'] / max(r['context'], 1):>8.1f}x"
+              f"{r['found']:>11.0%}{r['ranking_ms']:>9.1f}{saved:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Lookup latency of the semantic cache index.
+
+Fills a SemanticCache with `--entries` random unit vectors, then times
+`--lookups` lookups of paraphrase-like queries (a stored vector plus noise)
+and of unrelated ones, and reports insert time, lookup percentiles, hit rate
+and index memory. With --model the embedding time of a few questions is
+reported too.
+
+    python -m scry_pkg.scry_bench.semantic_cache --entries 100000 --dim 768
+"""
+import time
+import argparse
+import numpy as np
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_ws.semantic_cache import SemanticCache
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def percentile(samples: list, q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768, help="embedding size (384 for bge-small, 768 for nomic-embed)")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.15, help="relative noise added to a stored vector to make a paraphrase")
+    parser.add_argument("--threshold", type=float, default=0.92)
+    parser.add_argument("--model", help="GGUF embedding model: time embed() on a few questions too")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cache = SemanticCache(args.dim, args.entries, args.threshold)
+    vectors = unit(rng.standard_normal((args.entries, args.dim), dtype=np.float32))
+
+    started = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        cache.add(vector, "bench", [f"answer {i}"], {"tokens": 1})
+    insert = time.perf_counter() - started
+    logger.info(f"Semantic cache benchmark: {args.entries} entries, dim {args.dim}")
+
+    near, far = [], []
+    for i in range(args.lookups):
+        stored = vectors[rng.integers(args.entries)]
+        query = unit(stored + args.noise * unit(rng.standard_normal(args.dim, dtype=np.float32)))
+        started = time.perf_counter()
+        cache.lookup(query, "bench", "bench")
+        near.append(time.perf_counter() - started)
+
+        query = unit(rng.standard_normal(args.dim, dtype=np.float32))
+        started = time.perf_counter()
+        cache.lookup(query, "bench", "bench")
+        far.append(time.perf_counter() - started)
+
+    stats = cache.stats()
+    print(f"insert: {insert / args.entries * 1e6:.1f} us/entry, index {stats['bytes_resident'] / 1024**2:.1f} MiB")
+    print(f"{'queries':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    print(f"{'paraphrase':>12}{percentile(near, 50):>9}{percentile(near, 95):>9}{percentile(near, 99):>9}")
+    print(f"{'unrelated':>12}{percentile(far, 50):>9}{percentile(far, 95):>9}{percentile(far, 99):>9}")
+    print(f"hit rate: {stats['hit_rate']} (paraphrases are half of the lookups)")
+
+    if args.model:
+        from scry_pkg.scry_ws.engine import Embedder
+        embedder = Embedder(args.model)
+        questions = ["How do I reverse a list in Python?", "What is the capital of Australia?",
+                     "Explain the difference between TCP and UDP.", "Give me a recipe for pancakes."]
+        timings = []
+        for question in questions * 5:
+            started = time.perf_counter()
+            embedder.embed(question)
+            timings.append(time.perf_counter() - started)
+        embedder.close()
+        print(f"embed: p50 {percentile(timings, 50)} ms, p95 {percentile(timings, 95)} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Startup time of the WebSocket server, with and without the GGUF prefetch.
+
+Spawns call_llama.cpp.py `--runs` times per mode and reports the median time
+from spawn to the port being bound (the "running on" log line) and to the
+ready message on a connection opened right after, with the loading messages
+received in between. --cold drops the GGUF from the page cache before every
+run (posix_fadvise DONTNEED: Linux, and only pages no other process maps), so
+every load reads the disk; without it the runs after the first are warm.
+
+    python -m scry_pkg.scry_bench.startup --server model --runs 3 --cold
+    python -m scry_pkg.scry_bench.startup --server fake --runs 5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import websockets
+from typing import Dict, List
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_bench.ws_load import WS_DIR, READY_LINE, drain, receive
+
+
+def evict(path: str) -> bool:
+    """Drops the cached pages of `path`; False where the platform cannot."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+async def run_once(args, prefetch: bool) -> Dict[str, float]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(WS_DIR.parent.parent), os.environ.get("PYTHONPATH")])),
+               SCRY_MODEL_PREFETCH="1" if prefetch else "0")
+    if args.server == "fake":
+        env["SCRY_FAKE_ENGINE"] = "1"
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(sys.executable, "call_llama.cpp.py", cwd=WS_DIR, env=env,
+                                                   stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    try:
+        while True:
+            line = await asyncio.wait_for(process.stdout.readline(), args.timeout)
+            if not line:
+                raise RuntimeError(f"Server exited with code {await process.wait()} before listening")
+            match = READY_LINE.search(line.decode("utf-8", "replace"))
+            if match:
+                break
+        bound = time.perf_counter() - started
+        asyncio.create_task(drain(process.stdout))
+
+        loading = 0
+        async with websockets.connect(f"ws://127.0.0.1:{match.group(1)}", open_timeout=args.timeout) as websocket:
+            while True:
+                message = await receive(websocket, args.timeout)
+                if message.get("type") != "loading":
+                    break
+                loading += 1
+        if message.get("type") != "ready":
+            raise RuntimeError(f"expected ready, got {message}")
+        return {"bound": bound, "ready": time.perf_counter() - started, "loading": loading}
+    finally:
+        process.terminate()
+        await process.wait()
+
+
+def median(runs: List[Dict[str, float]], key: str) -> float:
+    return statistics.median(run[key] for run in runs)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["fake", "model"], default="model", help="fake engine or the GGUF of current_model.json")
+    parser.add_argument("--runs", type=int, default=3, help="runs per mode")
+    parser.add_argument("--prefetch", choices=["both", "on", "off"], default="both")
+    parser.add_argument("--cold", action="store_true", help="drop the GGUF from the page cache before every run")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    from scry_pkg.scry_ws import MODEL_PATH
+    model_path = str(WS_DIR / MODEL_PATH)
+    if args.cold:
+        if not os.path.exists(model_path):
+            parser.error(f"--cold needs the GGUF, {model_path} not found")
+        if not evict(model_path):
+            parser.error("--cold needs posix_fadvise (Linux)")
+
+    modes = {"both": [True, False], "on": [True], "off": [False]}[args.prefetch]
+    results: Dict[bool, List[Dict[str, float]]] = {mode: [] for mode in modes}
+    # MODES INTERLEAVED: A DRIFT OF THE DISK OR THE PAGE CACHE HITS BOTH ALIKE
+    for run in range(args.runs):
+        for mode in modes:
+            if args.cold:
+                evict(model_path)
+            result = await run_once(args, mode)
+            results[mode].append(result)
+            logger.info(f"Run {run + 1}, prefetch {'on' if mode else 'off'}: bound {result['bound']:.2f} s, "
+                        f"ready {result['ready']:.2f} s, {result['loading']} loading messages")
+
+    print(f"{args.server} server, {args.runs} runs per mode, {'cold' if args.cold else 'warm'} page cache")
+    print(f"{'prefetch':>10}{'bound s':>10}{'ready s':>10}{'loading msgs':>14}")
+    for mode, runs in results.items():
+        print(f"{'on' if mode else 'off':>10}{median(runs, 'bound'):>10.2f}{median(runs, 'ready'):>10.2f}{median(runs, 'loading'):>14.0f}")
+    if len(results) == 2:
+        on, off = median(results[True], "ready"), median(results[False], "ready")
+        print(f"time to ready: {off - on:+.2f} s saved by the prefetch ({(off - on) / off:.1%})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Generation throughput of worker mode for several worker counts.
+
+Starts a WorkerPool per count, waits until every worker loaded the model,
+then runs `--sessions` concurrent sessions sending `--prompts` prompts each
+and reports tokens/s over the whole run and the latency percentiles per prompt.
+
+    python -m scry_pkg.scry_bench.workers --model ../llama.cpp/models/qwen2.5-7b-instruct.Q4_K_M.gguf --workers 1 2 4
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from scry_pkg.scry_bench import logger
+from scry_pkg.scry_ws import MODEL_FORMATS, BATCH_SLOTS, BATCH_SIZE
+from scry_pkg.scry_ws.scheduler import GenerationRequest
+from scry_pkg.scry_ws.workers import WorkerPool
+
+QUESTIONS = [
+    "Explain how a hash map handles collisions.",
+    "Write a haiku about the sea.",
+    "What are the trade-offs of microservices?",
+    "Summarize the plot of Hamlet in three sentences.",
+]
+
+PARAMS = {"temperature": 0.7, "top_p": 0.9, "top_k": 40, "repeat_penalty": 1.1, "frequency_penalty": 0.0,
+          "presence_penalty": 0.0, "min_p": 0.05, "seed": 1, "speculative": "none", "draft_tokens": 4}
+
+
+async def run_session(pool: WorkerPool, session: int, prompts: int, max_tokens: int, latencies: list) -> int:
+    tokens = 0
+    history = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(prompts):
+        history.append({"role": "user", "content": QUESTIONS[(session + i) % len(QUESTIONS)]})
+        request = GenerationRequest(f"s{session}-p{i}", list(history), PARAMS, max_tokens, session_id=f"s{session}")
+        started = time.perf_counter()
+        pool.submit(request)
+        text = []
+        while True:
+            kind, payload = await request.events.get()
+            if kind == "token":
+                text.append(payload)
+                continue
+            if kind == "complete":
+                tokens += payload["tokens"]
+            else:
+                logger.warning(f"Prompt {request.prompt_id} ended with {kind}: {payload}")
+            break
+        latencies.append(time.perf_counter() - started)
+        history.append({"role": "assistant", "content": "".join(text)})
+    return tokens
+
+
+async def run_workers(args, n_workers: int) -> dict:
+    name = args.model.rsplit("/", 1)[-1]
+    pool = WorkerPool(n_workers, args.model, MODEL_FORMATS.get(name, "chatml"), n_ctx=args.n_ctx, n_slots=BATCH_SLOTS, n_batch=BATCH_SIZE)
+    pool.start(asyncio.get_running_loop())
+    load = time.perf_counter()
+    while not all(worker.ready for worker in pool.workers):
+        await asyncio.sleep(0.1)
+    load = time.perf_counter() - load
+
+    latencies = []
+    wall = time.perf_counter()
+    counts = await asyncio.gather(*(run_session(pool, s, args.prompts, args.tokens, latencies) for s in range(args.sessions)))
+    wall = time.perf_counter() - wall
+    pool.close()
+
+    latencies.sort()
+    pick = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+    return {
+        "workers": n_workers,
+        "load_s": round(load, 1),
+        "tokens": sum(counts),
+        "tokens_per_s": round(sum(counts) / wall, 1),
+        "p50_s": round(statistics.median(latencies), 2),
+        "p95_s": round(pick(0.95), 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="path of the GGUF")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--prompts", type=int, default=4, help="prompts per session")
+    parser.add_argument("--tokens", type=int, default=128, help="max tokens per reply")
+    parser.add_argument("--n-ctx", type=int, default=8000)
+    args = parser.parse_args()
+
+    logger.info(f"Worker benchmark: {args.sessions} sessions x {args.prompts} prompts, {args.tokens} tokens max")
+    print(f"{'workers':>8}{'load s':>8}{'tokens':>9}{'tok/s':>9}{'p50 s':>8}{'p95 s':>8}")
+    for n in args.workers:
+        r = await run_workers(args, n)
+        print(f"{r['workers']:>8}{r['load_s']:>8}{r['tokens']:>9}{r['tokens_per_s']:>9}{r['p50_s']:>8}{r['p95_s']:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,315 @@
+"""
+Load test of the WebSocket chat protocol (loading -> ready -> prompt -> started/token/complete, cancel, clear_history).
+
+Opens `--sessions` concurrent client sessions, each sending `--prompts`
+prompts with a think time between them, and reports time to first token,
+inter-token latency (gap between token frames), end-to-end latency,
+throughput and error rates. With --flooders, that many extra sessions keep
+--flood-depth prompts in flight the whole run; the report then covers the
+regular sessions only, which is how fairness of the admission queue shows.
+Cancelled prompts (--cancel-rate) are cancelled after their first token, or
+--cancel-after-ms after sending (mid-prefill for long prompts); the time
+from the cancel to their complete message is reported as cancel latency.
+The target is a running server (--url), or one
+started for the run: --server fake uses the deterministic FakeEngine (no
+GGUF needed, tokens at --fake-rate per sequence), --server model the GGUF of
+current_model.json.
+
+    python -m scry_pkg.scry_bench.ws_load --server fake --sessions 32 --prompts 10
+    python -m scry_pkg.scry_bench.ws_load --server fake --sessions 8 --flooders 1 --flood-depth 16
+    python -m scry_pkg.scry_bench.ws_load --server fake --cancel-rate 0.5 --cancel-after-ms 200 --prompt-words 400 800 --fake-prefill-rate 200
+    python -m scry_pkg.scry_bench.ws_load --url ws://127.0.0.1:8765 --sessions 8 --think-ms 2000
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import websockets
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from scry_pkg.scry_bench import logger
+
+WS_DIR = Path(__file__).resolve().parent.parent / "scry_ws"
+READY_LINE = re.compile(r"running on ws://[^:]+:(\d+)")
+
+VOCABULARY = ("explain compare summarize list describe why how what when the a of in for with system network memory "
+              "cache latency python rust database index query thread process kernel model token prompt history "
+              "server client protocol frame socket benchmark budget policy session").split()
+
+
+class Results:
+    __slots__ = ('ttft', 'itl', 'e2e', 'cancel', 'tokens', 'prompts', 'completed', 'cancelled', 'errors', 'timeouts',
+                 'connect_errors', 'error_messages')
+
+    def __init__(self):
+        self.ttft: List[float] = []
+        self.itl: List[float] = []
+        self.e2e: List[float] = []
+        self.cancel: List[float] = []
+        self.tokens = 0
+        self.prompts = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.connect_errors = 0
+        self.error_messages: Dict[str, int] = {}
+
+
+def prompt_words(rng: random.Random, args) -> int:
+    low, high = args.prompt_words
+    if args.prompt_dist == "lognormal":
+        # MEDIAN AT THE GEOMETRIC MEAN OF THE RANGE, LONG TAIL TOWARDS `high`
+        median = (low * high) ** 0.5
+        return int(min(max(rng.lognormvariate(0, 0.6) * median, low), high))
+    return rng.randint(low, high)
+
+
+def think_seconds(rng: random.Random, args) -> float:
+    mean = args.think_ms / 1000
+    if args.think_dist == "exp":
+        return rng.expovariate(1 / mean) if mean > 0 else 0.0
+    if args.think_dist == "uniform":
+        return rng.uniform(0, 2 * mean)
+    return mean
+
+
+async def receive(websocket, timeout: float):
+    message = await asyncio.wait_for(websocket.recv(), timeout)
+    if isinstance(message, bytes):
+        return {"type": "token"}
+    return json.loads(message)
+
+
+async def wait_ready(websocket, timeout: float):
+    """The ready message, after the loading messages of a server still loading its model."""
+    message = await receive(websocket, timeout)
+    while message.get("type") == "loading":
+        message = await receive(websocket, timeout)
+    if message.get("type") != "ready":
+        raise RuntimeError(f"expected ready, got {message}")
+    return message
+
+
+async def run_prompt(websocket, session: int, n: int, rng: random.Random, args, results: Results) -> bool:
+    """One prompt/response exchange; returns False when the session cannot go on."""
+    prompt_id = f"s{session}-p{n}"
+    prompt = " ".join(rng.choice(VOCABULARY) for _ in range(prompt_words(rng, args)))
+    action = {"action": "prompt", "prompt": prompt, "promptId": prompt_id, "stats": True}
+    if args.stream_window_ms is not None:
+        action["stream"] = {"windowMs": args.stream_window_ms, "flushChars": args.stream_flush_chars, "binary": args.binary}
+    cancel = rng.random() < args.cancel_rate
+    cancel_sent = None
+
+    async def send_cancel():
+        nonlocal cancel_sent
+        cancel_sent = time.perf_counter()
+        await websocket.send(json.dumps({"action": "cancel", "promptId": prompt_id}))
+
+    results.prompts += 1
+    sent = time.perf_counter()
+    await websocket.send(json.dumps(action))
+    first = last = None
+    frames = 0
+    timer = None
+    if cancel and args.cancel_after_ms is not None:
+        timer = asyncio.get_running_loop().call_later(args.cancel_after_ms / 1000, lambda: asyncio.ensure_future(send_cancel()))
+    try:
+        while True:
+            message = await receive(websocket, args.timeout)
+            kind = message.get("type")
+            if kind == "token":
+                now = time.perf_counter()
+                if first is None:
+                    first = now
+                    results.ttft.append(now - sent)
+                    if cancel and timer is None:
+                        await send_cancel()
+                else:
+                    results.itl.append(now - last)
+                last = now
+                frames += 1
+            elif kind == "error":
+                results.errors += 1
+                error = message.get("error", "?")
+                results.error_messages[error] = results.error_messages.get(error, 0) + 1
+                return True
+            elif kind == "complete":
+                if cancel_sent is not None:
+                    results.cancelled += 1
+                    results.cancel.append(time.perf_counter() - cancel_sent)
+                    return True
+                if timer is not None:
+                    timer.cancel()
+                results.completed += 1
+                results.e2e.append(time.perf_counter() - sent)
+                # THE STATS MESSAGE FOLLOWS: SERVER-SIDE TOKEN COUNT (FRAMES MAY BE COALESCED)
+                stats = await receive(websocket, args.timeout)
+                results.tokens += stats.get("generatedTokens", frames) if stats.get("type") == "stats" else frames
+                return True
+    except asyncio.TimeoutError:
+        results.timeouts += 1
+        return False
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+async def run_session(url: str, session: int, args, results: Results) -> None:
+    rng = random.Random(args.seed * 100003 + session)
+    # STAGGERED CONNECTS: A THUNDERING HERD IS NOT WHAT THIS MEASURES
+    await asyncio.sleep(rng.uniform(0, args.ramp_s))
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=args.timeout) as websocket:
+            await wait_ready(websocket, args.timeout)
+            for n in range(args.prompts):
+                await asyncio.sleep(think_seconds(rng, args))
+                if args.clear_every and n and n % args.clear_every == 0:
+                    await websocket.send(json.dumps({"action": "clear_history"}))
+                    while (await receive(websocket, args.timeout)).get("type") != "memory_cleared":
+                        pass
+                if not await run_prompt(websocket, session, n, rng, args, results):
+                    return
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException, RuntimeError) as e:
+        results.connect_errors += 1
+        logger.warning(f"Session {session}: {type(e).__name__}: {e}")
+
+
+async def run_flooder(url: str, flooder: int, args, stop: asyncio.Event, results: Results) -> None:
+    """Keeps `--flood-depth` prompts of one session in flight until `stop` is set."""
+    rng = random.Random(args.seed * 100003 - flooder - 1)
+    n = 0
+
+    async def send(websocket):
+        nonlocal n
+        prompt = " ".join(rng.choice(VOCABULARY) for _ in range(prompt_words(rng, args)))
+        await websocket.send(json.dumps({"action": "prompt", "prompt": prompt, "promptId": f"f{flooder}-p{n}",
+                                         "priority": args.flood_priority}))
+        results.prompts += 1
+        n += 1
+
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=args.timeout) as websocket:
+            await wait_ready(websocket, args.timeout)
+            for _ in range(args.flood_depth):
+                await send(websocket)
+            while not stop.is_set():
+                try:
+                    message = await receive(websocket, 0.5)
+                except asyncio.TimeoutError:
+                    continue
+                if message.get("type") in ("complete", "error"):
+                    if message["type"] == "complete":
+                        results.completed += 1
+                    else:
+                        results.errors += 1
+                    await send(websocket)
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        results.connect_errors += 1
+        logger.warning(f"Flooder {flooder}: {type(e).__name__}: {e}")
+
+
+async def start_server(args) -> Tuple[asyncio.subprocess.Process, str]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(WS_DIR.parent.parent), os.environ.get("PYTHONPATH")])))
+    if args.server == "fake":
+        env.update(SCRY_FAKE_ENGINE="1", SCRY_FAKE_ENGINE_RATE=str(args.fake_rate),
+                   SCRY_FAKE_ENGINE_PREFILL_RATE=str(args.fake_prefill_rate), SCRY_FAKE_ENGINE_REPLY_TOKENS=str(args.fake_reply_tokens))
+    process = await asyncio.create_subprocess_exec(sys.executable, "call_llama.cpp.py", cwd=WS_DIR, env=env,
+                                                   stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    while True:
+        line = await process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Server exited with code {await process.wait()} before listening")
+        match = READY_LINE.search(line.decode("utf-8", "replace"))
+        if match:
+            break
+    # KEEP DRAINING THE LOG SO THE SERVER NEVER BLOCKS ON A FULL PIPE
+    asyncio.create_task(drain(process.stdout))
+    return process, f"ws://127.0.0.1:{match.group(1)}"
+
+
+async def drain(stream) -> None:
+    while await stream.readline():
+        pass
+
+
+def percentiles(samples: List[float]) -> List[Optional[float]]:
+    if not samples:
+        return [None, None, None]
+    ordered = sorted(samples)
+    return [round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 1) for q in (0.5, 0.95, 0.99)]
+
+
+def report(results: Results, wall: float, args) -> None:
+    print(f"{args.sessions} sessions x {args.prompts} prompts in {wall:.1f} s")
+    print(f"{'':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, samples in (("ttft", results.ttft), ("inter-token", results.itl), ("end-to-end", results.e2e),
+                          ("cancel", results.cancel)):
+        row = "".join(f"{'-' if v is None else v:>10}" for v in percentiles(samples))
+        print(f"{name:>12}{row}")
+    prompts = max(results.prompts, 1)
+    print(f"throughput: {results.tokens / wall:.1f} tokens/s, {results.completed / wall:.2f} prompts/s")
+    print(f"prompts: {results.prompts} sent, {results.completed} complete, {results.cancelled} cancelled, "
+          f"{results.errors} errors ({results.errors / prompts:.1%}), {results.timeouts} timeouts, "
+          f"{results.connect_errors} failed sessions")
+    for error, count in sorted(results.error_messages.items(), key=lambda item: -item[1]):
+        print(f"  {count:>5} x {error}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://127.0.0.1:8765", help="server to load when --server is none")
+    parser.add_argument("--server", choices=["none", "fake", "model"], default="none", help="start a server for the run")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--prompts", type=int, default=5, help="prompts per session")
+    parser.add_argument("--prompt-words", type=int, nargs=2, default=[8, 200], metavar=("MIN", "MAX"))
+    parser.add_argument("--prompt-dist", choices=["uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between the prompts of a session")
+    parser.add_argument("--think-dist", choices=["const", "exp", "uniform"], default="exp")
+    parser.add_argument("--ramp-s", type=float, default=1.0, help="sessions connect spread over this many seconds")
+    parser.add_argument("--cancel-rate", type=float, default=0.0, help="share of prompts cancelled after their first token")
+    parser.add_argument("--cancel-after-ms", type=float, help="cancel that long after sending instead, e.g. during prefill")
+    parser.add_argument("--clear-every", type=int, default=0, help="send clear_history every N prompts (0 = never)")
+    parser.add_argument("--stream-window-ms", type=int, default=None, help="negotiate coalesced frames with this window")
+    parser.add_argument("--stream-flush-chars", type=int, default=256)
+    parser.add_argument("--binary", action="store_true", help="binary token frames (with --stream-window-ms)")
+    parser.add_argument("--flooders", type=int, default=0, help="extra sessions flooding the server, left out of the report")
+    parser.add_argument("--flood-depth", type=int, default=16, help="prompts each flooder keeps in flight")
+    parser.add_argument("--flood-priority", choices=["high", "normal", "low"], default="normal")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds without a message before a prompt times out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-rate", type=float, default=50.0, help="fake engine: tokens/s per sequence")
+    parser.add_argument("--fake-prefill-rate", type=float, default=2000.0, help="fake engine: prompt tokens/s")
+    parser.add_argument("--fake-reply-tokens", type=int, default=64, help="fake engine: tokens per reply")
+    args = parser.parse_args()
+
+    process, url = None, args.url
+    if args.server != "none":
+        process, url = await start_server(args)
+        logger.info(f"Started {args.server} server on {url}")
+
+    logger.info(f"WebSocket load: {args.sessions} sessions x {args.prompts} prompts against {url}")
+    results, flood = Results(), Results()
+    stop = asyncio.Event()
+    flooders = [asyncio.create_task(run_flooder(url, f, args, stop, flood)) for f in range(args.flooders)]
+    try:
+        wall = time.perf_counter()
+        await asyncio.gather(*(run_session(url, s, args, results) for s in range(args.sessions)))
+        wall = time.perf_counter() - wall
+        stop.set()
+        await asyncio.gather(*flooders)
+    finally:
+        if process is not None:
+            process.terminate()
+            await process.wait()
+    report(results, wall, args)
+    if args.flooders:
+        print(f"flooders: {flood.prompts} sent, {flood.completed} complete, {flood.errors} errors")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
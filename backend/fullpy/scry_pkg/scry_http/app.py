@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from scry_pkg.scry_http import logger
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from scry_pkg.scry_metrics.middleware import instrument
 from scry_pkg.scry_http.routers.prompt_router import prompt_router
 from scry_pkg.scry_http.routers.switch_routers import switch_routers 
 from scry_pkg.scry_http.routers.configs_routers import configs_routers
@@ -39,6 +40,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# REQUEST METRICS AND GET /metrics
+instrument(app, "scry_http")
+
 # INCLUDE ROUTER
 app.include_router(switch_routers)
 app.include_router(configs_routers)
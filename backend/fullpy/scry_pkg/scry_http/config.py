@@ -1,4 +1,5 @@
 from scry_pkg.scry_http import logger
+from typing import Optional
 from pydantic import BaseModel
 class ModelSwitchRequest(BaseModel):
     model_name: str
@@ -7,4 +8,6 @@ class ModelSwitchResponse(BaseModel):
     status: str
     current_model: str
     message: str
-    needs_restart: bool
\ No newline at end of file
+    needs_restart: bool
+    switch_seconds: Optional[float] = None
+    downtime_seconds: Optional[float] = None
@@ -33,15 +33,17 @@ async def switch_model(request: ModelSwitchRequest):
         logger.error(f"Error saving configuration for: {request.model_name}")
         raise HTTPException(status_code=500, detail="Error saving configuration")
 
-    # WAITS FOR CONFIRMATION
-    websocket_ok = await wait_for_websocket_confirmation(request.model_name, 60)
+    # WAITS FOR CONFIRMATION: THE WEBSOCKET SERVER LOADS THE MODEL AND SWAPS IT IN
+    confirmation = await wait_for_websocket_confirmation(request.model_name, 60)
 
-    if websocket_ok:
+    if confirmation:
         return ModelSwitchResponse(
             status="success",
             current_model=request.model_name,
             message=f"Model changed to {request.model_name} successfully",
-            needs_restart=False
+            needs_restart=False,
+            switch_seconds=confirmation.get("switchSeconds"),
+            downtime_seconds=confirmation.get("downtimeSeconds")
         )
     else:
         return ModelSwitchResponse(
@@ -5,6 +5,8 @@ import json
 from itertools import chain
 from datetime import datetime
 import asyncio
+import websockets
+from typing import Optional
 # MAIN FUNCTIONS
 async def get_current_model() -> str:
     """Reads the current model from the configuration file"""
@@ -102,13 +104,35 @@ async def model_exists(model_name: str) -> bool:
         logger.error(f"Error verifying model: {e}")
         return False
 
-async def wait_for_websocket_confirmation(model_name: str, timeout: int = 60) -> bool:
-    """Waits for WebSocket confirmation"""
+async def wait_for_websocket_confirmation(model_name: str, timeout: int = 60) -> Optional[dict]:
+    """Asks the WebSocket server to switch models and waits for its confirmation"""
+    # IMPORTED HERE: THE PACKAGE READS current_model.json, WHICH MAY NOT EXIST BEFORE THE FIRST SWITCH
+    from scry_pkg.scry_ws import FALLBACK_PORTS_WEBSOCKET
+    logger.info(f"Waiting for WebSocket confirmation: {model_name}")
     try:
-        logger.info(f"Waiting for WebSocket confirmation: {model_name}")
-        await asyncio.sleep(2)
-        logger.info("WebSocket confirmation received")
-        return True
+        async with asyncio.timeout(timeout):
+            for port in FALLBACK_PORTS_WEBSOCKET:
+                try:
+                    websocket = await websockets.connect(f"ws://127.0.0.1:{port}")
+                except OSError:
+                    continue
+                async with websocket:
+                    await websocket.send(json.dumps({"action": "switch_model", "model": model_name}))
+                    async for message in websocket:
+                        if isinstance(message, bytes):
+                            continue
+                        data = json.loads(message)
+                        if data.get("type") == "model_switched":
+                            logger.info(f"WebSocket confirmation received: {data}")
+                            return data
+                        if data.get("type") == "model_switch_failed":
+                            logger.error(f"WebSocket switch failed: {data.get('error')}")
+                            return None
+            logger.error("WebSocket server not reachable")
+            return None
+    except TimeoutError:
+        logger.error(f"WebSocket confirmation timed out after {timeout}s: {model_name}")
+        return None
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        return False
\ No newline at end of file
+        return None
@@ -0,0 +1,11 @@
+"""Counters, gauges and histograms of the Python servers, exposed in the Prometheus text format on /metrics"""
+from scry_pkg.utils import setup_logging
+# LOGGING CONFIGURATION
+logger = setup_logging('METRICS')
+
+# HISTOGRAM BUCKETS: LATENCIES IN SECONDS AND THROUGHPUTS IN TOKENS PER SECOND
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# CONTENT TYPE OF THE TEXT EXPOSITION FORMAT
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,53 @@
+"""Request metrics and the /metrics route for the FastAPI servers (HTTP API, SSE downloads)"""
+import time
+from fastapi import FastAPI
+from fastapi.responses import Response
+from scry_pkg.scry_metrics import CONTENT_TYPE
+from scry_pkg.scry_metrics.registry import REGISTRY
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware: counts requests by method, route template and
+    status, and times them until the last body chunk is sent, so a streamed
+    (SSE) response counts for its whole duration.
+    """
+
+    def __init__(self, app, prefix: str):
+        self.app = app
+        self.requests = REGISTRY.counter(f"{prefix}_requests_total", "HTTP requests handled", ("method", "route", "status"))
+        self.duration = REGISTRY.histogram(f"{prefix}_request_duration_seconds", "HTTP request duration", ("method", "route"))
+        self.in_flight = REGISTRY.gauge(f"{prefix}_requests_in_flight", "HTTP requests being handled")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            self.in_flight.dec()
+            # ROUTE TEMPLATE, NOT THE RAW PATH: ONE SERIES PER ENDPOINT WHATEVER THE MODEL ID
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.requests.inc(method=scope["method"], route=route, status=status)
+            self.duration.observe(time.perf_counter() - started, method=scope["method"], route=route)
+
+
+def instrument(app: FastAPI, prefix: str) -> None:
+    """Adds the request metrics middleware and GET /metrics to `app`."""
+    app.add_middleware(MetricsMiddleware, prefix=prefix)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
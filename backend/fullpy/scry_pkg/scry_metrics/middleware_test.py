@@ -0,0 +1,50 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from scry_pkg.scry_metrics import CONTENT_TYPE
+from scry_pkg.scry_metrics.middleware import instrument
+from scry_pkg.scry_metrics.registry import REGISTRY
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    instrument(app, "scry_mwtest")
+
+    @app.get("/models/{model_id}")
+    async def model(model_id: str):
+        return {"id": model_id}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for chunk in ("a", "b"):
+                await asyncio.sleep(0.05)
+                yield chunk
+        return StreamingResponse(chunks())
+
+    return app
+
+
+def test_requests_are_counted_by_route_template_and_status():
+    client = TestClient(make_app())
+    assert client.get("/models/one").status_code == 200
+    assert client.get("/models/two").status_code == 200
+    assert client.get("/missing").status_code == 404
+    requests = REGISTRY.counter("scry_mwtest_requests_total", "")
+    assert requests.get(method="GET", route="/models/{model_id}", status="200") == 2
+    assert requests.get(method="GET", route="unmatched", status="404") == 1
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"] == CONTENT_TYPE
+    assert 'scry_mwtest_requests_total{method="GET",route="/models/{model_id}",status="200"} 2' in response.text
+    # THE SCRAPE ITSELF IS THE ONE REQUEST IN FLIGHT
+    assert "scry_mwtest_requests_in_flight 1" in response.text
+
+
+def test_streamed_response_is_timed_until_its_last_chunk():
+    client = TestClient(make_app())
+    assert client.get("/stream").text == "ab"
+    duration = REGISTRY.histogram("scry_mwtest_request_duration_seconds", "")
+    _, total = duration._values[("GET", "/stream")]
+    assert total >= 0.1
@@ -0,0 +1,51 @@
+import pytest
+from scry_pkg.scry_metrics.registry import Registry
+
+
+def test_counter_renders_one_sample_per_label_set():
+    registry = Registry()
+    counter = registry.counter("scry_test_total", "Test counter", ("model", "outcome"))
+    counter.inc(model="a", outcome="complete")
+    counter.inc(2, model="a", outcome="complete")
+    counter.inc(model='quo"te', outcome="error")
+    assert counter.get(model="a", outcome="complete") == 3
+    assert registry.render().splitlines() == [
+        "# HELP scry_test_total Test counter",
+        "# TYPE scry_test_total counter",
+        'scry_test_total{model="a",outcome="complete"} 3',
+        'scry_test_total{model="quo\\"te",outcome="error"} 1',
+    ]
+
+
+def test_wrong_labels_are_refused():
+    counter = Registry().counter("scry_test_total", "Test counter", ("model",))
+    with pytest.raises(ValueError):
+        counter.inc(source="miss")
+
+
+def test_registering_a_name_twice_returns_the_first_metric():
+    registry = Registry()
+    first = registry.counter("scry_test_total", "Test counter")
+    assert registry.counter("scry_test_total", "Again") is first
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("scry_test_seconds", "Test histogram", ("model",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, model="a")
+    assert registry.render().splitlines()[2:] == [
+        'scry_test_seconds_bucket{model="a",le="0.1"} 1',
+        'scry_test_seconds_bucket{model="a",le="1"} 3',
+        'scry_test_seconds_bucket{model="a",le="+Inf"} 4',
+        'scry_test_seconds_sum{model="a"} 6.05',
+        'scry_test_seconds_count{model="a"} 4',
+    ]
+
+
+def test_gauge_reads_its_function_at_every_scrape():
+    registry = Registry()
+    value = [1]
+    registry.gauge("scry_test_depth", "Test gauge", function=lambda: value[0])
+    value[0] = 7
+    assert registry.render().splitlines()[-1] == "scry_test_depth 7"
@@ -0,0 +1,15 @@
+"""Shared HTTP clients: pooled keep-alive connections, DNS cache, compression and per-host limits for search and downloads"""
+from scry_pkg.utils import setup_logging
+# LOGGING CONFIGURATION
+logger = setup_logging('NET')
+
+# CONNECTION POOL: OPEN CONNECTIONS IN TOTAL AND PER HOST, IDLE SECONDS BEFORE A KEPT-ALIVE CONNECTION IS CLOSED
+NET_LIMIT = 64
+NET_LIMIT_PER_HOST = 4
+NET_KEEPALIVE = 60.0
+
+# SECONDS A RESOLVED HOST STAYS IN THE DNS CACHE
+NET_DNS_TTL = 300
+
+# DEFAULT TIMEOUT OF A REQUEST, SECONDS (MODEL DOWNLOADS PASS THEIR OWN)
+NET_TIMEOUT = 30.0
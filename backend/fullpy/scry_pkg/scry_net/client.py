@@ -0,0 +1,260 @@
+"""
+The HTTP clients of the Python servers. HttpClient (aiohttp, event loop) and
+SyncHttpClient (urllib3, threads) keep connections alive in a pool shared by
+every caller, so a host already contacted costs no DNS, TCP or TLS setup.
+Both speak HTTP/1.1 with gzip/deflate (br and zstd when their decoders are
+installed); neither library implements HTTP/2.
+"""
+import re
+import time
+import codecs
+import asyncio
+import threading
+import weakref
+import charset_normalizer
+from typing import Dict, Optional
+from scry_pkg.scry_metrics.registry import REGISTRY
+from scry_pkg.scry_net import logger, NET_LIMIT, NET_LIMIT_PER_HOST, NET_KEEPALIVE, NET_DNS_TTL, NET_TIMEOUT
+
+REQUESTS = REGISTRY.counter("scry_net_requests_total", "HTTP requests sent by the shared clients", ("client",))
+CONNECTIONS = REGISTRY.counter("scry_net_connections_total", "Connections a request went out on: new (handshake paid) or reused",
+                               ("client", "kind"))
+CONNECT_SECONDS = REGISTRY.histogram("scry_net_connect_seconds", "DNS, TCP and TLS setup of a new connection", ("client",))
+
+DECODED = REGISTRY.counter("scry_net_decoded_total", "Response bodies decoded, by what chose the charset (bom, ascii, "
+                          "declared, utf-8, detected)", ("source",))
+
+CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+# LABELS BROWSERS READ AS windows-1252 (WHATWG ENCODING STANDARD): SERVERS SAY latin-1 FOR CP1252 TEXT
+WINDOWS_1252 = {"iso8859-1", "ascii"}
+# A PAGE DECLARES ITS CHARSET IN ITS FIRST BYTES; DETECTION LOOKS AT THIS MUCH OF ITS TEXT
+PRESCAN_BYTES = 4096
+DETECT_BYTES = 64 * 1024
+
+
+def declared_charset(data: bytes, content_type: Optional[str]) -> Optional[str]:
+    """Codec name of the charset of the Content-Type header, else of a <meta> near the top of the page."""
+    match = CHARSET.search(content_type or "") or META_CHARSET.search(data, 0, PRESCAN_BYTES)
+    if match is None:
+        return None
+    label = match.group(1)
+    try:
+        name = codecs.lookup(label.decode("ascii", "replace") if isinstance(label, bytes) else label).name
+    except LookupError:
+        return None
+    return "cp1252" if name in WINDOWS_1252 else name
+
+
+def decode_body(data: bytes, content_type: Optional[str]) -> str:
+    """
+    Body text, decoded once from the raw bytes: by a byte order mark, as
+    UTF-8 when the bytes are valid UTF-8 (whatever the page declares: UTF-8
+    served as latin-1 is where mojibake comes from), in the declared charset
+    when the bytes decode in it, else in the charset charset_normalizer detects.
+    """
+    for bom, codec in BOMS:
+        if data.startswith(bom):
+            DECODED.inc(source="bom")
+            return data.decode(codec, "replace")
+    if data.isascii():
+        DECODED.inc(source="ascii")
+        return data.decode("ascii")
+    charset = declared_charset(data, content_type)
+    try:
+        text = data.decode("utf-8")
+        DECODED.inc(source="declared" if charset == "utf-8" else "utf-8")
+        return text
+    except UnicodeDecodeError:
+        pass
+    if charset is not None and charset != "utf-8":
+        try:
+            text = data.decode(charset)
+            DECODED.inc(source="declared")
+            return text
+        except (UnicodeDecodeError, LookupError):
+            pass
+    DECODED.inc(source="detected")
+    return data.decode(detect_charset(data) or charset or "utf-8", "replace")
+
+
+def detect_charset(data: bytes) -> Optional[str]:
+    """
+    charset_normalizer's guess, made on the text nodes holding non-ASCII bytes
+    only: the markup, scripts and styles around them are ASCII and would
+    drown the sample. Between equally likely single-byte charsets,
+    windows-1252, which browsers fall back to.
+    """
+    sample = b" ".join(node.rsplit(b">", 1)[-1] for node in data.split(b"<") if not node.isascii())[:DETECT_BYTES]
+    matches = list(charset_normalizer.from_bytes(sample or data[:DETECT_BYTES]))
+    if not matches:
+        return None
+    best = matches[0]
+    for match in matches:
+        if match.encoding == "cp1252" and match.chaos <= best.chaos and match.coherence >= best.coherence:
+            return "cp1252"
+    return best.encoding
+
+
+class HttpClient:
+    """
+    One aiohttp session over a keep-alive connection pool: at most `limit`
+    connections, `limit_per_host` per host (further requests wait for one),
+    idle connections closed after `keepalive` seconds, hosts resolved once per
+    `dns_ttl` seconds. The session is created on first use, on the running loop.
+    """
+
+    def __init__(self, name: str = "shared", limit: int = NET_LIMIT, limit_per_host: int = NET_LIMIT_PER_HOST,
+                 keepalive: float = NET_KEEPALIVE, dns_ttl: int = NET_DNS_TTL, timeout: float = NET_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive = keepalive
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self._session = None
+        self.requests = 0
+        self.connections = 0
+        self.reused = 0
+        self.connect_seconds = 0.0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def _trace(self):
+        import aiohttp
+        trace = aiohttp.TraceConfig()
+
+        async def request_start(session, context, params):
+            self.requests += 1
+            REQUESTS.inc(client=self.name)
+
+        async def create_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def create_end(session, context, params):
+            seconds = time.perf_counter() - context.connect_started
+            self.connections += 1
+            self.connect_seconds += seconds
+            CONNECTIONS.inc(client=self.name, kind="new")
+            CONNECT_SECONDS.observe(seconds, client=self.name)
+
+        async def reuse(session, context, params):
+            self.reused += 1
+            CONNECTIONS.inc(client=self.name, kind="reused")
+
+        async def dns_hit(session, context, params):
+            self.dns_hits += 1
+
+        async def dns_miss(session, context, params):
+            self.dns_misses += 1
+
+        trace.on_request_start.append(request_start)
+        trace.on_connection_create_start.append(create_start)
+        trace.on_connection_create_end.append(create_end)
+        trace.on_connection_reuseconn.append(reuse)
+        trace.on_dns_cache_hit.append(dns_hit)
+        trace.on_dns_cache_miss.append(dns_miss)
+        return trace
+
+    @property
+    def session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive, ttl_dns_cache=self.dns_ttl)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  auto_decompress=True, trace_configs=[self._trace()])
+        return self._session
+
+    def get(self, url: str, **kwargs):
+        """session.get: use it as `async with client.get(url) as response`."""
+        return self.session.get(url, **kwargs)
+
+    async def text(self, url: str, **kwargs) -> str:
+        """Body of a 2xx response as text; raises on anything else."""
+        async with self.get(url, **kwargs) as response:
+            response.raise_for_status()
+            return decode_body(await response.read(), response.headers.get("Content-Type"))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> Dict:
+        connections = self.connections + self.reused
+        return {"requests": self.requests, "connections": self.connections, "reused": self.reused,
+                "reuse_rate": self.reused / connections if connections else 0.0,
+                "connect_seconds": self.connect_seconds, "dns_hits": self.dns_hits, "dns_misses": self.dns_misses}
+
+
+class SyncHttpClient:
+    """
+    urllib3 PoolManager for the threads that cannot await: one pool of up to
+    `limit_per_host` kept-alive connections per host, `limit` hosts kept.
+    Thread-safe; a request waits for a free connection of its host.
+    """
+
+    def __init__(self, name: str = "shared-sync", limit: int = NET_LIMIT, limit_per_host: int = NET_LIMIT_PER_HOST,
+                 timeout: float = NET_TIMEOUT, **pool_kwargs):
+        import urllib3
+        self.name = name
+        self.timeout = timeout
+        self.pool = urllib3.PoolManager(num_pools=limit, maxsize=limit_per_host, block=True,
+                                        headers=urllib3.util.make_headers(accept_encoding=True),
+                                        retries=urllib3.Retry(total=2, redirect=5, raise_on_status=False), **pool_kwargs)
+
+    def request(self, method: str, url: str, headers: Optional[Dict] = None, timeout: Optional[float] = None):
+        # PER-REQUEST HEADERS REPLACE THE POOL'S INSTEAD OF EXTENDING THEM
+        headers = {**self.pool.headers, **(headers or {})}
+        REQUESTS.inc(client=self.name)
+        return self.pool.request(method, url, headers=headers, timeout=timeout or self.timeout)
+
+    def text(self, url: str, headers: Optional[Dict] = None, timeout: Optional[float] = None) -> str:
+        """Body of a 2xx response as text; raises on anything else."""
+        response = self.request("GET", url, headers, timeout)
+        if not 200 <= response.status < 300:
+            raise IOError(f"HTTP {response.status} for {url}")
+        return decode_body(response.data, response.headers.get("Content-Type"))
+
+    def close(self) -> None:
+        self.pool.clear()
+
+    def stats(self) -> Dict:
+        # COUNTED BY THE HOST POOLS STILL KEPT (urllib3 TRACES NOTHING PER REQUEST)
+        pools = [self.pool.pools[key] for key in self.pool.pools.keys()]
+        requests = sum(p.num_requests for p in pools)
+        connections = sum(p.num_connections for p in pools)
+        return {"requests": requests, "connections": connections, "reused": max(requests - connections, 0),
+                "reuse_rate": max(requests - connections, 0) / requests if requests else 0.0}
+
+
+# ONE ASYNC CLIENT PER EVENT LOOP (AN aiohttp SESSION IS BOUND TO ITS LOOP), ONE SYNC CLIENT PER PROCESS
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, HttpClient]" = weakref.WeakKeyDictionary()
+_sync_client: Optional[SyncHttpClient] = None
+_sync_lock = threading.Lock()
+
+
+def shared_client() -> HttpClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = HttpClient()
+    return client
+
+
+def shared_sync_client() -> SyncHttpClient:
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None:
+            _sync_client = SyncHttpClient()
+        return _sync_client
+
+
+async def close_shared() -> None:
+    """Closes the async client of the running loop; call it before the loop stops."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        logger.info(f"HTTP client: {client.stats()}")
+        await client.close()
@@ -0,0 +1,84 @@
+import codecs
+import asyncio
+from aiohttp import web
+from scry_pkg.scry_net.client import HttpClient, declared_charset, decode_body, detect_charset
+
+FRENCH = "Les élèves ont répondu à la dernière question, même après l'heure prévue. " * 4
+
+
+def test_declared_charset_from_header_then_meta():
+    assert declared_charset(b"", "text/html; charset=UTF-8") == "utf-8"
+    assert declared_charset(b'<meta charset="shift_jis">', "text/html") == "shift_jis"
+    assert declared_charset(b'<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">', None) == "koi8-r"
+    assert declared_charset(b"<p>no charset</p>", "text/html") is None
+    assert declared_charset(b"", "text/html; charset=no-such-charset") is None
+
+
+def test_latin1_and_ascii_labels_read_as_windows_1252():
+    assert declared_charset(b"", "text/html; charset=ISO-8859-1") == "cp1252"
+    assert declared_charset(b"", "text/html; charset=us-ascii") == "cp1252"
+
+
+def test_bom_wins_over_everything():
+    assert decode_body(codecs.BOM_UTF8 + "café".encode("utf-8"), "text/html; charset=cp1252") == "café"
+    assert decode_body(codecs.BOM_UTF16_LE + "café".encode("utf-16-le"), None) == "café"
+
+
+def test_ascii_and_valid_utf8_bodies():
+    assert decode_body(b"<p>plain</p>", "text/html; charset=shift_jis") == "<p>plain</p>"
+    # VALID UTF-8 IS UTF-8 EVEN WHEN THE SERVER SAYS latin-1: NO MOJIBAKE
+    assert decode_body("<p>café</p>".encode("utf-8"), "text/html; charset=iso-8859-1") == "<p>café</p>"
+
+
+def test_declared_charset_when_the_bytes_are_not_utf8():
+    # 0x93 0x94 ARE CURLY QUOTES IN WINDOWS-1252, CONTROL CHARACTERS IN TRUE LATIN-1
+    body = "<p>“café”</p>".encode("cp1252")
+    assert decode_body(body, "text/html; charset=iso-8859-1") == "<p>“café”</p>"
+    assert decode_body("<p>привет</p>".encode("koi8-r"), "text/html; charset=koi8-r") == "<p>привет</p>"
+
+
+def test_undeclared_charset_is_detected():
+    body = f"<html><body><p>{FRENCH}</p></body></html>".encode("cp1252")
+    assert detect_charset(body) == "cp1252"
+    assert decode_body(body, "text/html") == f"<html><body><p>{FRENCH}</p></body></html>"
+
+
+async def serve_text(text: bytes, content_type: str):
+    async def handler(request):
+        return web.Response(body=text, headers={"Content-Type": content_type})
+
+    app = web.Application()
+    app.add_routes([web.get("/{name}", handler)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def test_client_reuses_its_keep_alive_connection():
+    async def run():
+        runner, base = await serve_text("café".encode("cp1252"), "text/plain; charset=iso-8859-1")
+        client = HttpClient("test", limit_per_host=1)
+        try:
+            texts = [await client.text(f"{base}/{name}") for name in ("a", "b", "c")]
+            return texts, client.stats()
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    texts, stats = asyncio.run(run())
+    assert texts == ["café"] * 3
+    assert stats["requests"] == 3 and stats["connections"] == 1 and stats["reused"] == 2
+
+
+def test_session_is_created_again_after_close():
+    async def run():
+        client = HttpClient("test")
+        first = client.session
+        await client.close()
+        second = client.session
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is not second and first.closed
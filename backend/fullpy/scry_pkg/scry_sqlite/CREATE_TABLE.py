@@ -1,3 +1,5 @@
 from scry_pkg.scry_sqlite.control_config import ControlConfig
+from scry_pkg.scry_sqlite.runtime_profile import RuntimeProfile
 control = ControlConfig()
-control.create()
\ No newline at end of file
+control.create()
+RuntimeProfile().create()
\ No newline at end of file
@@ -13,13 +13,35 @@ class ControlConfig:
         frequency_penalty REAL DEFAULT 0.0,
         presence_penalty REAL DEFAULT 0.0,
         min_p REAL DEFAULT 0.05, tfs_z REAL DEFAULT 1.0,
-        mirostat_tau REAL DEFAULT 5.0, seed INTEGER, stop TEXT)"""
+        mirostat_tau REAL DEFAULT 5.0, seed INTEGER, stop TEXT,
+        speculative TEXT DEFAULT 'none', draft_model TEXT, draft_tokens INTEGER DEFAULT 4,
+        n_ctx INTEGER, type_k TEXT DEFAULT 'f16', type_v TEXT DEFAULT 'f16',
+        rope_scaling TEXT DEFAULT 'model', rope_freq_scale REAL,
+        use_mlock INTEGER DEFAULT 1, use_mmap INTEGER DEFAULT 1)"""
+
+    # COLUMNS ADDED AFTER THE FIRST RELEASE: ADDED TO OLDER DATABASES ON FIRST USE
+    MIGRATIONS = {
+        'speculative': "TEXT DEFAULT 'none'",
+        'draft_model': "TEXT",
+        'draft_tokens': "INTEGER DEFAULT 4",
+        'n_ctx': "INTEGER",
+        'type_k': "TEXT DEFAULT 'f16'",
+        'type_v': "TEXT DEFAULT 'f16'",
+        'rope_scaling': "TEXT DEFAULT 'model'",
+        'rope_freq_scale': "REAL",
+        'use_mlock': "INTEGER DEFAULT 1",
+        'use_mmap': "INTEGER DEFAULT 1",
+    }
+    _migrated = False
     
     # SAFE DEFAULTS: Balanced for 1B-7B+ models
     SAFE_DEFAULTS = {
         'temperature': 0.7, 'top_p': 0.9, 'top_k': 40, 'tokens': 512,
         'repeat_penalty': 1.1, 'frequency_penalty': 0.0, 'presence_penalty': 0.0,
-        'min_p': 0.05, 'tfs_z': 1.0, 'mirostat_tau': 5.0, 'seed': None, 'stop': None
+        'min_p': 0.05, 'tfs_z': 1.0, 'mirostat_tau': 5.0, 'seed': None, 'stop': None,
+        'speculative': 'none', 'draft_model': None, 'draft_tokens': 4,
+        'n_ctx': None, 'type_k': 'f16', 'type_v': 'f16', 'rope_scaling': 'model', 'rope_freq_scale': None,
+        'use_mlock': True, 'use_mmap': True
     }
     
     # VALIDATION: Safety ranges for all parameters
@@ -37,18 +59,38 @@ class ControlConfig:
         'mirostat_tau': lambda v: isinstance(v, (int, float)) and 0 <= v <= 10,
         'seed': lambda v: v is None or (isinstance(v, int) and 0 <= v <= 2**32-1),
         'stop': lambda v: v is None or (isinstance(v, list) and all(isinstance(s, str) for s in v)),
+        # SPECULATIVE DECODING: "draft" NEEDS A GGUF FROM THE MODELS DIRECTORY, "lookup" NEEDS NO MODEL
+        'speculative': lambda v: v in ('none', 'draft', 'lookup'),
+        'draft_model': lambda v: v is None or (isinstance(v, str) and v.endswith('.gguf') and '/' not in v and '\\' not in v),
+        'draft_tokens': lambda v: isinstance(v, int) and 1 <= v <= 16,
+        # LOAD PROFILE: READ WHEN THE MODEL IS LOADED, A CHANGE NEEDS A RELOAD. n_ctx NULL = SERVER DEFAULT
+        'n_ctx': lambda v: v is None or (isinstance(v, int) and 512 <= v <= 131072),
+        # KV CACHE PRECISION: q8_0 HALVES ITS RAM, q4_0 QUARTERS IT (A QUANTIZED V CACHE NEEDS FLASH ATTENTION)
+        'type_k': lambda v: v in ('f16', 'q8_0', 'q4_0'),
+        'type_v': lambda v: v in ('f16', 'q8_0', 'q4_0'),
+        # "model" KEEPS THE GGUF SETTING; rope_freq_scale NULL = n_ctx_train / n_ctx WHEN SCALING PAST THE TRAINED CONTEXT
+        'rope_scaling': lambda v: v in ('model', 'none', 'linear', 'yarn'),
+        'rope_freq_scale': lambda v: v is None or (isinstance(v, (int, float)) and 0 < v <= 1),
+        'use_mlock': lambda v: isinstance(v, bool),
+        'use_mmap': lambda v: isinstance(v, bool),
     }
     
     # FIELD ORDER: Matches database column order (excluding id_model)
     FIELDS = ['temperature', 'top_p', 'top_k', 'tokens', 'repeat_penalty',
               'frequency_penalty', 'presence_penalty', 'min_p', 'tfs_z',
-              'mirostat_tau', 'seed', 'stop']
+              'mirostat_tau', 'seed', 'stop', 'speculative', 'draft_model', 'draft_tokens',
+              'n_ctx', 'type_k', 'type_v', 'rope_scaling', 'rope_freq_scale', 'use_mlock', 'use_mmap']
+
+    # STORED AS 0/1, RETURNED AS BOOLEANS
+    BOOLEANS = ('use_mlock', 'use_mmap')
     
     def __init__(self, configs=None):
         self.configs = configs or {}
         
         current_dir = os.path.dirname(os.path.abspath(__file__))
         self.__DB_FILE = os.path.join(current_dir, "config_model.sqlite")
+        if not ControlConfig._migrated:
+            self._migrate()
     
     def _valid(self, key, value):
         return key in self.VALID and self.VALID[key](value)
@@ -63,6 +105,18 @@ class ControlConfig:
             logger.error(f"DB: {e}")
             return None
     
+    def _migrate(self):
+        cur = self._db("PRAGMA table_info(configModel)")
+        if not cur:
+            return
+        existing = {row[1] for row in cur.fetchall()}
+        if existing:
+            for column, definition in self.MIGRATIONS.items():
+                if column not in existing:
+                    self._db(f"ALTER TABLE configModel ADD COLUMN {column} {definition}")
+                    logger.info(f"DB: added column {column}")
+        ControlConfig._migrated = True
+
     def create(self):
         return bool(self._db(self.SCHEMA))
     
@@ -91,7 +145,7 @@ class ControlConfig:
                 values.append(self.SAFE_DEFAULTS[field] if field != 'stop' else None)
         
         return bool(self._db(
-            "INSERT INTO configModel VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            f"INSERT INTO configModel (id_model,{','.join(self.FIELDS)}) VALUES ({','.join('?' * len(values))})",
             values
         ))
     
@@ -149,4 +203,7 @@ class ControlConfig:
         result = dict(zip(cols, row))
         if result.get('stop'):
             result['stop'] = json.loads(result['stop'])
+        for field in self.BOOLEANS:
+            if result.get(field) is not None:
+                result[field] = bool(result[field])
         return result
\ No newline at end of file
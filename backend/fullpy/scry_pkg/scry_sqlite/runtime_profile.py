@@ -0,0 +1,108 @@
+from sqlite3 import connect
+import os
+import time
+import socket
+import platform
+from scry_pkg.scry_sqlite import logger
+
+
+def host_key():
+    # SAME MACHINE, SAME CPU COUNT AND ARCHITECTURE: A PROFILE TUNED ELSEWHERE DOES NOT APPLY
+    return f"{socket.gethostname()}/{platform.machine()}/{os.cpu_count()}cpu"
+
+
+class RuntimeProfile:
+    # DATABASE SCHEMA: ONE TUNED PROFILE PER MODEL AND HOST
+    SCHEMA = """CREATE TABLE IF NOT EXISTS runtimeProfile (
+        id_model TEXT NOT NULL, host TEXT NOT NULL,
+        n_threads INTEGER, n_threads_batch INTEGER,
+        n_batch INTEGER, n_ubatch INTEGER, flash_attn INTEGER DEFAULT 0,
+        prompt_tokens_per_s REAL, gen_tokens_per_s REAL, tuned_at REAL,
+        PRIMARY KEY (id_model, host))"""
+    _created = False
+
+    # VALIDATION: Ranges llama.cpp accepts
+    VALID = {
+        'id_model': lambda v: isinstance(v, str) and v.endswith('.gguf') and '/' not in v and '\\' not in v,
+        'host': lambda v: isinstance(v, str) and 0 < len(v) <= 256,
+        'n_threads': lambda v: isinstance(v, int) and 1 <= v <= 512,
+        'n_threads_batch': lambda v: isinstance(v, int) and 1 <= v <= 512,
+        'n_batch': lambda v: isinstance(v, int) and 32 <= v <= 8192,
+        'n_ubatch': lambda v: isinstance(v, int) and 32 <= v <= 8192,
+        'flash_attn': lambda v: isinstance(v, bool),
+        'prompt_tokens_per_s': lambda v: v is None or (isinstance(v, (int, float)) and v >= 0),
+        'gen_tokens_per_s': lambda v: v is None or (isinstance(v, (int, float)) and v >= 0),
+    }
+
+    # FIELD ORDER: Matches database column order (excluding id_model, host and tuned_at)
+    FIELDS = ['n_threads', 'n_threads_batch', 'n_batch', 'n_ubatch', 'flash_attn',
+              'prompt_tokens_per_s', 'gen_tokens_per_s']
+
+    def __init__(self, configs=None):
+        self.configs = dict(configs or {})
+        self.configs.setdefault('host', host_key())
+
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        self.__DB_FILE = os.path.join(current_dir, "config_model.sqlite")
+        if not RuntimeProfile._created:
+            RuntimeProfile._created = self.create()
+
+    def _valid(self, key, value):
+        return key in self.VALID and self.VALID[key](value)
+
+    def _db(self, query, params=()):
+        try:
+            with connect(self.__DB_FILE) as conn:
+                cur = conn.execute(query, params)
+                conn.commit()
+                return cur
+        except Exception as e:
+            logger.error(f"DB: {e}")
+            return None
+
+    def create(self):
+        return bool(self._db(self.SCHEMA))
+
+    def save(self):
+        # Every field is required: a profile is the result of one tuning run
+        if any(k not in self.configs for k in ['id_model', 'host'] + self.FIELDS):
+            return False
+        for k, v in self.configs.items():
+            if not self._valid(k, v):
+                return False
+        if self.configs['n_ubatch'] > self.configs['n_batch']:
+            return False
+
+        values = [self.configs['id_model'], self.configs['host']]
+        values += [int(self.configs[f]) if f == 'flash_attn' else self.configs[f] for f in self.FIELDS]
+        values.append(time.time())
+        return bool(self._db(
+            f"INSERT OR REPLACE INTO runtimeProfile (id_model,host,{','.join(self.FIELDS)},tuned_at) "
+            f"VALUES ({','.join('?' * len(values))})",
+            values
+        ))
+
+    def delete(self):
+        if 'id_model' not in self.configs:
+            return False
+        cur = self._db("DELETE FROM runtimeProfile WHERE id_model=? AND host=?",
+                       (self.configs['id_model'], self.configs['host']))
+        return bool(cur and cur.rowcount > 0)
+
+    def get(self):
+        if 'id_model' not in self.configs:
+            return None
+
+        cur = self._db("SELECT * FROM runtimeProfile WHERE id_model=? AND host=?",
+                       (self.configs['id_model'], self.configs['host']))
+        if not cur:
+            return None
+
+        row = cur.fetchone()
+        if not row:
+            return None
+
+        cols = [d[0] for d in cur.description]
+        result = dict(zip(cols, row))
+        result['flash_attn'] = bool(result['flash_attn'])
+        return result
@@ -12,6 +12,10 @@ from typing import AsyncGenerator, Optional
 from fastapi.responses import StreamingResponse
 from scry_pkg.config.paths import possible_paths
 from fastapi.middleware.cors import CORSMiddleware
+from scry_pkg.scry_metrics import LATENCY_BUCKETS
+from scry_pkg.scry_metrics.registry import REGISTRY
+from scry_pkg.scry_metrics.middleware import instrument
+from scry_pkg.scry_net.client import shared_client, close_shared
 from scry_pkg.scry_sse import logger, FALLBACK_PORTS_SSE
 
 def which_os(posix, windows):
@@ -67,9 +71,9 @@ class RAMDownloader:
     async def download_to_ram(url: str) -> Optional[bytes]:
         try:
             import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=3600)) as response:
-                    return await response.read() if response.status == 200 else None
+            # SHARED KEEP-ALIVE POOL AND DNS CACHE: NO NEW SESSION (AND HANDSHAKE) PER URL
+            async with shared_client().get(url, timeout=aiohttp.ClientTimeout(total=3600)) as response:
+                return await response.read() if response.status == 200 else None
         except Exception as e:
             logger.error(f"RAM download error: {e}")
             return None
@@ -272,13 +276,22 @@ class DownloadManager:
 
 manager = DownloadManager()
 
+# DOWNLOAD METRICS: OUTCOME OF EVERY SSE DOWNLOAD STREAM AND HOW LONG IT RAN
+DOWNLOADS = REGISTRY.counter("scry_sse_downloads_total", "Model downloads by outcome", ("outcome",))
+DOWNLOAD_SECONDS = REGISTRY.histogram("scry_sse_download_duration_seconds", "Model download duration", ("outcome",),
+                                      buckets=LATENCY_BUCKETS + (300.0, 900.0, 1800.0, 3600.0))
+REGISTRY.gauge("scry_sse_active_downloads", "Downloads in progress", function=lambda: len(manager.active_downloads))
+REGISTRY.gauge("scry_sse_available_ram_bytes", "Available RAM reported by psutil", function=lambda: psutil.virtual_memory().available)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     manager.load_config()
     yield
+    await close_shared()
 
 app = FastAPI(title="Model Download API", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+instrument(app, "scry_sse")
 
 @app.get("/api/models")
 async def list_models():
@@ -304,8 +317,17 @@ async def download_model(model_id: str):
         raise HTTPException(status_code=400, detail="Invalid ID")
 
     async def event_stream():
-        async for event in manager.download(model_id):
-            yield f"data: {json.dumps(event)}\n\n"
+        started = time.time()
+        # A CLIENT THAT GOES AWAY BEFORE THE LAST EVENT LEAVES "aborted"
+        outcome = "aborted"
+        try:
+            async for event in manager.download(model_id):
+                if event["type"] in ("completed", "error", "cancelled"):
+                    outcome = event["type"]
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            DOWNLOADS.inc(outcome=outcome)
+            DOWNLOAD_SECONDS.observe(time.time() - started, outcome=outcome)
 
     return StreamingResponse(event_stream(), media_type="text/event-stream",
                            headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"})
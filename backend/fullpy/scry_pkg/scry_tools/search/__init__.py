@@ -1,7 +1,36 @@
+import os
+from pathlib import Path
 from scry_pkg.utils import setup_logging
 # LOGGING CONFIGURATION
 logger = setup_logging('search_in_tools')
 
+# ASYNC SEARCH: ENGINES TRIED IN ORDER UNTIL ONE GIVES PAGES, ALL WITHIN SEARCH_DEADLINE SECONDS
+SEARCH_ENGINES = ("duckduckgo", "brave")
+SEARCH_DEADLINE = 20.0
+SEARCH_FETCH_TIMEOUT = 10.0
+SEARCH_MAX_PAGES = 3
+
+# SEARCH CACHE (SCRY_SEARCH_CACHE="" TURNS IT OFF): DIRECTORY, DISK BUDGET, SECONDS A QUERY'S RESULT URLS ARE REUSED,
+# SECONDS A PAGE'S TEXT IS SERVED WITHOUT ASKING THE SITE, AND SECONDS IT IS KEPT FOR A CONDITIONAL REVALIDATION
+SEARCH_CACHE_DIR = os.environ.get("SCRY_SEARCH_CACHE", str(Path.home() / ".scry" / "search_cache")) or None
+SEARCH_CACHE_BYTES = 512 * 1024**2
+SEARCH_QUERY_TTL = 6 * 3600
+SEARCH_PAGE_TTL = 24 * 3600
+SEARCH_PAGE_KEEP = 7 * 24 * 3600
+
+# WORKER PROCESSES EXTRACTING PAGE TEXT, ONE CORE LEFT TO THE SERVER; 0 (SCRY_SEARCH_EXTRACT_WORKERS=0, OR A
+# SINGLE CORE) EXTRACTS IN THE DEFAULT THREAD EXECUTOR INSTEAD
+SEARCH_EXTRACT_WORKERS = int(os.environ.get("SCRY_SEARCH_EXTRACT_WORKERS", min(2, (os.cpu_count() or 1) - 1)))
+# SECONDS A PAGE MAY TAKE IN THE POOL BEFORE ITS WORKER IS KILLED AND THE PAGE DROPPED
+SEARCH_EXTRACT_TIMEOUT = 10.0
+
+# SEARCH CONTEXT: PAGES ARE CUT INTO PASSAGES OF AT MOST SEARCH_PASSAGE_CHARS, RANKED AGAINST THE QUERY WITH BM25
+# (SEARCH_BM25_K1, SEARCH_BM25_B), AND THE BEST ONES KEPT UP TO SEARCH_CONTEXT_TOKENS (SCRY_SEARCH_CONTEXT_TOKENS)
+SEARCH_CONTEXT_TOKENS = int(os.environ.get("SCRY_SEARCH_CONTEXT_TOKENS", 1024))
+SEARCH_PASSAGE_CHARS = 600
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+
 import re
 import trafilatura
 def cleanPage(html_content: str) -> str:
@@ -18,35 +47,72 @@ def cleanPage(html_content: str) -> str:
         return ""
     
     content = trafilatura.extract(html_content) if html_content else ""
-    if not content:
+    return cleanText(content) if content else ""
+
+# UTF-8 READ AS WINDOWS-1252 (OR LATIN-1): EACH BYTE OF A MULTI-BYTE SEQUENCE BECAME ITS OWN CHARACTER, "Ã©" FOR "é".
+# THE BYTES ARE TAKEN BACK AND DECODED AGAIN, SO EVERY CHARACTER IS REPAIRED, NOT A LIST OF KNOWN ONES
+def _cp1252_bytes() -> dict:
+    """Byte behind each character a byte of 0x80-0xFF reads as, in windows-1252 or latin-1."""
+    table = {}
+    for byte in range(0x80, 0x100):
+        try:
+            table[bytes([byte]).decode("cp1252")] = byte
+        except UnicodeDecodeError:
+            pass
+        table.setdefault(chr(byte), byte)
+    return table
+
+_CP1252_BYTES = _cp1252_bytes()
+_CONTINUATION = "[" + "".join(re.escape(char) for char, byte in _CP1252_BYTES.items() if byte < 0xC0) + "]"
+
+# ONE PATTERN, EVERY MATCH STARTING WITH "[" OR A UTF-8 LEAD BYTE READ AS CP1252 (C2-F4): THE ENGINE SKIPS TO THOSE
+# CHARACTERS INSTEAD OF TRYING EACH BRANCH AT EVERY POSITION. AFTER "[": COMMENT MARKERS, ELLIPSIS AND EMPTY BRACKETS
+# ARE DROPPED, [12] REFERENCE MARKS LOSE THEIR BRACKETS. AFTER A LEAD BYTE: MOJIBAKE, ALSO WITH THE GUESSES OF
+# _LOST_BYTE: "Ã" FOLLOWED BY A SPACE OR A LOWER CASE LETTER IS "à" OR "í" WHOSE SECOND BYTE (NO-BREAK SPACE, SOFT
+# HYPHEN) THE EXTRACTION DID NOT KEEP, AND "â€" IS "”" (E2 80 9D) WITHOUT ITS 9D, WHICH CP1252 HAS NO CHARACTER FOR
+_BRACKETS = r"(?<=\[)(?:(?P<drop>\s*(?:\.\.\.|…|â€¦)\s*\]|\d+\s*(?i:comments?)\]|\])|(?P<ref>\d+)\])"
+_NORMALIZE = re.compile(rf"[\[\xc2-\xf4](?:{_BRACKETS}"
+                        rf"|(?<=[\xc2-\xf4])(?P<mojibake>{_CONTINUATION}{{1,3}}|(?<=Ã) |(?<=Ã)(?=[a-z])))")
+_LOST_BYTE = {"Ã ": "à ", "Ã": "í", "â€": "”"}
+# BYTES ARE ONLY TAKEN BACK IN TEXT THAT IS CLEARLY MOJIBAKE ("Ã©", "â€™"): CORRECT TEXT HAS LEAD BYTE LOOKALIKES
+# FOLLOWED BY CONTINUATION LOOKALIKES TOO ("ß“" IN GERMAN QUOTES, "Ñ”", "NÃO"), WHICH WOULD DECODE TO OTHER CHARACTERS.
+# ANY OTHER TEXT ONLY LOSES ITS BRACKET MARKERS
+_EVIDENT_MOJIBAKE = re.compile(rf"[ÂÃ]{_CONTINUATION}|â€{_CONTINUATION}")
+_BRACKET_MARKERS = re.compile(rf"\[{_BRACKETS}")
+
+
+def _repair(match: "re.Match") -> str:
+    kind = match.lastgroup
+    if kind == "drop":
         return ""
-    
-    encoding_fixes = [
-        (r'Ã¡', 'á'), (r'Ã©', 'é'), (r'Ã­', 'í'), (r'Ã³', 'ó'), (r'Ãº', 'ú'),
-        (r'Ã£', 'ã'), (r'Ãµ', 'õ'), (r'Ã§', 'ç'), (r'Ã¢', 'â'), (r'Ãª', 'ê'),
-        (r'Ã´', 'ô'), (r'Ã ', 'à'), (r'Â°', '°'), (r'â', '-'), (r'â', '"'),
-        (r'â', '"'), (r'â¦', '...')
-    ]
-    
-    for wrong, correct in encoding_fixes:
-        content = re.sub(wrong, correct, content)
-    
-    # Remove common comment markers and brackets
-    content = re.sub(r'\[\s*\.\.\.\s*\]', '', content)
-    content = re.sub(r'\[\d+\s*Comments?\]', '', content, flags=re.IGNORECASE)
-    
-    # Clean table formatting
-    content = re.sub(r'\|\s*', ' ', content)
-    content = re.sub(r'\s*\|', ' ', content)
-    
-    # Normalize whitespace
-    content = re.sub(r'\n\s*\n\s*\n+', '\n\n', content)
-    content = re.sub(r'\s+', ' ', content)
-    
-    content = re.sub(r'\[(\d+)\]', r'\1', content)
-    content = re.sub(r'\[\]', '', content)
-    content = re.sub(r'\s+', ' ', content)
-    content = re.sub(r'\s+(\d+)\s+', r' \1 ', content)
+    if kind == "ref":
+        return match.group("ref")
+    text = match.group()
+    lost = _LOST_BYTE.get(text)
+    if lost is not None:
+        return lost
+    # A LEAD BYTE BELOW E0 TAKES ONE CONTINUATION BYTE, BELOW F0 TWO, ELSE THREE
+    size = 2 if text[0] < "\xe0" else 3 if text[0] < "\xf0" else 4
+    try:
+        return bytes(_CP1252_BYTES[char] for char in text[:size]).decode("utf-8") + text[size:]
+    except UnicodeDecodeError:
+        return text
 
-    return content.strip()
 
+def cleanText(content: str) -> str:
+    """
+    The cleanup of cleanPage on text already extracted, so a caller holding
+    the trafilatura output does not parse the page a second time. One pass
+    of one precompiled pattern repairs mojibake and drops the markers in
+    text that is clearly mojibake; other text only gets its markers dropped
+    (no pass at all without a "["). Table pipes and whitespace runs become
+    single spaces in str.split, faster than any pattern that has to stop at
+    every space.
+    """
+    if "|" in content:
+        content = content.replace("|", " ")
+    if ("Ã" in content or "Â" in content or "â€" in content) and _EVIDENT_MOJIBAKE.search(content):
+        content = _NORMALIZE.sub(_repair, content)
+    elif "[" in content:
+        content = _BRACKET_MARKERS.sub(_repair, content)
+    return " ".join(content.split())
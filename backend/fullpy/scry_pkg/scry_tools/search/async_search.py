@@ -0,0 +1,128 @@
+import time
+import asyncio
+from contextlib import aclosing
+from urllib.parse import quote
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Tuple
+from .__init__ import logger, SEARCH_ENGINES, SEARCH_DEADLINE, SEARCH_FETCH_TIMEOUT, SEARCH_MAX_PAGES
+from .search import Search
+from .cache import SearchCache
+from .extract import ExtractionPool, extract_body
+from scry_pkg.scry_net.client import HttpClient, decode_body, shared_client
+
+
+class AsyncSearch:
+    """
+    Search on the event loop: the candidate pages of a results page are
+    fetched concurrently over the shared keep-alive client (its per-host limit
+    applies), extracted in the ExtractionPool (else the default executor), and
+    yielded as soon as each one is ready. Nothing here blocks the loop; the
+    whole search stops at `deadline` seconds. With a SearchCache, result URLs
+    and page texts are looked up there first.
+    """
+
+    def __init__(self, deadline: float = SEARCH_DEADLINE, max_pages: int = SEARCH_MAX_PAGES,
+                 client: Optional[HttpClient] = None, cache: Optional[SearchCache] = None,
+                 extractor: Optional[ExtractionPool] = None) -> None:
+        # URL FILTERS AND EXTRACTION ARE THE ONES OF THE SYNCHRONOUS Search
+        self.search = Search(fiveSearches=True)
+        self.deadline = deadline
+        self.max_pages = max_pages
+        self.client = client
+        self.cache = cache
+        self.extractor = extractor
+
+    async def stream(self, query: str) -> AsyncIterator[Dict]:
+        """Yields {"url", "content", "engine"} per extracted page, in the order they finish."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        client = self.client or shared_client()
+        for engine in SEARCH_ENGINES:
+            if loop.time() >= deadline:
+                break
+            found = 0
+            urls = await self._candidates(client, query, engine, deadline)
+            async with aclosing(self._pages(client, urls, deadline)) as pages:
+                async for url, content in pages:
+                    found += 1
+                    yield {"url": url, "content": content, "engine": engine}
+            if found:
+                return
+
+    async def _candidates(self, client: HttpClient, query: str, engine: str, deadline: float) -> List[str]:
+        fetch = lambda: self._fetch_candidates(client, query, engine, deadline)
+        return await (self.cache.urls(engine, query, fetch) if self.cache is not None else fetch())
+
+    async def _fetch_candidates(self, client: HttpClient, query: str, engine: str, deadline: float) -> List[str]:
+        response = await self._fetch(client, self.search._search_engines[engine].format(quote(query)), deadline)
+        if response is None or not response[1]:
+            return []
+        _, body, headers = response
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.search._extractAndFilterUrls(decode_body(body, headers.get("Content-Type")), engine))
+
+    async def _pages(self, client: HttpClient, urls: List[str], deadline: float) -> AsyncIterator:
+        loop = asyncio.get_running_loop()
+        tasks = [asyncio.create_task(self._page(client, url, deadline)) for url in urls]
+        found = 0
+        try:
+            for next_page in asyncio.as_completed(tasks, timeout=max(deadline - loop.time(), 0)):
+                url, content = await next_page
+                if content:
+                    found += 1
+                    yield url, content
+                    if found >= self.max_pages:
+                        return
+        except asyncio.TimeoutError:
+            logger.warning(f"Search deadline reached with {found} pages, {sum(not t.done() for t in tasks)} fetches dropped")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _page(self, client: HttpClient, url: str, deadline: float) -> Tuple[str, str]:
+        fetch = lambda entry: self._fetch_page(client, url, deadline, entry)
+        if self.cache is not None:
+            return url, await self.cache.page(url, fetch)
+        page = await fetch(None)
+        return url, page["content"] if page else ""
+
+    async def _fetch_page(self, client: HttpClient, url: str, deadline: float, cached: Optional[Dict]) -> Optional[Dict]:
+        started = time.perf_counter()
+        headers = dict(self.search.headers)
+        # A CACHED COPY MAKES THE REQUEST CONDITIONAL: 304 AND NO BODY IF THE PAGE DID NOT CHANGE
+        if cached is not None and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached is not None and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        response = await self._fetch(client, url, deadline, headers)
+        if response is None:
+            return None
+        status, body, response_headers = response
+        if status == 304:
+            return {"not_modified": True}
+        # DECODING AND TRAFILATURA ARE CPU BOUND: OFF THE LOOP, IN OTHER PROCESSES WHEN THERE IS A POOL
+        content_type = response_headers.get("Content-Type")
+        if self.extractor is not None:
+            content = await self.extractor.extract_body(body, content_type)
+        else:
+            content = await asyncio.get_running_loop().run_in_executor(None, extract_body, body, content_type)
+        logger.debug(f"{url}: {len(content)} chars in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return {"content": content, "etag": response_headers.get("ETag"), "last_modified": response_headers.get("Last-Modified")}
+
+    async def _fetch(self, client: HttpClient, url: str, deadline: float, headers: Optional[Dict] = None) -> Optional[Tuple[int, bytes, Mapping]]:
+        """(status, raw body, case-insensitive headers) of a 2xx or 304 response; None when it failed or the deadline is past."""
+        import aiohttp
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return None
+        try:
+            async with client.get(url, headers=headers or self.search.headers,
+                                  timeout=aiohttp.ClientTimeout(total=min(remaining, SEARCH_FETCH_TIMEOUT))) as response:
+                if response.status == 304:
+                    return 304, b"", response.headers
+                response.raise_for_status()
+                return response.status, await response.read(), response.headers
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Fetch failed for {url}: {type(e).__name__}: {e}")
+            return None
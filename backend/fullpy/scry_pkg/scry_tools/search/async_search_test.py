@@ -0,0 +1,111 @@
+import asyncio
+from aiohttp import web
+from scry_pkg.scry_net.client import HttpClient
+from scry_pkg.scry_tools.search.async_search import AsyncSearch
+
+ARTICLE = "<html><head><title>{0}</title></head><body><article><h1>{0}</h1>{1}</article></body></html>"
+PARAGRAPH = "<p>The key-value cache keeps the attention keys and values of every token already seen, so the next token only computes its own.</p>"
+
+
+async def serve(routes):
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def article(title: str) -> web.Response:
+    return web.Response(text=ARTICLE.format(title, PARAGRAPH * 4), content_type="text/html", headers={"ETag": '"v1"'})
+
+
+async def page(request):
+    if request.headers.get("If-None-Match") == '"v1"':
+        return web.Response(status=304)
+    return article(request.match_info["name"])
+
+
+async def slow(request):
+    await asyncio.sleep(2)
+    return article("slow")
+
+
+async def empty(request):
+    return web.Response(text="<html><body></body></html>", content_type="text/html")
+
+
+ROUTES = [web.get("/page/{name}", page), web.get("/slow", slow), web.get("/results/{engine}", empty)]
+
+
+def search_against(base: str, urls_by_engine, deadline: float = 5, max_pages: int = 3) -> AsyncSearch:
+    search = AsyncSearch(deadline=deadline, max_pages=max_pages, client=HttpClient("test"))
+    search.search._search_engines = {engine: f"{base}/results/{engine}?q={{}}" for engine in urls_by_engine}
+    search.search._extractAndFilterUrls = lambda html, engine: [base + path for path in urls_by_engine[engine]]
+    return search
+
+
+def test_pages_are_yielded_up_to_max_pages():
+    async def run():
+        runner, base = await serve(ROUTES)
+        search = search_against(base, {"duckduckgo": ["/page/a", "/page/b", "/page/c"], "brave": []}, max_pages=2)
+        try:
+            return [item async for item in search.stream("kv cache")]
+        finally:
+            await search.client.close()
+            await runner.cleanup()
+
+    pages = asyncio.run(run())
+    assert len(pages) == 2
+    assert all(page["engine"] == "duckduckgo" and "key-value cache" in page["content"] for page in pages)
+
+
+def test_next_engine_is_tried_when_the_first_gives_no_pages():
+    async def run():
+        runner, base = await serve(ROUTES)
+        search = search_against(base, {"duckduckgo": ["/missing"], "brave": ["/page/a"]})
+        try:
+            return [item async for item in search.stream("kv cache")]
+        finally:
+            await search.client.close()
+            await runner.cleanup()
+
+    pages = asyncio.run(run())
+    assert [page["engine"] for page in pages] == ["brave"]
+
+
+def test_slow_page_is_dropped_at_the_deadline():
+    async def run():
+        runner, base = await serve(ROUTES)
+        search = search_against(base, {"duckduckgo": ["/page/a", "/slow"], "brave": []}, deadline=0.5)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            pages = [item async for item in search.stream("kv cache")]
+            return pages, loop.time() - started
+        finally:
+            await search.client.close()
+            await runner.cleanup()
+
+    pages, seconds = asyncio.run(run())
+    assert [page["url"].rsplit("/", 1)[1] for page in pages] == ["a"]
+    assert seconds < 1.5
+
+
+def test_cached_page_is_fetched_conditionally():
+    async def run():
+        runner, base = await serve(ROUTES)
+        search = search_against(base, {"duckduckgo": []})
+        deadline = asyncio.get_running_loop().time() + 5
+        try:
+            fresh = await search._fetch_page(search.client, f"{base}/page/a", deadline, None)
+            again = await search._fetch_page(search.client, f"{base}/page/a", deadline, fresh)
+            return fresh, again
+        finally:
+            await search.client.close()
+            await runner.cleanup()
+
+    fresh, again = asyncio.run(run())
+    assert fresh["etag"] == '"v1"' and "key-value cache" in fresh["content"]
+    assert again == {"not_modified": True}
@@ -0,0 +1,141 @@
+"""Search results and extracted pages kept on disk between searches, revalidated with ETag/Last-Modified once stale"""
+import time
+import asyncio
+import unicodedata
+import diskcache
+from typing import Awaitable, Callable, Dict, List, Optional
+from scry_pkg.scry_metrics.registry import REGISTRY
+from .__init__ import logger
+
+LOOKUPS = REGISTRY.counter("scry_search_cache_lookups_total", "Search cache lookups by level (query, page) and outcome "
+                           "(hit, miss, revalidated, shared)", ("level", "outcome"))
+SAVED_SECONDS = REGISTRY.counter("scry_search_cache_saved_seconds_total", "Fetch and extraction time the search cache saved", ("level",))
+
+
+def normalize_query(query: str) -> str:
+    """Case, Unicode form and whitespace do not make a different search."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class SearchCache:
+    """
+    Two levels in one diskcache directory of up to `size_limit` bytes (least
+    recently stored evicted first):
+      query:<engine>:<normalized query> -> result URLs, for `query_ttl` seconds
+      page:<url> -> extracted text, its validators and what producing it cost
+    A page is served as is for `page_ttl` seconds; after that it is kept up to
+    `page_keep` seconds and revalidated with a conditional GET, a 304 reusing
+    the stored text without downloading or extracting it again.
+    Identical lookups running at the same time share one fetch (single-flight).
+    Only the event loop may use it; the disk is read and written in the executor.
+    """
+
+    def __init__(self, directory: str, size_limit: int, query_ttl: float, page_ttl: float, page_keep: float):
+        self.disk = diskcache.Cache(directory, size_limit=size_limit)
+        self.query_ttl = query_ttl
+        self.page_ttl = page_ttl
+        self.page_keep = page_keep
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.hits = {"query": 0, "page": 0}
+        self.misses = {"query": 0, "page": 0}
+        self.revalidated = 0
+        self.shared = 0
+        self.saved_seconds = 0.0
+
+    async def urls(self, engine: str, query: str, fetch: Callable[[], Awaitable[List[str]]]) -> List[str]:
+        """The result URLs of `query` on `engine`; `fetch` gets them on a miss."""
+        key = f"query:{engine}:{normalize_query(query)}"
+        entry = await self._get(key)
+        if entry is not None:
+            self._hit("query", entry["seconds"])
+            return entry["urls"]
+        return await self._single_flight(key, "query", lambda: self._fill_urls(key, fetch))
+
+    async def page(self, url: str, fetch: Callable[[Optional[Dict]], Awaitable[Optional[Dict]]]) -> str:
+        """
+        The extracted text of `url`. On a miss or a stale entry, `fetch` is called
+        with the stored entry (its "etag" and "last_modified" make the request
+        conditional) and returns {"not_modified": True}, {"content", "etag",
+        "last_modified"} or None when the page could not be fetched.
+        """
+        key = f"page:{url}"
+        entry = await self._get(key)
+        if entry is not None and entry["fetched_at"] + self.page_ttl > time.time():
+            self._hit("page", entry["seconds"])
+            return entry["content"]
+        return await self._single_flight(key, "page", lambda: self._fill_page(key, entry, fetch))
+
+    async def _fill_urls(self, key: str, fetch: Callable[[], Awaitable[List[str]]]) -> List[str]:
+        started = time.perf_counter()
+        urls = await fetch()
+        self._miss("query")
+        if urls:
+            await self._set(key, {"urls": urls, "seconds": time.perf_counter() - started}, self.query_ttl)
+        return urls
+
+    async def _fill_page(self, key: str, entry: Optional[Dict], fetch: Callable[[Optional[Dict]], Awaitable[Optional[Dict]]]) -> str:
+        started = time.perf_counter()
+        result = await fetch(entry)
+        seconds = time.perf_counter() - started
+        if result is None:
+            self._miss("page")
+            # A STALE TEXT BEATS NONE WHEN THE SITE IS DOWN
+            return entry["content"] if entry is not None else ""
+        if result.get("not_modified") and entry is not None:
+            self.revalidated += 1
+            LOOKUPS.inc(level="page", outcome="revalidated")
+            saved = max(entry["seconds"] - seconds, 0.0)
+            self.saved_seconds += saved
+            SAVED_SECONDS.inc(saved, level="page")
+            await self._set(key, dict(entry, fetched_at=time.time()), self.page_keep)
+            return entry["content"]
+        self._miss("page")
+        await self._set(key, {"content": result["content"], "etag": result.get("etag"), "last_modified": result.get("last_modified"),
+                              "fetched_at": time.time(), "seconds": seconds}, self.page_keep)
+        return result["content"]
+
+    async def _single_flight(self, key: str, level: str, fill: Callable[[], Awaitable]):
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.shared += 1
+            LOOKUPS.inc(level=level, outcome="shared")
+            return await asyncio.shield(flight)
+        flight = self._flights[key] = asyncio.ensure_future(fill())
+        flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        # SHIELDED: A SEARCH THAT GIVES UP (DEADLINE) DOES NOT CANCEL THE FETCH FOR THE OTHERS WAITING ON IT
+        return await asyncio.shield(flight)
+
+    def _hit(self, level: str, seconds: float) -> None:
+        self.hits[level] += 1
+        self.saved_seconds += seconds
+        LOOKUPS.inc(level=level, outcome="hit")
+        SAVED_SECONDS.inc(seconds, level=level)
+
+    def _miss(self, level: str) -> None:
+        self.misses[level] += 1
+        LOOKUPS.inc(level=level, outcome="miss")
+
+    async def _get(self, key: str) -> Optional[Dict]:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.disk.get, key)
+        except Exception as e:
+            logger.warning(f"Search cache read of {key} failed: {e}")
+            return None
+
+    async def _set(self, key: str, value: Dict, expire: float) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, lambda: self.disk.set(key, value, expire=expire))
+        except Exception as e:
+            logger.warning(f"Search cache write of {key} failed: {e}")
+
+    def stats(self) -> Dict:
+        hits = sum(self.hits.values()) + self.revalidated + self.shared
+        lookups = hits + sum(self.misses.values())
+        return {"query_hits": self.hits["query"], "query_misses": self.misses["query"],
+                "page_hits": self.hits["page"], "page_misses": self.misses["page"],
+                "revalidated": self.revalidated, "shared": self.shared,
+                "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2), "bytes": self.disk.volume()}
+
+    def close(self) -> None:
+        self.disk.close()
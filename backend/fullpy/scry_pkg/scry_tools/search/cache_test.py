@@ -0,0 +1,116 @@
+import asyncio
+from scry_pkg.scry_tools.search.cache import SearchCache, normalize_query
+
+
+def make_cache(tmp_path, page_ttl: float = 60) -> SearchCache:
+    return SearchCache(str(tmp_path), 1024**2, query_ttl=60, page_ttl=page_ttl, page_keep=3600)
+
+
+def test_normalized_queries_share_an_entry():
+    assert normalize_query("  KV  Cache\tＨits ") == "kv cache hits"
+
+
+def test_query_urls_are_fetched_once(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return ["https://a.example", "https://b.example"]
+
+    async def run():
+        first = await cache.urls("ddg", "KV cache", fetch)
+        second = await cache.urls("ddg", "kv  CACHE", fetch)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == ["https://a.example", "https://b.example"]
+    assert len(calls) == 1
+    assert cache.stats()["query_hits"] == 1 and cache.stats()["query_misses"] == 1
+    cache.close()
+
+
+def test_stale_page_is_revalidated_with_its_validators(tmp_path):
+    cache = make_cache(tmp_path, page_ttl=0)
+    seen = []
+
+    async def fetch(entry):
+        seen.append(entry)
+        if entry is None:
+            return {"content": "text", "etag": '"v1"', "last_modified": None}
+        return {"not_modified": True}
+
+    async def run():
+        return [await cache.page("https://a.example", fetch) for _ in range(2)]
+
+    assert asyncio.run(run()) == ["text", "text"]
+    assert seen[0] is None
+    # THE SECOND FETCH WAS CONDITIONAL ON THE STORED ETAG AND GOT A 304
+    assert seen[1]["etag"] == '"v1"'
+    assert cache.revalidated == 1 and cache.stats()["page_misses"] == 1
+    cache.close()
+
+
+def test_changed_page_replaces_the_stored_text(tmp_path):
+    cache = make_cache(tmp_path, page_ttl=0)
+    versions = iter(["old", "new"])
+
+    async def fetch(entry):
+        return {"content": next(versions), "etag": None, "last_modified": None}
+
+    async def run():
+        return [await cache.page("https://a.example", fetch) for _ in range(2)]
+
+    assert asyncio.run(run()) == ["old", "new"]
+    cache.close()
+
+
+def test_stale_text_is_served_when_the_site_is_down(tmp_path):
+    cache = make_cache(tmp_path, page_ttl=0)
+    results = iter([{"content": "text", "etag": None, "last_modified": None}, None])
+
+    async def fetch(entry):
+        return next(results)
+
+    async def run():
+        return [await cache.page("https://a.example", fetch) for _ in range(2)]
+
+    assert asyncio.run(run()) == ["text", "text"]
+    cache.close()
+
+
+def test_concurrent_lookups_share_one_fetch(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    async def fetch(entry):
+        calls.append(entry)
+        await asyncio.sleep(0.05)
+        return {"content": "text", "etag": None, "last_modified": None}
+
+    async def run():
+        return await asyncio.gather(*(cache.page("https://a.example", fetch) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["text"] * 5
+    assert len(calls) == 1
+    assert cache.shared == 4
+    assert not cache._flights
+    cache.close()
+
+
+def test_a_waiter_giving_up_does_not_cancel_the_shared_fetch(tmp_path):
+    cache = make_cache(tmp_path)
+
+    async def fetch(entry):
+        await asyncio.sleep(0.05)
+        return {"content": "text", "etag": None, "last_modified": None}
+
+    async def run():
+        impatient = asyncio.ensure_future(cache.page("https://a.example", fetch))
+        patient = asyncio.ensure_future(cache.page("https://a.example", fetch))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(run()) == "text"
+    cache.close()
@@ -0,0 +1,37 @@
+from scry_pkg.scry_tools.search import cleanText
+
+
+def test_whitespace_and_table_pipes_become_single_spaces():
+    assert cleanText("Hello  world | table\n\n\trow ") == "Hello world table row"
+
+
+def test_bracket_markers():
+    # REFERENCE MARKS LOSE THEIR BRACKETS, ELLIPSIS, COMMENT COUNTS AND EMPTY BRACKETS GO
+    assert cleanText("A claim[12] and [...] and [3 comments] and [] and [ … ]") == "A claim12 and and and and"
+    assert cleanText("a [note] stays") == "a [note] stays"
+
+
+def test_mojibake_is_repaired_byte_for_byte():
+    assert cleanText("cafÃ© and naÃ¯ve â€œquotedâ€\x9d") == "café and naïve “quoted”"
+    assert cleanText("Â£5 for ðŸ˜€") == "£5 for 😀"
+
+
+def test_correct_text_is_left_alone():
+    assert cleanText("plain café, naïve, 東京") == "plain café, naïve, 東京"
+    # PORTUGUESE "Ã" IS NOT A LOST BYTE WHEN NOTHING ELSE IN THE TEXT IS MOJIBAKE
+    assert cleanText("IRMÃ DA NÃO SEI") == "IRMÃ DA NÃO SEI"
+    assert cleanText("Ã alone") == "Ã alone"
+
+
+def test_lost_bytes_are_guessed_only_in_evident_mojibake():
+    assert cleanText("cafÃ© Ã  noite, aÃnda") == "café à noite, aínda"
+    assert cleanText("Mojibake â€™s apostrophe and â€ end") == "Mojibake ’s apostrophe and ” end"
+
+
+def test_correct_text_with_lead_byte_lookalikes_is_not_decoded():
+    # "ß“" AND "Ñ”" LOOK LIKE A UTF-8 LEAD BYTE AND ITS CONTINUATION READ AS CP1252, BUT ARE CORRECT TEXT
+    assert cleanText("Er sagte „groß“ und ging.") == "Er sagte „groß“ und ging."
+    assert cleanText("Señor „Ñ” [1] Straße") == "Señor „Ñ” 1 Straße"
+    assert cleanText("Der Preis: 5 € pro Stück, „Grüße“.") == "Der Preis: 5 € pro Stück, „Grüße“."
+    assert cleanText("Привет, мир! Ціна: 10 € [2]") == "Привет, мир! Ціна: 10 € 2"
+    assert cleanText("Élève, garçon, cœur — «très» bien…") == "Élève, garçon, cœur — «très» bien…"
@@ -0,0 +1,103 @@
+"""Page text extraction: one trafilatura pass per document, in a bounded pool of worker processes"""
+import time
+import asyncio
+import multiprocessing
+import trafilatura
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+from .__init__ import logger, cleanText, SEARCH_EXTRACT_TIMEOUT
+from scry_pkg.scry_net.client import decode_body
+
+# CHARACTERS OF UTF-8 READ AS LATIN-1: THE TEXT GOES THROUGH cleanText
+MOJIBAKE = ('Ã', 'â', '€')
+
+
+def extract_page(html_content: str) -> str:
+    """
+    Text of a page worth keeping (more than 150 characters), or "". The page
+    is parsed and extracted once; mojibake or a short text get the cleanPage
+    cleanup applied to that same extraction.
+    """
+    if not html_content:
+        return ""
+    content = trafilatura.extract(html_content)
+    if content and (any(char in content for char in MOJIBAKE) or len(content.strip()) < 200):
+        content = cleanText(content)
+    return content.strip() if content and len(content.strip()) > 150 else ""
+
+
+def extract_body(data: bytes, content_type: Optional[str]) -> str:
+    """extract_page of a response body still in bytes: decoding it (a charset detection at worst) is off the loop too."""
+    return extract_page(decode_body(data, content_type)) if data else ""
+
+
+class ExtractionPool:
+    """
+    `workers` spawned processes running extract_page (extract_body for bytes
+    still to decode): extraction holds the GIL, so threads would serialize
+    it with the event loop and with each other.
+    At most `workers * 2` documents are handed to the pool at a time, the rest
+    wait on the loop. A worker that dies breaks the pool; it is started again
+    on the next page. A document still running after `timeout` seconds is
+    dropped and the pool killed, a worker stuck on it would hold its slot
+    for good.
+    """
+
+    def __init__(self, workers: int, timeout: float = SEARCH_EXTRACT_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(workers * 2)
+        self.timeouts = 0
+        self.pages = 0
+        self.seconds = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def extract(self, html_content: str) -> str:
+        return await self._run(extract_page, html_content)
+
+    async def extract_body(self, data: bytes, content_type: Optional[str]) -> str:
+        return await self._run(extract_body, data, content_type)
+
+    async def _run(self, function: Callable[..., str], *args) -> str:
+        async with self._slots:
+            started = time.perf_counter()
+            pool = self._executor()
+            try:
+                content = await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(pool, function, *args), self.timeout)
+            except BrokenProcessPool:
+                logger.warning("Extraction worker died, the pool is started again")
+                self._discard(pool)
+                return ""
+            except asyncio.TimeoutError:
+                logger.warning(f"Extraction still running after {self.timeout} s, the pool is killed and started again")
+                self.timeouts += 1
+                self._discard(pool, kill=True)
+                return ""
+            self.pages += 1
+            self.seconds += time.perf_counter() - started
+            return content
+
+    def _discard(self, pool: ProcessPoolExecutor, kill: bool = False) -> None:
+        # PAGES STILL IN THE OLD POOL FAIL WITH BrokenProcessPool, THE NEXT ONES START A NEW POOL
+        if self._pool is pool:
+            self._pool = None
+        if kill:
+            # A RUNNING CALL CANNOT BE CANCELLED, ONLY ITS PROCESS STOPPED
+            for process in list((pool._processes or {}).values()):
+                process.kill()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {"workers": self.workers, "pages": self.pages, "timeouts": self.timeouts,
+                "mean_ms": round(self.seconds / self.pages * 1000, 1) if self.pages else 0.0}
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,68 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from scry_pkg.scry_tools.search.extract import ExtractionPool, extract_page
+
+
+# RUN IN THE SPAWNED WORKERS: MODULE LEVEL SO THEY CAN BE PICKLED
+def echo(text: str) -> str:
+    return text
+
+
+def hang(text: str) -> str:
+    time.sleep(60)
+    return text
+
+
+def test_short_pages_are_dropped():
+    assert extract_page("") == ""
+    assert extract_page("<html><body><p>Too short.</p></body></html>") == ""
+
+
+def test_at_most_twice_the_workers_are_handed_to_the_pool():
+    running, most = [0], [0]
+    lock = threading.Lock()
+
+    def busy(text: str) -> str:
+        with lock:
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return text
+
+    async def run():
+        pool = ExtractionPool(2)
+        # THREADS STAND IN FOR THE PROCESSES: THE BOUND IS KEPT ON THE LOOP SIDE
+        pool._executor = lambda: threads
+        return await asyncio.gather(*(pool._run(busy, str(i)) for i in range(20))), pool
+
+    with ThreadPoolExecutor(20) as threads:
+        texts, pool = asyncio.run(run())
+    assert texts == [str(i) for i in range(20)]
+    assert most[0] == 4
+    assert pool.stats()["pages"] == 20
+
+
+def test_a_hung_page_is_dropped_and_the_pool_started_again():
+    async def run():
+        pool = ExtractionPool(1, timeout=1.0)
+        try:
+            assert await pool._run(echo, "warm") == "warm"
+            hung = pool._pool
+            process = next(iter(hung._processes.values()))
+            started = time.perf_counter()
+            assert await pool._run(hang, "never") == ""
+            assert time.perf_counter() - started < 5
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+            assert not process.is_alive()
+            assert await pool._run(echo, "again") == "again"
+            assert pool._pool is not hung
+            return pool.stats()
+        finally:
+            pool.close()
+
+    stats = asyncio.run(run())
+    assert stats["timeouts"] == 1 and stats["pages"] == 2
@@ -0,0 +1,152 @@
+"""Search context: extracted pages cut into passages, ranked against the query with BM25, kept within a token budget"""
+import re
+import numpy as np
+from typing import Callable, Dict, List, Optional
+from scry_pkg.scry_metrics.registry import REGISTRY
+from scry_pkg.utils import estimate_tokens
+from .__init__ import SEARCH_CONTEXT_TOKENS, SEARCH_PASSAGE_CHARS, SEARCH_BM25_K1, SEARCH_BM25_B
+
+CONTEXT_TOKENS = REGISTRY.counter("scry_search_context_tokens_total", "Tokens of the search results: the extracted pages, and "
+                                  "the passages kept from them", ("stage",))
+
+PARAGRAPHS = re.compile(r"\s*\n\s*")
+SENTENCES = re.compile(r"(?<=[.!?\u3002\uff01\uff1f])\s+|(?<=[\u3002\uff01\uff1f])")
+# TERMS: A WORD, OR ONE HAN/KANA CHARACTER (THOSE SCRIPTS DO NOT SEPARATE THEIR WORDS)
+TERMS = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]|[^\W_]+")
+
+
+def terms(text: str) -> List[str]:
+    return TERMS.findall(text.casefold())
+
+
+def split_passages(text: str, max_chars: int = SEARCH_PASSAGE_CHARS) -> List[str]:
+    """
+    Consecutive paragraphs packed into passages of at most `max_chars`; a
+    longer paragraph is cut between sentences, a longer sentence at a space.
+    """
+    units = []
+    for paragraph in PARAGRAPHS.split(text.strip()):
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
+            continue
+        for sentence in SENTENCES.split(paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                units.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            units.append(sentence)
+    passages, current = [], ""
+    for unit in filter(None, units):
+        if current and len(current) + 1 + len(unit) > max_chars:
+            passages.append(current)
+            current = unit
+        else:
+            current = f"{current} {unit}" if current else unit
+    if current:
+        passages.append(current)
+    return passages
+
+
+def bm25(query: str, passages: List[str], k1: float = SEARCH_BM25_K1, b: float = SEARCH_BM25_B) -> np.ndarray:
+    """
+    BM25 score of every passage for `query`, the passages being the collection
+    (term frequencies, lengths and document frequencies all come from them).
+    Only the query's terms are counted: one (passages x query terms) matrix.
+    """
+    query_terms = list(dict.fromkeys(terms(query)))
+    scores = np.zeros(len(passages), dtype=np.float64)
+    if not query_terms or not passages:
+        return scores
+    column = {term: j for j, term in enumerate(query_terms)}
+    tokens = [terms(passage) for passage in passages]
+    lengths = np.fromiter(map(len, tokens), dtype=np.float64, count=len(tokens))
+    # EVERY TOKEN OF EVERY PASSAGE, AS (PASSAGE, QUERY TERM OR -1): ONE bincount FILLS THE TERM FREQUENCY MATRIX
+    flat = [column.get(token, -1) for passage_tokens in tokens for token in passage_tokens]
+    columns = np.array(flat, dtype=np.int64)
+    rows = np.repeat(np.arange(len(passages)), lengths.astype(np.int64))
+    hit = columns >= 0
+    tf = np.bincount(rows[hit] * len(query_terms) + columns[hit],
+                     minlength=len(passages) * len(query_terms)).reshape(len(passages), len(query_terms)).astype(np.float64)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((len(passages) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def select_passages(query: str, pages: List[Dict], budget: int = SEARCH_CONTEXT_TOKENS,
+                    count_tokens: Optional[Callable[[str], int]] = None, max_chars: int = SEARCH_PASSAGE_CHARS) -> List[Dict]:
+    """
+    The passages of `pages` ({"url", "content"}) that best answer `query` and
+    fit in `budget` tokens, best first until the budget is full, then given
+    back in page and reading order as {"url", "text", "score", "tokens"}.
+    Passages no query term occurs in are only taken when none scores.
+    """
+    count_tokens = count_tokens or estimate_tokens
+    passages = [{"url": page["url"], "page": i, "position": j, "text": text}
+                for i, page in enumerate(pages) for j, text in enumerate(split_passages(page["content"], max_chars))]
+    if not passages:
+        return []
+    scores = bm25(query, [passage["text"] for passage in passages])
+    # STABLE: EQUAL SCORES KEEP PAGE ORDER, THE SEARCH ENGINE'S RANKING
+    order = np.argsort(-scores, kind="stable")
+    if scores[order[0]] > 0:
+        order = order[scores[order] > 0]
+    chosen, used = [], 0
+    for i in order:
+        passage = passages[i]
+        tokens = count_tokens(passage["text"])
+        if used + tokens > budget:
+            continue
+        chosen.append(dict(passage, score=round(float(scores[i]), 3), tokens=tokens))
+        used += tokens
+    CONTEXT_TOKENS.inc(sum(count_tokens(page["content"]) for page in pages), stage="pages")
+    CONTEXT_TOKENS.inc(used, stage="passages")
+    return sorted(chosen, key=lambda passage: (passage["page"], passage["position"]))
+
+
+class PassageStream:
+    """
+    select_passages for pages that arrive one by one, so each can be sent as
+    soon as it is extracted. A page is ranked on its own (its passages are
+    the BM25 collection) and keeps what fits in its share of the budget: what
+    is left, split over the pages still expected, so a first page cannot take
+    it all. The price of not waiting for every page: passages are not ranked
+    across pages, and the share of a page that never comes goes unused.
+    """
+
+    def __init__(self, query: str, pages_expected: int, budget: int = SEARCH_CONTEXT_TOKENS,
+                 count_tokens: Optional[Callable[[str], int]] = None, max_chars: int = SEARCH_PASSAGE_CHARS):
+        self.query = query
+        self.pages_expected = pages_expected
+        self.budget = budget
+        self.count_tokens = count_tokens or estimate_tokens
+        self.max_chars = max_chars
+        self.pages = 0
+        self.used = 0
+
+    def add(self, page: Dict) -> List[Dict]:
+        """The passages of `page` to send, as select_passages gives them."""
+        share = (self.budget - self.used) // max(self.pages_expected - self.pages, 1)
+        self.pages += 1
+        passages = select_passages(self.query, [page], share, self.count_tokens, self.max_chars)
+        self.used += sum(passage["tokens"] for passage in passages)
+        return passages
+
+
+def source_blocks(passages: List[Dict]) -> List[Dict]:
+    """One block per source, {"url", "text"}: its passages in reading order, "..." where text was left out."""
+    blocks = []
+    for passage in passages:
+        if blocks and blocks[-1]["url"] == passage["url"]:
+            gap = passage["position"] != blocks[-1]["position"] + 1
+            blocks[-1]["text"] += ("\n...\n" if gap else "\n") + passage["text"]
+            blocks[-1]["position"] = passage["position"]
+        else:
+            blocks.append({"url": passage["url"], "text": passage["text"], "position": passage["position"]})
+    return [{"url": block["url"], "text": block["text"]} for block in blocks]
+
+
+def format_passages(passages: List[Dict]) -> str:
+    """The passages as prompt context, each source's block under its URL."""
+    return "\n\n".join(f"Source: {block['url']}\n{block['text']}" for block in source_blocks(passages))
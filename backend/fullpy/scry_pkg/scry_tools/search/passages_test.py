@@ -0,0 +1,84 @@
+from scry_pkg.scry_tools.search.passages import (PassageStream, bm25, format_passages, select_passages, source_blocks,
+                                                 split_passages, terms)
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+def page(url: str, *paragraphs: str) -> dict:
+    return {"url": url, "content": "\n".join(paragraphs)}
+
+
+def test_terms_split_words_and_han_characters():
+    assert terms("KV-Cache hits, 2x!") == ["kv", "cache", "hits", "2x"]
+    assert terms("東京タワー") == ["東", "京", "タ", "ワ", "ー"]
+
+
+def test_split_passages_packs_paragraphs_and_cuts_long_ones():
+    assert split_passages("one\ntwo\n\nthree", max_chars=9) == ["one two", "three"]
+    passages = split_passages("First sentence here. Second sentence here. " + "x" * 30, max_chars=25)
+    assert all(len(passage) <= 25 for passage in passages)
+    assert passages[0] == "First sentence here."
+
+
+def test_bm25_ranks_the_passage_about_the_query_first():
+    passages = ["the weather is nice today", "the kv cache stores keys and values", "cache cache cache of the browser"]
+    scores = bm25("kv cache", passages)
+    assert scores.argmax() == 1
+    assert scores[0] == 0
+    # A TERM EVERY PASSAGE HAS IS WORTH LITTLE, A RARE ONE A LOT
+    assert bm25("the", passages).max() < bm25("kv", passages).max()
+
+
+def test_bm25_without_terms_or_passages():
+    assert bm25("", ["text"]).tolist() == [0.0]
+    assert bm25("query", []).tolist() == []
+
+
+def test_select_passages_stays_within_the_budget_best_first():
+    pages = [page("https://a", "intro about nothing", "kv cache latency explained", "unrelated footer"),
+             page("https://b", "the kv cache in llama", "more kv cache latency and kv cache reuse")]
+    chosen = select_passages("kv cache latency", pages, budget=12, count_tokens=words, max_chars=40)
+    assert sum(passage["tokens"] for passage in chosen) <= 12
+    texts = [passage["text"] for passage in chosen]
+    assert "more kv cache latency and kv cache reuse" in texts
+    assert "intro about nothing" not in texts and "unrelated footer" not in texts
+    # GIVEN BACK IN PAGE AND READING ORDER
+    assert [(passage["page"], passage["position"]) for passage in chosen] == sorted((p["page"], p["position"]) for p in chosen)
+
+
+def test_select_passages_skips_what_does_not_fit_and_takes_smaller_ones():
+    pages = [page("https://a", "cache " * 10, "cache hit")]
+    chosen = select_passages("cache", pages, budget=5, count_tokens=words, max_chars=60)
+    assert [passage["text"] for passage in chosen] == ["cache hit"]
+
+
+def test_select_passages_without_any_match_keeps_the_first_passages():
+    pages = [page("https://a", "alpha beta", "gamma delta")]
+    chosen = select_passages("zeta", pages, budget=2, count_tokens=words, max_chars=12)
+    assert [passage["text"] for passage in chosen] == ["alpha beta"]
+    assert select_passages("zeta", [page("https://a", "")], budget=10) == []
+
+
+def test_passage_stream_splits_the_budget_over_the_pages_expected():
+    paragraphs = ["kv cache " + "w " * 8] * 4   # 10 WORDS EACH
+    stream = PassageStream("kv cache", pages_expected=3, budget=30, count_tokens=words, max_chars=30)
+    first = stream.add(page("https://a", *paragraphs))
+    # A THIRD OF THE BUDGET, NOT ALL OF IT
+    assert sum(passage["tokens"] for passage in first) == 10
+    second = stream.add(page("https://b", *paragraphs))
+    assert sum(passage["tokens"] for passage in second) == 10
+    assert stream.used == 20
+    # WHAT A PAGE LEAVES UNUSED GOES TO THE ONES AFTER IT
+    stream = PassageStream("kv cache", pages_expected=3, budget=30, count_tokens=words, max_chars=30)
+    assert stream.add(page("https://a", "")) == []
+    assert sum(passage["tokens"] for passage in stream.add(page("https://b", *paragraphs))) == 10
+    assert sum(passage["tokens"] for passage in stream.add(page("https://c", *paragraphs))) == 20
+
+
+def test_source_blocks_mark_the_gaps():
+    passages = [{"url": "https://a", "position": 0, "text": "one"}, {"url": "https://a", "position": 1, "text": "two"},
+                {"url": "https://a", "position": 5, "text": "six"}, {"url": "https://b", "position": 2, "text": "b"}]
+    assert source_blocks(passages) == [{"url": "https://a", "text": "one\ntwo\n...\nsix"}, {"url": "https://b", "text": "b"}]
+    assert format_passages(passages) == "Source: https://a\none\ntwo\n...\nsix\n\nSource: https://b\nb"
@@ -1,5 +1,6 @@
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from .search import Search
+from .passages import select_passages, format_passages
 class RunSearch:
     def __init__(self):
         pass
@@ -26,12 +27,12 @@ class RunSearch:
             
             if quality_results:
                 if quality_results.get("content"):
-                    response = quality_results["content"]
-                elif quality_results.get("contents"):
-                    valid_contents = [c for c in quality_results["contents"][:3] if len(c.strip()) > 150]
-                    response = "\n\n".join(valid_contents) if valid_contents else ""
+                    pages = [{"url": quality_results.get("used_url", ""), "content": quality_results["content"]}]
                 else:
-                    response = ""
+                    pages = [{"url": url, "content": c} for url, c in zip(quality_results.get("used_urls", []), quality_results.get("contents", []))
+                             if len(c.strip()) > 150][:3]
+                # ONLY THE PASSAGES THAT ANSWER THE QUERY, WITHIN THE CONTEXT TOKEN BUDGET, UNDER THEIR SOURCE URL
+                response = format_passages(select_passages(query, pages)) if pages else ""
             else:
                 response = ""
             
@@ -1,8 +1,8 @@
-import requests
-import trafilatura
-from urllib.parse import unquote, urlparse, parse_qs
+from urllib.parse import quote, unquote, urlparse, parse_qs
 import re
-from .__init__ import logger, cleanPage
+from .__init__ import logger
+from .extract import extract_page
+from scry_pkg.scry_net.client import shared_sync_client
 from typing import Dict, List
 
 class Search:
@@ -27,7 +27,7 @@ class Search:
         return self._universalSearch(query, "brave")
 
     def _universalSearch(self, query: str, engine: str) -> Dict:
-        search_url = self._search_engines[engine].format(requests.utils.quote(query))
+        search_url = self._search_engines[engine].format(quote(query))
         html_content = self._fetchUrl(search_url)
         
         if not html_content:
@@ -41,28 +41,16 @@ class Search:
 
     def _fetchUrl(self, url: str) -> str:
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            return response.text
+            return shared_sync_client().text(url, headers=self.headers, timeout=10)
         except Exception as e:
             logger.warning(f"Fetch failed for {url}: {e}")
             return ""
 
     def _extractContent(self, url: str) -> str:
-        html_content = self._fetchUrl(url)
-        if not html_content:
-            return ""
-        
-        # First try trafilatura
-        content = trafilatura.extract(html_content)
-        
-        # If content has encoding issues or trafilatura failed, use cleanPage
-        if content and any(char in content for char in ['Ã', 'â', '€']):
-            content = cleanPage(html_content)
-        elif not content or len(content.strip()) < 200:
-            content = cleanPage(html_content)
-        
-        return content.strip() if content and len(content.strip()) > 150 else ""
+        return self._extractFromHtml(self._fetchUrl(url))
+
+    def _extractFromHtml(self, html_content: str) -> str:
+        return extract_page(html_content)
 
     def _extractAndFilterUrls(self, html: str, engine: str) -> List[str]:
         urls = set()
@@ -1,4 +1,5 @@
 """Model settings for the Websocket package"""
+import os
 import sys
 import json
 from pathlib import Path
@@ -17,34 +18,35 @@ MODEL_FORMATS = {
     "phi-3-mini-4k-instruct.Q4_K_M.gguf": "chatml"
 }
 
-def load_config():
-    """Loads JSON configuration"""
-    
+# FILE WRITTEN BY THE HTTP API ON /switch-model
+CONFIG_PATH = Path(__file__).resolve().parents[3] / "config" / "current_model.json"
+
+def model_path_for(model_name: str) -> str:
+    """Path of a GGUF in the llama.cpp models directory"""
     # PATH IS SIMILAR TO YOUR EXAMPLE
-    current_file = Path(__file__).resolve()
-    config_path = current_file.parents[3] / "config" / "current_model.json"
+    return f"../llama.cpp/models/{model_name}" if sys.platform == 'linux' else str(Path(__file__).resolve().parent.parent.parent.parent.parent / "llama.cpp" / "models" / model_name)
+
+def read_model_name() -> str:
+    """Model named in current_model.json"""
+    if not CONFIG_PATH.exists():
+        raise FileNotFoundError(f"Configuration file not found: {CONFIG_PATH}")
 
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
-    
-    with open(config_path, 'r') as f:
+    with open(CONFIG_PATH, 'r') as f:
         config = json.load(f)
-    
+
     model_name = config.get("model_name")
-    name_of_model = config.get("model_name")
     if not model_name:
         raise ValueError("model_name not found in JSON")
-    
-    # PATH IS SIMILAR TO YOUR EXAMPLE
-    model_path = f"../llama.cpp/models/{model_name}" if sys.platform == 'linux' else str(Path(__file__).resolve().parent.parent.parent.parent.parent / "llama.cpp" / "models" / model_name) 
-    
-    # GET THE CORRECT FORMAT
-    chat_format = MODEL_FORMATS.get(model_name, "chatml")
-    
+    return model_name
+
+def load_config():
+    """Loads JSON configuration"""
+    model_name = read_model_name()
     return {
-        "model_path": model_path,
-        "chat_format": chat_format,
-        "name_of_model": name_of_model
+        "model_path": model_path_for(model_name),
+        # GET THE CORRECT FORMAT
+        "chat_format": MODEL_FORMATS.get(model_name, "chatml"),
+        "name_of_model": model_name
     }
 
 # LOAD CONFIGURATION
@@ -59,5 +61,100 @@ except Exception as e:
 
 PROMPT_SYSTEM_PATH = Path("/dev/shm/prompt_system.txt")
 
+# CONTINUOUS BATCHING: CONCURRENT SEQUENCES IN THE CONTEXT AND TOKENS PER DECODE CALL
+BATCH_SLOTS = 4
+BATCH_SIZE = 512
+
+# SECONDS A CANCEL IS HELD FOR A PROMPT NOT SUBMITTED TO THE SCHEDULER YET (STILL LOADING ITS MODEL OR IN A CACHE LOOKUP)
+EARLY_CANCEL_HOLD = 60.0
+# PROMPT IDS THE SCHEDULER REMEMBERS HAVING RECEIVED: A CANCEL FOR ONE OF THEM THAT IS NO LONGER QUEUED OR RUNNING
+# CAME AFTER IT FINISHED AND IS NOT HELD FOR A LATER PROMPT REUSING THE ID
+SUBMITTED_IDS_KEPT = 4096
+
+# PREFIX KV CACHE: RAM BUDGET, OPTIONAL DISK TIER AND SMALLEST PREFIX WORTH STORING
+PREFIX_CACHE_BYTES = 2 * 1024**3
+PREFIX_CACHE_DISK_DIR = None
+PREFIX_CACHE_DISK_BYTES = 8 * 1024**3
+PREFIX_CACHE_MIN_TOKENS = 64
+
+# SESSION HISTORY: TRIM POLICY (drop_oldest, pin_last_n, truncate_head) AND TURNS KEPT BY pin_last_n
+CONTEXT_POLICY = "drop_oldest"
+CONTEXT_KEEP_LAST_TURNS = 6
+
+# PER-PROMPT TOKEN STREAM BETWEEN THE DECODE THREAD AND THE WEBSOCKET SENDER
+# "coalesce": A FULL QUEUE MERGES NEW TOKENS INTO THE LAST QUEUED ONE
+# "cancel": A FULL QUEUE CANCELS THE PROMPT
+# EITHER WAY THE PROMPT IS CANCELLED ONCE STREAM_MAX_PENDING_CHARS ARE WAITING
+STREAM_QUEUE_SIZE = 256
+STREAM_MAX_PENDING_CHARS = 1 << 20
+SLOW_CONSUMER_POLICY = "coalesce"
+
+# OPT-IN COALESCED FRAMING ("stream" IN THE PROMPT ACTION): DEFAULT WINDOW AND FLUSH SIZE
+STREAM_WINDOW_MS = 25
+STREAM_FLUSH_CHARS = 256
+
+# PERMESSAGE-DEFLATE: FAST LEVEL AND SMALL WINDOWS, TOKEN FRAMES ARE SHORT AND LATENCY BOUND
+WS_DEFLATE_LEVEL = 1
+WS_DEFLATE_WINDOW_BITS = 12
+WS_DEFLATE_MEM_LEVEL = 5
+
+# HOT MODEL SWITCH: POLL INTERVAL OF current_model.json
+SWITCH_WATCH_INTERVAL = 1.0
+
+# RESIDENT MODEL POOL: RAM BUDGET IN BYTES, OR THIS SHARE OF THE TOTAL RAM REPORTED BY PSUTIL WHEN NONE
+MODEL_POOL_RAM_BYTES = None
+MODEL_POOL_RAM_FRACTION = 0.6
+
+# RESPONSE CACHE FOR DETERMINISTIC REQUESTS (TEMPERATURE 0 OR FIXED SEED): RAM BUDGET, TTL AND OPTIONAL diskcache TIER
+RESPONSE_CACHE = True
+RESPONSE_CACHE_BYTES = 64 * 1024**2
+RESPONSE_CACHE_TTL = 24 * 3600
+RESPONSE_CACHE_DISK_DIR = None
+RESPONSE_CACHE_DISK_BYTES = 1024**3
+
+# SEMANTIC CACHE: GGUF EMBEDDING MODEL OF THE MODELS DIRECTORY (NONE = DISABLED), ROWS OF THE INDEX,
+# COSINE SIMILARITY NEEDED FOR A HIT AND PER-MODEL OVERRIDES OF IT
+SEMANTIC_CACHE_MODEL = None
+SEMANTIC_CACHE_ENTRIES = 100_000
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_THRESHOLDS = {}
+
+# ADMISSION QUEUE: PROMPTS RUNNING AT ONCE (NONE = ONE PER BATCH SLOT), DEFICIT ROUND ROBIN QUANTUM IN
+# ESTIMATED TOKENS, WAITING PROMPTS IN TOTAL AND PER SESSION, AND PRIORITY CLASSES (LOWER IS SERVED FIRST)
+ADMISSION_LIMIT = None
+ADMISSION_QUANTUM = 1024
+ADMISSION_MAX_QUEUED = 256
+ADMISSION_MAX_QUEUED_PER_SESSION = 16
+ADMISSION_PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# WORKER MODE: INFERENCE IN N PROCESSES (0 = IN THIS PROCESS) AND DELAY BEFORE RESTARTING A DEAD ONE
+WORKER_PROCESSES = 0
+WORKER_RESTART_DELAY = 1.0
+
+# FAKE ENGINE FOR BENCHMARKS (NO GGUF NEEDED), SWITCHED ON WITH SCRY_FAKE_ENGINE=1:
+# TOKENS PER SECOND PER SEQUENCE, PREFILL TOKENS PER SECOND AND TOKENS PER REPLY
+FAKE_ENGINE = os.environ.get("SCRY_FAKE_ENGINE") == "1"
+FAKE_ENGINE_RATE = float(os.environ.get("SCRY_FAKE_ENGINE_RATE", 50))
+FAKE_ENGINE_PREFILL_RATE = float(os.environ.get("SCRY_FAKE_ENGINE_PREFILL_RATE", 2000))
+FAKE_ENGINE_REPLY_TOKENS = int(os.environ.get("SCRY_FAKE_ENGINE_REPLY_TOKENS", 128))
+
+# STARTUP: THE PORT IS BOUND BEFORE THE MODEL LOADS AND PROMPTS QUEUE UNTIL IT IS READY. THE GGUF IS READ
+# AHEAD INTO THE PAGE CACHE NEXT TO THE LOAD (SCRY_MODEL_PREFETCH=0 TURNS IT OFF) IN CHUNKS OF THIS SIZE,
+# AND CLIENTS GET A loading MESSAGE AT MOST THIS OFTEN (SECONDS)
+MODEL_PREFETCH = os.environ.get("SCRY_MODEL_PREFETCH", "1") != "0"
+MODEL_PREFETCH_CHUNK = 16 * 1024**2
+LOADING_MESSAGE_INTERVAL = 0.25
+
+# DURABLE SESSIONS: SQLITE DATABASE OF THE HISTORIES (SCRY_SESSION_STORE="" TURNS IT OFF), SECONDS BETWEEN
+# BATCHED WRITES AND SECONDS AN UNUSED SESSION IS KEPT. A CLIENT RESUMES BY CONNECTING WITH ?session=<sessionId>
+SESSION_STORE_PATH = os.environ.get("SCRY_SESSION_STORE", str(Path.home() / ".scry" / "sessions.sqlite")) or None
+SESSION_FLUSH_INTERVAL = 0.2
+SESSION_TTL = 7 * 24 * 3600
+# KV SNAPSHOTS OF THE LAST TURN OF EVERY SESSION (SCRY_SESSION_KV=1): A RESUMED SESSION, EVEN AFTER A RESTART,
+# RESTORES ITS PREFIX INSTEAD OF PREFILLING THE HISTORY AGAIN. DIRECTORY AND DISK BUDGET
+SESSION_KV_SNAPSHOTS = os.environ.get("SCRY_SESSION_KV") == "1"
+SESSION_KV_DIR = os.environ.get("SCRY_SESSION_KV_DIR", str(Path.home() / ".scry" / "session_kv"))
+SESSION_KV_BYTES = 8 * 1024**3
+
 # PORTS
 FALLBACK_PORTS_WEBSOCKET = [8765, 8766, 8767, 8768, 8769, 8770, 8771, 8772]
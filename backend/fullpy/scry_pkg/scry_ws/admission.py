@@ -0,0 +1,185 @@
+"""Admission of prompts to the decode slots: priority classes, deficit round robin between sessions, deadlines"""
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional
+from scry_pkg.scry_ws import logger
+
+
+class AdmissionRejected(Exception):
+    """A waiting prompt that will not run. `outcome` is "cancelled" or "expired" (past its deadline)."""
+
+    def __init__(self, message: str, outcome: str):
+        super().__init__(message)
+        self.outcome = outcome
+
+
+class Ticket:
+    """A prompt waiting for admission."""
+    __slots__ = ('prompt_id', 'session_id', 'priority', 'cost', 'future', 'position', 'notify')
+
+    def __init__(self, prompt_id: str, session_id: str, priority: int, cost: int, future: asyncio.Future,
+                 notify: Optional[Callable[[int, int], None]]):
+        self.prompt_id = prompt_id
+        self.session_id = session_id
+        self.priority = priority
+        self.cost = cost
+        self.future = future
+        self.position = 0
+        self.notify = notify
+
+
+class AdmissionQueue:
+    """
+    At most `limit` prompts run at once; the others wait here. Lower priority
+    numbers are always served first. Within a priority, sessions are served by
+    deficit round robin: each turn a session earns `quantum` estimated tokens
+    and runs prompts while it can pay for them, so a session flooding the
+    server gets its share and nothing more, and a session sending its first
+    prompt waits at most one round. Waiting prompts hear of their position
+    through `notify(position, queued)`. Only the event loop may use it.
+    """
+
+    def __init__(self, limit: int, quantum: int, max_queued: int, max_queued_per_session: int):
+        self.limit = limit
+        self.quantum = quantum
+        self.max_queued = max_queued
+        self.max_queued_per_session = max_queued_per_session
+        self.running: set = set()
+        # PRIORITY -> SESSION (IN ROUND ROBIN ORDER) -> ITS WAITING TICKETS
+        self._classes: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._deficit: Dict[str, int] = {}
+        self._tickets: Dict[str, Ticket] = {}
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._tickets)
+
+    def check(self, session_id: str) -> Optional[str]:
+        """Why a new prompt of `session_id` cannot even wait, or None."""
+        if len(self._tickets) >= self.max_queued:
+            return "Server busy: admission queue full"
+        waiting = sum(len(sessions.get(session_id, ())) for sessions in self._classes.values())
+        if waiting >= self.max_queued_per_session:
+            return f"Too many queued prompts for this session ({waiting})"
+        return None
+
+    async def acquire(self, prompt_id: str, session_id: str, priority: int = 1, cost: int = 1,
+                      deadline: Optional[float] = None, notify: Optional[Callable[[int, int], None]] = None) -> float:
+        """Waits until the prompt may run; returns the seconds it waited. Raises AdmissionRejected."""
+        if len(self.running) < self.limit and not self._tickets:
+            self.running.add(prompt_id)
+            self.admitted += 1
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ticket = Ticket(prompt_id, session_id, priority, max(cost, 1), loop.create_future(), notify)
+        self._tickets[prompt_id] = ticket
+        self._classes.setdefault(priority, OrderedDict()).setdefault(session_id, deque()).append(ticket)
+        self._deficit.setdefault(session_id, 0)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), deadline)
+        except asyncio.TimeoutError:
+            self._remove(ticket)
+            if ticket.future.done() and not ticket.future.exception():
+                # ADMITTED IN THE SAME TICK THE DEADLINE FIRED: GIVE THE SLOT BACK
+                self.release(prompt_id)
+            self.rejected += 1
+            raise AdmissionRejected(f"Deadline of {deadline:.1f}s exceeded while queued", "expired")
+        except asyncio.CancelledError:
+            self._remove(ticket)
+            if ticket.future.done() and not ticket.future.cancelled() and not ticket.future.exception():
+                self.release(prompt_id)
+            raise
+        return loop.time() - started
+
+    def set_limit(self, limit: int) -> None:
+        """Changes how many prompts run at once (0 while the model loads: everything queues)."""
+        self.limit = limit
+        self._dispatch()
+
+    def release(self, prompt_id: str) -> None:
+        """The prompt finished (or never started): its place goes to the next waiting prompt."""
+        self.running.discard(prompt_id)
+        self._dispatch()
+
+    def cancel(self, prompt_id: str) -> bool:
+        ticket = self._tickets.get(prompt_id)
+        if ticket is None:
+            return False
+        self._remove(ticket)
+        self.rejected += 1
+        ticket.future.set_exception(AdmissionRejected("Cancelled while queued", "cancelled"))
+        self._renumber()
+        return True
+
+    def drop_session(self, session_id: str) -> None:
+        for ticket in [t for t in self._tickets.values() if t.session_id == session_id]:
+            self.cancel(ticket.prompt_id)
+
+    def _remove(self, ticket: Ticket) -> None:
+        if self._tickets.pop(ticket.prompt_id, None) is None:
+            return
+        sessions = self._classes[ticket.priority]
+        queue = sessions[ticket.session_id]
+        queue.remove(ticket)
+        if not queue:
+            del sessions[ticket.session_id]
+            if not any(ticket.session_id in s for s in self._classes.values()):
+                self._deficit.pop(ticket.session_id, None)
+        if not sessions:
+            del self._classes[ticket.priority]
+
+    def _dispatch(self) -> None:
+        while len(self.running) < self.limit and self._tickets:
+            ticket = self._next()
+            self._remove(ticket)
+            self.running.add(ticket.prompt_id)
+            self.admitted += 1
+            ticket.future.set_result(None)
+        self._renumber()
+
+    def _next(self) -> Ticket:
+        sessions = self._classes[min(self._classes)]
+        while True:
+            session_id, queue = next(iter(sessions.items()))
+            ticket = queue[0]
+            if self._deficit[session_id] >= ticket.cost:
+                self._deficit[session_id] -= ticket.cost
+                return ticket
+            # NOT ENOUGH CREDIT: EARN A QUANTUM AND LET THE NEXT SESSION GO
+            self._deficit[session_id] += self.quantum
+            sessions.move_to_end(session_id)
+
+    def _renumber(self) -> None:
+        """Estimated positions (round robin order, one prompt per session per round); notifies the changed ones."""
+        ahead = 0
+        for priority in sorted(self._classes):
+            sessions = list(self._classes[priority].values())
+            for s, queue in enumerate(sessions):
+                for i, ticket in enumerate(queue):
+                    # SESSIONS EARLIER IN THE ROUND GET THEIR (i+1)-TH PROMPT IN FIRST, LATER ONES THEIR i-TH
+                    others = sum(min(len(q), i + 1 if r < s else i) for r, q in enumerate(sessions) if r != s)
+                    position = ahead + i + others + 1
+                    if position != ticket.position:
+                        ticket.position = position
+                        if ticket.notify is not None:
+                            try:
+                                ticket.notify(position, len(self._tickets))
+                            except Exception as e:
+                                logger.warning(f"Queue position update failed for {ticket.prompt_id}: {e}")
+            ahead += sum(len(queue) for queue in sessions)
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self.running),
+            "limit": self.limit,
+            "queued": len(self._tickets),
+            "sessions_waiting": len(self._deficit),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
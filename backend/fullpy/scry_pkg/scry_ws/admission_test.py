@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+from scry_pkg.scry_ws.admission import AdmissionQueue, AdmissionRejected
+
+
+def admission_order(queue: AdmissionQueue, prompts):
+    """The order `prompts` ((prompt_id, session_id, priority, cost)) run in, one at a time, queued behind a running one."""
+
+    async def run():
+        order = []
+
+        async def wait(prompt_id, session_id, priority, cost):
+            await queue.acquire(prompt_id, session_id, priority, cost)
+            order.append(prompt_id)
+
+        await queue.acquire("running", "other")
+        tasks = []
+        for prompt in prompts:
+            tasks.append(asyncio.create_task(wait(*prompt)))
+            await asyncio.sleep(0)
+        current = "running"
+        for _ in prompts:
+            queue.release(current)
+            while order[-1:] == [current] or not order:
+                await asyncio.sleep(0)
+            current = order[-1]
+        await asyncio.gather(*tasks)
+        return order
+
+    return asyncio.run(run())
+
+
+def test_first_prompts_run_without_waiting():
+    async def run():
+        queue = AdmissionQueue(2, 100, 10, 10)
+        assert await queue.acquire("a", "s") == 0.0
+        assert await queue.acquire("b", "s") == 0.0
+        assert queue.stats()["running"] == 2
+
+    asyncio.run(run())
+
+
+def test_sessions_take_turns():
+    queue = AdmissionQueue(1, 1, 10, 10)
+    order = admission_order(queue, [("a1", "A", 1, 1), ("a2", "A", 1, 1), ("a3", "A", 1, 1), ("b1", "B", 1, 1)])
+    # B SENT ITS PROMPT LAST BUT DOES NOT WAIT FOR ALL OF A'S
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_expensive_prompts_wait_for_their_credit():
+    queue = AdmissionQueue(1, 2, 10, 10)
+    prompts = [("a1", "A", 1, 4), ("a2", "A", 1, 4)] + [(f"b{i}", "B", 1, 1) for i in range(1, 5)]
+    order = admission_order(queue, prompts)
+    # EACH ROUND A SESSION EARNS TWO TOKENS: TWO CHEAP PROMPTS OF B PER COSTLY ONE OF A
+    assert order == ["b1", "b2", "a1", "b3", "b4", "a2"]
+
+
+def test_lower_priority_numbers_go_first():
+    queue = AdmissionQueue(1, 1, 10, 10)
+    order = admission_order(queue, [("slow1", "A", 2, 1), ("normal", "B", 1, 1), ("slow2", "C", 2, 1), ("urgent", "D", 0, 1)])
+    assert order == ["urgent", "normal", "slow1", "slow2"]
+
+
+def test_deadline_expires_while_queued():
+    async def run():
+        queue = AdmissionQueue(1, 1, 10, 10)
+        await queue.acquire("running", "s")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire("late", "s", deadline=0.01)
+        assert rejected.value.outcome == "expired"
+        assert queue.queued == 0 and queue.rejected == 1
+        # THE EXPIRED PROMPT LEFT NO TRACE: THE NEXT ONE GETS THE SLOT
+        queue.release("running")
+        assert await queue.acquire("next", "s") == 0.0
+
+    asyncio.run(run())
+
+
+def test_cancel_while_queued():
+    async def run():
+        queue = AdmissionQueue(1, 1, 10, 10)
+        await queue.acquire("running", "s")
+        waiting = asyncio.create_task(queue.acquire("queued", "s"))
+        await asyncio.sleep(0)
+        assert queue.cancel("queued")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await waiting
+        assert rejected.value.outcome == "cancelled"
+        assert not queue.cancel("queued")
+        assert queue.stats()["sessions_waiting"] == 0
+
+    asyncio.run(run())
+
+
+def test_queue_positions_are_notified():
+    async def run():
+        queue = AdmissionQueue(1, 1, 10, 10)
+        await queue.acquire("running", "x")
+        positions = {}
+        tasks = [asyncio.create_task(queue.acquire(prompt_id, session_id,
+                                                   notify=lambda position, queued, p=prompt_id: positions.__setitem__(p, position)))
+                 for prompt_id, session_id in (("a1", "A"), ("a2", "A"), ("b1", "B"))]
+        await asyncio.sleep(0)
+        assert positions == {"a1": 1, "a2": 3, "b1": 2}
+        queue.release("running")
+        await asyncio.sleep(0)
+        # ONE PROMPT PER SESSION PER ROUND: THE TWO LEFT ARE NEXT AND SECOND
+        assert sorted((positions["a2"], positions["b1"])) == [1, 2]
+        queue.drop_session("A")
+        queue.drop_session("B")
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_check_limits_the_queue():
+    async def run():
+        queue = AdmissionQueue(1, 1, 3, 2)
+        await queue.acquire("running", "s")
+        tasks = [asyncio.create_task(queue.acquire(f"a{i}", "A")) for i in range(2)]
+        await asyncio.sleep(0)
+        assert queue.check("A").startswith("Too many queued prompts")
+        assert queue.check("B") is None
+        tasks.append(asyncio.create_task(queue.acquire("b", "B")))
+        await asyncio.sleep(0)
+        assert queue.check("C") == "Server busy: admission queue full"
+        for prompt_id in ("a0", "a1", "b"):
+            queue.cancel(prompt_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
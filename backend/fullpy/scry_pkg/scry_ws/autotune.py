@@ -0,0 +1,181 @@
+"""
+Autotuner of the llama.cpp runtime parameters of one model on this host.
+
+Stage 1 keeps one context open and sweeps the thread counts (llama_set_n_threads
+needs no reload): generation tok/s per n_threads, prefill tok/s per
+n_threads_batch. Stage 2 keeps the best threads and opens a context per
+n_batch x n_ubatch x flash attention combination. Each combination is scored by
+the time of a --prompt-tokens prefill plus a --gen-tokens generation, which is
+what one chat turn costs; the fastest is stored in the runtimeProfile table
+(one row per model and host) and LlamaChatServer loads with it from then on.
+
+    python -m scry_pkg.scry_ws.autotune --model qwen2.5-7b-instruct.Q4_K_M.gguf
+    python -m scry_pkg.scry_ws.autotune --model qwen2.5-7b-instruct.Q4_K_M.gguf --quick --dry-run
+    python -m scry_pkg.scry_ws.autotune --model qwen2.5-7b-instruct.Q4_K_M.gguf --show
+"""
+import os
+import time
+import argparse
+import psutil
+from itertools import product
+from typing import Dict, List, Tuple
+from scry_pkg.scry_ws import logger, model_path_for, MODEL_FORMATS, BATCH_SLOTS
+from scry_pkg.scry_ws.engine import LlamaEngine
+from scry_pkg.scry_ws.load_profile import load_profile
+from scry_pkg.scry_sqlite.control_config import ControlConfig
+from scry_pkg.scry_sqlite.runtime_profile import RuntimeProfile, host_key
+
+SAMPLE_TEXT = ("The scheduler batches the prompts of several sessions into one decode call, "
+               "so the cost of reading the weights is shared by every sequence in the batch. ")
+
+# CONTEXT_SIZE OF call_llama.cpp.py, FOR MODELS WITHOUT n_ctx IN THEIR LOAD PROFILE
+CONTEXT_SIZE = 8000
+
+# STAGE 2 GRID; --quick KEEPS n_batch AT 512
+BATCH_SIZES = (256, 512, 1024)
+UBATCH_SIZES = (128, 256, 512)
+
+
+def thread_candidates() -> List[int]:
+    logical = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    physical = min(psutil.cpu_count(logical=False) or logical, logical)
+    return sorted({logical, physical, max(physical // 2, 1)})
+
+
+def prompt_tokens(engine: LlamaEngine, n_tokens: int) -> List[int]:
+    tokens = engine.model.tokenize(SAMPLE_TEXT.encode("utf-8"), add_bos=False, special=False)
+    return (tokens * (n_tokens // len(tokens) + 1))[:n_tokens]
+
+
+def measure_prefill(engine: LlamaEngine, tokens: List[int]) -> float:
+    """Prompt tokens per second, fed in n_batch chunks like the scheduler does."""
+    engine.clear_seq(0)
+    started = time.perf_counter()
+    for start in range(0, len(tokens), engine.n_batch):
+        chunk = tokens[start:start + engine.n_batch]
+        engine.decode([(token, start + i, 0, start + i == len(tokens) - 1) for i, token in enumerate(chunk)])
+    seconds = time.perf_counter() - started
+    engine.clear_seq(0)
+    return len(tokens) / seconds
+
+
+def measure_generation(engine: LlamaEngine, tokens: List[int], n_gen: int) -> float:
+    """Single-token decodes per second after a short prompt; sampling left out, it does not depend on the profile."""
+    engine.clear_seq(0)
+    prompt = tokens[:32]
+    engine.decode([(token, pos, 0, pos == len(prompt) - 1) for pos, token in enumerate(prompt)])
+    started = time.perf_counter()
+    for i in range(n_gen):
+        engine.decode([(tokens[(len(prompt) + i) % len(tokens)], len(prompt) + i, 0, True)])
+    seconds = time.perf_counter() - started
+    engine.clear_seq(0)
+    return n_gen / seconds
+
+
+def open_tuned(model_path: str, chat_format: str, load: Dict, profile: Dict) -> LlamaEngine:
+    # TUNED UNDER THE MODEL'S LOAD PROFILE: KV CACHE TYPES AND SIZE CHANGE THE ATTENTION COST
+    engine = LlamaEngine(model_path, chat_format, load["n_ctx"], BATCH_SLOTS, profile["n_batch"], profile={**load, **profile})
+    engine.warmup()
+    return engine
+
+
+def tune_threads(model_path: str, chat_format: str, load: Dict, args) -> Tuple[int, int]:
+    candidates = thread_candidates()
+    engine = open_tuned(model_path, chat_format, load, {"n_batch": 512, "n_ubatch": 512, "flash_attn": load["type_v"] != "f16"})
+    try:
+        tokens = prompt_tokens(engine, args.prompt_tokens)
+        gen = {}
+        for n in candidates:
+            engine.set_threads(n, engine.n_threads_batch)
+            gen[n] = measure_generation(engine, tokens, args.gen_tokens)
+            logger.info(f"n_threads={n}: {gen[n]:.1f} gen tok/s")
+        engine.set_threads(max(gen, key=gen.get), engine.n_threads_batch)
+        prefill = {}
+        for n in candidates:
+            engine.set_threads(engine.n_threads, n)
+            prefill[n] = measure_prefill(engine, tokens)
+            logger.info(f"n_threads_batch={n}: {prefill[n]:.1f} prompt tok/s")
+    finally:
+        engine.close()
+    return max(gen, key=gen.get), max(prefill, key=prefill.get)
+
+
+def tune_batches(model_path: str, chat_format: str, load: Dict, n_threads: int, n_threads_batch: int, args) -> List[Dict]:
+    results = []
+    batches = (512,) if args.quick else BATCH_SIZES
+    for n_batch, n_ubatch, flash_attn in product(batches, UBATCH_SIZES, (False, True)):
+        # A QUANTIZED V CACHE ALWAYS RUNS WITH FLASH ATTENTION
+        if n_ubatch > n_batch or (not flash_attn and load["type_v"] != "f16"):
+            continue
+        profile = {"n_threads": n_threads, "n_threads_batch": n_threads_batch,
+                   "n_batch": n_batch, "n_ubatch": n_ubatch, "flash_attn": flash_attn}
+        try:
+            engine = open_tuned(model_path, chat_format, load, profile)
+        except Exception as e:
+            # FLASH ATTENTION IS NOT BUILT FOR EVERY BACKEND
+            logger.warning(f"Skipped {profile}: {e}")
+            continue
+        try:
+            tokens = prompt_tokens(engine, args.prompt_tokens)
+            profile["prompt_tokens_per_s"] = measure_prefill(engine, tokens)
+            profile["gen_tokens_per_s"] = measure_generation(engine, tokens, args.gen_tokens)
+        finally:
+            engine.close()
+        profile["turn_s"] = args.prompt_tokens / profile["prompt_tokens_per_s"] + args.gen_tokens / profile["gen_tokens_per_s"]
+        logger.info(f"n_batch={n_batch} n_ubatch={n_ubatch} flash_attn={flash_attn}: "
+                    f"{profile['prompt_tokens_per_s']:.1f} prompt tok/s, {profile['gen_tokens_per_s']:.1f} gen tok/s")
+        results.append(profile)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="GGUF file name in the llama.cpp models directory")
+    parser.add_argument("--prompt-tokens", type=int, default=512, help="prefill length of one scored turn")
+    parser.add_argument("--gen-tokens", type=int, default=64, help="generated tokens of one scored turn")
+    parser.add_argument("--quick", action="store_true", help="n_batch 512 only in stage 2")
+    parser.add_argument("--dry-run", action="store_true", help="print the results, store nothing")
+    parser.add_argument("--show", action="store_true", help="print the stored profile and exit")
+    parser.add_argument("--delete", action="store_true", help="delete the stored profile and exit")
+    args = parser.parse_args()
+
+    stored = RuntimeProfile({"id_model": args.model})
+    if args.show:
+        print(stored.get() or f"No runtime profile for {args.model} on {host_key()}")
+        return
+    if args.delete:
+        print("Deleted" if stored.delete() else f"No runtime profile for {args.model} on {host_key()}")
+        return
+
+    # model_path_for IS RELATIVE TO scry_ws, WHERE THE SERVER RUNS
+    model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), model_path_for(args.model))
+    if not os.path.exists(model_path):
+        parser.error(f"{model_path} not found")
+    chat_format = MODEL_FORMATS.get(args.model, "chatml")
+    load = load_profile(ControlConfig({"id_model": args.model}).get(), CONTEXT_SIZE)
+
+    started = time.perf_counter()
+    n_threads, n_threads_batch = tune_threads(model_path, chat_format, load, args)
+    results = sorted(tune_batches(model_path, chat_format, load, n_threads, n_threads_batch, args), key=lambda r: r["turn_s"])
+    if not results:
+        raise SystemExit("No combination could be measured")
+
+    print(f"{args.model} on {host_key()}: n_threads={n_threads}, n_threads_batch={n_threads_batch}, "
+          f"turn = {args.prompt_tokens} prompt + {args.gen_tokens} generated tokens")
+    print(f"{'n_batch':>8}{'n_ubatch':>9}{'flash':>7}{'prompt t/s':>12}{'gen t/s':>9}{'turn s':>8}")
+    for r in results:
+        print(f"{r['n_batch']:>8}{r['n_ubatch']:>9}{'on' if r['flash_attn'] else 'off':>7}"
+              f"{r['prompt_tokens_per_s']:>12.1f}{r['gen_tokens_per_s']:>9.1f}{r['turn_s']:>8.2f}")
+    print(f"tuned in {time.perf_counter() - started:.0f} s")
+
+    best = {k: v for k, v in results[0].items() if k != "turn_s"}
+    if args.dry_run:
+        return
+    if RuntimeProfile({"id_model": args.model, **best}).save():
+        print(f"Stored: {best}")
+    else:
+        raise SystemExit(f"Could not store {best}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,151 +1,642 @@
+import os
+import re
 import time
 import json
 import uuid
+import signal
 import asyncio
+import itertools
+import psutil
 import websockets
-from llama_cpp import Llama, LlamaCache
-from typing import List, Dict, Optional, Set
+from pathlib import Path
+from contextlib import aclosing
+from urllib.parse import parse_qs, urlsplit
+from typing import List, Dict, Optional, Set, Tuple
 from get_prompt_system import get_prompt_system
 from websockets.exceptions import ConnectionClosedOK
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from scry_pkg.scry_ws.engine import LlamaEngine, Embedder, open_engine, open_tokenizer
+from scry_pkg.scry_ws.scheduler import BatchScheduler, GenerationRequest
+from scry_pkg.scry_ws.prefix_cache import PrefixCache
+from scry_pkg.scry_ws.context_window import ContextWindow, POLICIES
+from scry_pkg.utils import estimate_tokens
+from scry_pkg.scry_ws.framing import StreamOptions, TokenSender
+from scry_pkg.scry_ws.speculative import PromptLookupDrafter, DraftModelDrafter
+from scry_pkg.scry_ws.model_pool import ModelPool, ResidentModel
+from scry_pkg.scry_ws.workers import WorkerPool
+from scry_pkg.scry_ws.response_cache import ResponseCache, is_deterministic, response_key, replay
+from scry_pkg.scry_ws.semantic_cache import SemanticCache
+from scry_pkg.scry_ws.admission import AdmissionQueue, AdmissionRejected
+from scry_pkg.scry_ws.startup import LoadProgress, prefetch
+from scry_pkg.scry_ws.load_profile import load_profile, log_kv_estimate
+from scry_pkg.scry_ws.session_store import SessionStore
+from scry_pkg.scry_ws.metrics import record_prompt, stats_message, serve_metrics, ADMISSION_WAIT, CANCEL_RELEASE
+from scry_pkg.scry_metrics.registry import REGISTRY
+from scry_pkg.scry_net.client import close_shared
 from scry_pkg.scry_sqlite.control_config import ControlConfig
-from scry_pkg.scry_ws import MODEL_PATH, CHAT_FORMAT, logger, FALLBACK_PORTS_WEBSOCKET, NAME_OF_MODEL, PROMPT_SYSTEM_PATH
+from scry_pkg.scry_sqlite.runtime_profile import RuntimeProfile
+from scry_pkg.scry_ws import MODEL_PATH, logger, FALLBACK_PORTS_WEBSOCKET, NAME_OF_MODEL, PROMPT_SYSTEM_PATH, BATCH_SLOTS, BATCH_SIZE
+from scry_pkg.scry_ws import MODEL_FORMATS, CONFIG_PATH, SWITCH_WATCH_INTERVAL, MODEL_POOL_RAM_BYTES, MODEL_POOL_RAM_FRACTION, model_path_for, read_model_name
+from scry_pkg.scry_ws import ADMISSION_LIMIT, ADMISSION_QUANTUM, ADMISSION_MAX_QUEUED, ADMISSION_MAX_QUEUED_PER_SESSION, ADMISSION_PRIORITIES
+from scry_pkg.scry_ws import SEMANTIC_CACHE_MODEL, SEMANTIC_CACHE_ENTRIES, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_THRESHOLDS
+from scry_pkg.scry_ws import WORKER_PROCESSES, RESPONSE_CACHE, RESPONSE_CACHE_BYTES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DISK_DIR, RESPONSE_CACHE_DISK_BYTES
+from scry_pkg.scry_ws import PREFIX_CACHE_BYTES, PREFIX_CACHE_DISK_DIR, PREFIX_CACHE_DISK_BYTES, CONTEXT_POLICY, CONTEXT_KEEP_LAST_TURNS
+from scry_pkg.scry_ws import WS_DEFLATE_LEVEL, WS_DEFLATE_WINDOW_BITS, WS_DEFLATE_MEM_LEVEL
+from scry_pkg.scry_ws import MODEL_PREFETCH, MODEL_PREFETCH_CHUNK, LOADING_MESSAGE_INTERVAL
+from scry_pkg.scry_ws import SESSION_STORE_PATH, SESSION_FLUSH_INTERVAL, SESSION_TTL, SESSION_KV_SNAPSHOTS, SESSION_KV_DIR, SESSION_KV_BYTES
 
 CONTEXT_SIZE = 8000
 
+# SESSION IDS A CLIENT MAY PRESENT ON RECONNECT
+SESSION_ID = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
 
 class LlamaChatServer:
-    # Cache for dynamic configuration
-    _config_cache = None
-    _cache_time = 0
+    # Default LLM parameters, overridden per model by its configModel row
+    DEFAULT_PARAMS = {
+        "temperature": 0.7, "top_p": 0.9, "top_k": 40, "tokens": 512, "repeat_penalty": 1.1,
+        "frequency_penalty": 0.0, "presence_penalty": 0.0, "min_p": 0.05, "tfs_z": 1.0, "mirostat_tau": 5.0,
+        "seed": None, "stop": None, "speculative": "none", "draft_model": None, "draft_tokens": 4,
+    }
+    # Keys of the parameters that reach the sampler
+    SAMPLING_KEYS = ("temperature", "top_p", "top_k", "repeat_penalty", "frequency_penalty", "presence_penalty", "min_p",
+                     "seed", "speculative", "draft_tokens")
+
+    # Cache for dynamic configuration, per model
+    _config_cache: Dict[str, dict] = {}
+    _cache_time: Dict[str, float] = {}
 
     @classmethod
-    def get_config(cls):
+    def get_config(cls, model_name: str = NAME_OF_MODEL):
         now = time.time()
-        if not cls._config_cache or (now - cls._cache_time) > 5:
-            cls._config_cache = ControlConfig({"id_model": NAME_OF_MODEL}).get()
-            cls._cache_time = now
-        return cls._config_cache
+        if not cls._config_cache.get(model_name) or (now - cls._cache_time.get(model_name, 0)) > 5:
+            cls._config_cache[model_name] = ControlConfig({"id_model": model_name}).get()
+            cls._cache_time[model_name] = now
+        return cls._config_cache[model_name]
 
     def __init__(self, model_path: str, system_prompt: Optional[str] = None):
-        # Default LLM parameters
-        self.temperature = 0.7
-        self.top_p = 0.9
-        self.top_k = 40
-        self.tokens = 512
-        self.repeat_penalty = 1.1
-        self.frequency_penalty = 0.0
-        self.presence_penalty = 0.0
-        self.min_p = 0.05
-        self.tfs_z = 1.0
-        self.mirostat_tau = 5.0
-        self.seed = None
-        self.stop = None
-
-        # Initialize LLaMA model
-        self.llm = Llama(
-            model_path=model_path,
-            n_ctx=CONTEXT_SIZE,
-            n_gpu_layers=-1,
-            seed=self.seed,
-            verbose=False,
-            chat_format=CHAT_FORMAT,
-            use_mlock=True,
-            use_mmap=True
-        )
-        self.llm.set_cache(LlamaCache())
+        # Resident models under a RAM budget: the default one (current_model.json) plus any a prompt asks for.
+        # Each has one context shared by BATCH_SLOTS sequences and its own decode thread.
+        # The default one is loaded by load(), after the port is bound
+        self.model_path = model_path
+        self.default_model = NAME_OF_MODEL
+        budget = MODEL_POOL_RAM_BYTES or int(psutil.virtual_memory().total * MODEL_POOL_RAM_FRACTION)
+        self.pool = ModelPool(budget, self._build_model)
+        # Worker mode: the model runs in WORKER_PROCESSES processes, this one only tokenizes and streams
+        self.workers: Optional[WorkerPool] = None
+        self.loading = LoadProgress(LOADING_MESSAGE_INTERVAL)
+        # Clients connected before the model was ready: they get loading messages, then ready
+        self._early_clients: Dict[websockets.WebSocketServerProtocol, str] = {}
+        # While a model switch runs: the longest serving stall seen so far (event loop or prompt routing)
+        self._switch_stall: Optional[Dict[str, float]] = None
+        # Switches asked for by the switch_model action and the current_model.json watcher: one runs at a time,
+        # a second request for the same model joins the one in flight
+        self._switches: Dict[str, asyncio.Future] = {}
+        self._switch_lock = asyncio.Lock()
+
+        # Replies of deterministic requests (temperature 0 or fixed seed), identical concurrent prompts share one generation
+        self.responses = ResponseCache(RESPONSE_CACHE_BYTES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DISK_DIR, RESPONSE_CACHE_DISK_BYTES) if RESPONSE_CACHE else None
+        # Paraphrases of a first question answered from past replies, matched on prompt embeddings (loaded by load())
+        self.embedder: Optional[Embedder] = None
+        self.semantic: Optional[SemanticCache] = None
+        # Cache of web search results and pages, and the processes extracting page text, opened by the first search
+        self.search_cache = None
+        self.search_extractor = None
 
         self.active_prompts: Set[str] = set()
-        self.session_history: Dict[str, List[Dict[str, str]]] = {}
+        # Prompts beyond the decode slots wait here: priority classes, then round robin between sessions.
+        # Nothing runs until the model is loaded: prompts sent before then queue
+        slots = BATCH_SLOTS * (WORKER_PROCESSES or 1)
+        self.admission_limit = ADMISSION_LIMIT or slots
+        self.admission = AdmissionQueue(0, ADMISSION_QUANTUM, ADMISSION_MAX_QUEUED, ADMISSION_MAX_QUEUED_PER_SESSION)
+        self._stream_ids = itertools.count(1)
+        self.session_history: Dict[str, ContextWindow] = {}
+        # Histories outlive their connection: a client reconnecting with ?session=<sessionId> resumes
+        kv_dir = SESSION_KV_DIR if SESSION_KV_SNAPSHOTS else None
+        self.sessions = SessionStore(Path(SESSION_STORE_PATH), SESSION_FLUSH_INTERVAL, SESSION_TTL, kv_dir, SESSION_KV_BYTES) if SESSION_STORE_PATH else None
+        # Session -> the connection it belongs to; a resume takes it over from a connection not yet seen as dropped
+        self._session_owners: Dict[str, websockets.WebSocketServerProtocol] = {}
+        # Resumed session -> messages restored, reported by its ready message
+        self._resumed: Dict[str, int] = {}
+        # Resumed session -> (model, KV snapshot being read), restored before its first prompt
+        self._resuming: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.context_policy = CONTEXT_POLICY
         self.__path_system_prompt = PROMPT_SYSTEM_PATH
         self.system_prompt = system_prompt or "You are a helpful, knowledgeable, and professional AI assistant."
 
-    def update_live_config(self):
-        # Update LLM parameters from database
-        config = self.get_config()
-        if config:
-            for key, value in config.items():
-                setattr(self, key, value)
-            logger.info(f"CONFIGPARAMS: {config}")
+        # Gauges read at every scrape of /metrics
+        REGISTRY.gauge("scry_ws_active_prompts", "Prompts started and not finished", function=lambda: len(self.active_prompts))
+        REGISTRY.gauge("scry_ws_queued_prompts", "Prompts waiting for admission", function=lambda: self.admission.queued)
+        REGISTRY.gauge("scry_ws_sessions", "Sessions with a history", function=lambda: len(self.session_history))
+        REGISTRY.gauge("scry_ws_resident_models", "Models loaded in the pool", function=lambda: len(self.pool.models))
+        REGISTRY.gauge("scry_ws_resident_model_bytes", "Memory taken by the resident models", function=lambda: self.pool.resident_bytes)
+        REGISTRY.gauge("scry_ws_model_ready", "1 once the startup model serves prompts", function=lambda: int(self.loading.ready))
+        REGISTRY.gauge("scry_ws_startup_seconds", "From process start to the startup model being ready (so far)", function=lambda: self.loading.seconds)
+
+    async def load(self):
+        """Loads the startup model, and the embedding model, while clients can already connect."""
+        loop = asyncio.get_running_loop()
+        report = lambda **progress: loop.call_soon_threadsafe(self._report_loading, progress)
+        logger.info(f"Initializing LLaMA model {self.default_model}...")
+        # Read ahead next to the load: its page faults then hit the page cache
+        if MODEL_PREFETCH and os.path.exists(self.model_path):
+            loop.run_in_executor(None, self._prefetch, report)
+        try:
+            if WORKER_PROCESSES:
+                model = self._worker_model(NAME_OF_MODEL, self.model_path)
+                self.pool.add(model)
+                # Ready only once every worker has loaded the GGUF: prompts wait in admission until then
+                await self.workers.wait_ready(lambda share: self._report_loading({"weights": share}))
+            else:
+                model = await loop.run_in_executor(None, self._build_model, NAME_OF_MODEL, self.model_path,
+                                                   lambda value: report(weights=value))
+                self.pool.add(model)
+            if SEMANTIC_CACHE_MODEL:
+                self._report_loading({"stage": "embedder"})
+                self.embedder = await loop.run_in_executor(None, Embedder, model_path_for(SEMANTIC_CACHE_MODEL))
+                self.semantic = SemanticCache(self.embedder.dim, SEMANTIC_CACHE_ENTRIES, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_THRESHOLDS)
+        except Exception as e:
+            self.loading.error = f"{type(e).__name__}: {e}"
+            self.loading.update(stage="failed")
+            await self._broadcast_loading()
+            raise
+
+        # Ready goes out before the queued prompts are admitted, so it precedes their tokens
+        self._report_loading({"stage": "ready"})
+        self.admission.set_limit(self.admission_limit)
+        logger.info(f"Model {self.default_model} ready {self.loading.seconds:.2f} s after startup")
+
+    def _prefetch(self, report):
+        try:
+            prefetch(self.model_path, MODEL_PREFETCH_CHUNK, lambda done, size: report(prefetched=done / size))
+        except OSError as e:
+            logger.warning(f"Prefetch of {self.model_path} failed: {e}")
+
+    def _report_loading(self, progress: Dict):
+        # A loaded model is warmed up before it counts as ready
+        if progress.get("weights", 0) >= 1 and self.loading.stage == "weights":
+            progress["stage"] = "warmup"
+        if self.loading.ready and progress.get("stage") != "ready":
+            return
+        if self.loading.update(**progress):
+            asyncio.ensure_future(self._broadcast_loading())
+
+    def _ready_message(self, session_id: str) -> Dict:
+        message = {"type": "ready", "message": "Model is ready", "sessionId": session_id, "model": self.default_model}
+        restored = self._resumed.pop(session_id, None)
+        if restored is not None:
+            message.update(resumed=True, historyLength=restored)
+        return message
+
+    async def _broadcast_loading(self):
+        if self.loading.ready:
+            clients, self._early_clients = self._early_clients, {}
+            messages = {websocket: self._ready_message(session_id) for websocket, session_id in clients.items()}
+        elif self.loading.error is not None:
+            messages = {websocket: {"type": "error", "error": f"Model failed to load: {self.loading.error}"} for websocket in self._early_clients}
         else:
+            messages = {websocket: dict(self.loading.message(), sessionId=session_id) for websocket, session_id in self._early_clients.items()}
+        # A client that left meanwhile is cleaned up by its own handler
+        await asyncio.gather(*(websocket.send(json.dumps(message)) for websocket, message in messages.items()), return_exceptions=True)
+
+    def model_params(self, model_name: str) -> Dict:
+        # LLM parameters of one model, from the database: each prompt gets its own copy, so
+        # concurrent prompts for different models never see each other's settings
+        config = self.get_config(model_name)
+        if not config:
             logger.warning("CONFIGPARAMS DEFAULTS USED")
-
-    def get_session_history(self, session_id: str) -> List[Dict[str, str]]:
-        # Retrieve or initialize session conversation
-        prompt_system = get_prompt_system(self.__path_system_prompt) or self.system_prompt
+        return {**self.DEFAULT_PARAMS, **(config or {})}
+
+    @staticmethod
+    def new_prefix_cache(model_name: str) -> PrefixCache:
+        # States are only valid for the model that produced them: one spill directory per model
+        disk_dir = Path(PREFIX_CACHE_DISK_DIR) / Path(model_name).stem if PREFIX_CACHE_DISK_DIR else None
+        return PrefixCache(PREFIX_CACHE_BYTES, disk_dir, PREFIX_CACHE_DISK_BYTES)
+
+    @staticmethod
+    def context_budget(engine: LlamaEngine, params: Dict) -> int:
+        # Prompt tokens a session may use: the model's context minus the reply reserve
+        return min(engine.n_ctx, engine.n_ctx_train) - params["tokens"]
+
+    def _window_counter(self):
+        model = self.pool.get(self.default_model)
+        params = self.model_params(self.default_model)
+        if model is None:
+            # Still loading: estimated counts, redone with the tokenizer by the first prompt
+            n_ctx = load_profile(self.get_config(self.default_model), CONTEXT_SIZE)["n_ctx"]
+            return estimate_tokens, n_ctx - params["tokens"]
+        return model.engine.count_tokens, self.context_budget(model.engine, params)
+
+    def new_context_window(self, system_prompt: str) -> ContextWindow:
+        count_tokens, budget = self._window_counter()
+        return ContextWindow(system_prompt, count_tokens, budget, policy=self.context_policy, keep_last=CONTEXT_KEEP_LAST_TURNS)
+
+    def get_session_history(self, session_id: str) -> ContextWindow:
+        # Retrieve or initialize session conversation; a resumed one was restored by open_session
         if session_id not in self.session_history:
-            self.session_history[session_id] = [{"role": "system", "content": prompt_system}]
+            prompt_system = get_prompt_system(self.__path_system_prompt) or self.system_prompt
+            self.session_history[session_id] = self.new_context_window(prompt_system)
         return self.session_history[session_id]
 
-    def cleanup_session(self, session_id: str):
+    def persist_session(self, session_id: str):
+        # Queued for the next batched write of the session store
+        if self.sessions is not None and session_id in self.session_history:
+            self.sessions.save(session_id, self.session_history[session_id].snapshot())
+
+    async def open_session(self, websocket: websockets.WebSocketServerProtocol) -> str:
+        # Resume the session named by ?session= when the store (or this process) still has it, else a new one
+        requested = parse_qs(urlsplit(websocket.request.path).query).get("session", [None])[0]
+        if requested and SESSION_ID.fullmatch(requested):
+            if requested not in self.session_history and self.sessions is not None:
+                # Read once, off the event loop: the restored window is the session's history from now on
+                snapshot = await asyncio.get_running_loop().run_in_executor(None, self.sessions.load, requested)
+                if snapshot is not None and requested not in self.session_history:
+                    count_tokens, budget = self._window_counter()
+                    self.session_history[requested] = ContextWindow.restore(snapshot, count_tokens, budget, CONTEXT_KEEP_LAST_TURNS)
+            if requested in self.session_history:
+                self._session_owners[requested] = websocket
+                self._resumed[requested] = len(self.session_history[requested]) - 1
+                if self.sessions is not None and self.sessions.kv_dir is not None and self.workers is None:
+                    future = asyncio.get_running_loop().run_in_executor(None, self.sessions.load_kv, requested, self.default_model)
+                    self._resuming[requested] = (self.default_model, future)
+                logger.info(f"Session {requested} resumed with {self._resumed[requested]} messages")
+                return requested
+        # Unguessable: the id is all a client needs to resume
+        session_id = uuid.uuid4().hex
+        self._session_owners[session_id] = websocket
+        return session_id
+
+    async def restore_session_kv(self, model: ResidentModel, session_id: str):
+        # The KV snapshot of the resumed session goes into the prefix cache before its first prompt is admitted
+        model_name, future = self._resuming.pop(session_id, (None, None))
+        if future is None:
+            return
+        snapshot = await future
+        if snapshot is not None and model_name == model.name:
+            model.scheduler.preload(*snapshot)
+            logger.info(f"Session {session_id}: KV snapshot of {len(snapshot[0])} tokens restored")
+
+    def cleanup_session(self, session_id: str, websocket: Optional[websockets.WebSocketServerProtocol] = None):
+        # A resumed session belongs to the newer connection: the old one leaves it alone
+        if websocket is not None and self._session_owners.get(session_id) is not websocket:
+            return
+        self._session_owners.pop(session_id, None)
+        self._resumed.pop(session_id, None)
+        self._resuming.pop(session_id, None)
+        # The history stays in the session store for a resume
         self.session_history.pop(session_id, None)
+        self.admission.drop_session(session_id)
+        if self.workers is not None:
+            self.workers.unpin(session_id)
         logger.info(f"Session cleanup complete for {session_id}")
 
-    async def handle_prompt(self, prompt_id: str, prompt_text: str, session_id: str, websocket: websockets.WebSocketServerProtocol):
-        self.update_live_config()
-        logger.info(f"Processing prompt {prompt_id} for session {session_id}")
-
-        history = self.get_session_history(session_id).copy()
-        history.append({"role": "user", "content": prompt_text})
-
-        loop = asyncio.get_event_loop()
-
-        def get_stream_sync():
-            # Synchronous LLM call wrapped for executor
-            return self.llm.create_chat_completion(
-                history,
-                max_tokens=self.tokens,
-                stream=True,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                top_k=self.top_k,
-                repeat_penalty=self.repeat_penalty,
-                frequency_penalty=self.frequency_penalty,
-                presence_penalty=self.presence_penalty,
-                min_p=self.min_p,
-                tfs_z=self.tfs_z,
-                mirostat_tau=self.mirostat_tau,
-                stop=self.stop
-            )
+    @classmethod
+    def sampling_params(cls, params: Dict) -> Dict:
+        return {key: params[key] for key in cls.SAMPLING_KEYS}
+
+    def ensure_draft_model(self, model: ResidentModel, params: Dict):
+        # Loads the draft GGUF in the background; prompts run without drafts until it is ready
+        draft_model = params["draft_model"]
+        if params["speculative"] != "draft" or not draft_model or model.draft_name == draft_model:
+            return
+        model.draft_name = draft_model
+        if self.workers is not None:
+            # The workers load the draft model they were started with, a new one needs a restart
+            if self.workers.draft_path != model_path_for(draft_model):
+                logger.warning(f"Draft model {draft_model} set while the workers run {self.workers.draft_path or 'none'}: "
+                               f"restart the server to use it, prompts draft without it until then")
+            return
+        asyncio.get_running_loop().run_in_executor(None, self._load_draft_model, model, draft_model)
+
+    def _load_draft_model(self, model: ResidentModel, name: str):
+        path = model_path_for(name)
+        logger.info(f"Loading draft model {path} for {model.name}")
+        try:
+            # SAME CONTEXT AS THE TARGET: DRAFTS RUN AT ITS POSITIONS
+            draft = LlamaEngine(path, model.chat_format, n_ctx=model.engine.n_ctx, n_slots=BATCH_SLOTS, n_batch=BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Draft model {name} failed to load: {e}")
+            return
+        if draft.n_vocab != model.engine.n_vocab:
+            logger.error(f"Draft model {name} has {draft.n_vocab} tokens, target has {model.engine.n_vocab}: not usable")
+            draft.close()
+            return
+        model.scheduler.set_drafter("draft", DraftModelDrafter(draft))
+        logger.info(f"Draft model {name} ready")
+
+    def _build_model(self, model_name: str, model_path: Optional[str] = None, progress=None) -> ResidentModel:
+        # Runs in an executor
+        if self.workers is not None:
+            raise RuntimeError(f"Worker mode serves {self.default_model} only, restart the server to change models")
+        path = model_path or model_path_for(model_name)
+        chat_format = MODEL_FORMATS.get(model_name, "chatml")
+        profile = self.engine_profile(model_name, path)
+        engine = open_engine(path, chat_format, n_ctx=profile["n_ctx"], n_slots=BATCH_SLOTS, n_batch=BATCH_SIZE, progress=progress,
+                             profile=profile)
+        engine.warmup()
+        # KV states keyed by token prefix: the shared system prompt and past turns are restored, not re-prefilled
+        prefix_cache = self.new_prefix_cache(model_name)
+        # Every completed turn of a session also leaves its KV state with the session store
+        snapshot = None
+        if self.sessions is not None and self.sessions.kv_dir is not None:
+            snapshot = lambda session_id, tokens, state: self.sessions.save_kv(session_id, model_name, tokens, state)
+        scheduler = BatchScheduler(engine, prefix_cache, {"lookup": PromptLookupDrafter()}, snapshot)
+        return ResidentModel(model_name, path, chat_format, engine, prefix_cache, scheduler)
+
+    def engine_profile(self, model_name: str, model_path: str) -> Dict:
+        # Load profile of configModel (context, KV cache types, RoPE, mlock/mmap), then the
+        # threads, batch sizes and flash attention tuned for this host by scry_ws.autotune
+        profile = load_profile(self.get_config(model_name), CONTEXT_SIZE)
+        log_kv_estimate(model_name, model_path, profile)
+        runtime = RuntimeProfile({"id_model": model_name}).get()
+        if runtime:
+            logger.info(f"Runtime profile of {model_name} for {runtime['host']}: {runtime}")
+            profile.update(runtime)
+        return profile
+
+    def _worker_model(self, model_name: str, model_path: str) -> ResidentModel:
+        chat_format = MODEL_FORMATS.get(model_name, "chatml")
+        profile = self.engine_profile(model_name, model_path)
+        # Every worker loads the draft model configured at startup next to the target
+        params = self.model_params(model_name)
+        draft_path = model_path_for(params["draft_model"]) if params["speculative"] == "draft" and params["draft_model"] else None
+        self.workers = WorkerPool(WORKER_PROCESSES, model_path, chat_format, n_ctx=profile["n_ctx"], n_slots=BATCH_SLOTS, n_batch=BATCH_SIZE,
+                                  profile=profile, draft_path=draft_path)
+        tokenizer = open_tokenizer(model_path, profile["n_ctx"], profile["rope_scaling"])
+        return ResidentModel(model_name, model_path, chat_format, tokenizer, None, self.workers)
+
+    async def switch_model(self, model_name: str) -> Dict:
+        """Makes `model_name` the default model, loading it next to the resident ones if needed."""
+        switch = self._switches.get(model_name)
+        if switch is None:
+            if model_name == self.default_model:
+                return self._already_active(model_name)
+            switch = self._switches[model_name] = asyncio.ensure_future(self._switch_model(model_name))
+            switch.add_done_callback(lambda _: self._switches.pop(model_name, None))
+        # SHIELDED: A CLIENT LEAVING DOES NOT STOP A SWITCH OTHERS MAY WAIT ON
+        return await asyncio.shield(switch)
+
+    @staticmethod
+    def _already_active(model_name: str) -> Dict:
+        return {"model": model_name, "status": "already_active", "switchSeconds": 0.0, "downtimeSeconds": 0.0}
+
+    async def _switch_model(self, model_name: str) -> Dict:
+        async with self._switch_lock:
+            # A SWITCH QUEUED BEHIND ANOTHER ONE MAY FIND ITS MODEL ACTIVE ALREADY
+            if model_name == self.default_model:
+                return self._already_active(model_name)
+            return await self._switch_to(model_name)
+
+    async def _switch_to(self, model_name: str) -> Dict:
+        started = time.perf_counter()
+        previous = self.default_model
+        was_resident = self.pool.get(model_name) is not None
+        logger.info(f"Switching model {previous} -> {model_name}")
+
+        # DOWNTIME IS MEASURED, NOT ASSUMED: THE LONGEST STALL OF THE EVENT LOOP OR OF A PROMPT WAITING FOR ITS MODEL
+        stall = self._switch_stall = self._switch_stall or {"seconds": 0.0}
+        probe = asyncio.create_task(self._probe_loop_stalls(stall))
+        try:
+            # LOADED AND WARMED UP IN THE BACKGROUND: THE PREVIOUS MODEL SERVES UNTIL THE NEW ONE IS RESIDENT
+            self.pool.release(await self.pool.acquire(model_name, keep={previous}))
+            loaded = time.perf_counter()
+            self.default_model = model_name
 
+            # THE PREVIOUS MODEL STAYS RESIDENT WHILE IT FITS, OR UNTIL ITS LAST PROMPT FINISHES
+            await self.pool.trim(keep={model_name})
+        finally:
+            probe.cancel()
+            if self._switch_stall is stall:
+                self._switch_stall = None
+        result = {
+            "model": model_name,
+            "previous": previous,
+            "status": "switched",
+            "resident": was_resident,
+            "loadSeconds": round(loaded - started, 3),
+            "downtimeSeconds": round(stall["seconds"], 3),
+            "switchSeconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info(f"Model switch complete: {result}, pool: {self.pool.stats()}")
+        return result
+
+    @staticmethod
+    async def _probe_loop_stalls(stall: Dict[str, float], tick: float = 0.01):
+        # A tick that runs late means the event loop served nobody for that long
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(tick)
+            stall["seconds"] = max(stall["seconds"], loop.time() - before - tick)
+
+    async def watch_model_config(self):
+        # POST /switch-model rewrites current_model.json: a new model name there starts a switch
+        last = CONFIG_PATH.stat().st_mtime if CONFIG_PATH.exists() else None
+        while True:
+            await asyncio.sleep(SWITCH_WATCH_INTERVAL)
+            try:
+                mtime = CONFIG_PATH.stat().st_mtime
+                if mtime == last:
+                    continue
+                model_name = read_model_name()
+                last = mtime
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read {CONFIG_PATH}: {e}")
+                continue
+            if model_name != self.default_model:
+                asyncio.create_task(self._switch_from_config(model_name))
+
+    async def _switch_from_config(self, model_name: str):
         try:
-            stream = await loop.run_in_executor(None, get_stream_sync)
-            response_tokens = []
+            await self.switch_model(model_name)
+        except Exception as e:
+            logger.error(f"Model switch to {model_name} failed: {type(e).__name__}: {e}")
 
-            for chunk in stream:
-                await asyncio.sleep(0)  # yield control for cancellation
+    async def semantic_lookup(self, model: ResidentModel, history: List[Dict[str, str]], max_tokens: int):
+        # Only first questions: a follow-up means nothing without the turns before it
+        if self.semantic is None or len(history) != 2 or history[0]["role"] != "system":
+            return None
+        scope = f"{model.name}\n{max_tokens}\n{history[0]['content']}"
 
-                if prompt_id not in self.active_prompts:
-                    await websocket.send(json.dumps({"promptId": prompt_id, "complete": True, "type": "complete"}))
-                    return
+        def probe():
+            vector = self.embedder.embed(history[-1]["content"])
+            return vector, self.semantic.lookup(vector, scope, model.name)
 
-                token = chunk["choices"][0]["delta"].get("content", "")
-                if token:
-                    response_tokens.append(token)
-                    await websocket.send(json.dumps({"promptId": prompt_id, "token": token, "type": "token"}))
+        try:
+            vector, found = await asyncio.get_running_loop().run_in_executor(None, probe)
+        except Exception as e:
+            logger.error(f"Semantic cache lookup failed: {type(e).__name__}: {e}")
+            return None
+        return scope, vector, found
 
-            # Append final response to session
-            if prompt_id in self.active_prompts:
-                self.active_prompts.remove(prompt_id)
-                assistant_response = "".join(response_tokens)
-                self.get_session_history(session_id).append({"role": "user", "content": prompt_text})
-                if assistant_response:
-                    self.get_session_history(session_id).append({"role": "assistant", "content": assistant_response})
+    def cancel_prompt(self, prompt_id: str, model: Optional[ResidentModel] = None):
+        # A prompt sharing a generation only detaches from it
+        if self.responses is not None and self.responses.cancel(prompt_id):
+            return
+        if model is not None:
+            model.scheduler.cancel(prompt_id)
+        else:
+            self.pool.cancel(prompt_id)
+
+    async def handle_prompt(self, prompt_id: str, prompt_text: str, session_id: str, websocket: websockets.WebSocketServerProtocol,
+                            stream_options: Optional[StreamOptions] = None, model_name: Optional[str] = None, want_stats: bool = False,
+                            priority: str = "normal", deadline: Optional[float] = None):
+        received = time.perf_counter()
+        # Wait for a decode slot; the cost of a prompt is its estimated tokens plus the reply budget of its model
+        cost = estimate_tokens(prompt_text) + self.model_params(model_name or self.default_model)["tokens"]
+        notify = lambda position, queued: asyncio.create_task(self._send_queued(websocket, prompt_id, position, queued))
+        try:
+            waited = await self.admission.acquire(prompt_id, session_id, ADMISSION_PRIORITIES[priority], cost, deadline, notify)
+        except AdmissionRejected as e:
+            record_prompt(model_name or self.default_model, e.outcome, "miss", {}, None, time.perf_counter() - received)
+            if e.outcome == "expired":
+                await self._send_error(websocket, prompt_id, str(e))
+            elif prompt_id not in self.active_prompts:
+                # Cancelled by the client (a closed session has nobody to tell)
                 await websocket.send(json.dumps({"promptId": prompt_id, "complete": True, "type": "complete"}))
-                logger.info(f"Prompt {prompt_id} complete. History length: {len(self.get_session_history(session_id))}")
+            self.active_prompts.discard(prompt_id)
+            return
+        ADMISSION_WAIT.observe(waited, priority=priority)
+
+        try:
+            await self._handle_admitted(prompt_id, prompt_text, session_id, websocket, stream_options, model_name, want_stats, received, waited)
+        finally:
+            self.admission.release(prompt_id)
+
+    async def _send_queued(self, websocket, prompt_id: str, position: int, queued: int):
+        try:
+            await websocket.send(json.dumps({"promptId": prompt_id, "type": "queued", "position": position, "queueLength": queued}))
+        except Exception as e:
+            logger.warning(f"Could not send queue position of {prompt_id}: {e}")
+
+    async def _handle_admitted(self, prompt_id: str, prompt_text: str, session_id: str, websocket, stream_options: Optional[StreamOptions],
+                               model_name: Optional[str], want_stats: bool, received: float, waited: float):
+        # Route to the requested model (loaded on demand) or the default one
+        routing, to_default = time.perf_counter(), not model_name or model_name == self.default_model
+        try:
+            model = await self.pool.acquire(model_name or self.default_model, keep={self.default_model})
+            # A prompt for the default model held up during a switch counts as its downtime
+            if self._switch_stall is not None and to_default:
+                self._switch_stall["seconds"] = max(self._switch_stall["seconds"], time.perf_counter() - routing)
+        except Exception as e:
+            logger.error(f"Model {model_name} unavailable for prompt {prompt_id}: {type(e).__name__}: {e}")
+            await self._send_error(websocket, prompt_id, f"Model unavailable: {e}")
+            self.active_prompts.discard(prompt_id)
+            record_prompt(model_name or self.default_model, "error", "miss", {}, None, time.perf_counter() - received)
+            return
+
+        try:
+            await self._run_prompt(model, prompt_id, prompt_text, session_id, websocket, stream_options, received, want_stats, waited)
+        finally:
+            self.pool.release(model)
+            await self.pool.trim(keep={self.default_model})
+
+    async def _run_prompt(self, model: ResidentModel, prompt_id: str, prompt_text: str, session_id: str,
+                          websocket: websockets.WebSocketServerProtocol, stream_options: Optional[StreamOptions],
+                          received: float, want_stats: bool = False, waited: float = 0.0):
+        params = self.model_params(model.name)
+        logger.info(f"CONFIGPARAMS: {params}")
+        self.ensure_draft_model(model, params)
+        logger.info(f"Processing prompt {prompt_id} for session {session_id} on {model.name}")
+
+        # History plus the new message, trimmed to the token budget of the model
+        window = self.get_session_history(session_id)
+        if window.count_tokens != model.engine.count_tokens:
+            window.recount(model.engine.count_tokens)
+        window.budget = self.context_budget(model.engine, params)
+        history = window.build(prompt_text)
+        await self.restore_session_kv(model, session_id)
+
+        # Decoding happens in the scheduler, batched with the other active prompts
+        request = GenerationRequest(prompt_id, history, self.sampling_params(params), params["tokens"], params["stop"], session_id)
+        # Exact reply cache first, then a paraphrase of a cached question, then a real generation
+        stream, source, key, probe = None, "miss", None, None
+        if self.responses is not None and is_deterministic(request.params):
+            key = response_key(model.name, history, request.params, request.max_tokens, request.stops)
+            stream = await self.responses.replay(key)
+            source = "hit" if stream is not None else "miss"
+        if stream is None:
+            probe = await self.semantic_lookup(model, history, request.max_tokens)
+            if probe is not None and probe[2] is not None:
+                texts, stats, similarity = probe[2]
+                stream, source = replay(texts, dict(stats, cached=True, similarity=round(similarity, 4))), "semantic"
+        if stream is None and key is not None:
+            stream, source = self.responses.share(key, request, model.scheduler.submit, model.scheduler.cancel)
+        elif stream is None:
+            model.scheduler.submit(request)
+            stream = request.events
+
+        sender = TokenSender(websocket, prompt_id, stream_options)
+        try:
+            # One frame per token, or coalesced frames when the client negotiated them
+            response_tokens, kind, payload = await sender.pump(stream)
+            if kind == "error":
+                raise RuntimeError(payload)
+            stats = payload or {}
+
+            if prompt_id not in self.active_prompts:
+                await websocket.send(json.dumps({"promptId": prompt_id, "complete": True, "type": "complete"}))
+                record_prompt(model.name, "cancelled", source, stats, None, time.perf_counter() - received)
+                if "release_s" in stats:
+                    CANCEL_RELEASE.observe(stats["release_s"], model=model.name)
+                return
+
+            # Append final response to session
+            self.active_prompts.remove(prompt_id)
+            assistant_response = "".join(response_tokens)
+            self.get_session_history(session_id).append({"role": "user", "content": prompt_text})
+            if assistant_response:
+                self.get_session_history(session_id).append({"role": "assistant", "content": assistant_response})
+            self.persist_session(session_id)
+            complete = {"promptId": prompt_id, "complete": True, "type": "complete"}
+            if stats.get("speculative", "none") != "none":
+                complete["speculative"] = stats
+            if source != "miss":
+                complete["cache"] = source
+            if source == "semantic":
+                complete["similarity"] = stats["similarity"]
+            elif source == "miss" and probe is not None and assistant_response:
+                # The index lock may be held by a lookup scan: never wait for it on the event loop
+                asyncio.get_running_loop().run_in_executor(None, self.semantic.add, probe[1], probe[0], list(response_tokens), stats)
+            await websocket.send(json.dumps(complete))
+            ttft = sender.first_sent - received if sender.first_sent is not None else None
+            duration = time.perf_counter() - received
+            record_prompt(model.name, "complete", source, stats, ttft, duration)
+            if want_stats:
+                await websocket.send(json.dumps(stats_message(prompt_id, model.name, source, stats, ttft, duration, waited)))
+            logger.info(f"Prompt {prompt_id} complete. History length: {len(self.get_session_history(session_id))}")
+            logger.info(f"Generation stats: {stats}")
+            if self.responses is not None:
+                logger.info(f"Response cache ({source}): {self.responses.stats()}")
+            if self.semantic is not None:
+                logger.info(f"Semantic cache: {self.semantic.stats()}")
+            if model.prefix_cache is not None:
+                logger.info(f"Prefix cache: {model.prefix_cache.stats()}")
+            else:
+                logger.info(f"Workers: {self.workers.stats()}")
 
         except ConnectionClosedOK:
+            self.cancel_prompt(prompt_id, model)
             self.active_prompts.discard(prompt_id)
+            record_prompt(model.name, "disconnected", source, {}, None, time.perf_counter() - received)
         except Exception as e:
             logger.error(f"Fatal error during prompt {prompt_id}: {type(e).__name__}: {e}", exc_info=True)
+            self.cancel_prompt(prompt_id, model)
             await self._send_error(websocket, prompt_id, f"Server Error: {e}")
             self.active_prompts.discard(prompt_id)
+            record_prompt(model.name, "error", source, {}, None, time.perf_counter() - received)
 
     async def handle_client(self, websocket: websockets.WebSocketServerProtocol, path: Optional[str] = None):
-        session_id = str(uuid.uuid4())[:8]
+        session_id = await self.open_session(websocket)
         logger.info(f"New client connected: {websocket.remote_address} - Session: {session_id}")
 
         try:
-            await websocket.send(json.dumps({"type": "ready", "message": "Model is ready", "sessionId": session_id}))
+            if self.loading.ready:
+                await websocket.send(json.dumps(self._ready_message(session_id)))
+            else:
+                # Model still loading: progress now, ready later; prompts sent meanwhile queue
+                self._early_clients[websocket] = session_id
+                await websocket.send(json.dumps(dict(self.loading.message(), sessionId=session_id)))
             async for message in websocket:
                 await self._process_client_message(websocket, message, session_id)
         except ConnectionClosedOK:
@@ -154,7 +645,8 @@ class LlamaChatServer:
             logger.error(f"Client handler error: {e}")
             await self._send_error(websocket, None, f"Connection failure: {e}")
         finally:
-            self.cleanup_session(session_id)
+            self._early_clients.pop(websocket, None)
+            self.cleanup_session(session_id, websocket)
 
     async def _process_client_message(self, websocket, message, session_id):
         try:
@@ -166,6 +658,8 @@ class LlamaChatServer:
                 await self._handle_cancel_action(websocket, data)
             elif action == "clear_history":
                 await self._handle_clear_history_action(websocket, session_id)
+            elif action == "switch_model":
+                await self._handle_switch_model_action(websocket, data)
             else:
                 await self._send_error(websocket, None, f"Unknown action: {action}")
         except Exception as e:
@@ -178,23 +672,74 @@ class LlamaChatServer:
             return
 
         prompt_id = data.get("promptId") or str(uuid.uuid4())
-        if len(self.active_prompts) > 5:
-            await self._send_error(websocket, prompt_id, "Too many active prompts. Wait for current ones to finish.")
+        # Beyond the running limit prompts queue; only a full queue turns them away
+        rejection = self.admission.check(session_id)
+        if rejection:
+            record_prompt(data.get("model") or self.default_model, "rejected", "miss", {}, None, 0.0)
+            await self._send_error(websocket, prompt_id, rejection)
             return
 
+        # Optional priority class and deadline (milliseconds the prompt may wait in the queue)
+        priority = data.get("priority", "normal")
+        if priority not in ADMISSION_PRIORITIES:
+            await self._send_error(websocket, prompt_id, f"Unknown priority: {priority}")
+            return
+        deadline_ms = data.get("deadlineMs")
+        if deadline_ms is not None and (not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0):
+            await self._send_error(websocket, prompt_id, "deadlineMs must be a positive number")
+            return
+
+        # Optional per-session history policy
+        context_policy = data.get("contextPolicy")
+        if context_policy in POLICIES:
+            self.get_session_history(session_id).policy = context_policy
+
+        # Optional model id: any GGUF of the models directory, kept resident after its first prompt
+        model_name = data.get("model")
+        if model_name and not Path(model_path_for(model_name)).is_file():
+            await self._send_error(websocket, prompt_id, f"Unknown model: {model_name}")
+            return
+
+        stream_options = StreamOptions.negotiate(data.get("stream"), next(self._stream_ids))
+        started = {"promptId": prompt_id, "sessionId": session_id, "status": "started", "type": "started",
+                   "model": model_name or self.default_model}
+        if stream_options:
+            started["stream"] = stream_options.describe()
+
         self.active_prompts.add(prompt_id)
-        asyncio.create_task(self.router(data, prompt_id, prompt_text, session_id, websocket))
-        await websocket.send(json.dumps({"promptId": prompt_id, "sessionId": session_id, "status": "started", "type": "started"}))
+        # started goes out first: queued and token messages of this prompt always follow it
+        await websocket.send(json.dumps(started))
+        asyncio.create_task(self.router(data, prompt_id, prompt_text, session_id, websocket, stream_options))
 
     async def _handle_cancel_action(self, websocket, data):
         prompt_id = data.get("promptId")
         if prompt_id:
             self.active_prompts.discard(prompt_id)
+            # Still queued: it leaves the queue and never runs
+            if not self.admission.cancel(prompt_id):
+                self.cancel_prompt(prompt_id)
             await websocket.send(json.dumps({"promptId": prompt_id, "status": "canceled", "type": "status"}))
 
+    async def _handle_switch_model_action(self, websocket, data):
+        model_name = data.get("model")
+        if not model_name:
+            await self._send_error(websocket, None, "Missing model")
+            return
+        if not self.loading.ready:
+            await websocket.send(json.dumps({"type": "model_switch_failed", "model": model_name, "error": "Startup model still loading"}))
+            return
+        try:
+            result = await self.switch_model(model_name)
+        except Exception as e:
+            logger.error(f"Model switch to {model_name} failed: {type(e).__name__}: {e}")
+            await websocket.send(json.dumps({"type": "model_switch_failed", "model": model_name, "error": str(e)}))
+            return
+        await websocket.send(json.dumps({"type": "model_switched", **result}))
+
     async def _handle_clear_history_action(self, websocket, session_id):
         # Reset session conversation
-        self.session_history[session_id] = [{"role": "system", "content": "You are a helpful and polite assistant. Always respond in the user's language."}]
+        self.session_history[session_id] = self.new_context_window("You are a helpful and polite assistant. Always respond in the user's language.")
+        self.persist_session(session_id)
         await websocket.send(json.dumps({"sessionId": session_id, "status": "history_cleared", "type": "memory_cleared"}))
         logger.info(f"Session history reset for {session_id}")
 
@@ -209,18 +754,18 @@ class LlamaChatServer:
 
     async def bridges(self, data, promptId, promptText, sessionId, websocket):
         # Specialized processing (search or thinking)
-        from scry_pkg.scry_tools.search.run_search import RunSearch
         try:
             search_code = data.get("search", 100)
             think_flag = data.get("think", False)
 
             if search_code in (200, 300):
-                response = RunSearch()._search(promptText)
-            else:
-                response = f"Thinking analysis for: {promptText}" if think_flag else f"Chat response to: {promptText}"
-                if search_code == 100:
-                    self.get_session_history(sessionId).append({"role": "user", "content": promptText})
-                    self.get_session_history(sessionId).append({"role": "assistant", "content": response})
+                await self.stream_search(promptId, promptText, websocket)
+                return
+            response = f"Thinking analysis for: {promptText}" if think_flag else f"Chat response to: {promptText}"
+            if search_code == 100:
+                self.get_session_history(sessionId).append({"role": "user", "content": promptText})
+                self.get_session_history(sessionId).append({"role": "assistant", "content": response})
+                self.persist_session(sessionId)
 
             await websocket.send(json.dumps({"promptId": promptId, "token": response, "type": "token"}))
             await websocket.send(json.dumps({"promptId": promptId, "complete": True, "type": "complete"}))
@@ -228,37 +773,83 @@ class LlamaChatServer:
             logger.error(f"Bridge error: {e}")
             await websocket.send(json.dumps({"promptId": promptId, "error": f"Processing failed: {e}", "type": "error"}))
 
+    async def stream_search(self, promptId, promptText, websocket):
+        # Each page is sent as soon as it is extracted, cut down to its passages that best answer the prompt: every
+        # page gets a share of SEARCH_CONTEXT_TOKENS. The fetches, extraction and ranking never block the loop
+        from scry_pkg.scry_tools.search.async_search import AsyncSearch
+        from scry_pkg.scry_tools.search.passages import PassageStream, source_blocks
+        self.open_search()
+        loop = asyncio.get_running_loop()
+        started, pages, sources = time.perf_counter(), 0, []
+        search = AsyncSearch(cache=self.search_cache, extractor=self.search_extractor)
+        selection = PassageStream(promptText, search.max_pages, count_tokens=self._window_counter()[0])
+        async with aclosing(search.stream(promptText)) as stream:
+            async for page in stream:
+                pages += 1
+                passages = await loop.run_in_executor(None, selection.add, page)
+                for block in source_blocks(passages):
+                    token = block["text"] if not sources else "\n\n" + block["text"]
+                    sources.append(block["url"])
+                    await websocket.send(json.dumps({"promptId": promptId, "token": token, "source": block["url"], "type": "token"}))
+        cache = f", cache {self.search_cache.stats()}" if self.search_cache is not None else ""
+        logger.info(f"Search {promptId}: {pages} pages, {selection.used} tokens of passages from {len(sources)} "
+                    f"in {time.perf_counter() - started:.1f} s{cache}")
+        await websocket.send(json.dumps({"promptId": promptId, "complete": True, "sources": sources, "type": "complete"}))
+
+    def open_search(self):
+        # The search package imports trafilatura: loaded by the first search, not at startup
+        from scry_pkg.scry_tools.search import SEARCH_CACHE_DIR, SEARCH_CACHE_BYTES, SEARCH_QUERY_TTL, SEARCH_PAGE_TTL, SEARCH_PAGE_KEEP
+        from scry_pkg.scry_tools.search import SEARCH_EXTRACT_WORKERS
+        from scry_pkg.scry_tools.search.cache import SearchCache
+        from scry_pkg.scry_tools.search.extract import ExtractionPool
+        if self.search_extractor is None and SEARCH_EXTRACT_WORKERS > 0:
+            self.search_extractor = ExtractionPool(SEARCH_EXTRACT_WORKERS)
+        if self.search_cache is not None or not SEARCH_CACHE_DIR:
+            return
+        try:
+            self.search_cache = SearchCache(SEARCH_CACHE_DIR, SEARCH_CACHE_BYTES, SEARCH_QUERY_TTL, SEARCH_PAGE_TTL, SEARCH_PAGE_KEEP)
+        except Exception as e:
+            logger.warning(f"Search cache at {SEARCH_CACHE_DIR} unavailable, searching without it: {e}")
+
     def _updateSystemPrompt(self, session_id, new_prompt):
         # Update system prompt for a session
         if session_id in self.session_history:
-            for msg in self.session_history[session_id]:
-                if msg.get("role") == "system":
-                    msg["content"] = new_prompt
-                    return
-            self.session_history[session_id].insert(0, {"role": "system", "content": new_prompt})
+            self.session_history[session_id].set_system(new_prompt)
+            self.persist_session(session_id)
 
-    def router(self, data, promptId, promptText, sessionId, websocket):
+    def router(self, data, promptId, promptText, sessionId, websocket, streamOptions=None):
         # Route between standard chat and bridges
         searchCode = data.get("search", 100)
         thinkFlag = data.get("think", False)
         if searchCode == 100 and not thinkFlag:
-            return self.handle_prompt(promptId, promptText, sessionId, websocket)
+            deadline = data["deadlineMs"] / 1000 if data.get("deadlineMs") else None
+            return self.handle_prompt(promptId, promptText, sessionId, websocket, streamOptions, data.get("model"), data.get("stats") is True,
+                                      data.get("priority", "normal"), deadline)
         return self.bridges(data, promptId, promptText, sessionId, websocket)
 
 
+def deflate_extension() -> ServerPerMessageDeflateFactory:
+    # Tuned for short, latency-bound token frames: cheap level, small windows
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+        client_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+        compress_settings={"level": WS_DEFLATE_LEVEL, "memLevel": WS_DEFLATE_MEM_LEVEL},
+    )
+
+
 async def main():
-    logger.info("Initializing LLaMA model...")
-    try:
-        server = LlamaChatServer(MODEL_PATH)
-    except Exception as e:
-        logger.error(f"FATAL: Failed to load LLaMA model at {MODEL_PATH}: {e}")
-        return
+    # The port is bound first: clients connect (and queue prompts) while the model loads
+    server = LlamaChatServer(MODEL_PATH)
+    server.pool.start(asyncio.get_running_loop())
 
     ws_server = None
     for port in FALLBACK_PORTS_WEBSOCKET:
         try:
             ws_server = await websockets.serve(
-                server.handle_client, "0.0.0.0", port, ping_interval=20, ping_timeout=10, close_timeout=10
+                server.handle_client, "0.0.0.0", port, ping_interval=20, ping_timeout=10, close_timeout=10,
+                compression=None, extensions=[deflate_extension()],
+                # GET /metrics on the same port answers the Prometheus scrape instead of upgrading
+                process_request=serve_metrics,
             )
             logger.info(f"WebSocket LLaMA server running on ws://0.0.0.0:{port}")
             break
@@ -270,11 +861,42 @@ async def main():
         return
 
     try:
-        await asyncio.Future()
-    except KeyboardInterrupt:
+        await server.load()
+    except Exception as e:
+        logger.error(f"FATAL: Failed to load LLaMA model at {MODEL_PATH}: {e}")
+        ws_server.close()
+        await ws_server.wait_closed()
+        return
+    watcher = asyncio.create_task(server.watch_model_config())
+
+    # SIGTERM TOO: THE SESSION STORE WRITES ITS LAST BATCH BEFORE THE PROCESS GOES
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass    # WINDOWS: CTRL+C CANCELS THE WAIT BELOW
+    try:
+        await stopping.wait()
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
         logger.info("Server shutting down...")
+        watcher.cancel()
+        if server.sessions is not None:
+            server.sessions.close()
+        server.pool.close()
+        if server.responses is not None:
+            server.responses.close()
+        if server.embedder is not None:
+            server.embedder.close()
+        if server.search_cache is not None:
+            server.search_cache.close()
+        if server.search_extractor is not None:
+            server.search_extractor.close()
         ws_server.close()
         await ws_server.wait_closed()
+        await close_shared()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,129 @@
+"""Token-budgeted conversation history of one session"""
+from typing import Callable, Dict, Iterator, List
+from scry_pkg.scry_ws import logger
+
+# TEMPLATE TOKENS AROUND EVERY MESSAGE (ROLE HEADER, SEPARATORS)
+MESSAGE_OVERHEAD = 8
+
+# drop_oldest: DROP THE OLDEST TURNS UNTIL THE HISTORY FITS
+# pin_last_n: KEEP THE SYSTEM PROMPT AND THE LAST N TURNS, THEN DROP_OLDEST
+# truncate_head: KEEP THE FIRST CHARACTERS OF EVERY DROPPED MESSAGE IN A PINNED MESSAGE (NO MODEL CALL, NOT A SUMMARY)
+POLICIES = ("drop_oldest", "pin_last_n", "truncate_head")
+
+# TRUNCATE_HEAD POLICY: CHARACTERS KEPT PER DROPPED MESSAGE AND SHARE OF THE BUDGET THE PINNED MESSAGE MAY USE
+TRUNCATED_ITEM_CHARS = 200
+TRUNCATED_BUDGET_SHARE = 0.25
+
+
+class ContextWindow:
+    """
+    History of one session with the token count of every message, counted once
+    when the message is stored. The system prompt (and the truncated earlier
+    messages, if any) is pinned; when a prompt would overflow the budget the
+    oldest turns are removed down to `low_water` of the budget, so the history
+    prefix (and the prefix KV cache) stays stable for several turns instead of
+    shifting on every turn.
+    """
+
+    def __init__(self, system_prompt: str, count_tokens: Callable[[str], int], budget: int,
+                 policy: str = "drop_oldest", keep_last: int = 6, low_water: float = 0.75):
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.policy = policy if policy in POLICIES else "drop_oldest"
+        self.keep_last = keep_last
+        self.low_water = low_water
+        self.messages: List[Dict[str, str]] = []
+        self.counts: List[int] = []
+        self.total_tokens = 0
+        self.truncated_lines: List[str] = []
+        self._head = 1   # INDEX OF THE FIRST DROPPABLE MESSAGE
+        self.append({"role": "system", "content": system_prompt})
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter(self.messages)
+
+    def _count(self, content: str) -> int:
+        return self.count_tokens(content) + MESSAGE_OVERHEAD
+
+    def append(self, message: Dict[str, str]) -> None:
+        n = self._count(message["content"])
+        self.messages.append(message)
+        self.counts.append(n)
+        self.total_tokens += n
+
+    def recount(self, count_tokens: Callable[[str], int]) -> None:
+        """Counts the stored messages again with another tokenizer (after a model switch)."""
+        self.count_tokens = count_tokens
+        self.counts = [self._count(message["content"]) for message in self.messages]
+        self.total_tokens = sum(self.counts)
+
+    def snapshot(self) -> Dict:
+        """What the session store keeps; token counts are redone by restore()."""
+        return {"messages": self.messages, "truncated_lines": self.truncated_lines, "head": self._head, "policy": self.policy}
+
+    @classmethod
+    def restore(cls, snapshot: Dict, count_tokens: Callable[[str], int], budget: int, keep_last: int = 6) -> "ContextWindow":
+        messages = snapshot["messages"]
+        window = cls(messages[0]["content"], count_tokens, budget, snapshot.get("policy", "drop_oldest"), keep_last)
+        window.messages = list(messages)
+        window.truncated_lines = list(snapshot.get("truncated_lines", []))
+        window._head = snapshot.get("head", 1)
+        window.recount(count_tokens)
+        return window
+
+    def set_system(self, content: str) -> None:
+        n = self._count(content)
+        self.total_tokens += n - self.counts[0]
+        self.messages[0] = {"role": "system", "content": content}
+        self.counts[0] = n
+
+    def build(self, prompt_text: str) -> List[Dict[str, str]]:
+        """Stored history plus the new user message, trimmed (in place) to fit the budget."""
+        incoming = self._count(prompt_text)
+        if self.policy == "pin_last_n":
+            while (len(self.messages) - self._head) > self.keep_last * 2:
+                self._drop_oldest()
+
+        if self.total_tokens + incoming > self.budget:
+            before = self.total_tokens
+            target = int(self.budget * self.low_water) - incoming
+            while self.total_tokens > target and len(self.messages) > self._head:
+                self._drop_oldest()
+            logger.info(f"Context trimmed ({self.policy}): {before} -> {self.total_tokens} tokens, {len(self.messages)} messages")
+
+        return self.messages + [{"role": "user", "content": prompt_text}]
+
+    def _drop_oldest(self) -> None:
+        message = self.messages.pop(self._head)
+        self.total_tokens -= self.counts.pop(self._head)
+        if self.policy == "truncate_head":
+            self._fold(message)
+
+    def _fold(self, message: Dict[str, str]) -> None:
+        text = " ".join(message["content"].split())
+        if len(text) > TRUNCATED_ITEM_CHARS:
+            text = text[:TRUNCATED_ITEM_CHARS].rsplit(" ", 1)[0] + "..."
+        self.truncated_lines.append(f"- {message['role']}: {text}")
+
+        content = self._truncated_content()
+        while len(self.truncated_lines) > 1 and self._count(content) > self.budget * TRUNCATED_BUDGET_SHARE:
+            self.truncated_lines.pop(0)
+            content = self._truncated_content()
+
+        pinned = {"role": "system", "content": content}
+        n = self._count(content)
+        if self._head == 1:
+            self.messages.insert(1, pinned)
+            self.counts.insert(1, n)
+            self.total_tokens += n
+            self._head = 2
+        else:
+            self.total_tokens += n - self.counts[1]
+            self.messages[1] = pinned
+            self.counts[1] = n
+
+    def _truncated_content(self) -> str:
+        return "Earlier messages, truncated:\n" + "\n".join(self.truncated_lines)
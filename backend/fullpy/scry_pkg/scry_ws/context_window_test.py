@@ -0,0 +1,100 @@
+from scry_pkg.scry_ws.context_window import ContextWindow, MESSAGE_OVERHEAD, TRUNCATED_BUDGET_SHARE
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+def turns(window: ContextWindow, n: int, size: int = 10) -> None:
+    for i in range(n):
+        window.append({"role": "user", "content": f"q{i} " + "w " * (size - 1)})
+        window.append({"role": "assistant", "content": f"a{i} " + "w " * (size - 1)})
+
+
+def contents(messages):
+    return [m["content"].split()[0] for m in messages]
+
+
+def test_counts_every_message_once_with_overhead():
+    window = ContextWindow("be brief", words, 1000)
+    turns(window, 2)
+    assert window.total_tokens == 2 + 4 * 10 + 5 * MESSAGE_OVERHEAD
+    assert window.total_tokens == sum(window.counts)
+
+
+def test_history_that_fits_is_untouched():
+    window = ContextWindow("system", words, 1000)
+    turns(window, 3)
+    history = window.build("next question")
+    assert contents(history) == ["system", "q0", "a0", "q1", "a1", "q2", "a2", "next"]
+    assert len(window) == 7
+
+
+def test_drop_oldest_trims_to_low_water_and_keeps_the_system_prompt():
+    window = ContextWindow("system", words, 200, low_water=0.75)
+    turns(window, 6)   # 1 + 12 messages of 18 tokens, 9 for the system prompt: 225
+    history = window.build("next question")
+    assert history[0]["content"] == "system"
+    assert history[-1]["content"] == "next question"
+    # ONE MESSAGE AT A TIME, OLDEST FIRST, DOWN TO 75% OF THE BUDGET MINUS THE NEW MESSAGE: 225 - 5 * 18
+    assert window.total_tokens == 135
+    assert contents(history)[1:-1] == ["a2", "q3", "a3", "q4", "a4", "q5", "a5"]
+
+
+def test_trimming_leaves_a_stable_prefix_for_the_next_turns():
+    window = ContextWindow("system", words, 200)
+    turns(window, 6)
+    first = window.build("next")[:-1]
+    window.append({"role": "user", "content": "next"})
+    second = window.build("again")
+    assert second[:len(first)] == first
+
+
+def test_pin_last_n_keeps_only_the_last_turns():
+    window = ContextWindow("system", words, 10_000, policy="pin_last_n", keep_last=2)
+    turns(window, 5)
+    history = window.build("next")
+    assert contents(history) == ["system", "q3", "a3", "q4", "a4", "next"]
+
+
+def test_truncate_head_folds_dropped_turns_into_a_pinned_message():
+    window = ContextWindow("system", words, 200, policy="truncate_head")
+    turns(window, 6)
+    history = window.build("next")
+    assert history[0]["content"] == "system"
+    pinned = history[1]
+    assert pinned["role"] == "system"
+    assert pinned["content"].startswith("Earlier messages, truncated:")
+    # THE PINNED MESSAGE STAYS UNDER ITS SHARE OF THE BUDGET: THE OLDEST LINES GO FIRST
+    kept = contents(history)[2:-1]
+    folded = [line.split()[2] for line in pinned["content"].split("\n")[1:]]
+    assert folded[-1] == "a3" and kept[0] == "q4"
+    assert window.count_tokens(pinned["content"]) + MESSAGE_OVERHEAD <= 200 * TRUNCATED_BUDGET_SHARE
+    assert window.total_tokens == sum(window.counts)
+    # A SECOND TRIM REPLACES THE PINNED MESSAGE INSTEAD OF DROPPING IT
+    turns(window, 6)
+    history = window.build("later")
+    assert history[1]["content"].startswith("Earlier messages, truncated:")
+    assert sum(m["content"].startswith("Earlier messages") for m in history) == 1
+
+
+def test_unknown_policy_falls_back_to_drop_oldest():
+    assert ContextWindow("system", words, 100, policy="bogus").policy == "drop_oldest"
+
+
+def test_snapshot_and_restore_recount_with_the_new_tokenizer():
+    window = ContextWindow("system", words, 200, policy="truncate_head")
+    turns(window, 6)
+    window.build("next")
+    restored = ContextWindow.restore(window.snapshot(), lambda text: len(text), 200)
+    assert restored.messages == window.messages
+    assert restored.policy == "truncate_head"
+    assert restored.counts == [len(m["content"]) + MESSAGE_OVERHEAD for m in window.messages]
+    assert restored.build("x")[1]["content"].startswith("Earlier messages")
+
+
+def test_set_system_updates_the_total():
+    window = ContextWindow("short", words, 200)
+    window.set_system("a much longer system prompt")
+    assert window.messages[0]["content"] == "a much longer system prompt"
+    assert window.total_tokens == 5 + MESSAGE_OVERHEAD
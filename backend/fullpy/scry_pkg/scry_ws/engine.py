@@ -0,0 +1,309 @@
+"""Low-level llama.cpp engine: one model, one context, one KV sequence per slot"""
+import os
+import ctypes
+import threading
+import numpy as np
+import llama_cpp
+from llama_cpp import _internals, llama_chat_format
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from scry_pkg.scry_ws import logger, FAKE_ENGINE, FAKE_ENGINE_RATE, FAKE_ENGINE_PREFILL_RATE, FAKE_ENGINE_REPLY_TOKENS
+from scry_pkg.scry_ws.scheduler import DecodeError, DecodeAborted
+from scry_pkg.scry_ws.load_profile import CACHE_TYPES, ROPE_SCALING
+
+# CHAT FORMAT NAME (MODEL_FORMATS) -> PROMPT FORMATTER
+CHAT_FORMATTERS = {
+    "llama-3": llama_chat_format.format_llama3,
+    "chatml": llama_chat_format.format_chatml,
+    "mistral-instruct": llama_chat_format.format_mistral_instruct,
+}
+
+# TOKENS LOOKED AT BY THE REPEAT/FREQUENCY/PRESENCE PENALTIES
+PENALTY_LAST_N = 64
+
+
+def open_engine(model_path: str, chat_format: str, n_ctx: int, n_slots: int, n_batch: int = 512,
+                n_threads: Optional[int] = None, progress: Optional[Callable[[float], None]] = None,
+                profile: Optional[Dict] = None):
+    """LlamaEngine, or the FakeEngine stand-in when SCRY_FAKE_ENGINE=1."""
+    if FAKE_ENGINE:
+        from scry_pkg.scry_ws.fake_engine import FakeEngine
+        if progress is not None:
+            progress(1.0)
+        return FakeEngine(model_path, chat_format, n_ctx, n_slots, n_batch, n_threads,
+                          FAKE_ENGINE_RATE, FAKE_ENGINE_PREFILL_RATE, FAKE_ENGINE_REPLY_TOKENS)
+    return LlamaEngine(model_path, chat_format, n_ctx, n_slots, n_batch, n_threads, progress, profile)
+
+
+def open_tokenizer(model_path: str, n_ctx: int, rope_scaling: str = "model"):
+    """Tokenizer, or a FakeEngine (same token counts as the fake workers) when SCRY_FAKE_ENGINE=1."""
+    if FAKE_ENGINE:
+        from scry_pkg.scry_ws.fake_engine import FakeEngine
+        return FakeEngine(model_path, "chatml", n_ctx, 1)
+    return Tokenizer(model_path, n_ctx, rope_scaling)
+
+
+class LlamaEngine:
+    """
+    Thin wrapper over the llama.cpp C API used by the batching scheduler.
+    Every scheduler slot maps to a sequence id inside one shared context, so
+    several prompts are decoded in the same llama_decode call.
+    Not thread safe: only the scheduler thread may call into it.
+    `profile` (a RuntimeProfile row from the autotuner) overrides the thread
+    counts, batch sizes and flash attention; an explicit n_threads (a worker
+    process and its share of the cores) still wins over its thread counts.
+    Its load_profile keys set the KV cache types, RoPE scaling and mlock/mmap.
+    """
+
+    def __init__(self, model_path: str, chat_format: str, n_ctx: int, n_slots: int, n_batch: int = 512,
+                 n_threads: Optional[int] = None, progress: Optional[Callable[[float], None]] = None,
+                 profile: Optional[Dict] = None):
+        profile = profile or {}
+        n_batch = profile.get("n_batch") or n_batch
+        model_params = llama_cpp.llama_model_default_params()
+        # ALL LAYERS ON THE GPU WHEN THE BUILD HAS ONE, NONE ON CPU-ONLY BUILDS
+        model_params.n_gpu_layers = -1 if llama_cpp.llama_supports_gpu_offload() else 0
+        model_params.use_mmap = profile.get("use_mmap", True)
+        model_params.use_mlock = profile.get("use_mlock", True)
+        if progress is not None:
+            # CALLED BY llama.cpp WITH THE FRACTION OF TENSORS LOADED; RETURNING FALSE WOULD ABORT THE LOAD
+            on_progress = llama_cpp.llama_progress_callback(lambda value, _: progress(value) or True)
+            model_params.progress_callback = on_progress
+        self.model = _internals.LlamaModel(path_model=model_path, params=model_params, verbose=False)
+
+        n_cpu = os.cpu_count() or 1
+        ctx_params = llama_cpp.llama_context_default_params()
+        ctx_params.n_ctx = n_ctx
+        ctx_params.n_batch = n_batch
+        ctx_params.n_ubatch = min(profile.get("n_ubatch") or n_batch, n_batch)
+        ctx_params.n_seq_max = n_slots
+        # A WORKER PROCESS GETS ITS OWN SHARE OF THE CORES
+        ctx_params.n_threads = n_threads or profile.get("n_threads") or max(n_cpu // 2, 1)
+        ctx_params.n_threads_batch = n_threads or profile.get("n_threads_batch") or n_cpu
+        type_k, type_v = profile.get("type_k", "f16"), profile.get("type_v", "f16")
+        ctx_params.type_k = CACHE_TYPES[type_k][0]
+        ctx_params.type_v = CACHE_TYPES[type_v][0]
+        flash_attn = profile.get("flash_attn")
+        if type_v != "f16" and not flash_attn:
+            # llama.cpp REFUSES A QUANTIZED V CACHE WITHOUT FLASH ATTENTION
+            if flash_attn is False:
+                logger.warning(f"V cache {type_v} needs flash attention: enabled despite the runtime profile")
+            flash_attn = True
+        if flash_attn is not None:
+            # NEWER llama.cpp: TYPE ENUM (0 DISABLED, 1 ENABLED); OLDER: A BOOL
+            if hasattr(ctx_params, "flash_attn_type"):
+                ctx_params.flash_attn_type = int(flash_attn)
+            else:
+                ctx_params.flash_attn = bool(flash_attn)
+        n_ctx_train = self.model.n_ctx_train()
+        rope_scaling = profile.get("rope_scaling", "model")
+        ctx_params.rope_scaling_type = ROPE_SCALING[rope_scaling]
+        if rope_scaling in ("linear", "yarn"):
+            # STRETCH THE TRAINED POSITIONS OVER n_ctx UNLESS THE PROFILE GIVES THE FACTOR
+            ctx_params.rope_freq_scale = profile.get("rope_freq_scale") or min(n_ctx_train / n_ctx, 1.0)
+            if rope_scaling == "yarn":
+                ctx_params.yarn_orig_ctx = n_ctx_train
+        elif n_ctx > n_ctx_train:
+            logger.warning(f"n_ctx={n_ctx} exceeds the trained context {n_ctx_train} without RoPE scaling: "
+                           f"prompts stay within {n_ctx_train} tokens")
+        # ONE KV POOL FOR ALL SEQUENCES INSTEAD OF n_ctx / n_seq_max EACH
+        if hasattr(ctx_params, "kv_unified"):
+            ctx_params.kv_unified = True
+        self.ctx = _internals.LlamaContext(model=self.model, params=ctx_params, verbose=False)
+
+        self.vocab = llama_cpp.llama_model_get_vocab(self.model.model)
+        self.n_vocab = llama_cpp.llama_vocab_n_tokens(self.vocab)
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, n_slots)
+        self.formatter = CHAT_FORMATTERS.get(chat_format, llama_chat_format.format_chatml)
+        self.n_ctx = n_ctx
+        # POSITIONS THE MODEL HANDLES: THE TRAINED CONTEXT, OR ALL OF n_ctx ONCE ROPE STRETCHES IT
+        self.n_ctx_train = max(n_ctx_train, n_ctx) if rope_scaling in ("linear", "yarn") else n_ctx_train
+        self.n_slots = n_slots
+        self.n_batch = n_batch
+        self.n_ubatch = ctx_params.n_ubatch
+        self.n_threads = ctx_params.n_threads
+        self.n_threads_batch = ctx_params.n_threads_batch
+        # POLLED BY llama.cpp BETWEEN GRAPH NODES WHILE AN ABORTABLE DECODE RUNS
+        self._abort: Optional[threading.Event] = None
+        self._abort_callback = llama_cpp.ggml_abort_callback(lambda _: self._abort is not None and self._abort.is_set())
+        self._no_abort = llama_cpp.ggml_abort_callback()
+        logger.info(f"Engine ready: n_ctx={n_ctx}, slots={n_slots}, n_batch={n_batch}, n_ubatch={self.n_ubatch}, "
+                    f"threads={self.n_threads}/{self.n_threads_batch}, flash_attn={'default' if flash_attn is None else flash_attn}, "
+                    f"kv={type_k}/{type_v}, rope={rope_scaling}, format={chat_format}")
+
+    def set_threads(self, n_threads: int, n_threads_batch: int) -> None:
+        """Threads for single-token decodes and for prompt batches; no new context needed."""
+        llama_cpp.llama_set_n_threads(self.ctx.ctx, n_threads, n_threads_batch)
+        self.n_threads = n_threads
+        self.n_threads_batch = n_threads_batch
+
+    def warmup(self) -> None:
+        """One small decode so weights are paged in and compute buffers exist before the first prompt."""
+        tokens = self.model.tokenize(b"Hello", add_bos=True, special=False)
+        self.decode([(token, pos, 0, pos == len(tokens) - 1) for pos, token in enumerate(tokens)])
+        self.clear_seq(0)
+
+    def format_chat(self, messages: List[Dict[str, str]]) -> Tuple[List[int], List[str]]:
+        """Applies the chat template and returns (prompt tokens, stop strings)."""
+        result = self.formatter(messages=messages)
+        tokens = self.model.tokenize(result.prompt.encode("utf-8"), add_bos=not result.added_special, special=True)
+        stops = result.stop if isinstance(result.stop, list) else [result.stop] if result.stop else []
+        return tokens, stops
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False, special=False))
+
+    def piece(self, token: int) -> bytes:
+        return self.model.token_to_piece(token, special=False)
+
+    def is_eog(self, token: int) -> bool:
+        return bool(llama_cpp.llama_vocab_is_eog(self.vocab, token))
+
+    def decode(self, entries: Sequence[Tuple[int, int, int, bool]], abort: Optional[threading.Event] = None) -> None:
+        """
+        Decodes (token, pos, seq_id, want_logits) entries in a single llama_decode call.
+        Setting `abort` from another thread stops the call early with DecodeAborted.
+        """
+        batch = self.batch
+        for i, (token, pos, seq_id, logits) in enumerate(entries):
+            batch.token[i] = token
+            batch.pos[i] = pos
+            batch.n_seq_id[i] = 1
+            batch.seq_id[i][0] = seq_id
+            batch.logits[i] = logits
+        batch.n_tokens = len(entries)
+        if abort is None:
+            status = llama_cpp.llama_decode(self.ctx.ctx, batch)
+        else:
+            # THE CALLBACK TAKES THE GIL ON EVERY NODE, SO IT IS ONLY INSTALLED FOR THIS CALL
+            self._abort = abort
+            llama_cpp.llama_set_abort_callback(self.ctx.ctx, self._abort_callback, None)
+            try:
+                status = llama_cpp.llama_decode(self.ctx.ctx, batch)
+            finally:
+                llama_cpp.llama_set_abort_callback(self.ctx.ctx, self._no_abort, None)
+                self._abort = None
+        if status == 2 and abort is not None and abort.is_set():
+            raise DecodeAborted(status)
+        if status != 0:
+            raise DecodeError(status)
+
+    def clear_seq(self, seq_id: int, start: int = 0) -> None:
+        """Drops the KV cells of a sequence from position `start` onwards."""
+        self.ctx.kv_cache_seq_rm(seq_id, start, -1)
+
+    def save_seq(self, seq_id: int) -> bytes:
+        """Serializes the KV state of one sequence."""
+        size = llama_cpp.llama_state_seq_get_size(self.ctx.ctx, seq_id)
+        buffer = (ctypes.c_uint8 * size)()
+        written = llama_cpp.llama_state_seq_get_data(self.ctx.ctx, buffer, size, seq_id)
+        return ctypes.string_at(buffer, written)
+
+    def load_seq(self, seq_id: int, state: bytes) -> bool:
+        """Replaces the KV cells of a sequence with a state from save_seq."""
+        self.clear_seq(seq_id)
+        buffer = (ctypes.c_uint8 * len(state)).from_buffer_copy(state)
+        return llama_cpp.llama_state_seq_set_data(self.ctx.ctx, buffer, len(state), seq_id) != 0
+
+    def new_sampler(self, params: Dict):
+        chain = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        add = lambda sampler: llama_cpp.llama_sampler_chain_add(chain, sampler)
+        add(llama_cpp.llama_sampler_init_penalties(
+            PENALTY_LAST_N, params["repeat_penalty"], params["frequency_penalty"], params["presence_penalty"]
+        ))
+        if params["temperature"] <= 0:
+            add(llama_cpp.llama_sampler_init_greedy())
+            return chain
+        seed = params["seed"] if params.get("seed") is not None else llama_cpp.LLAMA_DEFAULT_SEED
+        add(llama_cpp.llama_sampler_init_top_k(params["top_k"]))
+        add(llama_cpp.llama_sampler_init_top_p(params["top_p"], 1))
+        add(llama_cpp.llama_sampler_init_min_p(params["min_p"], 1))
+        add(llama_cpp.llama_sampler_init_temp(params["temperature"]))
+        add(llama_cpp.llama_sampler_init_dist(seed))
+        return chain
+
+    def sample(self, sampler, index: int) -> int:
+        """Samples (and accepts) a token from the logits at batch position `index`."""
+        return llama_cpp.llama_sampler_sample(sampler, self.ctx.ctx, index)
+
+    def free_sampler(self, sampler) -> None:
+        llama_cpp.llama_sampler_free(sampler)
+
+    def close(self) -> None:
+        llama_cpp.llama_batch_free(self.batch)
+        self.ctx.close()
+        self.model.close()
+
+
+class Tokenizer:
+    """
+    Vocabulary-only load of a GGUF (no weights, no context): token counts for a
+    process that does not run the model, like the front-end in worker mode.
+    """
+
+    def __init__(self, model_path: str, n_ctx: int, rope_scaling: str = "model"):
+        model_params = llama_cpp.llama_model_default_params()
+        model_params.vocab_only = True
+        self.model = _internals.LlamaModel(path_model=model_path, params=model_params, verbose=False)
+        self.n_ctx = n_ctx
+        # SAME AS THE WORKERS' LlamaEngine
+        n_ctx_train = self.model.n_ctx_train()
+        self.n_ctx_train = max(n_ctx_train, n_ctx) if rope_scaling in ("linear", "yarn") else n_ctx_train
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False, special=False))
+
+    def close(self) -> None:
+        self.model.close()
+
+
+class Embedder:
+    """
+    Sentence embeddings from a GGUF embedding model (mean pooled, L2 normalized)
+    for the semantic response cache. Safe to call from executor threads.
+    """
+
+    def __init__(self, model_path: str, n_ctx: int = 512):
+        model_params = llama_cpp.llama_model_default_params()
+        model_params.use_mmap = True
+        self.model = _internals.LlamaModel(path_model=model_path, params=model_params, verbose=False)
+
+        ctx_params = llama_cpp.llama_context_default_params()
+        ctx_params.n_ctx = n_ctx
+        # THE WHOLE TEXT GOES IN ONE UBATCH: POOLING NEEDS EVERY TOKEN OF THE SEQUENCE AT ONCE
+        ctx_params.n_batch = n_ctx
+        ctx_params.n_ubatch = n_ctx
+        ctx_params.embeddings = True
+        ctx_params.pooling_type = llama_cpp.LLAMA_POOLING_TYPE_MEAN
+        self.ctx = _internals.LlamaContext(model=self.model, params=ctx_params, verbose=False)
+
+        self.dim = self.model.n_embd()
+        self.n_ctx = n_ctx
+        self.batch = llama_cpp.llama_batch_init(n_ctx, 0, 1)
+        self._lock = threading.Lock()
+        logger.info(f"Embedder ready: {os.path.basename(model_path)}, dim={self.dim}")
+
+    def embed(self, text: str) -> np.ndarray:
+        # LONG PROMPTS ARE CUT: THE START OF A QUESTION CARRIES MOST OF ITS MEANING
+        tokens = self.model.tokenize(text.encode("utf-8"), add_bos=True, special=False)[:self.n_ctx]
+        with self._lock:
+            self.ctx.kv_cache_seq_rm(0, 0, -1)
+            batch = self.batch
+            for pos, token in enumerate(tokens):
+                batch.token[pos] = token
+                batch.pos[pos] = pos
+                batch.n_seq_id[pos] = 1
+                batch.seq_id[pos][0] = 0
+                batch.logits[pos] = True
+            batch.n_tokens = len(tokens)
+            status = llama_cpp.llama_decode(self.ctx.ctx, batch)
+            if status != 0:
+                raise DecodeError(status)
+            pointer = llama_cpp.llama_get_embeddings_seq(self.ctx.ctx, 0)
+            vector = np.ctypeslib.as_array(pointer, shape=(self.dim,)).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def close(self) -> None:
+        llama_cpp.llama_batch_free(self.batch)
+        self.ctx.close()
+        self.model.close()
@@ -0,0 +1,118 @@
+"""Deterministic stand-in for LlamaEngine: no GGUF, no llama.cpp, tokens at a fixed rate"""
+import time
+import zlib
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+from scry_pkg.scry_ws import logger
+from scry_pkg.scry_ws.scheduler import DecodeAborted, DecodeError
+
+# REPLY VOCABULARY: TOKEN i (1..) IS WORDS[i - 1], TOKEN 0 IS END OF GENERATION
+WORDS = ["The", " model", " answers", " with", " a", " steady", " stream", " of", " short", " tokens", ",",
+         " one", " per", " decode", " step", "."]
+EOG = 0
+# PROMPT TOKENS ARE WORD HASHES ABOVE THE REPLY VOCABULARY
+N_VOCAB = 32000
+
+
+class _Sampler:
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+
+class FakeEngine:
+    """
+    Same interface as LlamaEngine, for benchmarks of the scheduler, framing and
+    WebSocket protocol on any machine. A decode call sleeps one generation step
+    (1 / `rate`) plus its prompt tokens at `prefill_rate`, so every generating
+    sequence gets `rate` tokens per second. Replies are the same `reply_tokens`
+    tokens for every prompt, cut short by max_tokens. KV cells are tracked per
+    sequence so prefix reuse and state save/restore behave as with llama.cpp,
+    all sequences sharing one pool of `n_ctx` cells (status 1 when it is full).
+    """
+
+    def __init__(self, model_path: str, chat_format: str, n_ctx: int, n_slots: int, n_batch: int = 512,
+                 n_threads: Optional[int] = None, rate: float = 50.0, prefill_rate: float = 2000.0, reply_tokens: int = 128):
+        self.n_ctx = n_ctx
+        self.n_ctx_train = n_ctx
+        self.n_slots = n_slots
+        self.n_batch = n_batch
+        self.n_vocab = N_VOCAB
+        self.rate = rate
+        self.prefill_rate = prefill_rate
+        self.reply_tokens = reply_tokens
+        self.kv: Dict[int, List[int]] = {}
+        logger.info(f"Fake engine ready: {rate} tokens/s per sequence, prefill {prefill_rate} tokens/s, "
+                    f"{reply_tokens} tokens per reply, n_ctx={n_ctx}, slots={n_slots}")
+
+    def warmup(self) -> None:
+        pass
+
+    @staticmethod
+    def _tokenize(text: str) -> List[int]:
+        # ONE TOKEN PER WORD, STABLE ACROSS PROCESSES (NO SALTED hash())
+        return [len(WORDS) + 1 + zlib.crc32(word.encode("utf-8")) % (N_VOCAB - len(WORDS) - 1) for word in text.split()]
+
+    def format_chat(self, messages: List[Dict[str, str]]) -> Tuple[List[int], List[str]]:
+        tokens = [1]
+        for message in messages:
+            tokens += self._tokenize(f"<{message['role']}> {message['content']}")
+        return tokens, []
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def piece(self, token: int) -> bytes:
+        return WORDS[(token - 1) % len(WORDS)].encode("utf-8") if token else b""
+
+    def is_eog(self, token: int) -> bool:
+        return token == EOG
+
+    def decode(self, entries: Sequence[Tuple[int, int, int, bool]], abort: Optional[threading.Event] = None) -> None:
+        lengths = {seq_id: len(cells) for seq_id, cells in self.kv.items()}
+        for token, pos, seq_id, logits in entries:
+            lengths[seq_id] = pos + 1
+        if sum(lengths.values()) > self.n_ctx:
+            raise DecodeError(1)
+        prompt = 0
+        for token, pos, seq_id, logits in entries:
+            cells = self.kv.setdefault(seq_id, [])
+            del cells[pos:]
+            cells.append(token)
+            prompt += not logits
+        duration = 1 / self.rate + prompt / self.prefill_rate
+        if abort is None:
+            time.sleep(duration)
+            return
+        # LIKE llama.cpp, AN ABORTED DECODE LEAVES ITS CELLS BEHIND FOR THE CALLER TO CLEAR
+        if abort.wait(duration):
+            raise DecodeAborted(2)
+
+    def clear_seq(self, seq_id: int, start: int = 0) -> None:
+        del self.kv.setdefault(seq_id, [])[start:]
+
+    def save_seq(self, seq_id: int) -> bytes:
+        return array("i", self.kv.get(seq_id, [])).tobytes()
+
+    def load_seq(self, seq_id: int, state: bytes) -> bool:
+        cells = array("i")
+        cells.frombytes(state)
+        self.kv[seq_id] = cells.tolist()
+        return True
+
+    def new_sampler(self, params: Dict) -> _Sampler:
+        return _Sampler()
+
+    def sample(self, sampler: _Sampler, index: int) -> int:
+        sampler.count += 1
+        if sampler.count > self.reply_tokens:
+            return EOG
+        return (sampler.count - 1) % len(WORDS) + 1
+
+    def free_sampler(self, sampler) -> None:
+        pass
+
+    def close(self) -> None:
+        self.kv.clear()
@@ -0,0 +1,44 @@
+import pytest
+from scry_pkg.scry_ws.fake_engine import EOG, FakeEngine
+from scry_pkg.scry_ws.scheduler import DecodeError
+
+
+def make_engine(**kwargs) -> FakeEngine:
+    return FakeEngine("fake.gguf", "chatml", n_ctx=kwargs.pop("n_ctx", 64), n_slots=2, rate=1e6, prefill_rate=1e9, **kwargs)
+
+
+def test_prompt_tokens_are_stable_and_share_prefixes():
+    engine = make_engine()
+    first, _ = engine.format_chat([{"role": "user", "content": "hello there"}])
+    longer, _ = engine.format_chat([{"role": "user", "content": "hello there"}, {"role": "assistant", "content": "hi"}])
+    assert first == make_engine().format_chat([{"role": "user", "content": "hello there"}])[0]
+    assert longer[:len(first)] == first
+
+
+def test_reply_ends_after_reply_tokens():
+    engine = make_engine(reply_tokens=3)
+    sampler = engine.new_sampler({})
+    tokens = [engine.sample(sampler, 0) for _ in range(4)]
+    assert tokens[-1] == EOG and EOG not in tokens[:-1]
+    assert b"".join(engine.piece(token) for token in tokens) == b"The model answers"
+
+
+def test_sequences_share_one_pool_of_cells():
+    engine = make_engine(n_ctx=4)
+    engine.decode([(5, pos, 0, False) for pos in range(3)])
+    with pytest.raises(DecodeError) as error:
+        engine.decode([(5, pos, 1, False) for pos in range(2)])
+    assert error.value.status == 1
+    # THE REFUSED BATCH LEFT NO CELLS
+    assert engine.kv.get(1, []) == []
+    engine.clear_seq(0, 1)
+    engine.decode([(5, pos, 1, False) for pos in range(2)])
+
+
+def test_saved_sequence_is_restored():
+    engine = make_engine()
+    engine.decode([(7, pos, 0, False) for pos in range(5)])
+    state = engine.save_seq(0)
+    engine.clear_seq(0)
+    assert engine.load_seq(1, state)
+    assert engine.kv[1] == [7] * 5
@@ -0,0 +1,97 @@
+"""Token framing on the WebSocket: one JSON frame per token, or coalesced (optionally binary) frames"""
+import json
+import time
+import struct
+from typing import List, Optional, Tuple
+from scry_pkg.scry_ws import STREAM_WINDOW_MS, STREAM_FLUSH_CHARS
+
+# BINARY TOKEN FRAME: KIND (u8), STREAM ID (u16, BIG ENDIAN), THEN THE UTF-8 TEXT
+BINARY_HEADER = struct.Struct(">BH")
+FRAME_TOKENS = 1
+
+
+class StreamOptions:
+    """
+    Coalescing negotiated in the prompt action, e.g.
+    {"action": "prompt", ..., "stream": {"windowMs": 25, "flushChars": 256, "binary": true}}.
+    Tokens are held until `window` seconds after the first one or `flush_chars`
+    characters, whichever comes first. Binary frames replace promptId with the
+    `stream_id` announced in the `started` message.
+    """
+    __slots__ = ('window', 'flush_chars', 'binary', 'stream_id')
+
+    def __init__(self, window: float, flush_chars: int, binary: bool, stream_id: int):
+        self.window = window
+        self.flush_chars = flush_chars
+        self.binary = binary
+        self.stream_id = stream_id
+
+    @classmethod
+    def negotiate(cls, spec, stream_id: int) -> Optional["StreamOptions"]:
+        if not isinstance(spec, dict):
+            return None
+        window_ms = spec.get("windowMs", STREAM_WINDOW_MS)
+        flush_chars = spec.get("flushChars", STREAM_FLUSH_CHARS)
+        if not isinstance(window_ms, (int, float)) or not isinstance(flush_chars, int):
+            return None
+        # CLAMPED SO A CLIENT CANNOT ASK FOR UNBOUNDED BUFFERING
+        window_ms = min(max(window_ms, 0), 250)
+        flush_chars = min(max(flush_chars, 1), 16384)
+        return cls(window_ms / 1000, flush_chars, bool(spec.get("binary", False)), stream_id & 0xFFFF)
+
+    def describe(self) -> dict:
+        return {"windowMs": round(self.window * 1000), "flushChars": self.flush_chars,
+                "binary": self.binary, "streamId": self.stream_id}
+
+
+def json_token_frame(prompt_id: str, text: str) -> str:
+    return json.dumps({"promptId": prompt_id, "token": text, "type": "token"})
+
+
+def binary_token_frame(stream_id: int, text: str) -> bytes:
+    return BINARY_HEADER.pack(FRAME_TOKENS, stream_id) + text.encode("utf-8")
+
+
+class TokenSender:
+    """Forwards the token events of one prompt to its WebSocket until a control event arrives."""
+
+    def __init__(self, websocket, prompt_id: str, options: Optional[StreamOptions] = None):
+        self.websocket = websocket
+        self.prompt_id = prompt_id
+        self.options = options
+        self.frames = 0
+        self.first_sent: Optional[float] = None
+
+    async def pump(self, stream) -> Tuple[List[str], str, Optional[str]]:
+        """Returns (texts sent, final event kind, final payload)."""
+        texts: List[str] = []
+        while True:
+            if self.options is None:
+                events = [await stream.get()]
+            else:
+                events = await stream.get_many(self.options.window, self.options.flush_chars)
+
+            chunk = []
+            for kind, payload in events:
+                if kind == "token":
+                    chunk.append(payload)
+                    continue
+                await self._send(chunk, texts)
+                return texts, kind, payload
+            await self._send(chunk, texts)
+
+    async def _send(self, chunk: List[str], texts: List[str]) -> None:
+        if not chunk:
+            return
+        if self.first_sent is None:
+            self.first_sent = time.perf_counter()
+        texts.extend(chunk)
+        if self.options is None:
+            for text in chunk:
+                await self.websocket.send(json_token_frame(self.prompt_id, text))
+                self.frames += 1
+            return
+        text = "".join(chunk)
+        frame = binary_token_frame(self.options.stream_id, text) if self.options.binary else json_token_frame(self.prompt_id, text)
+        await self.websocket.send(frame)
+        self.frames += 1
@@ -0,0 +1,83 @@
+import json
+import asyncio
+from scry_pkg.scry_ws.framing import BINARY_HEADER, FRAME_TOKENS, StreamOptions, TokenSender, binary_token_frame, json_token_frame
+from scry_pkg.scry_ws.scheduler import TokenStream
+
+
+class Socket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, frame):
+        self.frames.append(frame)
+
+
+def decode_binary(frame: bytes):
+    kind, stream_id = BINARY_HEADER.unpack_from(frame)
+    return kind, stream_id, frame[BINARY_HEADER.size:].decode("utf-8")
+
+
+def pump(options, events):
+    async def run():
+        stream = TokenStream()
+        for kind, payload in events:
+            stream.put_nowait(kind, payload)
+        socket = Socket()
+        sender = TokenSender(socket, "p1", options)
+        texts, kind, payload = await asyncio.wait_for(sender.pump(stream), 5)
+        return socket.frames, texts, kind, payload, sender.frames
+
+    return asyncio.run(run())
+
+
+EVENTS = [("token", "Hel"), ("token", "lo"), ("token", " wörld"), ("complete", {"tokens": 3})]
+
+
+def test_negotiate_clamps_and_rejects():
+    options = StreamOptions.negotiate({"windowMs": 10_000, "flushChars": 0, "binary": True}, 70_000)
+    assert options.describe() == {"windowMs": 250, "flushChars": 1, "binary": True, "streamId": 70_000 & 0xFFFF}
+    assert StreamOptions.negotiate(None, 1) is None
+    assert StreamOptions.negotiate({"windowMs": "soon"}, 1) is None
+    assert StreamOptions.negotiate({}, 1).binary is False
+
+
+def test_frames_round_trip():
+    assert json.loads(json_token_frame("p1", "é\n")) == {"promptId": "p1", "token": "é\n", "type": "token"}
+    assert decode_binary(binary_token_frame(513, "日本")) == (FRAME_TOKENS, 513, "日本")
+
+
+def test_one_json_frame_per_token_by_default():
+    frames, texts, kind, payload, count = pump(None, EVENTS)
+    assert [json.loads(frame)["token"] for frame in frames] == ["Hel", "lo", " wörld"]
+    assert texts == ["Hel", "lo", " wörld"]
+    assert (kind, payload, count) == ("complete", {"tokens": 3}, 3)
+
+
+def test_coalesced_json_frames():
+    frames, texts, kind, _, count = pump(StreamOptions(1.0, 1000, False, 7), EVENTS)
+    # THE COMPLETE EVENT FLUSHES WHAT IS HELD WITHOUT WAITING FOR THE WINDOW
+    assert [json.loads(frame) for frame in frames] == [{"promptId": "p1", "token": "Hello wörld", "type": "token"}]
+    assert texts == ["Hel", "lo", " wörld"] and kind == "complete" and count == 1
+
+
+def test_coalesced_binary_frames():
+    frames, _, kind, _, _ = pump(StreamOptions(1.0, 1000, True, 7), EVENTS)
+    assert [decode_binary(frame) for frame in frames] == [(FRAME_TOKENS, 7, "Hello wörld")]
+    assert kind == "complete"
+
+
+def test_flush_chars_bounds_a_frame():
+    async def run():
+        stream = TokenStream()
+        socket = Socket()
+        sender = TokenSender(socket, "p1", StreamOptions(5.0, 4, True, 1))
+        task = asyncio.create_task(sender.pump(stream))
+        stream.put_nowait("token", "abcd")
+        await asyncio.sleep(0.05)
+        # SENT ON REACHING flushChars, LONG BEFORE THE 5 s WINDOW
+        assert [decode_binary(frame)[2] for frame in socket.frames] == ["abcd"]
+        stream.put_nowait("cancelled", None)
+        texts, kind, _ = await asyncio.wait_for(task, 1)
+        assert texts == ["abcd"] and kind == "cancelled"
+
+    asyncio.run(run())
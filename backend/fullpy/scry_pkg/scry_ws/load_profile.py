@@ -0,0 +1,105 @@
+"""Per-model load profile (context size, KV cache types, RoPE scaling, mlock/mmap) and the KV cache size it implies"""
+import struct
+from typing import BinaryIO, Dict, Optional
+from scry_pkg.scry_ws import logger
+
+# KV CACHE TYPE NAME -> (ggml_type, BYTES PER ELEMENT); q8_0 AND q4_0 STORE BLOCKS OF 32 VALUES AND AN f16 SCALE
+CACHE_TYPES = {
+    "f16": (1, 2.0),
+    "q8_0": (8, 34 / 32),
+    "q4_0": (2, 18 / 32),
+}
+
+# ROPE SCALING NAME -> llama_rope_scaling_type ("model": UNSPECIFIED, THE GGUF DECIDES)
+ROPE_SCALING = {"model": -1, "none": 0, "linear": 1, "yarn": 2}
+
+# WHAT A MODEL WITHOUT A configModel ROW (OR WITH NULL COLUMNS) LOADS WITH
+DEFAULTS = {"type_k": "f16", "type_v": "f16", "rope_scaling": "model", "rope_freq_scale": None,
+            "use_mlock": True, "use_mmap": True}
+
+# GGUF METADATA VALUE TYPE -> struct FORMAT (8 = STRING, 9 = ARRAY ARE READ SEPARATELY)
+GGUF_SCALARS = {0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i", 6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d"}
+
+
+def load_profile(config: Optional[Dict], default_n_ctx: int) -> Dict:
+    """The load settings of a configModel row (ControlConfig.get), defaults for what it leaves unset."""
+    config = config or {}
+    profile = {key: default if config.get(key) is None else config[key] for key, default in DEFAULTS.items()}
+    profile["n_ctx"] = config.get("n_ctx") or default_n_ctx
+    return profile
+
+
+def _read(f: BinaryIO, fmt: str):
+    return struct.unpack(fmt, f.read(struct.calcsize(fmt)))[0]
+
+
+def _read_string(f: BinaryIO) -> str:
+    return f.read(_read(f, "<Q")).decode("utf-8", "replace")
+
+
+def _skip_value(f: BinaryIO, value_type: int) -> None:
+    if value_type == 8:
+        f.seek(_read(f, "<Q"), 1)
+    elif value_type == 9:
+        item_type, count = _read(f, "<I"), _read(f, "<Q")
+        if item_type in GGUF_SCALARS:
+            f.seek(struct.calcsize(GGUF_SCALARS[item_type]) * count, 1)
+        else:
+            for _ in range(count):
+                _skip_value(f, item_type)
+    else:
+        f.seek(struct.calcsize(GGUF_SCALARS[value_type]), 1)
+
+
+def gguf_metadata(path: str) -> Dict:
+    """
+    Scalar and string metadata of a GGUF header, read without loading the
+    model; arrays (the tokenizer vocabulary) are skipped.
+    """
+    metadata = {}
+    with open(path, "rb") as f:
+        if f.read(4) != b"GGUF":
+            raise ValueError(f"{path} is not a GGUF file")
+        version = _read(f, "<I")
+        if version < 2:
+            raise ValueError(f"{path}: GGUF version {version} not supported")
+        _read(f, "<Q")
+        for _ in range(_read(f, "<Q")):
+            key = _read_string(f)
+            value_type = _read(f, "<I")
+            if value_type in GGUF_SCALARS:
+                metadata[key] = _read(f, GGUF_SCALARS[value_type])
+            elif value_type == 8:
+                metadata[key] = _read_string(f)
+            else:
+                _skip_value(f, value_type)
+    return metadata
+
+
+def kv_cache_bytes(metadata: Dict, n_ctx: int, type_k: str, type_v: str) -> int:
+    """KV cache of `n_ctx` cells over all layers (one unified pool shared by the slots)."""
+    arch = metadata["general.architecture"]
+    n_layer = metadata[f"{arch}.block_count"]
+    n_head = metadata[f"{arch}.attention.head_count"]
+    n_head_kv = metadata.get(f"{arch}.attention.head_count_kv", n_head)
+    head_dim = metadata[f"{arch}.embedding_length"] // n_head
+    k_dim = n_head_kv * metadata.get(f"{arch}.attention.key_length", head_dim)
+    v_dim = n_head_kv * metadata.get(f"{arch}.attention.value_length", head_dim)
+    return int(n_layer * n_ctx * (k_dim * CACHE_TYPES[type_k][1] + v_dim * CACHE_TYPES[type_v][1]))
+
+
+def log_kv_estimate(model_name: str, model_path: str, profile: Dict) -> Optional[int]:
+    """Logs the KV cache the profile will allocate, next to its full precision size; None if the header is unreadable."""
+    try:
+        metadata = gguf_metadata(model_path)
+        size = kv_cache_bytes(metadata, profile["n_ctx"], profile["type_k"], profile["type_v"])
+        full = kv_cache_bytes(metadata, profile["n_ctx"], "f16", "f16")
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        logger.warning(f"KV cache estimate of {model_name} unavailable: {e}")
+        return None
+    n_ctx_train = metadata.get(f"{metadata['general.architecture']}.context_length")
+    logger.info(f"KV cache of {model_name}: {size / 1024**2:.0f} MiB estimated for n_ctx={profile['n_ctx']} "
+                f"(trained {n_ctx_train}), K {profile['type_k']}, V {profile['type_v']} "
+                f"(f16: {full / 1024**2:.0f} MiB), rope {profile['rope_scaling']}, "
+                f"mlock={profile['use_mlock']}, mmap={profile['use_mmap']}")
+    return size
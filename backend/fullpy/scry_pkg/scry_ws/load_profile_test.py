@@ -0,0 +1,86 @@
+import struct
+import pytest
+from scry_pkg.scry_ws.load_profile import DEFAULTS, gguf_metadata, kv_cache_bytes, load_profile, log_kv_estimate
+
+LLAMA_8B = {"general.architecture": "llama", "llama.block_count": 32, "llama.attention.head_count": 32,
+            "llama.attention.head_count_kv": 8, "llama.embedding_length": 4096, "llama.context_length": 131072}
+
+
+def gguf_string(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+
+def write_gguf(path, version: int = 3) -> None:
+    """A GGUF header (no tensors) with scalars of several types, a string and two arrays to skip."""
+    fields = [
+        ("general.architecture", 8, gguf_string("llama")),
+        ("general.name", 8, gguf_string("Tiny Llama")),
+        ("llama.block_count", 4, struct.pack("<I", 32)),
+        ("llama.context_length", 4, struct.pack("<I", 131072)),
+        ("tokenizer.ggml.tokens", 9, struct.pack("<IQ", 8, 3) + b"".join(gguf_string(t) for t in ("<s>", "a", "b"))),
+        ("tokenizer.ggml.scores", 9, struct.pack("<IQ", 6, 3) + struct.pack("<3f", 0.0, -1.0, -2.0)),
+        ("llama.embedding_length", 4, struct.pack("<I", 4096)),
+        ("llama.attention.head_count", 4, struct.pack("<I", 32)),
+        ("llama.attention.head_count_kv", 4, struct.pack("<I", 8)),
+        ("llama.rope.freq_base", 6, struct.pack("<f", 500000.0)),
+        ("general.file_type", 10, struct.pack("<Q", 15)),
+        ("general.quantized", 7, struct.pack("<?", True)),
+    ]
+    with open(path, "wb") as f:
+        f.write(b"GGUF" + struct.pack("<IQQ", version, 0, len(fields)))
+        for key, value_type, value in fields:
+            f.write(gguf_string(key) + struct.pack("<I", value_type) + value)
+
+
+def test_gguf_metadata_reads_scalars_and_strings_and_skips_arrays(tmp_path):
+    path = tmp_path / "tiny.gguf"
+    write_gguf(path)
+    metadata = gguf_metadata(str(path))
+    assert metadata["general.architecture"] == "llama"
+    assert metadata["general.name"] == "Tiny Llama"
+    assert metadata["llama.block_count"] == 32
+    assert metadata["llama.attention.head_count_kv"] == 8
+    assert metadata["llama.rope.freq_base"] == 500000.0
+    assert metadata["general.file_type"] == 15 and metadata["general.quantized"] is True
+    assert "tokenizer.ggml.tokens" not in metadata and "tokenizer.ggml.scores" not in metadata
+
+
+def test_gguf_metadata_rejects_other_files(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"GGML" + bytes(20))
+    with pytest.raises(ValueError):
+        gguf_metadata(str(path))
+    old = tmp_path / "old.gguf"
+    write_gguf(old, version=1)
+    with pytest.raises(ValueError):
+        gguf_metadata(str(old))
+
+
+def test_kv_cache_bytes_with_grouped_query_attention():
+    # 32 LAYERS x 8192 CELLS x (8 KV HEADS x 128) FOR K AND FOR V, TWO BYTES EACH: 1 GiB
+    assert kv_cache_bytes(LLAMA_8B, 8192, "f16", "f16") == 1 << 30
+    assert kv_cache_bytes(LLAMA_8B, 8192, "q8_0", "q8_0") == (1 << 30) * 34 // 64
+    assert kv_cache_bytes(LLAMA_8B, 8192, "q8_0", "q4_0") == 32 * 8192 * 1024 * (34 + 18) // 32
+    # WITHOUT head_count_kv EVERY HEAD HAS ITS OWN K AND V
+    without_gqa = {key: value for key, value in LLAMA_8B.items() if key != "llama.attention.head_count_kv"}
+    assert kv_cache_bytes(without_gqa, 8192, "f16", "f16") == 4 << 30
+
+
+def test_kv_cache_bytes_with_explicit_key_and_value_lengths():
+    metadata = dict(LLAMA_8B, **{"llama.attention.key_length": 192, "llama.attention.value_length": 128})
+    assert kv_cache_bytes(metadata, 1024, "f16", "f16") == 32 * 1024 * 8 * (192 + 128) * 2
+
+
+def test_load_profile_fills_what_the_row_leaves_unset():
+    assert load_profile(None, 4096) == dict(DEFAULTS, n_ctx=4096)
+    profile = load_profile({"n_ctx": 16384, "type_k": "q8_0", "type_v": None, "use_mlock": False}, 4096)
+    assert profile["n_ctx"] == 16384 and profile["type_k"] == "q8_0" and profile["type_v"] == "f16"
+    assert profile["use_mlock"] is False and profile["use_mmap"] is True
+
+
+def test_log_kv_estimate(tmp_path):
+    path = tmp_path / "tiny.gguf"
+    write_gguf(path)
+    assert log_kv_estimate("tiny", str(path), load_profile({"n_ctx": 8192}, 4096)) == 1 << 30
+    assert log_kv_estimate("missing", str(tmp_path / "missing.gguf"), load_profile(None, 4096)) is None
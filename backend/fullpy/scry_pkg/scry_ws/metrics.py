@@ -0,0 +1,78 @@
+"""Inference metrics of the WebSocket server, scraped on /metrics of the WebSocket port"""
+from http import HTTPStatus
+from typing import Dict, Optional
+from scry_pkg.scry_metrics import CONTENT_TYPE, THROUGHPUT_BUCKETS
+from scry_pkg.scry_metrics.registry import REGISTRY
+
+PROMPTS = REGISTRY.counter("scry_ws_prompts_total", "Prompts by outcome: complete, cancelled, disconnected, error, expired, rejected",
+                           ("model", "outcome"))
+SOURCES = REGISTRY.counter("scry_ws_reply_sources_total", "Where replies came from: miss (generated), hit, shared, semantic", ("model", "source"))
+PROMPT_TOKENS = REGISTRY.counter("scry_ws_prompt_tokens_total", "Prompt tokens of generated replies", ("model",))
+CACHED_TOKENS = REGISTRY.counter("scry_ws_prompt_cached_tokens_total", "Prompt tokens restored from the KV caches instead of prefilled", ("model",))
+GENERATED_TOKENS = REGISTRY.counter("scry_ws_generated_tokens_total", "Tokens generated", ("model",))
+TTFT = REGISTRY.histogram("scry_ws_time_to_first_token_seconds", "From the prompt reaching the server to its first token frame", ("model", "source"))
+DURATION = REGISTRY.histogram("scry_ws_prompt_duration_seconds", "From the prompt reaching the server to its complete message", ("model", "source"))
+QUEUE_WAIT = REGISTRY.histogram("scry_ws_queue_wait_seconds", "Time a prompt waited for a free slot", ("model",))
+PROMPT_EVAL_RATE = REGISTRY.histogram("scry_ws_prompt_eval_tokens_per_second", "Prefill throughput per prompt", ("model",), THROUGHPUT_BUCKETS)
+GENERATION_RATE = REGISTRY.histogram("scry_ws_generation_tokens_per_second", "Generation throughput per prompt", ("model",), THROUGHPUT_BUCKETS)
+CANCEL_RELEASE = REGISTRY.histogram("scry_ws_cancel_release_seconds", "From a cancel reaching the scheduler to the prompt giving its slot back",
+                                    ("model",))
+ADMISSION_WAIT = REGISTRY.histogram("scry_ws_admission_wait_seconds", "Time a prompt waited in the admission queue", ("priority",))
+
+
+def record_prompt(model: str, outcome: str, source: str, stats: Dict, ttft: Optional[float], duration: float) -> None:
+    PROMPTS.inc(model=model, outcome=outcome)
+    if outcome != "complete":
+        return
+    SOURCES.inc(model=model, source=source)
+    if ttft is not None:
+        TTFT.observe(ttft, model=model, source=source)
+    DURATION.observe(duration, model=model, source=source)
+    # REPLAYED AND SHARED REPLIES CARRY THE STATS OF THE GENERATION THAT PRODUCED THEM: COUNTED ONCE, THERE
+    if source != "miss" or "queue_s" not in stats:
+        return
+    PROMPT_TOKENS.inc(stats["prompt_tokens"], model=model)
+    CACHED_TOKENS.inc(stats["cached_tokens"], model=model)
+    GENERATED_TOKENS.inc(stats["tokens"], model=model)
+    QUEUE_WAIT.observe(stats["queue_s"], model=model)
+    if stats["prompt_tokens_per_s"]:
+        PROMPT_EVAL_RATE.observe(stats["prompt_tokens_per_s"], model=model)
+    if stats["gen_tokens_per_s"]:
+        GENERATION_RATE.observe(stats["gen_tokens_per_s"], model=model)
+
+
+def stats_message(prompt_id: str, model: str, source: str, stats: Dict, ttft: Optional[float], duration: float,
+                  admission_wait: float = 0.0) -> Dict:
+    """The optional `stats` message sent after `complete`."""
+    message = {
+        "type": "stats",
+        "promptId": prompt_id,
+        "model": model,
+        "cache": source,
+        "ttftMs": round(ttft * 1000, 1) if ttft is not None else None,
+        "totalMs": round(duration * 1000, 1),
+        "admissionMs": round(admission_wait * 1000, 1),
+        "generatedTokens": stats.get("tokens", 0),
+    }
+    if source == "miss" and "queue_s" in stats:
+        message.update({
+            "queueMs": round(stats["queue_s"] * 1000, 1),
+            "prefillMs": round(stats["prefill_s"] * 1000, 1),
+            "promptTokens": stats["prompt_tokens"],
+            "cachedTokens": stats["cached_tokens"],
+            "promptTokensPerS": stats["prompt_tokens_per_s"],
+            "genTokensPerS": stats["gen_tokens_per_s"],
+        })
+    if "similarity" in stats:
+        message["similarity"] = stats["similarity"]
+    return message
+
+
+def serve_metrics(connection, request):
+    """process_request hook of websockets.serve: answers GET /metrics, lets every other request upgrade."""
+    if request.path.split("?", 1)[0] != "/metrics":
+        return None
+    response = connection.respond(HTTPStatus.OK, REGISTRY.render())
+    del response.headers["Content-Type"]
+    response.headers["Content-Type"] = CONTENT_TYPE
+    return response
@@ -0,0 +1,61 @@
+import asyncio
+import httpx
+from websockets.asyncio.server import serve
+from scry_pkg.scry_metrics import CONTENT_TYPE
+from scry_pkg.scry_ws.metrics import (CACHED_TOKENS, DURATION, GENERATED_TOKENS, PROMPT_TOKENS, PROMPTS, QUEUE_WAIT, SOURCES,
+                                      record_prompt, serve_metrics, stats_message)
+
+STATS = {"tokens": 12, "prompt_tokens": 40, "cached_tokens": 32, "queue_s": 0.01, "prefill_s": 0.02,
+         "prompt_tokens_per_s": 400.0, "gen_tokens_per_s": 30.0}
+
+
+def test_generated_reply_records_its_tokens():
+    record_prompt("metrics-miss", "complete", "miss", STATS, 0.1, 0.5)
+    assert PROMPTS.get(model="metrics-miss", outcome="complete") == 1
+    assert SOURCES.get(model="metrics-miss", source="miss") == 1
+    assert PROMPT_TOKENS.get(model="metrics-miss") == 40
+    assert CACHED_TOKENS.get(model="metrics-miss") == 32
+    assert GENERATED_TOKENS.get(model="metrics-miss") == 12
+    assert QUEUE_WAIT._values[("metrics-miss",)][1] == 0.01
+
+
+def test_cached_reply_does_not_count_the_tokens_again():
+    record_prompt("metrics-hit", "complete", "hit", STATS, 0.001, 0.002)
+    assert SOURCES.get(model="metrics-hit", source="hit") == 1
+    assert GENERATED_TOKENS.get(model="metrics-hit") == 0
+    assert ("metrics-hit", "hit") in DURATION._values
+
+
+def test_unfinished_prompt_only_counts_its_outcome():
+    record_prompt("metrics-cancel", "cancelled", "miss", {}, None, 0.3)
+    assert PROMPTS.get(model="metrics-cancel", outcome="cancelled") == 1
+    assert SOURCES.get(model="metrics-cancel", source="miss") == 0
+    assert ("metrics-cancel", "miss") not in DURATION._values
+
+
+def test_stats_message_details_only_generated_replies():
+    message = stats_message("p1", "m", "miss", STATS, 0.1234, 0.5)
+    assert message["ttftMs"] == 123.4 and message["promptTokens"] == 40 and message["genTokensPerS"] == 30.0
+    hit = stats_message("p2", "m", "hit", STATS, None, 0.002)
+    assert hit["ttftMs"] is None and "promptTokens" not in hit
+
+
+def test_metrics_are_served_on_the_websocket_port():
+    async def run():
+        async def handler(websocket):
+            await websocket.close()
+
+        record_prompt("metrics-served", "complete", "miss", STATS, 0.1, 0.5)
+        async with serve(handler, "127.0.0.1", 0, process_request=serve_metrics) as server:
+            port = server.sockets[0].getsockname()[1]
+            async with httpx.AsyncClient() as client:
+                response = await client.get(f"http://127.0.0.1:{port}/metrics")
+                other = await client.get(f"http://127.0.0.1:{port}/")
+        return response, other
+
+    response, other = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    assert 'scry_ws_generated_tokens_total{model="metrics-served"} 12' in response.text
+    # ANY OTHER PATH IS LEFT TO THE WEBSOCKET HANDSHAKE, WHICH REFUSES A PLAIN GET
+    assert other.status_code != 200
@@ -0,0 +1,201 @@
+"""Resident models: several engines kept loaded under a RAM budget, least recently used evicted first"""
+import os
+import asyncio
+import psutil
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+from scry_pkg.scry_ws import logger, model_path_for
+
+
+class ResidentModel:
+    """
+    A loaded model with its own context, scheduler (decode thread) and prefix
+    cache. In worker mode `scheduler` is the WorkerPool, `engine` a Tokenizer and
+    the prefix caches live in the workers.
+    """
+    __slots__ = ('name', 'path', 'chat_format', 'engine', 'prefix_cache', 'scheduler',
+                 'size_bytes', 'users', 'draft_name')
+
+    def __init__(self, name: str, path: str, chat_format: str, engine, prefix_cache, scheduler):
+        self.name = name
+        self.path = path
+        self.chat_format = chat_format
+        self.engine = engine
+        self.prefix_cache = prefix_cache
+        self.scheduler = scheduler
+        self.size_bytes = 0
+        self.users = 0
+        self.draft_name: Optional[str] = None
+
+    @property
+    def busy(self) -> bool:
+        return self.users > 0 or not self.scheduler.idle()
+
+    def close(self) -> None:
+        self.scheduler.close()
+        if self.prefix_cache is not None:
+            self.prefix_cache.clear()
+        self.engine.close()
+
+
+def keep_warm(path: str, size: int) -> None:
+    """
+    After munmap the weights stay in the page cache until the kernel reclaims
+    them; WILLNEED reads back what was already dropped, so reloading the model
+    soon after its eviction is a warm load. Skipped when memory is short.
+    """
+    if not hasattr(os, "posix_fadvise") or psutil.virtual_memory().available < size:
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.warning(f"Model pool: fadvise failed for {path}: {e}")
+
+
+class ModelPool:
+    """
+    Keeps models resident up to `budget_bytes`. The size of a model is the
+    process RSS growth measured with psutil while it loaded (at least its GGUF
+    size). Before a load, idle models are evicted least recently used first;
+    a model serving a prompt is never evicted. If the budget still cannot be
+    met the load only goes ahead when psutil reports the memory as available.
+    Only the event loop may use it; `build` runs in an executor.
+    """
+
+    def __init__(self, budget_bytes: int, build: Callable[[str], ResidentModel]):
+        self.budget_bytes = budget_bytes
+        self.build = build
+        self.models: "OrderedDict[str, ResidentModel]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        # MODEL NAME -> CALLERS WAITING FOR ITS LOAD
+        self._waiters: Dict[str, int] = {}
+        self._load_lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(model.size_bytes for model in self.models.values())
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        for model in self.models.values():
+            model.scheduler.start(loop)
+
+    def add(self, model: ResidentModel) -> None:
+        """Registers a model loaded outside the pool (the startup model)."""
+        # NO FILE BEHIND THE FAKE ENGINE OF THE BENCHMARKS
+        size = os.path.getsize(model.path) if os.path.exists(model.path) else 0
+        model.size_bytes = max(model.size_bytes, size)
+        self.models[model.name] = model
+        if self._loop is not None:
+            model.scheduler.start(self._loop)
+
+    def get(self, name: str) -> Optional[ResidentModel]:
+        return self.models.get(name)
+
+    async def acquire(self, name: str, keep: Iterable[str] = ()) -> ResidentModel:
+        """
+        Returns the resident model `name`, loading it first if needed, counted
+        as in use until release(). Concurrent callers share one load.
+        """
+        model = self.models.get(name)
+        if model is not None:
+            self.hits += 1
+            model.users += 1
+            self.models.move_to_end(name)
+            return model
+        if name not in self._loading:
+            self._loading[name] = asyncio.ensure_future(self._load(name, set(keep)))
+        load = self._loading[name]
+        # THE LOAD COUNTS ITS WAITING CALLERS IN USE AS IT MAKES THE MODEL RESIDENT: ANOTHER LOAD CANNOT EVICT IT
+        # BEFORE THEY RESUME
+        self._waiters[name] = self._waiters.get(name, 0) + 1
+        try:
+            return await asyncio.shield(load)
+        except asyncio.CancelledError:
+            if load.done() and not load.cancelled() and load.exception() is None:
+                self.release(load.result())
+            elif name in self._waiters:
+                self._waiters[name] -= 1
+            raise
+
+    def release(self, model: ResidentModel) -> None:
+        """The caller of acquire() is done with the model; it can be evicted once idle."""
+        model.users -= 1
+
+    async def _load(self, name: str, keep: set) -> ResidentModel:
+        try:
+            async with self._load_lock:
+                expected = os.path.getsize(model_path_for(name))
+                await self._close(self._victims(keep, extra=expected))
+                if self.resident_bytes + expected > self.budget_bytes and psutil.virtual_memory().available < expected:
+                    raise MemoryError(f"Not enough memory to load {name}: {expected / 1024**3:.2f} GiB needed, "
+                                      f"budget {self.budget_bytes / 1024**3:.2f} GiB taken by busy models")
+                model = await self._loop.run_in_executor(None, self._build_measured, name, expected)
+            self.models[name] = model
+            model.users += self._waiters.pop(name, 0)
+            model.scheduler.start(self._loop)
+            self.loads += 1
+            logger.info(f"Model pool: {name} resident ({model.size_bytes / 1024**3:.2f} GiB), {self.stats()}")
+            return model
+        finally:
+            self._loading.pop(name, None)
+            self._waiters.pop(name, None)
+
+    def _build_measured(self, name: str, expected: int) -> ResidentModel:
+        process = psutil.Process()
+        before = process.memory_info().rss
+        model = self.build(name)
+        model.size_bytes = max(process.memory_info().rss - before, expected)
+        return model
+
+    async def trim(self, keep: Iterable[str] = ()) -> None:
+        """Evicts idle models, least recently used first, until the pool fits its budget."""
+        await self._close(self._victims(set(keep)))
+
+    def _victims(self, keep: set, extra: int = 0) -> List[ResidentModel]:
+        victims = []
+        for name in list(self.models):
+            if self.resident_bytes + extra <= self.budget_bytes:
+                break
+            if name in keep or self.models[name].busy:
+                continue
+            victims.append(self.models.pop(name))
+            self.evictions += 1
+            logger.info(f"Model pool: evicting {name} ({victims[-1].size_bytes / 1024**3:.2f} GiB)")
+        return victims
+
+    async def _close(self, victims: List[ResidentModel]) -> None:
+        if victims:
+            await self._loop.run_in_executor(None, self._release, victims)
+
+    @staticmethod
+    def _release(victims: List[ResidentModel]) -> None:
+        for model in victims:
+            model.close()
+            keep_warm(model.path, model.size_bytes)
+
+    def cancel(self, prompt_id: str) -> None:
+        for model in self.models.values():
+            model.scheduler.cancel(prompt_id)
+
+    def close(self) -> None:
+        for name in list(self.models):
+            self.models.pop(name).close()
+
+    def stats(self) -> dict:
+        return {
+            "models": list(self.models),
+            "resident_bytes": self.resident_bytes,
+            "budget_bytes": self.budget_bytes,
+            "loads": self.loads,
+            "hits": self.hits,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,129 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from scry_pkg.scry_ws import model_pool
+from scry_pkg.scry_ws.model_pool import ModelPool, ResidentModel
+
+
+class Scheduler:
+    def __init__(self):
+        self.running = False
+        self.closed = False
+
+    def start(self, loop):
+        self.running = True
+
+    def idle(self) -> bool:
+        return True
+
+    def cancel(self, prompt_id):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class Engine:
+    def close(self):
+        pass
+
+
+class Process:
+    # THE RSS OF THE TEST PROCESS MOVES ON ITS OWN: A BUILD ADDS NOTHING, EVERY MODEL WEIGHS ITS FILE
+    def memory_info(self):
+        return SimpleNamespace(rss=0)
+
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    """GGUF stand-ins of 100 bytes each, and the list of names built so far."""
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_bytes(bytes(100))
+    monkeypatch.setattr(model_pool, "model_path_for", lambda name: str(tmp_path / name))
+    monkeypatch.setattr(model_pool, "keep_warm", lambda path, size: None)
+    monkeypatch.setattr(model_pool.psutil, "Process", Process)
+    built = []
+
+    def build(name):
+        built.append(name)
+        return ResidentModel(name, str(tmp_path / name), "chatml", Engine(), None, Scheduler())
+
+    return build, built
+
+
+def run(budget, build, body):
+    async def main():
+        pool = ModelPool(budget, build)
+        pool.start(asyncio.get_running_loop())
+        return await body(pool)
+
+    return asyncio.run(main())
+
+
+def test_least_recently_used_idle_model_is_evicted(models):
+    build, built = models
+
+    async def body(pool):
+        for name in ("a", "b", "a", "c"):
+            pool.release(await pool.acquire(name))
+        assert list(pool.models) == ["a", "c"]
+        assert pool.stats()["evictions"] == 1 and pool.stats()["hits"] == 1
+        assert built == ["a", "b", "c"]
+
+    run(250, build, body)
+
+
+def test_a_model_in_use_is_never_evicted(models):
+    build, _ = models
+
+    async def body(pool):
+        a = await pool.acquire("a")
+        pool.release(await pool.acquire("b"))
+        # OVER BUDGET: "a" IS BUSY, SO "b" GOES EVEN THOUGH IT WAS USED LAST
+        pool.release(await pool.acquire("c"))
+        assert "a" in pool.models and "b" not in pool.models
+        assert not a.scheduler.closed
+        pool.release(a)
+        await pool.trim(keep={"c"})
+        assert list(pool.models) == ["c"] and a.scheduler.closed
+
+    run(150, build, body)
+
+
+def test_concurrent_callers_share_one_load(models):
+    build, built = models
+
+    async def body(pool):
+        first, second = await asyncio.gather(pool.acquire("a"), pool.acquire("a"))
+        assert first is second and first.users == 2
+        assert built == ["a"]
+
+    run(1000, build, body)
+
+
+def test_a_finished_load_is_not_evicted_before_its_caller_counts_itself(models):
+    build, _ = models
+
+    async def body(pool):
+        # ROOM FOR ONE MODEL: THE LOAD OF "b" RUNS AS SOON AS "a" IS RESIDENT, BEFORE THE CALLER OF "a" RESUMES
+        a, b = await asyncio.gather(pool.acquire("a"), pool.acquire("b"))
+        for model in (a, b):
+            assert model.users == 1 and not model.scheduler.closed
+            assert pool.models[model.name] is model
+
+    run(150, build, body)
+
+
+def test_a_caller_cancelled_while_the_model_loads_is_not_counted(models):
+    build, _ = models
+
+    async def body(pool):
+        waiting = asyncio.create_task(pool.acquire("a"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        model = await pool.acquire("a")
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert model.users == 1
+
+    run(1000, build, body)
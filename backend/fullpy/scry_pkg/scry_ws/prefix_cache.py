@@ -0,0 +1,256 @@
+"""Radix tree of llama KV states keyed by token prefix, shared by every session"""
+import os
+import hashlib
+from array import array
+from pathlib import Path
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from scry_pkg.scry_ws import logger
+
+
+class _Node:
+    __slots__ = ('key', 'children', 'parent', 'depth', 'entry')
+
+    def __init__(self, key: tuple, parent: Optional["_Node"], depth: int):
+        self.key = key              # EDGE LABEL FROM THE PARENT
+        self.children = {}          # FIRST TOKEN OF THE CHILD EDGE -> NODE
+        self.parent = parent
+        self.depth = depth          # TOKENS FROM THE ROOT TO THE END OF THIS EDGE
+        self.entry: Optional["_Entry"] = None
+
+
+class _Entry:
+    __slots__ = ('node', 'state', 'path', 'size')
+
+    def __init__(self, node: _Node, state: bytes):
+        self.node = node
+        self.state: Optional[bytes] = state   # None WHILE SPILLED TO DISK
+        self.path: Optional[Path] = None
+        self.size = len(state)
+
+
+def _shared(edge: tuple, tokens: List[int], start: int) -> int:
+    n, limit = 0, min(len(edge), len(tokens) - start)
+    while n < limit and edge[n] == tokens[start + n]:
+        n += 1
+    return n
+
+
+class PrefixCache:
+    """
+    Maps token prefixes to sequence states saved with llama_state_seq_get_data.
+    A lookup returns the state sharing the longest prefix with the prompt: a
+    longer state is still usable because the caller truncates the restored
+    sequence to the shared length. Inserting a state drops the states of its
+    ancestors, which it fully covers.
+    RAM holds up to `budget_bytes`; least recently used states spill to
+    `disk_dir` (if set, up to `disk_budget_bytes`) and are dropped after that.
+    Only the decode thread may use it.
+    """
+
+    def __init__(self, budget_bytes: int, disk_dir: Optional[Path] = None, disk_budget_bytes: int = 0):
+        self.budget_bytes = budget_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_budget_bytes = disk_budget_bytes if disk_dir else 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._root = _Node((), None, 0)
+        self._ram: "OrderedDict[_Entry, None]" = OrderedDict()
+        self._disk: "OrderedDict[_Entry, None]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.tokens_reused = 0
+        self.bytes_resident = 0
+        self.bytes_on_disk = 0
+        self.evictions = 0
+
+    def lookup(self, tokens: List[int], longer_than: int = 0) -> Tuple[int, Optional[bytes]]:
+        """Returns (shared prefix length, state) or (0, None) when nothing beats `longer_than` tokens."""
+        node, i, best, best_len = self._root, 0, None, 0
+        while True:
+            if node.entry is not None:
+                best, best_len = node.entry, node.depth
+            if i == len(tokens):
+                break
+            child = node.children.get(tokens[i])
+            if child is None:
+                break
+            n = _shared(child.key, tokens, i)
+            if n < len(child.key):
+                node, i = child, i + n
+                break
+            node, i = child, i + n
+
+        # ANY STATE BELOW THE DIVERGENCE POINT SHARES EXACTLY i TOKENS WITH THE PROMPT
+        if i > best_len:
+            below = self._first_entry(node)
+            if below is not None:
+                best, best_len = below, i
+
+        if best is None or best_len <= longer_than:
+            self.misses += 1
+            return 0, None
+
+        state = self._load(best)
+        if state is None:
+            self.misses += 1
+            return 0, None
+        self.hits += 1
+        self.tokens_reused += best_len
+        return best_len, state
+
+    def insert(self, tokens: List[int], state: bytes) -> None:
+        if not tokens or len(state) > self.budget_bytes:
+            return
+        node = self._node_for(tokens)
+        # A LONGER STATE BELOW ALREADY COVERS THIS PREFIX
+        if any(self._first_entry(child) is not None for child in node.children.values()):
+            self._prune(node)
+            return
+        if node.entry is not None:
+            self._drop(node.entry, prune=False)
+
+        ancestor = node.parent
+        while ancestor is not None:
+            if ancestor.entry is not None:
+                self._drop(ancestor.entry)
+            ancestor = ancestor.parent
+
+        entry = _Entry(node, state)
+        node.entry = entry
+        self._ram[entry] = None
+        self.bytes_resident += entry.size
+        self._enforce_budget()
+
+    def clear(self) -> None:
+        """Drops every state, spilled ones included."""
+        for entry in list(self._ram) + list(self._disk):
+            self._drop(entry)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._ram) + len(self._disk),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "tokens_reused": self.tokens_reused,
+            "bytes_resident": self.bytes_resident,
+            "bytes_on_disk": self.bytes_on_disk,
+            "evictions": self.evictions,
+        }
+
+    # TREE
+    def _node_for(self, tokens: List[int]) -> _Node:
+        node, i = self._root, 0
+        while i < len(tokens):
+            child = node.children.get(tokens[i])
+            if child is None:
+                leaf = _Node(tuple(tokens[i:]), node, len(tokens))
+                node.children[tokens[i]] = leaf
+                return leaf
+            n = _shared(child.key, tokens, i)
+            if n < len(child.key):
+                # SPLIT THE EDGE AT THE DIVERGENCE POINT
+                middle = _Node(child.key[:n], node, node.depth + n)
+                node.children[tokens[i]] = middle
+                child.key = child.key[n:]
+                child.parent = middle
+                middle.children[child.key[0]] = child
+                child = middle
+            node, i = child, i + n
+        return node
+
+    def _first_entry(self, node: _Node) -> Optional[_Entry]:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.entry is not None:
+                return current.entry
+            stack.extend(current.children.values())
+        return None
+
+    def _prune(self, node: _Node) -> None:
+        while node.parent is not None and node.entry is None and not node.children:
+            del node.parent.children[node.key[0]]
+            node = node.parent
+
+    # STORAGE TIERS
+    def _load(self, entry: _Entry) -> Optional[bytes]:
+        if entry.state is not None:
+            self._ram.move_to_end(entry)
+            return entry.state
+        try:
+            state = entry.path.read_bytes()
+        except OSError as e:
+            logger.warning(f"Prefix cache: lost spilled state {entry.path}: {e}")
+            self._drop(entry)
+            return None
+        # PROMOTE BACK TO RAM
+        self._disk.pop(entry, None)
+        self.bytes_on_disk -= entry.size
+        entry.path.unlink(missing_ok=True)
+        entry.path = None
+        entry.state = state
+        self._ram[entry] = None
+        self.bytes_resident += entry.size
+        self._enforce_budget(keep=entry)
+        return state
+
+    def _enforce_budget(self, keep: Optional[_Entry] = None) -> None:
+        while self.bytes_resident > self.budget_bytes and self._ram:
+            entry = next(iter(self._ram))
+            if entry is keep:
+                self._ram.move_to_end(entry)
+                if len(self._ram) == 1:
+                    break
+                continue
+            if self.disk_dir and entry.size <= self.disk_budget_bytes:
+                self._spill(entry)
+            else:
+                self.evictions += 1
+                self._drop(entry)
+
+        while self.bytes_on_disk > self.disk_budget_bytes and self._disk:
+            self.evictions += 1
+            self._drop(next(iter(self._disk)))
+
+    def _spill(self, entry: _Entry) -> None:
+        key = array("i", self._tokens_of(entry.node)).tobytes()
+        path = self.disk_dir / f"{hashlib.sha1(key).hexdigest()}.kv"
+        tmp = path.with_suffix(".tmp")
+        try:
+            tmp.write_bytes(entry.state)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Prefix cache: spill failed, dropping state: {e}")
+            tmp.unlink(missing_ok=True)
+            self._drop(entry)
+            return
+        self._ram.pop(entry)
+        self.bytes_resident -= entry.size
+        entry.state = None
+        entry.path = path
+        self._disk[entry] = None
+        self.bytes_on_disk += entry.size
+
+    def _drop(self, entry: _Entry, prune: bool = True) -> None:
+        if entry.state is not None:
+            self._ram.pop(entry, None)
+            self.bytes_resident -= entry.size
+        else:
+            self._disk.pop(entry, None)
+            self.bytes_on_disk -= entry.size
+            entry.path.unlink(missing_ok=True)
+        entry.node.entry = None
+        if prune:
+            self._prune(entry.node)
+
+    def _tokens_of(self, node: _Node) -> List[int]:
+        parts = []
+        while node is not None:
+            parts.append(node.key)
+            node = node.parent
+        return [token for part in reversed(parts) for token in part]
@@ -0,0 +1,103 @@
+from scry_pkg.scry_ws.prefix_cache import PrefixCache
+
+
+def test_lookup_returns_the_longest_shared_prefix():
+    cache = PrefixCache(1 << 20)
+    cache.insert([1, 2, 3, 4], b"abcd")
+    cache.insert([1, 2, 7, 8, 9], b"xyz")
+    assert cache.lookup([1, 2, 3, 4, 5, 6]) == (4, b"abcd")
+    assert cache.lookup([1, 2, 7, 8, 9, 10]) == (5, b"xyz")
+    # A LONGER STATE IS USABLE UP TO THE DIVERGENCE POINT
+    assert cache.lookup([1, 2, 3, 9]) == (3, b"abcd")
+    assert cache.lookup([5, 6]) == (0, None)
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_lookup_must_beat_longer_than():
+    cache = PrefixCache(1 << 20)
+    cache.insert([1, 2, 3], b"s")
+    assert cache.lookup([1, 2, 3, 4], longer_than=3) == (0, None)
+    assert cache.lookup([1, 2, 3, 4], longer_than=2) == (3, b"s")
+
+
+def test_insert_drops_the_ancestors_it_covers():
+    cache = PrefixCache(1 << 20)
+    cache.insert([1, 2], b"short")
+    cache.insert([1, 2, 3, 4], b"long")
+    assert cache.stats()["entries"] == 1
+    assert cache.bytes_resident == 4
+    # AND A PREFIX OF A CACHED STATE IS NOT STORED AGAIN
+    cache.insert([1, 2, 3], b"mid")
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1, 2, 3]) == (3, b"long")
+
+
+def test_insert_replaces_the_state_of_the_same_prefix():
+    cache = PrefixCache(1 << 20)
+    cache.insert([1, 2, 3], b"old")
+    cache.insert([1, 2, 3], b"newer")
+    assert cache.lookup([1, 2, 3]) == (3, b"newer")
+    assert cache.bytes_resident == 5
+
+
+def test_ram_budget_evicts_the_least_recently_used():
+    cache = PrefixCache(10)
+    cache.insert([1], b"aaaa")
+    cache.insert([2], b"bbbb")
+    cache.lookup([1])                     # [1] IS NOW THE MOST RECENT
+    cache.insert([3], b"cccc")
+    assert cache.lookup([2]) == (0, None)
+    assert cache.lookup([1]) == (1, b"aaaa")
+    assert cache.lookup([3]) == (1, b"cccc")
+    assert cache.stats()["evictions"] == 1
+    assert cache.bytes_resident == 8
+
+
+def test_a_state_larger_than_the_budget_is_not_stored():
+    cache = PrefixCache(3)
+    cache.insert([1], b"four")
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_tier_spills_and_promotes_back(tmp_path):
+    cache = PrefixCache(10, tmp_path, disk_budget_bytes=100)
+    cache.insert([1], b"aaaa")
+    cache.insert([2], b"bbbb")
+    cache.insert([3], b"cccc")
+    assert cache.bytes_resident == 8 and cache.bytes_on_disk == 4
+    assert len(list(tmp_path.glob("*.kv"))) == 1
+    # THE SPILLED STATE COMES BACK FROM DISK, PUSHING THE OLDEST ONE OUT IN TURN
+    assert cache.lookup([1, 5]) == (1, b"aaaa")
+    assert cache.bytes_resident == 8 and cache.bytes_on_disk == 4
+    assert cache.lookup([2]) == (1, b"bbbb")
+    assert cache.stats()["evictions"] == 0
+
+
+def test_disk_budget_drops_the_oldest_spilled_state(tmp_path):
+    cache = PrefixCache(4, tmp_path, disk_budget_bytes=8)
+    for token in range(1, 5):
+        cache.insert([token], b"%04d" % token)
+    assert cache.bytes_on_disk == 8
+    assert cache.lookup([1]) == (0, None)
+    assert cache.stats()["evictions"] == 1
+    assert len(list(tmp_path.glob("*.kv"))) == 2
+
+
+def test_a_lost_spilled_state_is_a_miss(tmp_path):
+    cache = PrefixCache(4, tmp_path, disk_budget_bytes=100)
+    cache.insert([1], b"aaaa")
+    cache.insert([2], b"bbbb")
+    for path in tmp_path.glob("*.kv"):
+        path.unlink()
+    assert cache.lookup([1]) == (0, None)
+    assert cache.stats()["entries"] == 1
+
+
+def test_clear_removes_spilled_files(tmp_path):
+    cache = PrefixCache(4, tmp_path, disk_budget_bytes=100)
+    cache.insert([1], b"aaaa")
+    cache.insert([2], b"bbbb")
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.bytes_resident == 0 and cache.bytes_on_disk == 0
+    assert not list(tmp_path.iterdir())
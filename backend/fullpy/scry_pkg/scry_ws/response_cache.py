@@ -0,0 +1,198 @@
+"""Replies of deterministic requests, cached and shared between identical concurrent prompts"""
+import json
+import time
+import asyncio
+import hashlib
+import diskcache
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from scry_pkg.scry_ws import logger
+from scry_pkg.scry_ws.scheduler import GenerationRequest, TokenStream
+
+
+def is_deterministic(params: Dict) -> bool:
+    """Greedy decoding or a fixed seed: the same prompt gives the same reply."""
+    return params.get("temperature", 1) <= 0 or params.get("seed") is not None
+
+
+def response_key(model_name: str, messages: List[Dict[str, str]], params: Dict, max_tokens: int, stops: List[str]) -> str:
+    # CANONICAL JSON: KEY ORDER AND EXTRA MESSAGE FIELDS DO NOT CHANGE THE KEY, THE TEXT IS KEPT AS IS
+    canonical = json.dumps({
+        "model": model_name,
+        "messages": [[m["role"], m["content"]] for m in messages],
+        "params": params,
+        "max_tokens": max_tokens,
+        "stops": sorted(stops),
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def replay(texts: List[str], stats: Dict) -> TokenStream:
+    """A stream already holding a whole reply, sized so nothing is coalesced or dropped."""
+    stream = TokenStream(maxsize=len(texts) + 1, max_chars=sum(len(text) for text in texts) + 1)
+    for text in texts:
+        stream.put_nowait("token", text)
+    stream.put_nowait("complete", stats)
+    return stream
+
+
+class _Flight:
+    """One generation whose events are copied to every attached stream."""
+    __slots__ = ('prompt_id', 'cancel', 'sinks', 'texts')
+
+    def __init__(self, prompt_id: str, cancel: Callable[[str], None]):
+        self.prompt_id = prompt_id
+        self.cancel = cancel
+        self.sinks: Dict[str, TokenStream] = {}
+        self.texts: List[str] = []
+
+    def attach(self, prompt_id: str) -> TokenStream:
+        # A LATE JOINER FIRST GETS WHAT WAS ALREADY GENERATED
+        sink = TokenStream()
+        if self.texts:
+            sink.put_nowait("token", "".join(self.texts))
+        self.sinks[prompt_id] = sink
+        return sink
+
+
+class ResponseCache:
+    """
+    Full replies of deterministic requests keyed by model, history, sampling
+    parameters and limits. Memory holds up to `budget_bytes` (least recently used
+    evicted first), an optional diskcache tier holds up to `disk_budget_bytes`,
+    and both expire entries after `ttl` seconds. A request identical to one
+    still generating attaches to it instead of starting a second generation.
+    Only the event loop may use it.
+    """
+
+    def __init__(self, budget_bytes: int, ttl: float, disk_dir: Optional[str] = None, disk_budget_bytes: int = 0):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self.disk = diskcache.Cache(disk_dir, size_limit=disk_budget_bytes) if disk_dir else None
+        self._memory: "OrderedDict[str, Tuple[float, int, List[str], Dict]]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._joined: Dict[str, _Flight] = {}
+        self.bytes_resident = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    async def replay(self, key: str) -> Optional[TokenStream]:
+        """The cached reply of `key` as a complete stream, or None."""
+        cached = await self._get(key)
+        if cached is None:
+            return None
+        texts, stats = cached
+        return replay(texts, dict(stats, cached=True))
+
+    def share(self, key: str, request: GenerationRequest, submit: Callable[[GenerationRequest], None],
+              cancel: Callable[[str], None]) -> Tuple[TokenStream, str]:
+        """Attaches `request` to the identical generation in flight ("shared") or submits it ("miss")."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.shared += 1
+            self._joined[request.prompt_id] = flight
+            return flight.attach(request.prompt_id), "shared"
+
+        self.misses += 1
+        flight = _Flight(request.prompt_id, cancel)
+        self._flights[key] = flight
+        self._joined[request.prompt_id] = flight
+        sink = flight.attach(request.prompt_id)
+        submit(request)
+        asyncio.create_task(self._fan_out(key, flight, request))
+        return sink, "miss"
+
+    def cancel(self, prompt_id: str) -> bool:
+        """Detaches a prompt from its shared generation; the generation stops when nobody is left."""
+        flight = self._joined.pop(prompt_id, None)
+        if flight is None:
+            return False
+        sink = flight.sinks.pop(prompt_id, None)
+        if sink is not None:
+            sink.put_nowait("cancelled", None)
+        if not flight.sinks:
+            flight.cancel(flight.prompt_id)
+        return True
+
+    async def _fan_out(self, key: str, flight: _Flight, request: GenerationRequest) -> None:
+        try:
+            while True:
+                kind, payload = await request.events.get()
+                if kind == "token":
+                    flight.texts.append(payload)
+                for prompt_id, sink in list(flight.sinks.items()):
+                    if not sink.put_nowait(kind, payload):
+                        # ONE SLOW CLIENT LEAVES, THE OTHERS KEEP THEIR STREAM
+                        del flight.sinks[prompt_id]
+                        self._joined.pop(prompt_id, None)
+                        sink.put_nowait("error", "Client is reading too slowly, generation cancelled")
+                        logger.warning(f"Prompt {prompt_id} detached from shared generation {flight.prompt_id}: slow client")
+                if kind != "token":
+                    break
+                if not flight.sinks:
+                    flight.cancel(flight.prompt_id)
+        finally:
+            self._flights.pop(key, None)
+            for prompt_id in flight.sinks:
+                self._joined.pop(prompt_id, None)
+        if kind == "complete":
+            await self._put(key, flight.texts, payload or {})
+
+    # STORAGE TIERS
+    async def _get(self, key: str) -> Optional[Tuple[List[str], Dict]]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires, size, texts, stats = entry
+            if expires > time.time():
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return texts, stats
+            self._drop(key)
+        if self.disk is None:
+            return None
+        value = await asyncio.get_running_loop().run_in_executor(None, self.disk.get, key)
+        if value is None:
+            return None
+        self.hits += 1
+        self.disk_hits += 1
+        texts, stats = value
+        self._remember(key, texts, stats)
+        return texts, stats
+
+    async def _put(self, key: str, texts: List[str], stats: Dict) -> None:
+        self._remember(key, texts, stats)
+        if self.disk is not None:
+            await asyncio.get_running_loop().run_in_executor(None, lambda: self.disk.set(key, (texts, stats), expire=self.ttl))
+
+    def _remember(self, key: str, texts: List[str], stats: Dict) -> None:
+        size = sum(len(text) for text in texts) + 64
+        if size > self.budget_bytes:
+            return
+        if key in self._memory:
+            self._drop(key)
+        self._memory[key] = (time.time() + self.ttl, size, texts, stats)
+        self.bytes_resident += size
+        while self.bytes_resident > self.budget_bytes:
+            self._drop(next(iter(self._memory)))
+
+    def _drop(self, key: str) -> None:
+        self.bytes_resident -= self._memory.pop(key)[1]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.shared
+        return {
+            "entries": len(self._memory),
+            "bytes_resident": self.bytes_resident,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "shared": self.shared,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared) / lookups, 3) if lookups else 0.0,
+            "in_flight": len(self._flights),
+        }
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,119 @@
+import asyncio
+from scry_pkg.scry_ws.response_cache import ResponseCache, is_deterministic, response_key
+from scry_pkg.scry_ws.scheduler import GenerationRequest
+
+MESSAGES = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hello"}]
+
+
+def request(prompt_id: str) -> GenerationRequest:
+    return GenerationRequest(prompt_id, MESSAGES, {"temperature": 0}, 16)
+
+
+async def events(stream):
+    result = []
+    while not result or result[-1][0] == "token":
+        result.append(await stream.get())
+    return result
+
+
+def test_is_deterministic():
+    assert is_deterministic({"temperature": 0})
+    assert is_deterministic({"temperature": 0.7, "seed": 3})
+    assert not is_deterministic({"temperature": 0.7})
+    assert not is_deterministic({})
+
+
+def test_response_key_is_canonical():
+    key = response_key("m", MESSAGES, {"temperature": 0, "top_k": 40}, 16, ["a", "b"])
+    # KEY ORDER, EXTRA MESSAGE FIELDS AND STOP ORDER DO NOT MATTER
+    reordered = [{"content": "be brief", "role": "system"}, {"role": "user", "content": "hello", "name": "x"}]
+    assert response_key("m", reordered, {"top_k": 40, "temperature": 0}, 16, ["b", "a"]) == key
+    # THE MODEL, THE TEXT, THE PARAMETERS AND THE LIMITS DO
+    assert response_key("n", MESSAGES, {"temperature": 0, "top_k": 40}, 16, ["a", "b"]) != key
+    assert response_key("m", MESSAGES[:1] + [{"role": "user", "content": "hello "}], {"temperature": 0, "top_k": 40}, 16,
+                        ["a", "b"]) != key
+    assert response_key("m", MESSAGES, {"temperature": 0, "top_k": 41}, 16, ["a", "b"]) != key
+    assert response_key("m", MESSAGES, {"temperature": 0, "top_k": 40}, 17, ["a", "b"]) != key
+    assert response_key("m", MESSAGES, {"temperature": 0, "top_k": 40}, 16, ["a"]) != key
+
+
+def test_identical_request_shares_the_generation_and_the_reply_is_cached():
+    async def run():
+        cache = ResponseCache(1 << 20, ttl=60)
+        submitted, cancelled = [], []
+        first = request("p1")
+        sink1, outcome1 = cache.share("k", first, submitted.append, cancelled.append)
+        first.events.put_nowait("token", "Hel")
+        await asyncio.sleep(0)
+        sink2, outcome2 = cache.share("k", request("p2"), submitted.append, cancelled.append)
+        assert (outcome1, outcome2) == ("miss", "shared")
+        assert submitted == [first]
+        first.events.put_nowait("token", "lo")
+        first.events.put_nowait("complete", {"tokens": 2})
+        one, two = await events(sink1), await events(sink2)
+        assert one == [("token", "Hel"), ("token", "lo"), ("complete", {"tokens": 2})]
+        # THE LATE JOINER GETS WHAT WAS ALREADY GENERATED AS ONE TOKEN EVENT
+        assert two == [("token", "Hel"), ("token", "lo"), ("complete", {"tokens": 2})]
+        await asyncio.sleep(0)
+        assert cache.stats()["in_flight"] == 0
+
+        replayed = await cache.replay("k")
+        assert await events(replayed) == [("token", "Hel"), ("token", "lo"), ("complete", {"tokens": 2, "cached": True})]
+        assert await cache.replay("other") is None
+        assert cache.stats()["hits"] == 1 and cache.stats()["shared"] == 1 and cache.stats()["misses"] == 1
+        assert not cancelled
+
+    asyncio.run(run())
+
+
+def test_generation_stops_when_every_sharer_cancelled():
+    async def run():
+        cache = ResponseCache(1 << 20, ttl=60)
+        cancelled = []
+        first = request("p1")
+        sink1, _ = cache.share("k", first, lambda r: None, cancelled.append)
+        sink2, _ = cache.share("k", request("p2"), lambda r: None, cancelled.append)
+        assert cache.cancel("p2")
+        assert await sink2.get() == ("cancelled", None)
+        assert not cancelled
+        assert cache.cancel("p1")
+        # THE GENERATION IS CANCELLED UNDER THE PROMPT ID IT WAS SUBMITTED WITH
+        assert cancelled == ["p1"]
+        assert not cache.cancel("p1")
+        first.events.put_nowait("cancelled", None)
+        await asyncio.sleep(0)
+        assert await cache.replay("k") is None
+
+    asyncio.run(run())
+
+
+def test_memory_budget_and_ttl():
+    async def run():
+        cache = ResponseCache(200, ttl=60)
+        await cache._put("a", ["x" * 60], {})
+        await cache._put("b", ["y" * 60], {})
+        # BOTH DO NOT FIT: THE LEAST RECENTLY USED GOES
+        assert cache.bytes_resident == 60 + 64
+        assert await cache.replay("a") is None
+        assert await cache.replay("b") is not None
+        await cache._put("c", ["z" * 300], {})
+        assert cache.stats()["entries"] == 1
+        expired = ResponseCache(1 << 20, ttl=-1)
+        await expired._put("a", ["x"], {})
+        assert await expired.replay("a") is None
+        assert expired.bytes_resident == 0
+
+    asyncio.run(run())
+
+
+def test_disk_tier_outlives_memory(tmp_path):
+    async def run():
+        cache = ResponseCache(1 << 20, ttl=60, disk_dir=str(tmp_path), disk_budget_bytes=1 << 20)
+        await cache._put("k", ["hi"], {"tokens": 1})
+        cache.close()
+        reopened = ResponseCache(1 << 20, ttl=60, disk_dir=str(tmp_path), disk_budget_bytes=1 << 20)
+        assert await events(await reopened.replay("k")) == [("token", "hi"), ("complete", {"tokens": 1, "cached": True})]
+        assert reopened.stats()["disk_hits"] == 1
+        reopened.close()
+
+    asyncio.run(run())
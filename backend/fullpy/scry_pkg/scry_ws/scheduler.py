@@ -0,0 +1,671 @@
+"""Continuous-batching scheduler: many prompts, one llama context, one decode per step"""
+import time
+import codecs
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+from scry_pkg.scry_ws import logger, STREAM_QUEUE_SIZE, STREAM_MAX_PENDING_CHARS, SLOW_CONSUMER_POLICY, PREFIX_CACHE_MIN_TOKENS, \
+    EARLY_CANCEL_HOLD, SUBMITTED_IDS_KEPT
+
+
+class DecodeError(RuntimeError):
+    """llama_decode returned a non-zero status (1 = no KV slot left, <0 = fatal)."""
+
+    def __init__(self, status: int):
+        super().__init__(f"llama_decode failed with status {status}")
+        self.status = status
+
+
+class DecodeAborted(DecodeError):
+    """llama_decode stopped early (status 2) because the abort flag was set."""
+
+
+class TokenStream:
+    """
+    Bounded per-prompt event queue, filled on the event loop with what the decode
+    thread produced and drained by the WebSocket sender. put_nowait never blocks
+    the producer: it returns False when the consumer is too slow to keep.
+    """
+    __slots__ = ('maxsize', 'policy', 'max_chars', 'pending_chars', '_items', '_ready')
+
+    def __init__(self, maxsize: int = STREAM_QUEUE_SIZE, policy: str = SLOW_CONSUMER_POLICY, max_chars: int = STREAM_MAX_PENDING_CHARS):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_chars = max_chars
+        self.pending_chars = 0
+        self._items: deque = deque()
+        self._ready = asyncio.Event()
+
+    def put_nowait(self, kind: str, payload: Optional[str]) -> bool:
+        if kind == "token":
+            if self.pending_chars + len(payload) > self.max_chars:
+                return False
+            if len(self._items) >= self.maxsize and self.policy != "coalesce":
+                return False
+            self.pending_chars += len(payload)
+            if len(self._items) >= self.maxsize and self._items[-1][0] == "token":
+                self._items[-1] = ("token", self._items[-1][1] + payload)
+                return True
+        # CONTROL EVENTS (complete, cancelled, error) ARE NEVER DROPPED
+        self._items.append((kind, payload))
+        self._ready.set()
+        return True
+
+    async def get(self) -> Tuple[str, Optional[str]]:
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        kind, payload = self._items.popleft()
+        if kind == "token":
+            self.pending_chars -= len(payload)
+        return kind, payload
+
+    async def get_many(self, window: float, max_chars: int) -> List[Tuple[str, Optional[str]]]:
+        """
+        Waits for one event, then keeps collecting until `window` seconds passed,
+        `max_chars` characters are queued or a control event arrives, and returns
+        everything queued. Costs one timer per frame instead of a wake-up per token.
+        """
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + window
+        while self.pending_chars < max_chars and self._items[-1][0] == "token":
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._ready.clear()
+            timer = loop.call_later(remaining, self._ready.set)
+            await self._ready.wait()
+            timer.cancel()
+        items = list(self._items)
+        self._items.clear()
+        self.pending_chars = 0
+        return items
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+
+class GenerationRequest:
+    """One prompt waiting for or running in a slot. Events land in `events` as (kind, payload)."""
+    __slots__ = ('prompt_id', 'messages', 'params', 'max_tokens', 'stops', 'events', 'dropped', 'session_id', 'submitted',
+                 'formatted')
+
+    def __init__(self, prompt_id: str, messages: List[Dict[str, str]], params: Dict, max_tokens: int, stops: Optional[List[str]] = None,
+                 session_id: Optional[str] = None):
+        self.prompt_id = prompt_id
+        self.session_id = session_id
+        self.messages = messages
+        self.params = params
+        self.max_tokens = max_tokens
+        self.stops = list(stops or [])
+        self.events = TokenStream()
+        self.dropped = False
+        self.submitted = time.perf_counter()
+        # (TOKENS, STOPS) ONCE THE SCHEDULER FORMATTED IT: A PROMPT HELD BACK FOR KV CELLS IS NOT FORMATTED AGAIN
+        self.formatted: Optional[Tuple[List[int], List[str]]] = None
+
+
+class Slot:
+    """
+    A KV sequence of the shared context. `cached` mirrors the tokens held in its
+    KV cells; `reserved` is the most cells its prompt can grow to (prompt plus
+    max_tokens), counted against the pool while the prompt runs.
+    """
+    __slots__ = ('seq_id', 'request', 'cached', 'pending', 'sampler', 'last_token', 'n_generated',
+                 'decoder', 'text', 'emitted', 'last_used', 'started', 'first_token', 'n_prompt', 'n_reused',
+                 'drafted', 'accepted', 'reserved')
+
+    def __init__(self, seq_id: int):
+        self.seq_id = seq_id
+        self.request: Optional[GenerationRequest] = None
+        self.cached: List[int] = []
+        self.pending: List[int] = []
+        self.sampler = None
+        self.last_token: Optional[int] = None
+        self.n_generated = 0
+        self.decoder = None
+        self.text = ""
+        self.emitted = 0
+        self.last_used = 0
+        self.started = 0.0
+        self.first_token = 0.0
+        self.n_prompt = 0
+        self.n_reused = 0
+        self.drafted = 0
+        self.accepted = 0
+        self.reserved = 0
+
+    @property
+    def generating(self) -> bool:
+        return self.request is not None and not self.pending and self.last_token is not None
+
+
+def common_prefix(a: List[int], b: List[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class BatchScheduler:
+    """
+    Runs up to `engine.n_slots` prompts at once. Each step builds one batch with
+    the next token of every generating slot plus prompt chunks of the slots still
+    prefilling, decodes it and samples every slot that produced logits.
+    All engine calls happen on one dedicated thread; the event loop only submits,
+    cancels and receives the events of each step. Cancelling a prompt whose
+    prefill chunk is being decoded aborts that decode, so a long prompt gives
+    its slot back within one graph node instead of one batch.
+    All slots share one KV pool of `engine.n_ctx` cells: a prompt is admitted
+    once the cells it can grow to fit next to those reserved by the running
+    ones, else it waits (and the prompts behind it too) for one to finish.
+    `snapshot(session_id, tokens, state)` receives the KV state of every
+    completed turn that belongs to a session (the session store writes it).
+    """
+
+    def __init__(self, engine, prefix_cache=None, drafters=None,
+                 snapshot: Optional[Callable[[str, List[int], bytes], None]] = None):
+        self.engine = engine
+        self.prefix_cache = prefix_cache
+        self.snapshot = snapshot
+        # (TOKENS, STATE) OF RESUMED SESSIONS, INSERTED INTO THE PREFIX CACHE BY THE DECODE THREAD
+        self._preloads: List[Tuple[List[int], bytes]] = []
+        # SPECULATIVE MODE NAME -> DRAFTER, PICKED PER REQUEST FROM params["speculative"]
+        self.drafters = dict(drafters or {})
+        self._new_drafters = {}
+        self.slots = [Slot(seq_id) for seq_id in range(engine.n_slots)]
+        self._waiting: deque = deque()
+        # PROMPT ID -> WHEN ITS CANCEL ARRIVED
+        self._cancelled: Dict[str, float] = {}
+        # CANCELS OF PROMPTS NOT SUBMITTED YET (MODEL LOAD, CACHE LOOKUPS), KEPT UNTIL submit CONSUMES THEM
+        self._early_cancels: Dict[str, float] = {}
+        # THE LAST SUBMITTED_IDS_KEPT PROMPT IDS SUBMITTED, TO TELL A LATE CANCEL FROM AN EARLY ONE
+        self._submitted: "OrderedDict[str, None]" = OrderedDict()
+        # PROMPTS WITH A PREFILL CHUNK IN THE DECODE RUNNING NOW, AND THE FLAG THAT STOPS IT
+        self._decoding: set = set()
+        self._abort = threading.Event()
+        self._lock = threading.Lock()
+        self._work = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self._clock = 0
+
+    # EVENT LOOP SIDE
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._thread = threading.Thread(target=self._run, name="llama-decode", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._work.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def close(self) -> None:
+        """Stops the decode thread and closes the drafters; the engine stays with its owner."""
+        self.stop()
+        self._install_drafters()
+        for drafter in self.drafters.values():
+            drafter.close()
+        self.drafters = {}
+
+    def idle(self) -> bool:
+        """No prompt waiting or running."""
+        return not self._waiting and not any(s.request for s in self.slots)
+
+    def submit(self, request: GenerationRequest) -> None:
+        with self._lock:
+            # CANCELLED ON ITS WAY HERE (MODEL LOAD, CACHE LOOKUPS)
+            cancelled = self._early_cancels.pop(request.prompt_id, None)
+            if cancelled is None:
+                self._waiting.append(request)
+            self._submitted[request.prompt_id] = None
+            self._submitted.move_to_end(request.prompt_id)
+            if len(self._submitted) > SUBMITTED_IDS_KEPT:
+                self._submitted.popitem(last=False)
+        if cancelled is not None:
+            self._deliver([(request, "cancelled", {"release_s": round(time.perf_counter() - cancelled, 4)})])
+            return
+        self._work.set()
+
+    def preload(self, tokens: List[int], state: bytes) -> None:
+        """Hands a saved KV state to the prefix cache; prompts submitted after this call can restore it."""
+        if self.prefix_cache is None:
+            return
+        with self._lock:
+            self._preloads.append((tokens, state))
+        self._work.set()
+
+    def set_drafter(self, mode: str, drafter) -> None:
+        """Installs a drafter; the swap (and closing the old one) happens on the decode thread."""
+        with self._lock:
+            self._new_drafters[mode] = drafter
+
+    def cancel(self, prompt_id: str) -> None:
+        """
+        A prompt whose chunk is being decoded aborts that decode. Any other one
+        holds no compute, so it is released to its client at once; its slot is
+        cleaned up by the next step.
+        """
+        received = time.perf_counter()
+        released = None
+        with self._lock:
+            # CANCELS OF PROMPTS THAT NEVER CAME (ROUTED TO ANOTHER MODEL, FAILED BEFORE SUBMIT) ARE FORGOTTEN
+            for stale in [p for p, at in self._early_cancels.items() if received - at > EARLY_CANCEL_HOLD]:
+                del self._early_cancels[stale]
+            if prompt_id in self._decoding:
+                self._cancelled.setdefault(prompt_id, received)
+                self._abort.set()
+            else:
+                released = next((r for r in self._waiting if r.prompt_id == prompt_id), None)
+                if released is not None:
+                    self._waiting.remove(released)
+                else:
+                    released = next((s.request for s in self.slots if s.request is not None and s.request.prompt_id == prompt_id), None)
+                    if released is not None:
+                        self._cancelled.setdefault(prompt_id, received)
+                    elif prompt_id not in self._submitted:
+                        # NOT SUBMITTED YET: submit RELEASES IT ON ARRIVAL. A PROMPT ALREADY FINISHED IS LEFT ALONE
+                        self._early_cancels.setdefault(prompt_id, received)
+        if released is not None and not released.dropped:
+            self._deliver([(released, "cancelled", {"release_s": round(time.perf_counter() - received, 4)})])
+            # EVENTS THE DECODE THREAD STILL PRODUCES FOR IT ARE DISCARDED
+            released.dropped = True
+        self._work.set()
+
+    def _deliver(self, events) -> None:
+        for request, kind, payload in events:
+            if request.dropped:
+                continue
+            if not request.events.put_nowait(kind, payload):
+                # SLOW CONSUMER: STOP GENERATING FOR IT INSTEAD OF STALLING THE OTHER SLOTS
+                request.dropped = True
+                self.cancel(request.prompt_id)
+                request.events.put_nowait("error", "Client is reading too slowly, generation cancelled")
+                logger.warning(f"Prompt {request.prompt_id} dropped: {request.events.qsize()} events pending")
+
+    # WORKER THREAD SIDE
+    def has_work(self) -> bool:
+        return bool(self._waiting or self._cancelled or self._preloads or any(s.request for s in self.slots))
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._work.wait()
+            self._work.clear()
+            while not self._stopping and self.has_work():
+                try:
+                    events = self.step()
+                except Exception as e:
+                    logger.error(f"Scheduler step failed: {type(e).__name__}: {e}", exc_info=True)
+                    events = []
+                    for slot in self.slots:
+                        if slot.request is not None:
+                            self._finish(slot, events, error=f"Scheduler failure: {e}")
+                if events:
+                    self._loop.call_soon_threadsafe(self._deliver, events)
+
+    def step(self) -> List[Tuple[GenerationRequest, str, Optional[str]]]:
+        events = []
+        self._install_drafters()
+        self._install_preloads()
+        self._apply_cancellations(events)
+        self._admit(events)
+        # RELEASED SLOTS AND REJECTED PROMPTS ARE TOLD NOW, NOT AFTER THE DECODE BELOW
+        if events and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deliver, events)
+            events = []
+
+        # EVERY GENERATING SLOT DECODES ITS LAST TOKEN PLUS THE DRAFT TOKENS TO VERIFY
+        drafts = self._draft()
+        entries, sample_at, prefilling = [], [], []
+        # KV LENGTH OF EVERY SLOT IN THE BATCH BEFORE IT, TO UNDO AN ABORTED DECODE
+        starts = {}
+        for slot in self.slots:
+            if slot.generating:
+                starts[slot.seq_id] = len(slot.cached)
+                proposal = drafts.get(slot.seq_id, [])
+                start = len(entries)
+                for token in [slot.last_token] + proposal:
+                    entries.append((token, len(slot.cached), slot.seq_id, True))
+                    slot.cached.append(token)
+                sample_at.append((slot, start, proposal))
+
+        # PROMPT CHUNKS FILL WHATEVER IS LEFT OF THE BATCH AFTER THE GENERATING SLOTS
+        budget = self.engine.n_batch - len(entries)
+        for slot in self.slots:
+            if budget <= 0:
+                break
+            if slot.request is None or not slot.pending:
+                continue
+            chunk = slot.pending[:budget]
+            del slot.pending[:len(chunk)]
+            starts[slot.seq_id] = len(slot.cached)
+            prefilling.append((slot, chunk))
+            for i, token in enumerate(chunk):
+                last = not slot.pending and i == len(chunk) - 1
+                entries.append((token, len(slot.cached), slot.seq_id, last))
+                slot.cached.append(token)
+            if not slot.pending:
+                sample_at.append((slot, len(entries) - 1, []))
+            budget -= len(chunk)
+
+        if not entries:
+            return events
+
+        self._reclaim(len(entries), events)
+        with self._lock:
+            self._decoding = {slot.request.prompt_id for slot, _ in prefilling}
+            # CANCELLED SINCE _apply_cancellations: DO NOT EVEN START
+            if self._decoding & self._cancelled.keys():
+                self._abort.set()
+        try:
+            # ONLY BATCHES WITH PROMPT CHUNKS ARE ABORTABLE: A GENERATION STEP IS SHORTER THAN THE POLLING COSTS
+            self.engine.decode(entries, self._abort if prefilling else None)
+        except DecodeAborted:
+            logger.info(f"Batch of {len(entries)} tokens aborted for a cancelled prompt")
+            self._rollback(starts, prefilling)
+            return events
+        except DecodeError as e:
+            if e.status != 1:
+                logger.error(f"Batch of {len(entries)} tokens failed: {e}")
+                for slot in self.slots:
+                    if slot.request is not None:
+                        self._finish(slot, events, error=f"Decode failed: {e}")
+                return events
+            # NO KV CELLS LEFT: ONLY THE PROMPT ADMITTED LAST GIVES UP, THE OTHERS DECODE THEIR TOKENS AGAIN NEXT STEP
+            self._rollback(starts, prefilling)
+            overflowed = max((slot for slot in self.slots if slot.seq_id in starts), key=lambda slot: slot.started)
+            logger.error(f"Batch of {len(entries)} tokens found no KV cells, failing prompt {overflowed.request.prompt_id}")
+            self._finish(overflowed, events, error=f"Decode failed: {e}")
+            return events
+        finally:
+            with self._lock:
+                self._decoding = set()
+                self._abort.clear()
+
+        for slot, index, proposal in sample_at:
+            if slot.request is not None:
+                self._verify(slot, index, proposal, events)
+        return events
+
+    def _rollback(self, starts: Dict[int, int], prefilling: List[Tuple[Slot, List[int]]]) -> None:
+        """
+        Undoes an aborted or failed batch: llama.cpp keeps whatever ubatches it finished,
+        so every slot of the batch drops its KV cells past its start and the
+        prefill chunks go back in front of `pending`. The cancelled slot is
+        freed by the next step; the others decode their tokens again.
+        """
+        for slot in self.slots:
+            if slot.seq_id in starts:
+                self.engine.clear_seq(slot.seq_id, starts[slot.seq_id])
+                del slot.cached[starts[slot.seq_id]:]
+        for slot, chunk in prefilling:
+            slot.pending[:0] = chunk
+
+    def _install_preloads(self) -> None:
+        with self._lock:
+            preloads, self._preloads = self._preloads, []
+        for tokens, state in preloads:
+            self.prefix_cache.insert(tokens, state)
+
+    def _install_drafters(self) -> None:
+        with self._lock:
+            new, self._new_drafters = self._new_drafters, {}
+        for mode, drafter in new.items():
+            old = self.drafters.get(mode)
+            self.drafters[mode] = drafter
+            if old is not None:
+                old.close()
+
+    def _draft(self) -> Dict[int, List[int]]:
+        groups = {}
+        for slot in self.slots:
+            if not slot.generating:
+                continue
+            mode = slot.request.params.get("speculative")
+            drafter = self.drafters.get(mode)
+            if drafter is None:
+                continue
+            k = min(slot.request.params.get("draft_tokens", 4),
+                    slot.request.max_tokens - slot.n_generated - 1,
+                    self.engine.n_ctx - len(slot.cached) - 2,
+                    self.engine.n_batch // self.engine.n_slots - 1)
+            if k > 0:
+                groups.setdefault(mode, {})[slot.seq_id] = (slot.cached + [slot.last_token], k)
+
+        drafts = {}
+        for mode, wants in groups.items():
+            drafts.update(self.drafters[mode].draft(wants))
+        return drafts
+
+    def _verify(self, slot: Slot, index: int, proposal: List[int], events) -> None:
+        """
+        Samples the target at every drafted position while the samples match the
+        draft: accepted draft tokens are already in the KV cache, the first
+        mismatch (or the bonus token after a full match) becomes the next input.
+        """
+        sampled = []
+        for i in range(len(proposal) + 1):
+            token = self.engine.sample(slot.sampler, index + i)
+            sampled.append(token)
+            if i == len(proposal) or token != proposal[i]:
+                break
+
+        accepted = len(sampled) - 1
+        rejected = len(proposal) - accepted
+        if rejected:
+            keep = len(slot.cached) - rejected
+            self.engine.clear_seq(slot.seq_id, keep)
+            del slot.cached[keep:]
+        slot.drafted += len(proposal)
+        slot.accepted += accepted
+
+        for token in sampled[:-1]:
+            if not self._emit_token(slot, token, events):
+                return
+        self._accept_token(slot, sampled[-1], events)
+
+    def _apply_cancellations(self, events) -> None:
+        with self._lock:
+            cancelled, self._cancelled = self._cancelled, {}
+            if not cancelled:
+                return
+            kept = deque()
+            for request in self._waiting:
+                if request.prompt_id in cancelled:
+                    events.append((request, "cancelled", {"release_s": round(time.perf_counter() - cancelled[request.prompt_id], 4)}))
+                else:
+                    kept.append(request)
+            self._waiting = kept
+        for slot in self.slots:
+            if slot.request is not None and slot.request.prompt_id in cancelled:
+                self._finish(slot, events, kind="cancelled", cancelled_at=cancelled[slot.request.prompt_id])
+
+    def _admit(self, events) -> None:
+        while True:
+            free = [s for s in self.slots if s.request is None]
+            if not free:
+                return
+            with self._lock:
+                if not self._waiting:
+                    return
+                request = self._waiting.popleft()
+
+            if request.formatted is None:
+                try:
+                    request.formatted = self.engine.format_chat(request.messages)
+                except Exception as e:
+                    events.append((request, "error", f"Tokenization failed: {e}"))
+                    continue
+            tokens, stops = request.formatted
+
+            room = self.engine.n_ctx - len(tokens)
+            if room <= 0:
+                events.append((request, "error", f"Prompt of {len(tokens)} tokens exceeds the context window"))
+                continue
+
+            # THE CELLS IT CAN GROW TO MUST FIT NEXT TO THOSE OF THE RUNNING PROMPTS; IDLE SLOTS GIVE THEIRS BACK (_reclaim)
+            reserved = len(tokens) + min(request.max_tokens, room)
+            running = sum(s.reserved for s in self.slots if s.request is not None)
+            if running and running + reserved > self.engine.n_ctx:
+                with self._lock:
+                    self._waiting.appendleft(request)
+                return
+
+            # REUSE THE SLOT THAT ALREADY HOLDS THE LONGEST PREFIX OF THIS PROMPT
+            slot = max(free, key=lambda s: (common_prefix(s.cached, tokens), -s.last_used))
+            n_keep = min(common_prefix(slot.cached, tokens), len(tokens) - 1)
+            self.engine.clear_seq(slot.seq_id, n_keep)
+            del slot.cached[n_keep:]
+
+            # A LONGER PREFIX FROM ANOTHER SLOT OR SESSION: RESTORE IT AND CUT IT TO THE SHARED PART
+            if self.prefix_cache is not None:
+                n_hit, state = self.prefix_cache.lookup(tokens, longer_than=n_keep)
+                n_hit = min(n_hit, len(tokens) - 1)
+                if n_hit > n_keep:
+                    if self.engine.load_seq(slot.seq_id, state):
+                        self.engine.clear_seq(slot.seq_id, n_hit)
+                        slot.cached = tokens[:n_hit]
+                        n_keep = n_hit
+                    else:
+                        self.engine.clear_seq(slot.seq_id)
+                        slot.cached = []
+                        n_keep = 0
+
+            request.max_tokens = min(request.max_tokens, room)
+            slot.reserved = reserved
+            request.stops = stops + [s for s in request.stops if s not in stops]
+            slot.request = request
+            slot.pending = tokens[n_keep:]
+            slot.sampler = self.engine.new_sampler(request.params)
+            slot.last_token = None
+            slot.n_generated = 0
+            slot.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            slot.text = ""
+            slot.emitted = 0
+            slot.started = time.perf_counter()
+            slot.first_token = 0.0
+            slot.n_prompt = len(tokens)
+            slot.n_reused = n_keep
+            slot.drafted = 0
+            slot.accepted = 0
+            logger.info(f"Prompt {request.prompt_id} -> slot {slot.seq_id} ({n_keep}/{len(tokens)} tokens reused)")
+
+    def _reclaim(self, needed: int, events) -> None:
+        """Frees KV cells held by idle slots (least recently used first) when the pool runs short."""
+        used = sum(len(s.cached) for s in self.slots)
+        if used <= self.engine.n_ctx:
+            return
+        for slot in sorted((s for s in self.slots if s.request is None and s.cached), key=lambda s: s.last_used):
+            self.engine.clear_seq(slot.seq_id)
+            used -= len(slot.cached)
+            slot.cached = []
+            if used <= self.engine.n_ctx:
+                return
+        logger.warning(f"KV pool exhausted ({used} cells for {self.engine.n_ctx}), {needed} tokens in batch")
+
+    def _accept_token(self, slot: Slot, token: int, events) -> None:
+        """Streams a sampled token that still has to be decoded on the next step."""
+        slot.last_token = token
+        self._emit_token(slot, token, events)
+
+    def _emit_token(self, slot: Slot, token: int, events) -> bool:
+        """Streams one generated token; returns False once the request is finished."""
+        request = slot.request
+        if not slot.first_token:
+            slot.first_token = time.perf_counter()
+        if self.engine.is_eog(token):
+            self._finish(slot, events)
+            return False
+
+        slot.n_generated += 1
+        slot.text += slot.decoder.decode(self.engine.piece(token))
+
+        # STOP STRINGS: CUT AT THE FIRST MATCH AND HOLD BACK A POSSIBLE PARTIAL MATCH
+        safe = len(slot.text)
+        for stop in request.stops:
+            found = slot.text.find(stop, max(slot.emitted - len(stop) + 1, 0))
+            if found != -1:
+                self._emit(slot, found, events)
+                self._finish(slot, events, flush=False)
+                return False
+            for k in range(min(len(stop) - 1, len(slot.text)), 0, -1):
+                if slot.text.endswith(stop[:k]):
+                    safe = min(safe, len(slot.text) - k)
+                    break
+        self._emit(slot, safe, events)
+
+        if slot.n_generated >= request.max_tokens or len(slot.cached) + 1 >= self.engine.n_ctx:
+            self._finish(slot, events)
+            return False
+        return True
+
+    def _emit(self, slot: Slot, upto: int, events) -> None:
+        if upto > slot.emitted:
+            events.append((slot.request, "token", slot.text[slot.emitted:upto]))
+            slot.emitted = upto
+
+    def _stats(self, slot: Slot) -> Dict:
+        now = time.perf_counter()
+        elapsed = now - slot.started
+        first = slot.first_token or now
+        # PREFILL: FROM ADMISSION TO THE FIRST SAMPLED TOKEN, OVER THE PROMPT TOKENS NOT RESTORED FROM A CACHE
+        prefill = first - slot.started
+        generating = now - first
+        stats = {
+            "tokens": slot.n_generated,
+            "seconds": round(elapsed, 3),
+            "tokens_per_s": round(slot.n_generated / elapsed, 2) if elapsed > 0 else 0.0,
+            "prompt_tokens": slot.n_prompt,
+            "cached_tokens": slot.n_reused,
+            "queue_s": round(slot.started - slot.request.submitted, 4),
+            "prefill_s": round(prefill, 4),
+            "ttft_s": round(first - slot.request.submitted, 4),
+            "prompt_tokens_per_s": round((slot.n_prompt - slot.n_reused) / prefill, 2) if prefill > 0 else 0.0,
+            "gen_tokens_per_s": round((slot.n_generated - 1) / generating, 2) if slot.n_generated > 1 and generating > 0 else 0.0,
+            "speculative": slot.request.params.get("speculative") or "none",
+        }
+        if slot.drafted:
+            stats.update(drafted=slot.drafted, accepted=slot.accepted,
+                         acceptance_rate=round(slot.accepted / slot.drafted, 3))
+        return stats
+
+    def _finish(self, slot: Slot, events, kind: str = "complete", error: Optional[str] = None, flush: bool = True,
+                cancelled_at: Optional[float] = None) -> None:
+        request = slot.request
+        if error is not None:
+            self.engine.clear_seq(slot.seq_id)
+            slot.cached = []
+            events.append((request, "error", error))
+        else:
+            if flush and kind == "complete":
+                slot.text += slot.decoder.decode(b"", final=True)
+                self._emit(slot, len(slot.text), events)
+            if kind == "complete":
+                payload = self._stats(slot)
+            else:
+                # CANCEL-TO-RELEASE: HOW LONG THE CANCELLED PROMPT KEPT ITS SLOT
+                payload = {"release_s": round(time.perf_counter() - cancelled_at, 4)} if cancelled_at else None
+            events.append((request, kind, payload))
+            if self.prefix_cache is not None and len(slot.cached) >= PREFIX_CACHE_MIN_TOKENS:
+                state = self.engine.save_seq(slot.seq_id)
+                self.prefix_cache.insert(slot.cached, state)
+                if self.snapshot is not None and kind == "complete" and request.session_id:
+                    self.snapshot(request.session_id, list(slot.cached), state)
+        self.engine.free_sampler(slot.sampler)
+        self._clock += 1
+        slot.last_used = self._clock
+        slot.request = None
+        slot.sampler = None
+        slot.reserved = 0
+        slot.pending = []
+        slot.last_token = None
+        # KV OF A PARTIALLY PREFILLED PROMPT IS STILL VALID FOR `cached`, SO IT STAYS REUSABLE
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from scry_pkg.scry_ws.fake_engine import FakeEngine
+from scry_pkg.scry_ws.scheduler import BatchScheduler, GenerationRequest, TokenStream
+
+
+def make_scheduler() -> BatchScheduler:
+    engine = FakeEngine("fake.gguf", "chatml", n_ctx=512, n_slots=2, rate=10_000, prefill_rate=1e9, reply_tokens=4)
+    return BatchScheduler(engine)
+
+
+def request(prompt_id: str) -> GenerationRequest:
+    return GenerationRequest(prompt_id, [{"role": "user", "content": "hello there"}], {}, 8)
+
+
+def drain(req: GenerationRequest):
+    return [kind for kind, _ in req.events._items]
+
+
+async def collect(stream: TokenStream, n: int):
+    return [await stream.get() for _ in range(n)]
+
+
+def test_cancel_before_submit_survives_decode_steps():
+    scheduler = make_scheduler()
+    scheduler.cancel("late")
+    # OTHER PROMPTS KEEP THE DECODE THREAD STEPPING BEFORE "late" IS SUBMITTED
+    other = request("other")
+    scheduler.submit(other)
+    for _ in range(3):
+        for req, kind, payload in scheduler.step():
+            req.events.put_nowait(kind, payload)
+    late = request("late")
+    scheduler.submit(late)
+    assert drain(late) == ["cancelled"]
+    assert not scheduler._waiting
+
+
+def test_cancel_of_running_prompt_frees_its_slot():
+    scheduler = make_scheduler()
+    running = request("running")
+    scheduler.submit(running)
+    scheduler.step()
+    scheduler.cancel("running")
+    assert drain(running) == ["cancelled"]
+    scheduler.step()
+    assert scheduler.idle()
+    # A LATER PROMPT WITH THE SAME ID IS NOT CANCELLED BY IT
+    again = request("running")
+    scheduler.submit(again)
+    assert list(scheduler._waiting) == [again]
+
+
+def test_uncancelled_prompt_completes():
+    scheduler = make_scheduler()
+    req = request("done")
+    scheduler.submit(req)
+    events = []
+    while not scheduler.idle():
+        events += [kind for r, kind, _ in scheduler.step() if r is req]
+    assert events[-1] == "complete"
+    assert events.count("token") >= 1
+
+
+def run_until_idle(scheduler: BatchScheduler, requests) -> dict:
+    """Steps the scheduler until it is idle; the event kinds of every request, and how many ran at once at most."""
+    kinds = {req.prompt_id: [] for req in requests}
+    most_running = 0
+    while not scheduler.idle():
+        for req, kind, _ in scheduler.step():
+            kinds[req.prompt_id].append(kind)
+        most_running = max(most_running, sum(slot.request is not None for slot in scheduler.slots))
+    return {"kinds": kinds, "most_running": most_running}
+
+
+def test_prompt_waits_for_kv_cells_instead_of_overrunning_the_pool():
+    # 64 CELLS FOR TWO SLOTS: A 4-TOKEN PROMPT WITH 40 TOKENS TO GENERATE MAY GROW TO 44, TWO OF THEM DO NOT FIT
+    engine = FakeEngine("fake.gguf", "chatml", n_ctx=64, n_slots=2, rate=10_000, prefill_rate=1e9, reply_tokens=40)
+    scheduler = BatchScheduler(engine)
+    first, second = (GenerationRequest(p, [{"role": "user", "content": "hello there"}], {}, 40) for p in ("first", "second"))
+    scheduler.submit(first)
+    scheduler.submit(second)
+    result = run_until_idle(scheduler, [first, second])
+    assert result["kinds"]["first"][-1] == "complete" and result["kinds"]["second"][-1] == "complete"
+    assert "error" not in result["kinds"]["first"] + result["kinds"]["second"]
+    assert result["most_running"] == 1
+
+
+def test_prompts_that_fit_run_together():
+    engine = FakeEngine("fake.gguf", "chatml", n_ctx=64, n_slots=2, rate=10_000, prefill_rate=1e9, reply_tokens=20)
+    scheduler = BatchScheduler(engine)
+    reqs = [GenerationRequest(p, [{"role": "user", "content": "hello there"}], {}, 20) for p in ("a", "b")]
+    for req in reqs:
+        scheduler.submit(req)
+    result = run_until_idle(scheduler, reqs)
+    assert result["most_running"] == 2
+    assert all(kinds[-1] == "complete" for kinds in result["kinds"].values())
+
+
+def test_kv_exhaustion_fails_only_the_prompt_admitted_last():
+    engine = FakeEngine("fake.gguf", "chatml", n_ctx=64, n_slots=2, rate=10_000, prefill_rate=1e9, reply_tokens=4)
+    scheduler = BatchScheduler(engine)
+    reqs = [GenerationRequest(p, [{"role": "user", "content": "hello there"}], {}, 4) for p in ("older", "newer")]
+    for req in reqs:
+        scheduler.submit(req)
+    scheduler.step()
+    # THE POOL SHRINKS UNDER THE RUNNING PROMPTS (FRAGMENTATION, A MISCOUNTED RESERVATION): THE NEXT BATCH DOES NOT FIT
+    engine.n_ctx = 9
+    result = run_until_idle(scheduler, reqs)
+    assert result["kinds"]["newer"] == ["error"]
+    assert result["kinds"]["older"][-1] == "complete"
+    assert "error" not in result["kinds"]["older"]
+    # THE FAILED BATCH LEFT NO CELLS BEHIND
+    assert engine.kv[scheduler.slots[1].seq_id] == []
+
+
+def test_cancel_after_the_prompt_finished_is_not_held_for_a_reused_id():
+    scheduler = make_scheduler()
+    first = request("reused")
+    scheduler.submit(first)
+    run_until_idle(scheduler, [first])
+    # THE CLIENT'S CANCEL CROSSED THE COMPLETE MESSAGE
+    scheduler.cancel("reused")
+    assert not scheduler._early_cancels
+    again = request("reused")
+    scheduler.submit(again)
+    assert run_until_idle(scheduler, [again])["kinds"]["reused"][-1] == "complete"
+
+
+def test_token_stream_coalesces_tokens_once_full():
+    stream = TokenStream(maxsize=2, policy="coalesce", max_chars=100)
+    for text in ("a", "b", "c", "d"):
+        assert stream.put_nowait("token", text)
+    assert stream.qsize() == 2
+    assert list(stream._items) == [("token", "a"), ("token", "bcd")]
+    # CONTROL EVENTS GO PAST THE BOUND
+    assert stream.put_nowait("complete", None)
+    assert asyncio.run(collect(stream, 3)) == [("token", "a"), ("token", "bcd"), ("complete", None)]
+    assert stream.pending_chars == 0
+
+
+def test_token_stream_drop_policy_refuses_tokens_once_full():
+    stream = TokenStream(maxsize=2, policy="drop", max_chars=100)
+    assert stream.put_nowait("token", "a") and stream.put_nowait("token", "b")
+    assert not stream.put_nowait("token", "c")
+    assert stream.put_nowait("error", "stop")
+    assert stream.qsize() == 3
+
+
+def test_token_stream_refuses_past_max_chars_whatever_the_policy():
+    stream = TokenStream(maxsize=100, policy="coalesce", max_chars=5)
+    assert stream.put_nowait("token", "abc")
+    assert not stream.put_nowait("token", "def")
+    assert stream.pending_chars == 3
+
+
+def test_get_many_returns_a_frame_at_a_control_event_or_max_chars():
+    async def run():
+        stream = TokenStream(maxsize=100, max_chars=1000)
+        stream.put_nowait("token", "ab")
+        stream.put_nowait("complete", {"tokens": 2})
+        # A CONTROL EVENT ENDS THE FRAME AT ONCE, WHATEVER THE WINDOW
+        assert await asyncio.wait_for(stream.get_many(10.0, 100), 1) == [("token", "ab"), ("complete", {"tokens": 2})]
+        stream.put_nowait("token", "x" * 8)
+        assert await asyncio.wait_for(stream.get_many(10.0, 8), 1) == [("token", "x" * 8)]
+        stream.put_nowait("token", "y")
+        assert await stream.get_many(0.01, 100) == [("token", "y")]
+
+    asyncio.run(run())
+
+
+def test_slow_consumer_is_dropped_and_cancelled_without_stalling_the_others():
+    scheduler = make_scheduler()
+    slow, fast = request("slow"), request("fast")
+    slow.events = TokenStream(maxsize=1, policy="drop")
+    for req in (slow, fast):
+        scheduler.submit(req)
+    scheduler.step()
+    scheduler._deliver([(slow, "token", "a"), (slow, "token", "b"), (fast, "token", "a"), (fast, "token", "b")])
+    assert slow.dropped
+    assert drain(slow) == ["token", "error"]
+    assert drain(fast) == ["token", "token"]
+    # ITS SLOT IS FREED BY THE NEXT STEP, THE OTHER PROMPT RUNS ON
+    kinds = run_until_idle(scheduler, [slow, fast])["kinds"]
+    assert kinds["fast"][-1] == "complete"
+    assert scheduler.idle()
+
+
+def test_cancel_aborts_the_running_prefill():
+    # 200 PROMPT TOKENS AT 100 TOKENS/S: THE PREFILL WOULD TAKE TWO SECONDS
+    engine = FakeEngine("fake.gguf", "chatml", n_ctx=1024, n_slots=2, rate=10_000, prefill_rate=100, reply_tokens=4)
+    scheduler = BatchScheduler(engine)
+    words = " ".join(["word"] * 100)
+    cancelled, other = (GenerationRequest(p, [{"role": "user", "content": words}], {}, 4) for p in ("cancelled", "other"))
+    scheduler.submit(cancelled)
+    scheduler.submit(other)
+
+    async def run():
+        step = asyncio.get_running_loop().run_in_executor(None, scheduler.step)
+        while not scheduler._decoding:
+            await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        scheduler.cancel("cancelled")
+        await asyncio.wait_for(step, 1)
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 0.5
+    # THE BATCH IS UNDONE FOR BOTH PROMPTS
+    assert all(engine.kv[slot.seq_id] == [] for slot in scheduler.slots)
+    engine.prefill_rate = 1e9
+    kinds = run_until_idle(scheduler, [cancelled, other])["kinds"]
+    assert kinds["cancelled"] == ["cancelled"]
+    assert kinds["other"][-1] == "complete"
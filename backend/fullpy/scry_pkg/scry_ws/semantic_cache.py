@@ -0,0 +1,101 @@
+"""Replies served again for paraphrased prompts: nearest neighbour search over prompt embeddings"""
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# ROWS CONVERTED TO FLOAT32 AT A TIME DURING A LOOKUP
+SCAN_CHUNK = 8192
+
+
+class SemanticCache:
+    """
+    Answers keyed by the embedding of the prompt that produced them. Vectors
+    (L2 normalized) live in a preallocated float16 matrix of `capacity` rows;
+    a lookup is a cosine similarity scan restricted to one scope (model, system
+    prompt, limits) and hits when the best match reaches the threshold of the
+    model. When full, the least recently used row is overwritten.
+    Thread safe: lookups run in an executor next to the embedding.
+    """
+
+    def __init__(self, dim: int, capacity: int, threshold: float, thresholds: Optional[Dict[str, float]] = None):
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+        self.thresholds = thresholds or {}
+        self.vectors = np.zeros((capacity, dim), dtype=np.float16)
+        self.scopes = np.full(capacity, -1, dtype=np.int32)
+        self.used = np.zeros(capacity, dtype=np.int64)
+        self.answers: List[Optional[Tuple[List[str], Dict]]] = [None] * capacity
+        self._scope_ids: Dict[str, int] = {}
+        self._scratch = np.empty((min(SCAN_CHUNK, capacity), dim), dtype=np.float32)
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = 0.0
+
+    def lookup(self, vector: np.ndarray, scope: str, model_name: str) -> Optional[Tuple[List[str], Dict, float]]:
+        """Returns (texts, stats, similarity) of the closest answer in `scope` above the threshold, or None."""
+        started = time.perf_counter()
+        threshold = self.thresholds.get(model_name, self.threshold)
+        with self._lock:
+            row, similarity = self._best(vector.astype(np.float32, copy=False), self._scope_ids.get(scope))
+            if row is not None and similarity >= threshold:
+                self._clock += 1
+                self.used[row] = self._clock
+                self.hits += 1
+                texts, stats = self.answers[row]
+            else:
+                self.misses += 1
+                texts = None
+            self.lookup_seconds += time.perf_counter() - started
+        if texts is None:
+            return None
+        return texts, stats, similarity
+
+    def _best(self, query: np.ndarray, scope_id: Optional[int]) -> Tuple[Optional[int], float]:
+        if scope_id is None or self.size == 0:
+            return None, -1.0
+        best_row, best = None, -1.0
+        for start in range(0, self.size, SCAN_CHUNK):
+            end = min(start + SCAN_CHUNK, self.size)
+            rows = self._scratch[:end - start]
+            # FLOAT16 HAS NO FAST MATMUL: WIDEN ONE CHUNK INTO A REUSED BUFFER, THEN A FLOAT32 GEMV
+            np.copyto(rows, self.vectors[start:end])
+            scores = rows @ query
+            scores[self.scopes[start:end] != scope_id] = -1.0
+            i = int(np.argmax(scores))
+            if scores[i] > best:
+                best_row, best = start + i, min(float(scores[i]), 1.0)
+        return best_row, best
+
+    def add(self, vector: np.ndarray, scope: str, texts: List[str], stats: Dict) -> None:
+        with self._lock:
+            if self.size < self.capacity:
+                row = self.size
+                self.size += 1
+            else:
+                row = int(np.argmin(self.used))
+                self.evictions += 1
+            scope_id = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self.vectors[row] = vector
+            self.scopes[row] = scope_id
+            self._clock += 1
+            self.used[row] = self._clock
+            self.answers[row] = (texts, stats)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.size,
+            "capacity": self.capacity,
+            "bytes_resident": self.vectors.nbytes + self.scopes.nbytes + self.used.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "lookup_ms": round(self.lookup_seconds / lookups * 1000, 2) if lookups else 0.0,
+        }
@@ -0,0 +1,57 @@
+import numpy as np
+from scry_pkg.scry_ws import semantic_cache
+from scry_pkg.scry_ws.semantic_cache import SemanticCache
+
+
+def unit(*values) -> np.ndarray:
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_hit_above_the_threshold_only():
+    cache = SemanticCache(3, 8, threshold=0.95)
+    cache.add(unit(1, 0, 0), "scope", ["answer"], {"tokens": 1})
+    texts, stats, similarity = cache.lookup(unit(1, 0.1, 0), "scope", "model")
+    assert texts == ["answer"] and stats == {"tokens": 1}
+    assert 0.99 < similarity <= 1.0
+    assert cache.lookup(unit(1, 1, 0), "scope", "model") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_threshold_per_model():
+    cache = SemanticCache(3, 8, threshold=0.95, thresholds={"loose": 0.5})
+    cache.add(unit(1, 0, 0), "scope", ["answer"], {})
+    assert cache.lookup(unit(1, 1, 0), "scope", "strict") is None
+    assert cache.lookup(unit(1, 1, 0), "scope", "loose")[0] == ["answer"]
+
+
+def test_scopes_never_share_answers():
+    cache = SemanticCache(3, 8, threshold=0.9)
+    cache.add(unit(1, 0, 0), "model a|system 1", ["a1"], {})
+    cache.add(unit(1, 0.01, 0), "model a|system 2", ["a2"], {})
+    assert cache.lookup(unit(1, 0, 0), "model a|system 2", "a")[0] == ["a2"]
+    assert cache.lookup(unit(1, 0.01, 0), "model a|system 1", "a")[0] == ["a1"]
+    # THE SAME VECTOR IN A SCOPE NOTHING WAS ADDED TO IS A MISS
+    assert cache.lookup(unit(1, 0, 0), "model b|system 1", "b") is None
+
+
+def test_full_cache_overwrites_the_least_recently_used():
+    cache = SemanticCache(3, 2, threshold=0.99)
+    cache.add(unit(1, 0, 0), "s", ["x"], {})
+    cache.add(unit(0, 1, 0), "s", ["y"], {})
+    cache.lookup(unit(1, 0, 0), "s", "m")          # "x" IS NOW THE MOST RECENT
+    cache.add(unit(0, 0, 1), "s", ["z"], {})
+    assert cache.lookup(unit(0, 1, 0), "s", "m") is None
+    assert cache.lookup(unit(1, 0, 0), "s", "m")[0] == ["x"]
+    assert cache.lookup(unit(0, 0, 1), "s", "m")[0] == ["z"]
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+
+
+def test_scan_crosses_chunks(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "SCAN_CHUNK", 4)
+    cache = SemanticCache(2, 10, threshold=0.99)
+    angles = np.linspace(0, np.pi / 2, 10)
+    for i, angle in enumerate(angles):
+        cache.add(unit(np.cos(angle), np.sin(angle)), "s", [str(i)], {})
+    for i in (0, 5, 9):
+        assert cache.lookup(unit(np.cos(angles[i]), np.sin(angles[i])), "s", "m")[0] == [str(i)]
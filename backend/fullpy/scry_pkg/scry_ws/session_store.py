@@ -0,0 +1,230 @@
+"""Session histories and KV snapshots kept on disk, so a client reconnecting with its session id resumes where it was"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from scry_pkg.scry_ws import logger
+
+# KV SNAPSHOT FILE: MAGIC, TOKEN COUNT, THE TOKENS (int32), THEN THE llama_state_seq_get_data BYTES
+KV_MAGIC = b"SKV1"
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"""
+
+
+class SessionStore:
+    """
+    SQLite database in WAL mode holding one JSON snapshot per session
+    (ContextWindow.snapshot). save() only queues: the writer thread commits
+    everything queued every `flush_interval` seconds in one transaction, the
+    last snapshot of a session winning, so a turn costs the event loop a
+    json.dumps and no disk wait. load() sees queued snapshots before they are
+    written. Sessions untouched for `ttl` seconds are deleted.
+    With `kv_dir`, the KV state of a session's last turn is written there too
+    (one file per session and model, up to `kv_budget_bytes`, oldest dropped
+    first), so a resumed session restores its prefix instead of prefilling it.
+    """
+
+    def __init__(self, path: Path, flush_interval: float, ttl: float, kv_dir: Optional[Path] = None, kv_budget_bytes: int = 0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.kv_dir = Path(kv_dir) if kv_dir else None
+        self.kv_budget_bytes = kv_budget_bytes
+        if self.kv_dir:
+            self.kv_dir.mkdir(parents=True, exist_ok=True)
+
+        # READS ON THE CALLER'S THREAD, WRITES ON THE WRITER THREAD: WAL LETS THEM RUN SIDE BY SIDE
+        self._reader = self._connect()
+        self._reader.execute("PRAGMA journal_mode=WAL")
+        self._reader.execute(SCHEMA)
+        self._reader.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        self._reader.commit()
+
+        # SESSION ID -> JSON SNAPSHOT (None = DELETE); (SESSION ID, MODEL) -> (TOKENS, STATE)
+        self._pending: Dict[str, Optional[str]] = {}
+        self._pending_kv: Dict[Tuple[str, str], Tuple[List[int], bytes]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._generation = 0
+        self._stopping = False
+        self.writes = 0
+        self.batches = 0
+        self.kv_writes = 0
+        self.kv_bytes = 0
+        self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL WITH synchronous=NORMAL: A COMMIT SURVIVES A CRASH OF THE SERVER, NOT NECESSARILY A POWER LOSS
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # CALLER SIDE
+    def save(self, session_id: str, snapshot: Dict) -> None:
+        state = json.dumps(snapshot, ensure_ascii=False)
+        with self._lock:
+            self._pending[session_id] = state
+        self._wake.set()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._pending[session_id] = None
+            for key in [k for k in self._pending_kv if k[0] == session_id]:
+                del self._pending_kv[key]
+        self._wake.set()
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            if session_id in self._pending:
+                state = self._pending[session_id]
+                return json.loads(state) if state is not None else None
+        row = self._reader.execute("SELECT state, updated_at FROM sessions WHERE session_id=?", (session_id,)).fetchone()
+        if row is None or row[1] < time.time() - self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def save_kv(self, session_id: str, model_name: str, tokens: List[int], state: bytes) -> None:
+        """Queues the KV snapshot of a session (any thread: the decode thread calls it)."""
+        if self.kv_dir is None:
+            return
+        with self._lock:
+            self._pending_kv[(session_id, model_name)] = (tokens, state)
+        self._wake.set()
+
+    def load_kv(self, session_id: str, model_name: str) -> Optional[Tuple[List[int], bytes]]:
+        """The last KV snapshot of a session on `model_name`, or None. Reads the file: run it in an executor."""
+        if self.kv_dir is None:
+            return None
+        with self._lock:
+            pending = self._pending_kv.get((session_id, model_name))
+        if pending is not None:
+            return pending
+        try:
+            with open(self._kv_path(session_id, model_name), "rb") as f:
+                if f.read(4) != KV_MAGIC:
+                    return None
+                tokens = array("i")
+                tokens.frombytes(f.read(4 * int.from_bytes(f.read(4), "little")))
+                return tokens.tolist(), f.read()
+        except OSError:
+            return None
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Waits until everything queued so far is on disk."""
+        with self._lock:
+            target = self._generation + 1
+            self._wake.set()
+            return self._flushed.wait_for(lambda: self._generation >= target or self._stopping, timeout)
+
+    def close(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout=10)
+        self._reader.close()
+
+    def stats(self) -> Dict:
+        return {"writes": self.writes, "batches": self.batches, "pending": len(self._pending),
+                "kv_writes": self.kv_writes, "kv_bytes": self.kv_bytes}
+
+    # WRITER THREAD
+    def _kv_path(self, session_id: str, model_name: str) -> Path:
+        return self.kv_dir / Path(model_name).stem / f"{session_id}.kv"
+
+    def _run(self) -> None:
+        conn = self._connect()
+        last_expiry = 0.0
+        while True:
+            self._wake.wait()
+            stopping = self._stopping
+            if not stopping:
+                # LET A BURST OF TURNS PILE UP INTO ONE TRANSACTION
+                time.sleep(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                pending_kv, self._pending_kv = self._pending_kv, {}
+            try:
+                self._write(conn, pending)
+                self._write_kv(pending_kv)
+                if time.time() - last_expiry > min(self.ttl, 3600):
+                    last_expiry = time.time()
+                    self._expire(conn)
+            except Exception as e:
+                logger.error(f"Session store: write of {len(pending)} sessions failed: {type(e).__name__}: {e}")
+            with self._lock:
+                self._generation += 1
+                self._flushed.notify_all()
+            if stopping:
+                conn.close()
+                return
+
+    def _write(self, conn: sqlite3.Connection, pending: Dict[str, Optional[str]]) -> None:
+        if not pending:
+            return
+        now = time.time()
+        deleted = [(session_id,) for session_id, state in pending.items() if state is None]
+        saved = [(session_id, state, now) for session_id, state in pending.items() if state is not None]
+        with conn:
+            conn.executemany("DELETE FROM sessions WHERE session_id=?", deleted)
+            conn.executemany("INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?,?,?)", saved)
+        for (session_id,) in deleted:
+            self._unlink_kv(session_id)
+        self.writes += len(pending)
+        self.batches += 1
+
+    def _write_kv(self, pending_kv: Dict[Tuple[str, str], Tuple[List[int], bytes]]) -> None:
+        for (session_id, model_name), (tokens, state) in pending_kv.items():
+            path = self._kv_path(session_id, model_name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(KV_MAGIC)
+                    f.write(len(tokens).to_bytes(4, "little"))
+                    f.write(array("i", tokens).tobytes())
+                    f.write(state)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"Session store: KV snapshot of {session_id} failed: {e}")
+                tmp.unlink(missing_ok=True)
+                continue
+            self.kv_writes += 1
+        if pending_kv:
+            self._enforce_kv_budget()
+
+    def _enforce_kv_budget(self) -> None:
+        files = [(entry.stat().st_mtime, entry.stat().st_size, Path(entry.path))
+                 for model_dir in os.scandir(self.kv_dir) if model_dir.is_dir()
+                 for entry in os.scandir(model_dir.path) if entry.name.endswith(".kv")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.kv_budget_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self.kv_bytes = total
+
+    def _unlink_kv(self, session_id: str) -> None:
+        if self.kv_dir is None:
+            return
+        for model_dir in os.scandir(self.kv_dir):
+            if model_dir.is_dir():
+                Path(model_dir.path, f"{session_id}.kv").unlink(missing_ok=True)
+
+    def _expire(self, conn: sqlite3.Connection) -> None:
+        cutoff = time.time() - self.ttl
+        with conn:
+            expired = [row[0] for row in conn.execute("SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,))]
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+        for session_id in expired:
+            self._unlink_kv(session_id)
+        if expired:
+            logger.info(f"Session store: {len(expired)} sessions expired")
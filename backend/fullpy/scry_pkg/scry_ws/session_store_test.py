@@ -0,0 +1,96 @@
+import os
+import time
+import sqlite3
+from scry_pkg.scry_ws.session_store import SessionStore
+
+SNAPSHOT = {"messages": [{"role": "system", "content": "be brief"}, {"role": "user", "content": "héllo"}],
+            "truncated_lines": [], "head": 1, "policy": "drop_oldest"}
+
+
+def open_store(tmp_path, ttl: float = 3600, kv_budget_bytes: int = 1 << 20) -> SessionStore:
+    return SessionStore(tmp_path / "sessions.sqlite", 0.0, ttl, tmp_path / "kv", kv_budget_bytes)
+
+
+def test_save_then_load_before_and_after_the_write(tmp_path):
+    store = open_store(tmp_path)
+    store.save("s1", SNAPSHOT)
+    # QUEUED SNAPSHOTS ARE SEEN BEFORE THEY ARE WRITTEN
+    assert store.load("s1") == SNAPSHOT
+    assert store.flush()
+    store.close()
+    reopened = open_store(tmp_path)
+    assert reopened.load("s1") == SNAPSHOT
+    assert reopened.load("unknown") is None
+    reopened.close()
+
+
+def test_the_last_snapshot_of_a_burst_wins(tmp_path):
+    store = SessionStore(tmp_path / "sessions.sqlite", 0.2, 3600)
+    for n in range(5):
+        store.save("s1", dict(SNAPSHOT, head=n))
+    assert store.flush()
+    assert store.load("s1")["head"] == 4
+    assert store.stats()["writes"] == 1 and store.stats()["batches"] == 1
+    store.close()
+
+
+def test_delete_removes_the_session_and_its_kv(tmp_path):
+    store = open_store(tmp_path)
+    store.save("s1", SNAPSHOT)
+    store.save_kv("s1", "models/llama.gguf", [1, 2, 3], b"state")
+    assert store.flush()
+    store.delete("s1")
+    assert store.load("s1") is None
+    assert store.flush()
+    assert store.load("s1") is None
+    assert store.load_kv("s1", "models/llama.gguf") is None
+    store.close()
+
+
+def test_kv_snapshot_round_trip(tmp_path):
+    store = open_store(tmp_path)
+    store.save_kv("s1", "models/llama.gguf", [1, 2, 300000], b"\x00state\xff")
+    assert store.load_kv("s1", "models/llama.gguf") == ([1, 2, 300000], b"\x00state\xff")
+    assert store.flush()
+    store.close()
+    reopened = open_store(tmp_path)
+    assert reopened.load_kv("s1", "models/llama.gguf") == ([1, 2, 300000], b"\x00state\xff")
+    # ONE FILE PER SESSION AND MODEL
+    assert reopened.load_kv("s1", "models/other.gguf") is None
+    reopened.close()
+
+
+def test_kv_budget_drops_the_oldest_snapshots(tmp_path):
+    store = open_store(tmp_path, kv_budget_bytes=250)
+    store.save_kv("old", "m.gguf", [], bytes(100))
+    store.save_kv("mid", "m.gguf", [], bytes(100))
+    assert store.flush()
+    old = time.time() - 60
+    os.utime(tmp_path / "kv" / "m" / "old.kv", (old, old))
+    store.save_kv("new", "m.gguf", [], bytes(100))
+    assert store.flush()
+    assert store.load_kv("old", "m.gguf") is None
+    assert store.load_kv("mid", "m.gguf") is not None and store.load_kv("new", "m.gguf") is not None
+    assert store.stats()["kv_bytes"] == 2 * 108
+    store.close()
+
+
+def test_sessions_expire_after_ttl(tmp_path):
+    store = open_store(tmp_path, ttl=60)
+    store.save("stale", SNAPSHOT)
+    store.save("fresh", SNAPSHOT)
+    store.save_kv("stale", "m.gguf", [1], b"kv")
+    assert store.flush()
+    store.close()
+    with sqlite3.connect(tmp_path / "sessions.sqlite") as conn:
+        conn.execute("UPDATE sessions SET updated_at=? WHERE session_id='stale'", (time.time() - 120,))
+
+    reopened = open_store(tmp_path, ttl=60)
+    assert reopened.load("stale") is None
+    # THE FIRST WRITE OF THE WRITER THREAD ALSO DELETES THE EXPIRED ROWS AND THEIR KV FILES
+    assert reopened.flush()
+    with sqlite3.connect(tmp_path / "sessions.sqlite") as conn:
+        assert [row[0] for row in conn.execute("SELECT session_id FROM sessions")] == ["fresh"]
+    assert reopened.load_kv("stale", "m.gguf") is None
+    assert reopened.load("fresh") == SNAPSHOT
+    reopened.close()
@@ -0,0 +1,86 @@
+"""Draft proposers for speculative decoding: prompt lookup (n-gram) and a small draft model"""
+from typing import Dict, List, Tuple
+from scry_pkg.scry_ws import logger
+from scry_pkg.scry_ws.scheduler import DecodeError, common_prefix
+
+# seq_id -> (TOKEN HISTORY OF THE SLOT, TOKENS TO DRAFT)
+DraftWants = Dict[int, Tuple[List[int], int]]
+
+GREEDY = {"temperature": 0, "repeat_penalty": 1.0, "frequency_penalty": 0.0, "presence_penalty": 0.0}
+
+
+def lookup_draft(history: List[int], k: int, max_ngram: int = 3) -> List[int]:
+    """Finds the latest earlier occurrence of the trailing n-gram and proposes what followed it."""
+    for n in range(min(max_ngram, len(history) - 1), 0, -1):
+        tail = history[-n:]
+        first = tail[0]
+        for start in range(len(history) - n - 1, -1, -1):
+            if history[start] == first and history[start:start + n] == tail:
+                return history[start + n:start + n + k]
+    return []
+
+
+class PromptLookupDrafter:
+    """
+    No extra model: output that copies from the input (search results, code,
+    quoted text) is predicted from the slot's own prompt and output.
+    """
+
+    def __init__(self, max_ngram: int = 3):
+        self.max_ngram = max_ngram
+
+    def draft(self, wants: DraftWants) -> Dict[int, List[int]]:
+        return {seq: lookup_draft(history, k, self.max_ngram) for seq, (history, k) in wants.items()}
+
+    def close(self) -> None:
+        pass
+
+
+class DraftModelDrafter:
+    """
+    Greedy proposals from a small GGUF sharing the target's vocabulary
+    (e.g. Llama-3.2-1B drafting for Llama-3.1-8B). The draft context mirrors the
+    scheduler slots; each call only feeds the tokens the target added since.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.cached: Dict[int, List[int]] = {seq: [] for seq in range(engine.n_slots)}
+        self.greedy = engine.new_sampler(GREEDY)
+
+    def draft(self, wants: DraftWants) -> Dict[int, List[int]]:
+        out: Dict[int, List[int]] = {}
+        try:
+            # CATCH EVERY DRAFT SEQUENCE UP WITH THE TARGET HISTORY
+            for seq, (history, k) in wants.items():
+                cached = self.cached[seq]
+                n_keep = min(common_prefix(cached, history), len(history) - 1)
+                self.engine.clear_seq(seq, n_keep)
+                del cached[n_keep:]
+                feed = history[n_keep:]
+                for start in range(0, len(feed), self.engine.n_batch):
+                    chunk = feed[start:start + self.engine.n_batch]
+                    self.engine.decode([(token, len(cached) + i, seq, start + i == len(feed) - 1) for i, token in enumerate(chunk)])
+                    cached.extend(chunk)
+                out[seq] = [self.engine.sample(self.greedy, len(chunk) - 1)]
+
+            # THEN ONE BATCHED GREEDY STEP PER EXTRA DRAFT TOKEN
+            for _ in range(max(k for _, k in wants.values()) - 1):
+                seqs = [seq for seq in out if len(out[seq]) < wants[seq][1]]
+                if not seqs:
+                    break
+                self.engine.decode([(out[seq][-1], len(self.cached[seq]), seq, True) for seq in seqs])
+                for i, seq in enumerate(seqs):
+                    self.cached[seq].append(out[seq][-1])
+                    out[seq].append(self.engine.sample(self.greedy, i))
+        except DecodeError as e:
+            logger.warning(f"Draft model failed, drafting skipped this step: {e}")
+            for seq in wants:
+                self.engine.clear_seq(seq)
+                self.cached[seq] = []
+            return {}
+        return out
+
+    def close(self) -> None:
+        self.engine.free_sampler(self.greedy)
+        self.engine.close()
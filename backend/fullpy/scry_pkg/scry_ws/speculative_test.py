@@ -0,0 +1,45 @@
+from scry_pkg.scry_ws.fake_engine import FakeEngine
+from scry_pkg.scry_ws.speculative import DraftModelDrafter, PromptLookupDrafter, lookup_draft
+
+
+def test_lookup_draft_proposes_what_followed_the_trailing_ngram():
+    assert lookup_draft([1, 2, 3, 4, 5, 1, 2, 3], 2) == [4, 5]
+    # AT MOST k TOKENS, FEWER AT THE END OF THE HISTORY
+    assert lookup_draft([1, 2, 3, 4, 5, 1, 2, 3], 10) == [4, 5, 1, 2, 3]
+
+
+def test_lookup_draft_prefers_the_latest_occurrence():
+    assert lookup_draft([7, 1, 7, 2, 7], 1) == [2]
+
+
+def test_lookup_draft_falls_back_to_shorter_ngrams():
+    # NO EARLIER (9, 3): THE UNIGRAM 3 STILL MATCHES
+    assert lookup_draft([3, 4, 5, 9, 3], 2) == [4, 5]
+    assert lookup_draft([3, 4, 5, 9, 3], 2, max_ngram=1) == [4, 5]
+
+
+def test_lookup_draft_without_a_match():
+    assert lookup_draft([1, 2, 3], 4) == []
+    assert lookup_draft([1], 4) == []
+    assert lookup_draft([], 4) == []
+
+
+def test_prompt_lookup_drafter_drafts_every_sequence():
+    drafter = PromptLookupDrafter()
+    assert drafter.draft({0: ([1, 2, 1], 1), 1: ([5, 6], 3)}) == {0: [2], 1: []}
+
+
+def test_draft_model_feeds_only_what_the_target_added():
+    engine = FakeEngine("draft.gguf", "chatml", n_ctx=256, n_slots=2, rate=1e6, prefill_rate=1e9)
+    drafter = DraftModelDrafter(engine)
+    first = drafter.draft({0: ([100, 101, 102], 3), 1: ([200], 1)})
+    assert [len(first[0]), len(first[1])] == [3, 1]
+    # THE DRAFT CONTEXT HOLDS THE HISTORY AND THE DRAFTS IT DECODED
+    assert engine.kv[0] == [100, 101, 102] + first[0][:2]
+    assert drafter.cached[0] == engine.kv[0]
+
+    # THE TARGET ACCEPTED ONE DRAFT TOKEN AND SAMPLED ANOTHER: THE REJECTED TAIL IS CLEARED
+    history = [100, 101, 102, first[0][0], 999]
+    drafter.draft({0: (history, 2)})
+    assert engine.kv[0][:5] == history
+    assert len(engine.kv[0]) == 6
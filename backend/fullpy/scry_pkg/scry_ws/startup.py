@@ -0,0 +1,92 @@
+"""Startup of the WebSocket server: GGUF read-ahead and the loading progress told to early clients"""
+import os
+import time
+import psutil
+from typing import Callable, Dict, Optional, Tuple
+from scry_pkg.scry_ws import logger
+
+
+def prefetch(path: str, chunk: int, progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, float]:
+    """
+    Reads the GGUF once, sequentially and in large chunks, so the page faults
+    of the llama.cpp load (mmap + mlock, in tensor order) find the weights in
+    the page cache instead of waiting on the disk one fault at a time. Where
+    posix_fadvise exists the kernel also reads the whole file ahead. Skipped
+    when the file does not fit in free memory: it would only evict the pages
+    the load just brought in. Returns (bytes read, seconds).
+    """
+    size = os.path.getsize(path)
+    if psutil.virtual_memory().available < size:
+        logger.info(f"Prefetch skipped: {size / 1024**3:.2f} GiB does not fit in available memory")
+        return 0, 0.0
+
+    started = time.perf_counter()
+    done = 0
+    view = memoryview(bytearray(chunk))
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            done += n
+            if progress is not None:
+                progress(done, size)
+    seconds = time.perf_counter() - started
+    logger.info(f"Prefetched {done / 1024**3:.2f} GiB in {seconds:.1f} s ({done / 1024**2 / max(seconds, 1e-6):.0f} MiB/s)")
+    return done, seconds
+
+
+class LoadProgress:
+    """
+    Where the startup load is: stage (weights, warmup, embedder,
+    ready, failed), fraction of the weights loaded by llama.cpp and of the
+    GGUF prefetched. `update` says when a new loading message is worth sending.
+    """
+    __slots__ = ('stage', 'weights', 'prefetched', 'error', 'started', 'ready_at', 'interval', '_sent')
+
+    def __init__(self, interval: float):
+        self.stage = "weights"
+        self.weights = 0.0
+        self.prefetched = 0.0
+        self.error: Optional[str] = None
+        self.started = time.perf_counter()
+        self.ready_at: Optional[float] = None
+        self.interval = interval
+        self._sent = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.stage == "ready"
+
+    def update(self, stage: Optional[str] = None, weights: Optional[float] = None, prefetched: Optional[float] = None) -> bool:
+        changed = stage is not None and stage != self.stage
+        if stage is not None:
+            self.stage = stage
+        if weights is not None:
+            self.weights = weights
+        if prefetched is not None:
+            self.prefetched = prefetched
+        now = time.perf_counter()
+        if self.stage == "ready" and self.ready_at is None:
+            self.ready_at = now
+        if changed or now - self._sent >= self.interval:
+            self._sent = now
+            return True
+        return False
+
+    def message(self) -> Dict:
+        return {
+            "type": "loading",
+            "stage": self.stage,
+            "progress": round(self.weights, 3),
+            "prefetch": round(self.prefetched, 3),
+            "elapsedS": round(time.perf_counter() - self.started, 2),
+        }
+
+    @property
+    def seconds(self) -> float:
+        """Time to ready (or so far)."""
+        return (self.ready_at or time.perf_counter()) - self.started
@@ -0,0 +1,29 @@
+from scry_pkg.scry_ws.startup import LoadProgress, prefetch
+
+
+def test_prefetch_reads_the_whole_file_and_reports_progress(tmp_path):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"x" * 10_000)
+    seen = []
+    done, seconds = prefetch(str(path), 4096, lambda read, size: seen.append((read, size)))
+    assert done == 10_000 and seconds >= 0
+    assert seen == [(4096, 10_000), (8192, 10_000), (10_000, 10_000)]
+
+
+def test_prefetch_skips_a_file_larger_than_free_memory(tmp_path, monkeypatch):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"x" * 100)
+    monkeypatch.setattr("scry_pkg.scry_ws.startup.psutil.virtual_memory", lambda: type("Memory", (), {"available": 10})())
+    assert prefetch(str(path), 4096) == (0, 0.0)
+
+
+def test_loading_messages_are_rate_limited_except_on_a_new_stage():
+    progress = LoadProgress(interval=60)
+    assert progress.update(weights=0.1)
+    assert not progress.update(weights=0.2)
+    assert progress.update(stage="warmup")
+    assert progress.message()["stage"] == "warmup" and progress.message()["progress"] == 0.2
+    assert not progress.ready
+    progress.update(stage="ready")
+    assert progress.ready and progress.ready_at is not None
+    assert progress.seconds == progress.ready_at - progress.started
@@ -0,0 +1,300 @@
+"""Worker mode: N processes each running an engine and a scheduler, the WebSocket front-end only dispatches"""
+import os
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from scry_pkg.scry_ws import logger, PREFIX_CACHE_BYTES, STREAM_MAX_PENDING_CHARS, WORKER_RESTART_DELAY
+from scry_pkg.scry_ws.scheduler import BatchScheduler, GenerationRequest
+
+# MESSAGES, FRONT-END -> WORKER: ("submit", prompt_id, messages, params, max_tokens, stops), ("cancel", prompt_id), ("exit",)
+# WORKER -> FRONT-END: ("ready", pid), ("events", prompt_id, [(kind, payload), ...])
+
+
+def worker_main(index: int, model_path: str, chat_format: str, n_ctx: int, n_slots: int, n_batch: int,
+                prefix_cache_bytes: int, profile: Optional[Dict], draft_path: Optional[str], cpus: List[int], requests, events) -> None:
+    """Entry point of a worker process."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    try:
+        asyncio.run(_serve(index, model_path, chat_format, n_ctx, n_slots, n_batch, prefix_cache_bytes, profile, draft_path,
+                           len(cpus) or None, requests, events))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve(index, model_path, chat_format, n_ctx, n_slots, n_batch, prefix_cache_bytes, profile, draft_path, n_threads,
+                 requests, events) -> None:
+    from scry_pkg.scry_ws.engine import open_engine
+    from scry_pkg.scry_ws.prefix_cache import PrefixCache
+    from scry_pkg.scry_ws.speculative import PromptLookupDrafter
+
+    loop = asyncio.get_running_loop()
+    # THE PROFILE'S BATCH SIZES AND FLASH ATTENTION APPLY, ITS THREAD COUNTS GIVE WAY TO THE WORKER'S CORES
+    engine = open_engine(model_path, chat_format, n_ctx=n_ctx, n_slots=n_slots, n_batch=n_batch, n_threads=n_threads, profile=profile)
+    engine.warmup()
+    drafters = {"lookup": PromptLookupDrafter()}
+    if draft_path:
+        drafter = _open_drafter(index, draft_path, engine, chat_format, n_slots, n_batch, n_threads)
+        if drafter is not None:
+            drafters["draft"] = drafter
+    scheduler = BatchScheduler(engine, PrefixCache(prefix_cache_bytes), drafters)
+    scheduler.start(loop)
+
+    inbox: asyncio.Queue = asyncio.Queue()
+    threading.Thread(target=_read_requests, args=(requests, loop, inbox), name="worker-inbox", daemon=True).start()
+    events.send(("ready", os.getpid()))
+
+    while True:
+        message = await inbox.get()
+        if message is None or message[0] == "exit":
+            break
+        if message[0] == "submit":
+            _, prompt_id, messages, params, max_tokens, stops = message
+            request = GenerationRequest(prompt_id, messages, params, max_tokens, stops)
+            scheduler.submit(request)
+            loop.create_task(_forward(request, events))
+        elif message[0] == "cancel":
+            scheduler.cancel(message[1])
+
+    scheduler.close()
+    engine.close()
+
+
+def _open_drafter(index: int, draft_path: str, engine, chat_format: str, n_slots: int, n_batch: int, n_threads: Optional[int]):
+    """DraftModelDrafter over the draft GGUF, or None (logged) when it fails to load or its vocabulary differs."""
+    from scry_pkg.scry_ws.engine import open_engine
+    from scry_pkg.scry_ws.speculative import DraftModelDrafter
+    try:
+        # SAME CONTEXT AS THE TARGET: DRAFTS RUN AT ITS POSITIONS
+        draft = open_engine(draft_path, chat_format, n_ctx=engine.n_ctx, n_slots=n_slots, n_batch=n_batch, n_threads=n_threads)
+    except Exception as e:
+        logger.error(f"Worker {index}: draft model {draft_path} failed to load, drafting with lookup only: {e}")
+        return None
+    if draft.n_vocab != engine.n_vocab:
+        logger.error(f"Worker {index}: draft model {draft_path} has {draft.n_vocab} tokens, target has {engine.n_vocab}: not usable")
+        draft.close()
+        return None
+    logger.info(f"Worker {index}: draft model {draft_path} ready")
+    return DraftModelDrafter(draft)
+
+
+def _read_requests(requests, loop, inbox) -> None:
+    while True:
+        try:
+            message = requests.recv()
+        except (EOFError, OSError):
+            message = None
+        loop.call_soon_threadsafe(inbox.put_nowait, message)
+        if message is None:
+            return
+
+
+async def _forward(request: GenerationRequest, events) -> None:
+    # EVERYTHING QUEUED SINCE THE LAST SEND GOES IN ONE PIPE MESSAGE
+    while True:
+        batch = await request.events.get_many(0, STREAM_MAX_PENDING_CHARS)
+        events.send(("events", request.prompt_id, batch))
+        if batch[-1][0] != "token":
+            return
+
+
+class Worker:
+    """Front-end view of one worker process."""
+    __slots__ = ('index', 'cpus', 'process', 'requests', 'ready', 'generation', 'inflight', 'backlog',
+                 'sessions', 'restarts')
+
+    def __init__(self, index: int, cpus: List[int]):
+        self.index = index
+        self.cpus = cpus
+        self.process = None
+        self.requests = None
+        self.ready = False
+        self.generation = 0
+        self.inflight: Dict[str, GenerationRequest] = {}
+        self.backlog: deque = deque()
+        self.sessions: set = set()
+        self.restarts = 0
+
+
+class WorkerPool:
+    """
+    Scheduler interface (start, submit, cancel, idle, close) over worker
+    processes. Cores are split evenly and pinned per worker; a session stays on
+    the worker that served it first, so its prefix KV is reused there. A worker
+    that dies fails its in-flight prompts and is started again.
+    """
+
+    def __init__(self, n_workers: int, model_path: str, chat_format: str, n_ctx: int, n_slots: int, n_batch: int,
+                 profile: Optional[Dict] = None, draft_path: Optional[str] = None):
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        share = max(len(cpus) // n_workers, 1)
+        self.workers = [Worker(i, cpus[i * share:(i + 1) * share] or cpus) for i in range(n_workers)]
+        # THE PREFIX CACHE BUDGET IS SHARED BETWEEN THE WORKERS
+        self.args = (model_path, chat_format, n_ctx, n_slots, n_batch, PREFIX_CACHE_BYTES // n_workers, profile, draft_path)
+        # THE DRAFT MODEL IS LOADED BY EVERY WORKER AT START: CHANGING IT NEEDS A RESTART
+        self.draft_path = draft_path
+        self.pins: Dict[str, Worker] = {}
+        self._mp = multiprocessing.get_context("spawn")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        # SET BY wait_ready: RESOLVED ONCE EVERY WORKER HAS LOADED ITS MODEL, FAILED IF ONE DIES FIRST
+        self._startup: Optional[asyncio.Future] = None
+        self._progress: Optional[Callable[[float], None]] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        for worker in self.workers:
+            self._spawn(worker)
+
+    async def wait_ready(self, progress: Optional[Callable[[float], None]] = None) -> None:
+        """
+        Waits until every worker has loaded and warmed up its model; `progress`
+        gets the share of workers ready. Raises RuntimeError when a worker dies
+        before its first ready (it is still restarted, as always).
+        """
+        if all(worker.ready for worker in self.workers):
+            return
+        self._startup = self._loop.create_future()
+        self._progress = progress
+        try:
+            await self._startup
+        finally:
+            self._startup = None
+            self._progress = None
+
+    def _spawn(self, worker: Worker) -> None:
+        requests_out, requests_in = self._mp.Pipe(duplex=False)
+        events_out, events_in = self._mp.Pipe(duplex=False)
+        worker.generation += 1
+        worker.ready = False
+        worker.process = self._mp.Process(
+            target=worker_main, args=(worker.index, *self.args, worker.cpus, requests_out, events_in),
+            name=f"llama-worker-{worker.index}", daemon=True,
+        )
+        worker.process.start()
+        # ONLY THE CHILD KEEPS ITS ENDS: A DEAD WORKER THEN SHOWS UP AS EOF
+        requests_out.close()
+        events_in.close()
+        worker.requests = requests_in
+        threading.Thread(target=self._read_events, args=(worker, worker.process, events_out, worker.generation),
+                         name=f"worker-{worker.index}-events", daemon=True).start()
+        logger.info(f"Worker {worker.index} starting on cpus {worker.cpus[0]}-{worker.cpus[-1]}")
+
+    def _read_events(self, worker: Worker, process, events, generation: int) -> None:
+        while True:
+            try:
+                message = events.recv()
+            except (EOFError, OSError):
+                process.join(timeout=5)
+                # AFTER close() THE LOOP MAY BE CLOSED ALREADY, AND _on_exit WOULD IGNORE THE EXIT ANYWAY
+                if not self._stopping:
+                    self._loop.call_soon_threadsafe(self._on_exit, worker, generation, process.exitcode)
+                return
+            self._loop.call_soon_threadsafe(self._on_message, worker, generation, message)
+
+    # EVENT LOOP SIDE
+    def _on_message(self, worker: Worker, generation: int, message) -> None:
+        if generation != worker.generation:
+            return
+        if message[0] == "ready":
+            worker.ready = True
+            logger.info(f"Worker {worker.index} ready (pid {message[1]})")
+            while worker.backlog:
+                self._send(worker, worker.backlog.popleft())
+            ready = sum(w.ready for w in self.workers)
+            if self._progress is not None:
+                self._progress(ready / len(self.workers))
+            if self._startup is not None and not self._startup.done() and ready == len(self.workers):
+                self._startup.set_result(None)
+            return
+
+        _, prompt_id, batch = message
+        request = worker.inflight.get(prompt_id)
+        if request is None:
+            return
+        for kind, payload in batch:
+            if kind != "token":
+                worker.inflight.pop(prompt_id, None)
+            if request.dropped:
+                continue
+            if not request.events.put_nowait(kind, payload):
+                # SLOW CONSUMER, AS IN BatchScheduler._deliver
+                request.dropped = True
+                self.cancel(prompt_id)
+                request.events.put_nowait("error", "Client is reading too slowly, generation cancelled")
+
+    def _on_exit(self, worker: Worker, generation: int, code: Optional[int]) -> None:
+        if self._stopping or generation != worker.generation:
+            return
+        logger.error(f"Worker {worker.index} exited (code {code}), failing {len(worker.inflight)} prompts and restarting")
+        if self._startup is not None and not self._startup.done() and not worker.ready:
+            self._startup.set_exception(RuntimeError(f"Worker {worker.index} exited (code {code}) before its model was ready"))
+        for request in worker.inflight.values():
+            request.events.put_nowait("error", "Inference worker crashed, prompt aborted")
+        worker.inflight.clear()
+        worker.backlog.clear()
+        worker.requests.close()
+        worker.restarts += 1
+        # BACK OFF WHEN IT KEEPS CRASHING (E.G. A MODEL THAT FAILS TO LOAD)
+        delay = min(WORKER_RESTART_DELAY * worker.restarts, 30) if not worker.ready else WORKER_RESTART_DELAY
+        worker.ready = False
+        self._loop.call_later(delay, self._spawn, worker)
+
+    def _send(self, worker: Worker, message) -> None:
+        if not worker.ready:
+            worker.backlog.append(message)
+            return
+        try:
+            worker.requests.send(message)
+        except OSError as e:
+            logger.error(f"Worker {worker.index} unreachable: {e}")
+
+    def _pick(self, session_id: Optional[str]) -> Worker:
+        worker = self.pins.get(session_id)
+        if worker is None:
+            worker = min(self.workers, key=lambda w: (len(w.sessions), len(w.inflight)))
+            if session_id is not None:
+                self.pins[session_id] = worker
+                worker.sessions.add(session_id)
+        return worker
+
+    def submit(self, request: GenerationRequest) -> None:
+        worker = self._pick(request.session_id)
+        worker.inflight[request.prompt_id] = request
+        self._send(worker, ("submit", request.prompt_id, request.messages, request.params, request.max_tokens, request.stops))
+
+    def cancel(self, prompt_id: str) -> None:
+        for worker in self.workers:
+            if prompt_id in worker.inflight:
+                self._send(worker, ("cancel", prompt_id))
+
+    def unpin(self, session_id: str) -> None:
+        worker = self.pins.pop(session_id, None)
+        if worker is not None:
+            worker.sessions.discard(session_id)
+
+    def idle(self) -> bool:
+        return not any(worker.inflight for worker in self.workers)
+
+    def stats(self) -> dict:
+        return {
+            f"worker_{w.index}": {"ready": w.ready, "inflight": len(w.inflight), "sessions": len(w.sessions), "restarts": w.restarts}
+            for w in self.workers
+        }
+
+    def close(self) -> None:
+        self._stopping = True
+        for worker in self.workers:
+            if worker.ready:
+                try:
+                    worker.requests.send(("exit",))
+                except OSError:
+                    pass
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
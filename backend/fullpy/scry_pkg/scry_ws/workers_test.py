@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from scry_pkg.scry_ws.scheduler import GenerationRequest
+from scry_pkg.scry_ws.workers import WorkerPool
+
+# THE WORKERS IMPORT THE ENGINE MODULE, WHICH NEEDS llama_cpp EVEN WITH THE FAKE ENGINE
+pytest.importorskip("llama_cpp")
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    # READ BY THE SPAWNED WORKERS WHEN THEY IMPORT scry_pkg.scry_ws
+    monkeypatch.setenv("SCRY_FAKE_ENGINE", "1")
+    monkeypatch.setenv("SCRY_FAKE_ENGINE_RATE", "50")
+    monkeypatch.setenv("SCRY_FAKE_ENGINE_REPLY_TOKENS", "1000")
+
+
+def request(prompt_id: str, max_tokens: int, session_id: str = "s") -> GenerationRequest:
+    return GenerationRequest(prompt_id, [{"role": "user", "content": "hello there"}], {}, max_tokens, session_id=session_id)
+
+
+async def last_event(req: GenerationRequest, timeout: float = 30):
+    kind, payload = await asyncio.wait_for(req.events.get(), timeout)
+    while kind == "token":
+        kind, payload = await asyncio.wait_for(req.events.get(), timeout)
+    return kind, payload
+
+
+def test_crashed_worker_fails_its_prompts_and_is_restarted(fake_engine):
+    async def run():
+        pool = WorkerPool(1, "fake.gguf", "chatml", 512, 2, 512)
+        pool.start(asyncio.get_running_loop())
+        try:
+            await asyncio.wait_for(pool.wait_ready(), 60)
+            running = request("running", 1000)
+            pool.submit(running)
+            kind, _ = await asyncio.wait_for(running.events.get(), 30)
+            assert kind == "token"
+
+            worker = pool.workers[0]
+            worker.process.kill()
+            assert await last_event(running) == ("error", "Inference worker crashed, prompt aborted")
+            assert pool.idle() and worker.restarts == 1
+
+            # SUBMITTED WHILE THE WORKER RESTARTS: HELD IN ITS BACKLOG, RUN ONCE IT IS READY AGAIN
+            later = request("later", 3)
+            pool.submit(later)
+            assert not worker.ready and len(worker.backlog) == 1
+            kind, stats = await last_event(later, 60)
+            assert kind == "complete" and stats["tokens"] == 3
+            assert worker.ready and pool.stats()["worker_0"]["restarts"] == 1
+        finally:
+            pool.close()
+
+    asyncio.run(run())
+
+
+def test_wait_ready_fails_when_a_worker_dies_before_loading(fake_engine):
+    async def run():
+        pool = WorkerPool(1, "fake.gguf", "chatml", 512, 2, 512)
+        pool.start(asyncio.get_running_loop())
+        pool.workers[0].process.kill()
+        try:
+            with pytest.raises(RuntimeError, match="before its model was ready"):
+                await asyncio.wait_for(pool.wait_ready(), 30)
+        finally:
+            pool.close()
+
+    asyncio.run(run())
+
+
+def test_sessions_stay_on_their_worker(fake_engine):
+    pool = WorkerPool(2, "fake.gguf", "chatml", 512, 2, 512)
+    first = pool._pick("a")
+    second = pool._pick("b")
+    assert first is not second
+    assert pool._pick("a") is first
+    pool.unpin("a")
+    assert not first.sessions
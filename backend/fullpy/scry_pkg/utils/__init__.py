@@ -110,3 +110,7 @@ BG_COLORS = {
     'WHITE': '\033[47m'
 }
 
+
+def estimate_tokens(text: str) -> int:
+    """Rough count (four characters a token) for when no tokenizer is loaded yet."""
+    return len(text) // 4 + 1
@@ -5,6 +5,7 @@ setup(
     version="0.1.0",
     packages=find_packages(),  
     install_requires=[
+        "aiohttp==3.14.5",
         "aiofiles==25.1.0",
         "annotated-doc==0.0.4",
         "annotated-types==0.7.0",